@@ -0,0 +1,107 @@
+import asyncio
+import concurrent.futures
+import logging
+import signal
+from MQTT_Pipeline import shard_for
+
+# Optionale asyncio Laufzeit (RUNTIME_MODE = asyncio).
+# Die Verarbeitung der MQTT Nachrichten läuft als Tasks in einer Event-Loop. Die Ablaufsteuerung der
+# Gefährdungseinträge (Pair_Expiry.py) läuft wie im blockierenden Modus im eigenen Thread.
+# Für MySQL und pymemcache gibt es hier keine async Clients, die Verarbeitung wird daher in einen
+# begrenzten Thread-Pool ausgelagert. paho bleibt der MQTT Client, sein Netzwerk-Thread reicht die
+# Nachrichten threadsicher an die Event-Loop weiter.
+
+log = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    # client: konfigurierter paho Client, subscriptions: abonnierte Topics (wie mqtt_subscriptions im Microservice)
+    # handler: Verarbeitung einer Nachricht (bytes)
+    # workers: Anzahl gleichzeitig verarbeiteter Beacon-Shards, io_threads: Größe des Thread-Pools
+    # recorder: optionaler Mitschnitt der empfangenen Nachrichten (Traffic_Capture.TrafficRecorder)
+    def __init__(self, client, mqtt_server, mqtt_port, subscriptions, handler, workers=64,
+                 io_threads=64, queue_size=10000, full_policy='block', recorder=None):
+        self.client = client
+        self.mqtt_server = mqtt_server
+        self.mqtt_port = mqtt_port
+        self.subscriptions = list(subscriptions)
+        self.handler = handler
+        self.workers = workers
+        self.io_threads = io_threads
+        self.queue_size = queue_size
+        self.block = full_policy == 'block'
+        self.recorder = recorder
+        self.dropped = 0
+        self.loop = None
+        self.executor = None
+        self.queues = []
+        self._stop = None
+
+    # Aufruf aus dem paho Netzwerk-Thread
+    def _on_message(self, client, userdata, msg):
+        if self.recorder is not None:
+            self.recorder.record(msg.payload)
+        queue = self.queues[shard_for(msg.payload, self.workers)]
+        if self.block:
+            # Backpressure: der paho Thread wartet, bis im Shard wieder Platz ist
+            future = asyncio.run_coroutine_threadsafe(queue.put(msg.payload), self.loop)
+            try:
+                future.result()
+            except concurrent.futures.CancelledError:
+                pass
+        else:
+            self.loop.call_soon_threadsafe(self._put_nowait, queue, msg.payload)
+
+    def _put_nowait(self, queue, payload):
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            log.info("Mit MQTT-Broker verbunden.")
+            for topic in self.subscriptions:
+                client.subscribe(topic)
+        else:
+            log.warning("Verbindung fehlgeschlagen mit Code %s", rc)
+
+    # Je Shard ein Task: Nachrichten eines Beacons werden nacheinander verarbeitet, verschiedene Shards parallel
+    async def _consumer(self, queue):
+        while True:
+            payload = await queue.get()
+            try:
+                await self.loop.run_in_executor(self.executor, self.handler, payload)
+            except Exception as e:
+                log.error("Fehler bei der Verarbeitung der Nachricht: %s", e)
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        # Eigener Thread-Pool für die Verarbeitung, der Default-Executor der Event-Loop bleibt unberührt
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="async-io")
+        self._stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self._stop.set)
+        self.queues = [asyncio.Queue(max(1, self.queue_size // self.workers)) for _ in range(self.workers)]
+        tasks = [asyncio.create_task(self._consumer(queue)) for queue in self.queues]
+
+        self.client.on_message = self._on_message
+        self.client.on_connect = self._on_connect
+        self.client.connect_async(self.mqtt_server, self.mqtt_port, 60)
+        self.client.loop_start()   # paho verbindet sich bei Abbruch selbstständig neu
+        await self._stop.wait()
+
+        # Beenden: keine neuen Nachrichten, gepufferte noch verarbeiten. loop_stop wartet auf den paho Thread,
+        # der ggf. selbst auf einen Platz in einer Queue wartet, darf die Event-Loop also nicht blockieren.
+        await self.loop.run_in_executor(self.executor, self.client.loop_stop)
+        for queue in self.queues:
+            await queue.join()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+    def start(self):
+        asyncio.run(self.run())
@@ -0,0 +1,240 @@
+import heapq
+import logging
+import threading
+
+# Überwachung von Batteriestand und Meldungen der Beacons mit gesammelten Alarmen.
+# Je Beacon werden der geglättete Batteriestand (exponentiell, smoothing), dessen Verlauf (Änderung je Tag, gemessen über
+# mindestens trend_period Sekunden) und die letzte Meldung gehalten. Aktualisiert bei jeder verarbeiteten Nachricht,
+# ohne Zugriff auf memcache oder Datenbank.
+# Alarme (kind):
+#   battery_low   geglätteter Batteriestand unter battery_threshold
+#   battery_ok    wieder mindestens battery_threshold + battery_hysteresis (z.B. Batterie getauscht)
+#   silent        seit silence Sekunden keine Nachricht des Beacons
+#   back          erste Nachricht eines stillen Beacons
+# Alarme entstehen nur beim Überschreiten einer Schwelle, nicht je Nachricht. Ein einziger Thread gibt sie alle interval
+# Sekunden gesammelt an alert (Liste von Alarmen) weiter. Bis dahin heben sich gegenläufige Alarme desselben Beacons auf
+# (silent und back, battery_low und battery_ok), gleichartige werden zusammengefasst.
+# Die Fristen für silent liegen wie im PresenceIndex in einem Min-Heap mit höchstens einem Eintrag je Beacon, der beim
+# Entnehmen mit der letzten Meldung verglichen wird. Der Aufwand hängt damit nur von Meldungen und Änderungen ab, es
+# gibt weder Timer je Beacon noch Abfragen der Datenbank. Die Zeit ist die der Nachrichten (größter bisher gesehener
+# Zeitstempel): fällt der MQTT Broker aus, gelten nicht alle Beacons als still.
+# Beim Start aus dem Zustand übernommene Beacons (load) gelten ohne Alarm als schwach bzw. still, die aktuellen Listen
+# liefert die Abfrage /monitor (über den HTTP-Endpunkt der Kennzahlen, siehe Metrics.MetricsServer).
+# Im Scale-Out überwacht jeder Worker nur seine eigenen Beacons.
+
+log = logging.getLogger(__name__)
+
+KINDS = ('battery_low', 'battery_ok', 'silent', 'back')
+# Gegenläufige Alarme heben sich auf, solange sie noch nicht ausgegeben wurden
+OPPOSITE = {'battery_low': 'battery_ok', 'battery_ok': 'battery_low', 'silent': 'back', 'back': 'silent'}
+
+
+# Zustand eines Beacons. battery None = noch kein Batteriestand gemeldet.
+class BeaconHealth:
+    __slots__ = ('last_seen', 'battery', 'rate', 'reference_time', 'reference_battery', 'low', 'silent')
+
+    def __init__(self, last_seen):
+        self.last_seen = last_seen
+        self.battery = None
+        self.rate = None              # Änderung des Batteriestands je Tag
+        self.reference_time = last_seen
+        self.reference_battery = None
+        self.low = False
+        self.silent = False
+
+
+class BeaconMonitor:
+    # alert: Funktion, die eine Liste von Alarmen ({beacon, kind, battery, rate, last_seen, ts}) erhält
+    # battery_threshold: Schwelle des Batteriestands (0 = keine Überwachung der Batterie)
+    # silence: Sekunden ohne Nachricht, nach denen ein Beacon als still gilt (0 = keine Überwachung)
+    def __init__(self, alert, battery_threshold=20, battery_hysteresis=5, silence=900, smoothing=0.3, interval=5,
+                 trend_period=3600):
+        self.alert = alert
+        self.battery_threshold = battery_threshold
+        self.battery_hysteresis = battery_hysteresis
+        self.silence = silence
+        self.smoothing = smoothing
+        self.interval = interval
+        self.trend_period = trend_period
+        self.beacons = {}    # beacon_id: BeaconHealth
+        self.now = 0
+        self.alerts = {kind: 0 for kind in KINDS}
+        self._pending = {}   # (beacon_id, 'battery' oder 'silence'): Alarm
+        self._heap = []      # (Frist, beacon_id)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Meldung eines Beacons mit Batteriestand (None, wenn nicht gemeldet)
+    def seen(self, beacon_id, batterie, timestamp):
+        with self._lock:
+            if timestamp > self.now:
+                self.now = timestamp
+            health = self.beacons.get(beacon_id)
+            if health is None:
+                health = self.beacons[beacon_id] = BeaconHealth(timestamp)
+                self._watch(beacon_id, timestamp)
+            elif timestamp < health.last_seen:
+                return   # ältere Nachricht, z.B. nach einem Reconnect
+            else:
+                health.last_seen = timestamp
+                if health.silent:
+                    health.silent = False
+                    self._watch(beacon_id, timestamp)
+                    self._queue(beacon_id, 'back', health)
+            if batterie is not None and self.battery_threshold > 0:
+                self._battery(beacon_id, health, batterie, timestamp, True)
+
+    def _watch(self, beacon_id, timestamp):
+        if self.silence > 0:
+            heapq.heappush(self._heap, (timestamp + self.silence, beacon_id))
+
+    # Glätten, Verlauf und Schwelle des Batteriestands. Muss mit gehaltenem _lock aufgerufen werden.
+    def _battery(self, beacon_id, health, batterie, timestamp, alert):
+        if health.battery is None:
+            health.battery = batterie
+            health.reference_time = timestamp
+            health.reference_battery = batterie
+        else:
+            health.battery += self.smoothing * (batterie - health.battery)
+            if timestamp - health.reference_time >= self.trend_period:
+                health.rate = (health.battery - health.reference_battery) * 86400 / (timestamp - health.reference_time)
+                health.reference_time = timestamp
+                health.reference_battery = health.battery
+        if not health.low and health.battery < self.battery_threshold:
+            health.low = True
+            if alert:
+                self._queue(beacon_id, 'battery_low', health)
+        elif health.low and health.battery >= self.battery_threshold + self.battery_hysteresis:
+            health.low = False
+            if alert:
+                self._queue(beacon_id, 'battery_ok', health)
+
+    # Vormerken eines Alarms bis zur nächsten Ausgabe. Muss mit gehaltenem _lock aufgerufen werden.
+    def _queue(self, beacon_id, kind, health):
+        key = (beacon_id, 'silence' if kind in ('silent', 'back') else 'battery')
+        pending = self._pending.get(key)
+        if pending is not None and pending['kind'] == OPPOSITE[kind]:
+            del self._pending[key]
+            return
+        self._pending[key] = {'beacon': beacon_id, 'kind': kind,
+                              'battery': round(health.battery, 1) if health.battery is not None else None,
+                              'rate': round(health.rate, 2) if health.rate is not None else None,
+                              'last_seen': health.last_seen, 'ts': self.now}
+
+    # Alle Beacons ohne Meldung seit silence Sekunden als still markieren. Muss mit gehaltenem _lock aufgerufen werden.
+    def _expire(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            _, beacon_id = heapq.heappop(self._heap)
+            health = self.beacons.get(beacon_id)
+            if health is None or health.silent:
+                continue
+            due = health.last_seen + self.silence
+            if due <= now:
+                health.silent = True
+                self._queue(beacon_id, 'silent', health)
+            else:
+                heapq.heappush(self._heap, (due, beacon_id))
+
+    # Übernahme der Beacons aus dem Zustand beim Start (Iterator von BeaconRecord), bereits bekannte bleiben unverändert
+    def load(self, records):
+        count = 0
+        with self._lock:
+            for record in records:
+                if record.beacon_id in self.beacons or not isinstance(record.timestamp, int):
+                    continue
+                health = self.beacons[record.beacon_id] = BeaconHealth(record.timestamp)
+                if isinstance(record.batterie, int) and self.battery_threshold > 0:
+                    self._battery(record.beacon_id, health, record.batterie, record.timestamp, False)
+                self._watch(record.beacon_id, record.timestamp)
+                if record.timestamp > self.now:
+                    self.now = record.timestamp
+                count += 1
+            # Bereits beim Start stille Beacons ohne Alarm markieren
+            pending = dict(self._pending)
+            self._expire(self.now)
+            self._pending = pending
+        return count
+
+    # Ein Durchlauf des Schedulers: fällige Fristen prüfen, gesammelte Alarme ausgeben
+    def run_once(self):
+        with self._lock:
+            self._expire(self.now)
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            self._pending = {}
+        for alert in batch:
+            self.alerts[alert['kind']] += 1
+        try:
+            self.alert(batch)
+        except Exception as e:
+            log.error("Error reporting beacon alerts: %s", e)
+        return len(batch)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="beacon-monitor", daemon=True)
+            self._thread.start()
+
+    # Beenden des Threads, vorgemerkte Alarme werden noch ausgegeben
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.run_once()
+
+    # Beacons mit schwacher Batterie bzw. ohne Meldung: [beacon_id, ...]
+    def low_battery(self):
+        with self._lock:
+            return sorted(beacon_id for beacon_id, health in self.beacons.items() if health.low)
+
+    def silent(self):
+        with self._lock:
+            return sorted(beacon_id for beacon_id, health in self.beacons.items() if health.silent)
+
+    # Stand für den Snapshot (State_Snapshot.py), JSON-fähig
+    def export(self):
+        with self._lock:
+            return {'now': self.now,
+                    'beacons': [[beacon_id, health.last_seen, health.battery, health.rate, health.reference_time,
+                                 health.reference_battery, health.low, health.silent]
+                                for beacon_id, health in self.beacons.items()]}
+
+    # Übernahme eines Stands aus export(), bisherige Einträge werden ersetzt
+    def restore(self, data):
+        with self._lock:
+            self.now = data['now']
+            self.beacons = {}
+            self._heap = []
+            for beacon_id, last_seen, battery, rate, reference_time, reference_battery, low, silent in data['beacons']:
+                health = self.beacons[beacon_id] = BeaconHealth(last_seen)
+                health.battery = battery
+                health.rate = rate
+                health.reference_time = reference_time
+                health.reference_battery = reference_battery
+                health.low = low
+                health.silent = silent
+                if not silent:
+                    self._watch(beacon_id, last_seen)
+
+    # Abfrage über HTTP, parts: Pfad nach /monitor. Rückgabe None = nicht gefunden
+    def query(self, parts):
+        if not parts:
+            return {'low_battery': self.low_battery(), 'silent': self.silent(), 'beacons': len(self)}
+        if len(parts) != 2 or parts[0] != 'beacon' or not parts[1].isdigit():
+            return None
+        with self._lock:
+            health = self.beacons.get(int(parts[1]))
+            if health is None:
+                return None
+            return {'beacon': int(parts[1]), 'last_seen': health.last_seen, 'battery': health.battery,
+                    'rate': health.rate, 'low': health.low, 'silent': health.silent}
+
+    def __len__(self):
+        return len(self.beacons)
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+
+# In-Prozess Zustandsspeicher für Hubs und Beacons.
+# Der Hot-Path liest und schreibt ausschließlich hier, der memcached wird im Hintergrund (write-behind)
+# nachgezogen, damit der Validity Check und andere Leser weiterhin dieselben Daten sehen.
+
+log = logging.getLogger(__name__)
+
+
+# Datensatz eines Hubs. Notation im Memcache: hub_MAC: [hub_id, timestamp, timestamp des letzten DB Updates]
+class HubRecord:
+    __slots__ = ('hub_id', 'timestamp', 'db_sync_timestamp')
+
+    def __init__(self, hub_id, timestamp, db_sync_timestamp):
+        self.hub_id = hub_id
+        self.timestamp = timestamp
+        self.db_sync_timestamp = db_sync_timestamp
+
+    def to_list(self):
+        return [self.hub_id, self.timestamp, self.db_sync_timestamp]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(values[0], values[1], values[2])
+
+    def __repr__(self):
+        return f"HubRecord({self.hub_id}, {self.timestamp}, {self.db_sync_timestamp})"
+
+# Datensatz eines Beacons. Die Reihenfolge entspricht dem bisherigen Array im Memcache:
+# [id, hub_id, rssi, timestamp, hub_ts_beginn, batterie, mp_typ, db_sync_timestamp]
+class BeaconRecord:
+    __slots__ = ('beacon_id', 'hub_id', 'rssi', 'timestamp', 'hub_ts_beginn', 'batterie', 'mp_typ', 'db_sync_timestamp')
+
+    def __init__(self, beacon_id, hub_id, rssi, timestamp, hub_ts_beginn, batterie, mp_typ, db_sync_timestamp):
+        self.beacon_id = beacon_id
+        self.hub_id = hub_id
+        self.rssi = rssi
+        self.timestamp = timestamp
+        self.hub_ts_beginn = hub_ts_beginn
+        self.batterie = batterie
+        self.mp_typ = mp_typ
+        self.db_sync_timestamp = db_sync_timestamp
+
+    def to_list(self):
+        return [self.beacon_id, self.hub_id, self.rssi, self.timestamp, self.hub_ts_beginn,
+                self.batterie, self.mp_typ, self.db_sync_timestamp]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values[:8])
+
+    def __repr__(self):
+        return "BeaconRecord(%s)" % ", ".join(str(value) for value in self.to_list())
+
+
+# Datensatz aus dem memcache als Record. Je nach Format (Cache_Serializer) liegt ein Record oder eine Liste vor.
+def as_hub(value):
+    if value is None or isinstance(value, HubRecord):
+        return value
+    return HubRecord.from_list(value)
+
+def as_beacon(value):
+    if value is None or isinstance(value, BeaconRecord):
+        return value
+    if len(value) < 8:
+        return None
+    return BeaconRecord.from_list(value)
+
+
+class StateStore:
+    # memcache: bestehender pymemcache Client, flush_interval: Sekunden zwischen zwei Write-Behind Läufen,
+    # unknown_retry: Sekunden, nach denen eine unbekannte MAC erneut in memcache/DB gesucht wird,
+    # unknown_max: höchstens so viele unbekannte MACs werden gemerkt (die ältesten fallen zuerst heraus)
+    # beacons: Speicher der Beacon-Datensätze, ein Dictionary oder eine Beacon_Table.BeaconTable (große Flotten)
+    # snapshot: optionale Funktion ohne Parameter, die alle snapshot_interval Sekunden und beim Beenden im
+    # Hintergrund-Thread aufgerufen wird (Sichern des Zustands auf Platte)
+    def __init__(self, memcache, flush_interval=1.0, unknown_retry=60, beacons=None, snapshot=None, snapshot_interval=0,
+                 unknown_max=100000):
+        self.memcache = memcache
+        self.flush_interval = flush_interval
+        self.unknown_retry = unknown_retry
+        self.unknown_max = unknown_max
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval
+        self.hubs = {}      # hub_MAC: HubRecord
+        self.beacons = beacons if beacons is not None else {}   # beacon_MAC: BeaconRecord
+        self._next_snapshot = time.monotonic() + snapshot_interval
+        self._unknown = {}  # MAC: timestamp der letzten erfolglosen Suche, in der Reihenfolge der Suchen
+        self._unknown_lock = threading.Lock()
+        self._dirty = {}    # MAC: Record, noch nicht in den memcache geschrieben
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Lesender Zugriff ohne Netzwerk. None bedeutet: nicht im Prozess bekannt.
+    def get_hub(self, hub_MAC):
+        return self.hubs.get(hub_MAC)
+
+    def get_beacon(self, beacon_MAC):
+        return self.beacons.get(beacon_MAC)
+
+    # Schreibender Zugriff. Records werden nicht verändert, sondern ersetzt, damit der Flush-Thread
+    # immer einen konsistenten Stand in den memcache schreibt.
+    def put_hub(self, hub_MAC, record, write_through=True):
+        self.hubs[hub_MAC] = record
+        self._unknown.pop(hub_MAC, None)
+        if write_through:
+            with self._lock:
+                self._dirty[hub_MAC] = record
+
+    def put_beacon(self, beacon_MAC, record, write_through=True):
+        self.beacons[beacon_MAC] = record
+        self._unknown.pop(beacon_MAC, None)
+        if write_through:
+            with self._lock:
+                self._dirty[beacon_MAC] = record
+
+    # Merken von MACs, die weder im memcache noch in der DB stehen, damit nicht jede Nachricht
+    # eines fremden Senders erneut eine Netzwerkabfrage auslöst.
+    # Fremde Sender (z.B. BLE mit zufälliger MAC) kommen laufend neu hinzu: der Eintrag wird ans Ende verschoben,
+    # über unknown_max hinaus fällt der älteste heraus, abgelaufene entfernt expire_unknown.
+    def mark_unknown(self, mac, timestamp):
+        with self._unknown_lock:
+            self._unknown.pop(mac, None)
+            self._unknown[mac] = timestamp
+            if len(self._unknown) > self.unknown_max:
+                del self._unknown[next(iter(self._unknown))]
+
+    def is_unknown(self, mac, timestamp):
+        last_try = self._unknown.get(mac)
+        return last_try is not None and timestamp - last_try < self.unknown_retry
+
+    # Entfernen der Einträge, die älter als unknown_retry vor der letzten erfolglosen Suche sind (Zeit der
+    # Nachrichten). Aufruf im Flush-Thread, Rückgabe: Anzahl entfernter Einträge
+    def expire_unknown(self):
+        removed = 0
+        with self._unknown_lock:
+            if not self._unknown:
+                return 0
+            before = self._unknown[next(reversed(self._unknown))] - self.unknown_retry
+            while self._unknown:
+                mac = next(iter(self._unknown))
+                if self._unknown[mac] > before:
+                    break
+                del self._unknown[mac]
+                removed += 1
+        return removed
+
+    # Nachladen eines einzelnen Datensatzes aus dem memcache (nur bei einem Miss im Prozess)
+    def load_hub(self, hub_MAC):
+        record = as_hub(self.memcache.get(hub_MAC))
+        if record is None:
+            return None
+        self.put_hub(hub_MAC, record, write_through=False)
+        return record
+
+    def load_beacon(self, beacon_MAC):
+        record = as_beacon(self.memcache.get(beacon_MAC))
+        if record is None:
+            return None
+        self.put_beacon(beacon_MAC, record, write_through=False)
+        return record
+
+    # Auswertungen über alle Beacons: ohne Nachricht seit before, Batteriestand unter threshold.
+    # Mit der BeaconTable ein Durchlauf über eine Spalte, sonst über alle Datensätze.
+    def stale_beacons(self, before):
+        if hasattr(self.beacons, 'stale'):
+            return self.beacons.stale(before)
+        return [mac for mac, record in list(self.beacons.items())
+                if isinstance(record.timestamp, int) and record.timestamp < before]
+
+    def low_battery(self, threshold):
+        if hasattr(self.beacons, 'low_battery'):
+            return self.beacons.low_battery(threshold)
+        return [mac for mac, record in list(self.beacons.items())
+                if isinstance(record.batterie, int) and record.batterie < threshold]
+
+    # Anzahl der noch nicht in den memcache geschriebenen Datensätze
+    def pending(self):
+        return len(self._dirty)
+
+    # Schreiben aller geänderten Datensätze in einem set_many in den memcache
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+        values = dict(dirty)
+        try:
+            failed = self.memcache.set_many(values)
+        except Exception as e:
+            log.error("Error writing state to memcache: %s", e)
+            failed = list(values)
+        if failed:
+            # Nicht geschriebene Einträge erneut vormerken, sofern sie nicht inzwischen ersetzt wurden
+            with self._lock:
+                for mac in failed:
+                    self._dirty.setdefault(mac, dirty[mac])
+        return len(values) - len(failed)
+
+    def write_snapshot(self):
+        self._next_snapshot = time.monotonic() + self.snapshot_interval
+        try:
+            self.snapshot()
+        except Exception as e:
+            log.error("Error writing state snapshot: %s", e)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self.expire_unknown()
+            if self.snapshot is not None and self.snapshot_interval > 0 and time.monotonic() >= self._next_snapshot:
+                self.write_snapshot()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="state-write-behind", daemon=True)
+            self._thread.start()
+
+    # Beenden des Hintergrund-Threads, verbleibende Änderungen werden noch geschrieben
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.snapshot is not None:
+            self.write_snapshot()
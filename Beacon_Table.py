@@ -0,0 +1,246 @@
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from Beacon_State import BeaconRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Spaltenweise Tabelle der Beacon-Datensätze für große Flotten (STATE_BEACON_STORE = table).
+# Statt eines BeaconRecord-Objekts je Beacon liegen die acht Felder in typisierten Arrays (array.array), eine Zeile je
+# Beacon, dazu der Index MAC -> Zeile. Das braucht etwa 44 Byte je Beacon statt mehrerer hundert für Objekt und
+# Ganzzahlen, und erlaubt Auswertungen über alle Beacons in einem Durchlauf einer Spalte (stale, low_battery), mit NumPy
+# vektorisiert, ohne NumPy als Schleife über das Array.
+# Die Tabelle verhält sich wie das bisherige Dictionary (get, [], items, values, len, in). get liefert jeweils einen neuen
+# BeaconRecord, Änderungen daran erreichen die Tabelle nur über ein erneutes Eintragen (wie bisher put_beacon).
+# None wird als kleinster Wert der Spalte gespeichert. Werte, die nicht in die Spalte passen (kein int, zu groß), bleiben
+# als BeaconRecord in other, wie der binäre memcache-Serializer sie als JSON schreibt.
+# Neue Zeilen werden unter einer Sperre angehängt, ebenso laufen die Auswertungen (NumPy hält dabei den Puffer der
+# Arrays, die sich in der Zeit nicht vergrößern dürfen). Das Überschreiben einer bestehenden Zeile braucht keine Sperre,
+# ein Beacon wird immer nur von einem Worker verarbeitet.
+# Wechselt ein Beacon nach other, bleibt seine Zeile für ihn reserviert (free) und wird wieder belegt, sobald seine Werte
+# erneut in die Spalten passen. Ungenutzte Zeilen werden beim Schreiben des Snapshots weggelassen.
+# Snapshot (save/load): Kopf, danach die MACs und die Spalten als Bytes, je auf 8 Byte ausgerichtet, so dass
+# die Datei auch direkt per mmap gelesen werden kann. Geschrieben wird in eine temporäre Datei, die danach ersetzt.
+
+FIELDS = BeaconRecord.__slots__
+# beacon_id, hub_id, rssi, timestamp, hub_ts_beginn, batterie, mp_typ, db_sync_timestamp
+TYPECODES = ('i', 'i', 'i', 'q', 'q', 'i', 'i', 'q')
+TIMESTAMP = FIELDS.index('timestamp')
+BATTERIE = FIELDS.index('batterie')
+
+MAGIC = b'ATSTAB1\n'
+# Zeilen, Länge der MACs, Länge der übrigen Datensätze (JSON), Byte-Reihenfolge (0 little, 1 big)
+HEADER = struct.Struct('<QQQB7x')
+
+
+def _none_value(typecode):
+    return -(1 << (array.array(typecode).itemsize * 8 - 1))
+
+def _padding(length):
+    return -length % 8
+
+# Datensätze mit anderen Typen (z.B. datetime aus der DB) fehlen im Snapshot und werden bei Bedarf neu geladen
+def _json_compatible(record):
+    return all(value is None or type(value) in (int, float, str) for value in record.to_list())
+
+
+class BeaconTable:
+    def __init__(self):
+        self.columns = [array.array(typecode) for typecode in TYPECODES]
+        self.none = [_none_value(typecode) for typecode in TYPECODES]
+        self._none_values = set(self.none)
+        self.rows = {}     # beacon_MAC: Zeile
+        self.macs = []     # Zeile: beacon_MAC, None für Zeilen, deren Beacon nach other gewechselt ist
+        self.other = {}    # beacon_MAC: BeaconRecord, Werte passen nicht in die Spalten
+        self.free = {}     # beacon_MAC: ungenutzte Zeile eines Beacons in other
+        self._lock = threading.Lock()
+
+    # Werte einer Zeile, None als Marker. TypeError, wenn ein Wert selbst dem Marker entspricht.
+    def _row_values(self, record):
+        values = record.to_list()
+        if self._none_values.intersection(values):
+            raise TypeError("value equals the None marker")
+        if None in values:
+            values = [none if value is None else value for value, none in zip(values, self.none)]
+        return values
+
+    def get(self, beacon_MAC, default=None):
+        row = self.rows.get(beacon_MAC)
+        if row is None:
+            return self.other.get(beacon_MAC, default)
+        values = [column[row] for column in self.columns]
+        # Nur wenn ein Feld None ist, werden die Spalten einzeln verglichen (in der Regel ist keines None)
+        if self._none_values.intersection(values):
+            values = [None if value == none else value for value, none in zip(values, self.none)]
+        return BeaconRecord(*values)
+
+    def __getitem__(self, beacon_MAC):
+        record = self.get(beacon_MAC)
+        if record is None:
+            raise KeyError(beacon_MAC)
+        return record
+
+    # Andere Typen als int lehnt das Array mit TypeError ab, zu große Werte mit OverflowError. Beim Überschreiben
+    # bleibt eine teilweise geschriebene Zeile ungenutzt (_to_other), vor dem Anhängen oder erneuten Belegen einer
+    # Zeile aus free wird jeder Wert geprüft.
+    def __setitem__(self, beacon_MAC, record):
+        try:
+            values = self._row_values(record)
+            row = self.rows.get(beacon_MAC)
+            if row is not None:
+                for column, value in zip(self.columns, values):
+                    column[row] = value
+                return
+            for column, value in zip(self.columns, values):
+                if type(value) is not int:
+                    raise TypeError(value)
+                array.array(column.typecode, (value,))
+            with self._lock:
+                row = self.free.pop(beacon_MAC, None)
+                if row is None:
+                    row = len(self.macs)
+                    for column, value in zip(self.columns, values):
+                        column.append(value)
+                    self.macs.append(beacon_MAC)
+                else:
+                    for column, value in zip(self.columns, values):
+                        column[row] = value
+                    self.macs[row] = beacon_MAC
+                self.rows[beacon_MAC] = row
+                self.other.pop(beacon_MAC, None)
+        except (TypeError, OverflowError):
+            self._to_other(beacon_MAC, record)
+
+    # Datensatz, der nicht in die Spalten passt. Eine bisherige Zeile bleibt für den Beacon in free reserviert.
+    def _to_other(self, beacon_MAC, record):
+        with self._lock:
+            row = self.rows.pop(beacon_MAC, None)
+            if row is not None:
+                self.macs[row] = None
+                self.free[beacon_MAC] = row
+            self.other[beacon_MAC] = record
+
+    def __contains__(self, beacon_MAC):
+        return beacon_MAC in self.rows or beacon_MAC in self.other
+
+    def __len__(self):
+        return len(self.rows) + len(self.other)
+
+    def items(self):
+        for beacon_MAC in list(self.rows):
+            record = self.get(beacon_MAC)
+            if record is not None:
+                yield beacon_MAC, record
+        yield from list(self.other.items())
+
+    def values(self):
+        return (record for _, record in self.items())
+
+    @classmethod
+    def from_items(cls, items):
+        table = cls()
+        for beacon_MAC, record in items:
+            table[beacon_MAC] = record
+        return table
+
+    # MACs aller Beacons, deren Wert in der Spalte bekannt und kleiner als threshold ist
+    def _below(self, position, threshold):
+        column = self.columns[position]
+        none = self.none[position]
+        with self._lock:
+            if numpy is not None:
+                values = numpy.frombuffer(column, dtype=column.typecode)
+                rows = numpy.flatnonzero((values < threshold) & (values != none)).tolist()
+                del values
+            else:
+                rows = [row for row, value in enumerate(column) if none != value < threshold]
+            result = [self.macs[row] for row in rows if self.macs[row] is not None]
+            for beacon_MAC, record in self.other.items():
+                value = getattr(record, FIELDS[position])
+                if isinstance(value, (int, float)) and value < threshold:
+                    result.append(beacon_MAC)
+        return result
+
+    # Beacons ohne Nachricht seit before (Unix-Zeit), z.B. before = jetzt - ROOM_TIMEGAP
+    def stale(self, before):
+        return self._below(TIMESTAMP, before)
+
+    # Beacons mit Batteriestand unter threshold
+    def low_battery(self, threshold):
+        return self._below(BATTERIE, threshold)
+
+    # Schreiben der Tabelle in eine geöffnete Datei (auch als Teil eines größeren Snapshots, siehe State_Snapshot.py).
+    # Ungenutzte Zeilen werden dabei weggelassen.
+    def write(self, file):
+        with self._lock:
+            if len(self.rows) == len(self.macs):
+                live = self.macs
+                columns = [column.tobytes() for column in self.columns]
+            else:
+                used = [row for row, mac in enumerate(self.macs) if mac is not None]
+                live = [self.macs[row] for row in used]
+                columns = [array.array(column.typecode, [column[row] for row in used]).tobytes()
+                           for column in self.columns]
+            count = len(live)
+            macs = '\n'.join(live).encode()
+            other = json.dumps({mac: record.to_list() for mac, record in self.other.items()
+                                if _json_compatible(record)}).encode()
+        file.write(MAGIC)
+        file.write(HEADER.pack(count, len(macs), len(other), 1 if sys.byteorder == 'big' else 0))
+        for data in [macs, other] + columns:
+            file.write(data)
+            file.write(b'\0' * _padding(len(data)))
+
+    # Lesen aus einem Puffer (bytes, mmap, memoryview), ValueError bei einem ungültigen oder abgeschnittenen Inhalt
+    @classmethod
+    def read(cls, data):
+        table = cls()
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a beacon table")
+        count, macs_length, other_length, big_endian = HEADER.unpack_from(data, len(MAGIC))
+        position = len(MAGIC) + HEADER.size
+        macs = bytes(data[position:position + macs_length]).decode().split('\n') if count else []
+        position += macs_length + _padding(macs_length)
+        other = json.loads(bytes(data[position:position + other_length]))
+        position += other_length + _padding(other_length)
+        for column in table.columns:
+            length = count * column.itemsize
+            if position + length > len(data):
+                raise ValueError("Beacon table is truncated")
+            column.frombytes(data[position:position + length])
+            if big_endian != (sys.byteorder == 'big'):
+                column.byteswap()
+            position += length + _padding(length)
+        table.macs = [mac or None for mac in macs]
+        table.rows = {mac: row for row, mac in enumerate(table.macs) if mac is not None}
+        table.other = {mac: BeaconRecord.from_list(values) for mac, values in other.items()}
+        return table
+
+    # Snapshot nur der Tabelle in eine eigene Datei
+    def save(self, path):
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            self.write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    # OSError, wenn die Datei fehlt, ValueError bei einem ungültigen oder abgeschnittenen Snapshot
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return cls.read(data)
+
+
+# Tabelle aus dem Speicher eines StateStore: die Tabelle selbst oder (STATE_BEACON_STORE = dict) eine Kopie
+def as_table(beacons):
+    if isinstance(beacons, BeaconTable):
+        return beacons
+    return BeaconTable.from_items(list(beacons.items()))
@@ -1,10 +1,17 @@
 import mysql.connector
 import time
 from pymemcache.client import base
-import json
+import Cache_Serializer
 import sys
 import os
+import logging
+import Service_Log
 from dotenv import load_dotenv, find_dotenv
+from DB_Pool import ConnectionPool
+import SQL_Statements
+from Pair_Registry import PairRegistry
+from Pair_Expiry import ExpiryEngine, deadline
+from Cache_Batch import CacheBatch
 
 # Laden der ungebungsabhängigen Konfigurationsparameter
 load_dotenv(find_dotenv('Default_Config.env'))
@@ -18,117 +25,122 @@ db_config = {
 }
 memcache_server = os.getenv('MEMCACHE_SERVER')
 memcache_port = os.getenv('MEMCACHE_PORT')
-db_connection = None    # Globale Variable zum Halten des DB connectors
-timegap = os.getenv('TIMEGAP')
-
-# Debug Level und Filter Funktion, Debug Meldungen aus dem Text können bitweise auf Leveln definiert werden
-debug_level = 2
-def do_debug(k):
-    temp = debug_level >> (k - 1)
-    return temp & 1 != 0
-
-# Serializer zur Memcache Nutzung, erleichten den Zugriff (Strings/Arrays statt bytes).
-def json_serializer(key, value):
-    return json.dumps(value), 1
-def json_deserializer(key, value, flags):
-    if flags == 1:
-        return json.loads(value)
-    raise Exception("Unknown serialization format")
+cache_format = os.getenv('CACHE_FORMAT', 'json')
+db_pool_health_interval = int(os.getenv('DB_POOL_HEALTH_INTERVAL', 30))
+db_pool_backoff_max = int(os.getenv('DB_POOL_BACKOFF_MAX', 60))
+db_pool_timeout = int(os.getenv('DB_POOL_TIMEOUT', 10))
+timegap = int(os.getenv('TIMEGAP', 30))
+# Sekunden zwischen zwei vollständigen Prüfungen aller Paare im Microservice. Dazwischen werden nur fällige
+# Gefährdungseinträge geprüft, die vollständige Prüfung findet nur Einträge ohne Frist (z.B. nach einem Absturz).
+validity_check_interval = int(os.getenv('VALIDITY_CHECK_INTERVAL', 600))
+pair_shards = int(os.getenv('PAIR_SHARDS', 64))
+# Sekunden bis zur erneuten Prüfung eines Paares, dessen Gefährdungseintrag sich beim Auflösen geändert hat
+RECHECK_DELAY = 1
+
+# Protokollierung (siehe Service_Log.py), nur für den Hinweis in main. Im Microservice gilt dessen Einrichtung.
+log_level = os.getenv('LOG_LEVEL')
+log_format = os.getenv('LOG_FORMAT', 'text')
+log_sample = int(os.getenv('LOG_SAMPLE', 1))
+log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+debug_level = int(os.getenv('DEBUG_LEVEL', 2))
+log = logging.getLogger('ats.validity_check')
+detail_log = logging.getLogger('ats.detail')
+
+# Serializer zur Memcache Nutzung, erleichten den Zugriff (Records/Arrays statt bytes).
+# Gelesen werden alle Formate, geschrieben wird im Format CACHE_FORMAT (siehe Cache_Serializer.py).
+cache_serializer = Cache_Serializer.serializer_for(cache_format)
 
 # Aufbau der globalen Verbindung zum memcached
-memcache = base.Client((memcache_server, memcache_port), serializer=json_serializer, deserializer=json_deserializer)
+memcache = base.Client((memcache_server, memcache_port), serializer=cache_serializer, deserializer=Cache_Serializer.deserializer)
+
+# Pool der Datenbankverbindungen. Der Microservice setzt beim Import seinen eigenen Pool ein.
+db_pool = ConnectionPool(db_config, 1, db_pool_health_interval, db_pool_backoff_max, db_pool_timeout)
+
+# Register der Beaconpaare, dieselben Schlüssel wie im Microservice
+registry = PairRegistry(memcache, pair_shards)
+# Ereignis-Feed des Microservice (siehe Event_Feed.py), None ohne Ereignis-Feed
+events = None
 
 # Funktion zum Auflösen eines Beaconpaars in der Datenbank und im Memcache
-def delete_beaconpair(beacon_id_1, beacon_id_2, DeleteFromArray):
+def delete_beaconpair(beacon_id_1, beacon_id_2):
     try:
-        cursor = db_connection.cursor()
         # Löschen der beiden möglichen Paarungen 1 + 2 oder 2 + 1 in der Datenbank
-        delete_query = '''
-            DELETE FROM beaconpair
-            WHERE (beaconpair_beacon_id_1 = %(id1)s AND beaconpair_beacon_id_2 = %(id2)s)
-               OR (beaconpair_beacon_id_1 = %(id2)s AND beaconpair_beacon_id_2 = %(id1)s)
-        '''
-        cursor.execute(delete_query, {'id1': beacon_id_1, 'id2': beacon_id_2})
-        db_connection.commit()
-        if do_debug(2): print(f"Beacon pair {beacon_id_1} and {beacon_id_2} dissolved in DB.")
-
-        # Erstellen der Namen der Datensätze im Memcache und holen der Datensätze
-        beaconpairs_key_1 = f'beaconpairs_{beacon_id_1}'
-        beaconpairs_key_2 = f'beaconpairs_{beacon_id_2}'
-        beaconpairs_temp_1 = memcache.get(beaconpairs_key_1)
-        beaconpairs_temp_2 = memcache.get(beaconpairs_key_2)
-        
-        # Für jeden der Datensätze: Entfernen der jeweils anderen Beacon ID.
-        # Zurückschreiben, wenn Paarungen verbleiben, sonst löschen 
-        if beaconpairs_temp_1:
-            beaconpairs_temp_1 = [id for id in beaconpairs_temp_1 if id != beacon_id_2]
-            if beaconpairs_temp_1 == []:
-                memcache.delete(beaconpairs_key_1)
-            else:
-                memcache.set(beaconpairs_key_1, beaconpairs_temp_1)
-        if beaconpairs_temp_2:
-            beaconpairs_temp_2 = [id for id in beaconpairs_temp_2 if id != beacon_id_1]
-            if beaconpairs_temp_2 == []:
-                memcache.delete(beaconpairs_key_2)
-            else:
-                memcache.set(beaconpairs_key_2, beaconpairs_temp_2)
-        if do_debug(2): print(f"Beacon pair {beacon_id_1} and {beacon_id_2} dissolved in Memcache.")
-        
-        beaconpairs_temp_all = memcache.get('beaconpairs')
-        beaconpairs_temp_all.pop(DeleteFromArray)
-        memcache.set('beaconpairs', beaconpairs_temp_all)
+        with db_pool.connection() as connection:
+            SQL_Statements.execute(connection, 'beaconpair_delete', (beacon_id_1, beacon_id_2, beacon_id_2, beacon_id_1))
+            connection.commit()
+        log.debug("Beacon pair %s and %s dissolved in DB.", beacon_id_1, beacon_id_2)
+
+        # Entfernen aus den Nachbarschaften beider Beacons und aus dem Shard des Paares
+        registry.remove(beacon_id_1, beacon_id_2)
+        log.debug("Beacon pair %s and %s dissolved in Memcache.", beacon_id_1, beacon_id_2)
+        if events is not None:
+            events.emit('unpair', beacons=[beacon_id_1, beacon_id_2], ts=int(time.time()))
 
     except mysql.connector.Error as err:
-        print(f"Error dissolving beacon pair in MySQL: {err}")
+        log.error("Error dissolving beacon pair in MySQL: %s", err)
+
+
+# Bestätigen eines abgelaufenen Gefährdungseintrags vor dem Auflösen: unverändert seit dem Lesen und per cas (mit
+# demselben Wert) gesichert. Hat der Microservice den Eintrag inzwischen gelöscht oder neu geschrieben (Paar wieder
+# zusammen, erneuter Hubwechsel), schlägt das fehl.
+def eintrag_bestaetigen(krit_key, krit_data):
+    value, token = memcache.gets(krit_key)
+    return value == krit_data and bool(memcache.cas(krit_key, value, token, noreply=False))
 
+# Funktion zum Überprüfen und Auflösen kritischer Mappings einer Liste von Paaren.
+# Alle Gefährdungseinträge werden mit einem get_many geholt. Ist auch nur einer der zwei möglichen Einträge
+# eines Paares älter als timegap, wird das Paar aufgelöst. Der abgelaufene Eintrag wird davor bestätigt
+# (eintrag_bestaetigen) und die Einträge sofort gelöscht, danach erst das Paar in der Datenbank. Wurde der Eintrag
+# zwischenzeitlich geändert, wird das Paar nach RECHECK_DELAY Sekunden mit dem neuen Stand erneut geprüft.
+# Rückgabe: {Paar: Frist} für Paare mit Gefährdungseintrag, der noch nicht abgelaufen ist
+def resolve_pairs(beaconpairs):
+    krit_keys = {}
+    for beacon_id_1, beacon_id_2 in beaconpairs:
+        krit_keys[(beacon_id_1, beacon_id_2)] = (f'beacon_mapping_krit_{beacon_id_1}_{beacon_id_2}',
+                                                 f'beacon_mapping_krit_{beacon_id_2}_{beacon_id_1}')
+    if not krit_keys:
+        return {}
+    pending = {}
+    with CacheBatch(memcache) as batch:
+        batch.fetch([key for keys in krit_keys.values() for key in keys])
+        # Nutzung der lokalen Zeit zur Prüfung, ob die Zeitgrenze zum Löschen erreicht ist
+        current_time = int(time.time())
+        for (beacon_id_1, beacon_id_2), (krit_key_1, krit_key_2) in krit_keys.items():
+            krit_data_1 = batch.get(krit_key_1)
+            krit_data_2 = batch.get(krit_key_2)
+            expired = [(key, data) for key, data in ((krit_key_1, krit_data_1), (krit_key_2, krit_data_2))
+                       if data and current_time - data[0] > timegap]
+            if expired:
+                if not eintrag_bestaetigen(*expired[0]):
+                    log.debug("Critical mapping %s changed, checking again.", expired[0][0])
+                    pending[(beacon_id_1, beacon_id_2)] = current_time + RECHECK_DELAY
+                    continue
+                memcache.delete_many([krit_key_1, krit_key_2])
+                log.debug("Critical mappings %s and %s dissolved.", krit_key_1, krit_key_2)
+                delete_beaconpair(beacon_id_1, beacon_id_2)
+            elif krit_data_1 or krit_data_2:
+                pending[(beacon_id_1, beacon_id_2)] = deadline(min(data[0] for data in (krit_data_1, krit_data_2) if data), timegap)
+    return pending
 
-# Funktion zum Überprüfen und Auflösen kritischer Mappings
+# Vollständige Prüfung aller aktuell eingetragenen Beacon-Pairs (Rückfallebene der Ablaufsteuerung)
 def beaconpaar_validity_check():
-    # Holen aller aktuell eingetragenen Beacon-Pairs
-    beaconpairs = memcache.get('beaconpairs')
-    if do_debug(4): print(beaconpairs)
-    # Wenn die Liste nicht leer ist, wird über einen Positionsindex durch die Liste iteriert.
-    # Der Positionsindex wird ebenfalls zum Löschen eines Eintrags der laufenden Liste verwendet.
-    if beaconpairs != None:
-        array_length = len(beaconpairs) # Bestimmen, wann der Aublauf beendet werden muss
-        pairposition = 0 # Die Position des aktuellen Pairs in der Liste. Kein! Hochzählen bei Löschen des aktuellen.
-        while pairposition < array_length:
-            beacon_id_1 = beaconpairs[pairposition].split(",")[0]
-            beacon_id_2 = beaconpairs[pairposition].split(",")[1]
-            # Erzeugung der Zugriffsnamen für die kritischen Mapping-Einträge und holen dieser Werte
-            krit_key_1 = f'beacon_mapping_krit_{beacon_id_1}_{beacon_id_2}'
-            krit_key_2 = f'beacon_mapping_krit_{beacon_id_2}_{beacon_id_1}'
-            krit_data_1 = memcache.get(krit_key_1)
-            krit_data_2 = memcache.get(krit_key_2)
-            # Nutzung der lokalen Zeit zur Prüfung, ob die Zeitgrenze zum Löschen erreicht ist
-            current_time = int(time.time())
-            # Wenn auch nur eines der möglichen zwei Einträge zu alt ist, dann Löschen des Paares
-            if krit_data_1 and current_time - krit_data_1[0] > 30 or krit_data_2 and current_time - krit_data_2[0] > 30:
-                delete_beaconpair(beacon_id_1, beacon_id_2, pairposition)
-                memcache.delete(krit_key_1)
-                if do_debug(2):
-                    print(f"Critical mapping {krit_key_1} dissolved.")
-                memcache.delete(krit_key_2)
-                if do_debug(2):
-                    print(f"Critical mapping {krit_key_2} dissolved.")
-            else:
-                pairposition +=1    # nächste Position, da aktuelle nicht gelöscht wurde
-
-# Hauptprogramm
+    beaconpairs = list(registry.pairs())
+    detail_log.debug("%s", beaconpairs)
+    return resolve_pairs(beaconpairs)
+
+# Ablaufsteuerung: fällige Gefährdungseinträge zu ihrer Frist prüfen, alle Paare nur alle validity_check_interval Sekunden.
+# Der Microservice nutzt dieselbe Instanz und trägt neue Gefährdungseinträge direkt ein.
+expiry = ExpiryEngine(resolve_pairs, timegap, beaconpaar_validity_check, validity_check_interval)
+
+# Früheres Hauptprogramm. Die Ablaufsteuerung der Gefährdungseinträge läuft im Microservice (in beiden Laufzeiten),
+# ein zusätzlich gestarteter Validity Check würde dieselben Paare ein zweites Mal prüfen. Daher nur ein Hinweis.
 def main():
-    # Prüfen, ob memcache und Datenbank verbunden sind
-    try:
-        memcache.set('some_key', 'some value')
-    except Exception as e:
-        sys.exit(50) # erfolgt, wenn obiger Befehl fehlschlägt / memchaed nicht verfügbar ist
-    # memcache.flush_all() # nur zum Testen mit einem leeren memcached
-    # Verbindung zur Datenbank herstellen
-    try:
-        db_connection = mysql.connector.connect(**db_config)
-    except mysql.connector.Error as err:
-        exit(1) # Beenden des Programms mit dem Returnwert 1. Ohne Datenbank ist keine Verarbeitung möglich.
-    # Dauerhaftes Prüfen aller Beacon Paare. Die DB connection wird jede Minute genutzt, bleibt daher geöffnet.
-    while True:
-        beaconpaar_validity_check()
-        time.sleep(60)  # 1 Minute warten
-main()
+    Service_Log.setup(log_level, log_format, log_sample, log_queue_size, debug_level)
+    log.warning("Beaconpair_Validity_check.py no longer runs on its own, critical beacon pairs are resolved by Main_Microservice.py")
+    Service_Log.stop()
+    return 1
+
+# Beim Import durch den Microservice wird nichts ausgeführt
+if __name__ == '__main__':
+    sys.exit(main())
+
@@ -0,0 +1,322 @@
+import threading
+import time
+import SQL_Statements
+
+# Stand-ins für memcached und MySQL im Benchmark (Benchmark.py --backend fake), ohne Server und ohne Netzwerk.
+# FakeMemcache verhält sich für die genutzten Aufrufe wie der pymemcache Client und nutzt dessen serializer/deserializer,
+# die Kosten der Serialisierung sind also enthalten. FakeDatabase beantwortet die Statements aus SQL_Statements.py
+# und die Abfragen des Warm-up auf Tabellen im Speicher, gefüllt aus der Welt einer Workload (siehe Workload.py).
+# delay: künstliche Dauer je Aufruf in Sekunden, z.B. 0.0002 für die Latenz eines Servers im lokalen Netz.
+
+
+class FakeMemcache:
+    def __init__(self, serializer=None, deserializer=None, delay=0.0):
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.delay = delay
+        self._values = {}    # Schlüssel: (Daten, Flags, Ablaufzeitpunkt oder 0, cas Token)
+        self._token = 0
+        self._lock = threading.Lock()
+
+    def _roundtrip(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+    def _encode(self, key, value, expire):
+        if self.serializer is not None:
+            data, flags = self.serializer(key, value)
+        else:
+            data, flags = value, 0
+        self._token += 1
+        return data, flags, time.monotonic() + expire if expire else 0, self._token
+
+    def _decode(self, key, entry):
+        if self.deserializer is None:
+            return entry[0]
+        return self.deserializer(key, entry[0], entry[1])
+
+    # Eintrag zu key oder None, abgelaufene Einträge werden entfernt
+    def _entry(self, key):
+        entry = self._values.get(key)
+        if entry is not None and entry[2] and entry[2] <= time.monotonic():
+            del self._values[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        self._roundtrip()
+        with self._lock:
+            entry = self._entry(key)
+        return default if entry is None else self._decode(key, entry)
+
+    def get_many(self, keys):
+        self._roundtrip()
+        result = {}
+        with self._lock:
+            entries = [(key, self._entry(key)) for key in keys]
+        for key, entry in entries:
+            if entry is not None:
+                result[key] = self._decode(key, entry)
+        return result
+
+    def gets(self, key, default=None, cas_default=None):
+        self._roundtrip()
+        with self._lock:
+            entry = self._entry(key)
+        if entry is None:
+            return default, cas_default
+        return self._decode(key, entry), entry[3]
+
+    def set(self, key, value, expire=0, noreply=None, flags=None):
+        self._roundtrip()
+        with self._lock:
+            self._values[key] = self._encode(key, value, expire)
+        return True
+
+    # Rückgabe wie pymemcache: Liste der nicht geschriebenen Schlüssel
+    def set_many(self, values, expire=0, noreply=None, flags=None):
+        self._roundtrip()
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._encode(key, value, expire)
+        return []
+
+    def add(self, key, value, expire=0, noreply=None, flags=None):
+        self._roundtrip()
+        with self._lock:
+            if self._entry(key) is not None:
+                return False
+            self._values[key] = self._encode(key, value, expire)
+        return True
+
+    # Rückgabe wie pymemcache: True geschrieben, False anderes cas Token, None Schlüssel nicht vorhanden
+    def cas(self, key, value, cas, expire=0, noreply=False, flags=None):
+        self._roundtrip()
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                return None
+            if entry[3] != int(cas):
+                return False
+            self._values[key] = self._encode(key, value, expire)
+        return True
+
+    def delete(self, key, noreply=None):
+        self._roundtrip()
+        with self._lock:
+            deleted = self._values.pop(key, None) is not None
+        return deleted if noreply is False else True
+
+    def delete_many(self, keys, noreply=None):
+        self._roundtrip()
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+        return True
+
+    def flush_all(self, delay=0, noreply=None):
+        with self._lock:
+            self._values.clear()
+        return True
+
+    def close(self):
+        pass
+
+
+# Spalten der Tabellen, wie sie die Abfragen des Microservice erwarten
+COLUMNS = {
+    'hub': ('hub_id', 'hub_MAC', 'hub_timestamp'),
+    'beacon_left_join_mp': ('beacon_id', 'beacon_MAC', 'beacon_hub_id', 'beacon_RSSI', 'beacon_timestamp',
+                            'beacon_hub_ts_beginn', 'beacon_batterie', 'mp_mp_typ_id'),
+    'mp_mapping': ('mp_mapping_mp_typ_id_1', 'mp_mapping_mp_typ_id_2'),
+    'beaconpair': ('beaconpair_beacon_id_1', 'beaconpair_beacon_id_2', 'beaconpair_timestamp', 'beaconpair_hub_id'),
+}
+
+
+class FakeDatabase:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.hubs = {}       # hub_MAC: [hub_id, hub_timestamp]
+        self.beacons = {}    # beacon_MAC: [Spalten aus beacon_left_join_mp]
+        self.beacon_macs = {}
+        self.mp_mapping = []
+        self.beaconpairs = []
+        self._lock = threading.Lock()
+        self._statements = {
+            SQL_Statements.statements['hub_select'].sql: self._hub_select,
+            SQL_Statements.statements['beacon_select'].sql: self._beacon_select,
+            SQL_Statements.statements['hub_update'].sql: self._hub_update,
+            SQL_Statements.statements['beacon_update'].sql: self._beacon_update,
+            SQL_Statements.statements['beaconpair_insert'].sql: self._beaconpair_insert,
+            SQL_Statements.statements['beaconpair_delete'].sql: self._beaconpair_delete,
+        }
+        self._many = [(SQL_Statements.many_statements['hub_select_many'].sql.split('{')[0], self._hub_select_many),
+                      (SQL_Statements.many_statements['beacon_select_many'].sql.split('{')[0], self._beacon_select_many)]
+
+    # Tabellen aus der Welt einer Workload: alle Beacons sind ihrem Heimat-Hub bereits zugeordnet (Betrieb nach
+    # einem Neustart), die bestehenden Paare stehen in beaconpair
+    @classmethod
+    def from_workload(cls, workload, delay=0.0):
+        database = cls(delay)
+        timestamp = workload.start_time - 60
+        for index, mac in workload.hub_macs.items():
+            database.hubs[mac] = [index, timestamp]
+        for beacon in workload.beacons:
+            database.beacons[beacon.mac] = [beacon.beacon_id, beacon.mac, beacon.hub, 200, timestamp, timestamp,
+                                            beacon.batterie, beacon.mp_typ]
+            database.beacon_macs[beacon.beacon_id] = beacon.mac
+        database.mp_mapping = [[mp_typ_id_1, mp_typ_id_2] for mp_typ_id_1, mp_typ_id_2 in workload.mp_mapping]
+        for first, second in workload.existing_pairs:
+            database.beaconpairs.append([min(first.beacon_id, second.beacon_id), max(first.beacon_id, second.beacon_id),
+                                         timestamp, first.hub])
+        return database
+
+    # Tabellen aus den MACs eines Mitschnitts (Traffic_Replay.py): jeder Hub und Beacon bekommt eine Id in der
+    # Reihenfolge des ersten Auftretens, die Beacons sind noch keinem Hub zugeordnet, ohne MP-Typen und Paare
+    @classmethod
+    def from_macs(cls, hub_MACs, beacon_MACs, timestamp, delay=0.0):
+        database = cls(delay)
+        for hub_id, mac in enumerate(hub_MACs, 1):
+            database.hubs[mac] = [hub_id, timestamp]
+        for beacon_id, mac in enumerate(beacon_MACs, 1):
+            database.beacons[mac] = [beacon_id, mac, None, None, timestamp, None, None, None]
+            database.beacon_macs[beacon_id] = mac
+        return database
+
+    # Ersatz für mysql.connector.connect (siehe DB_Pool.ConnectionPool)
+    def connect(self, **config):
+        return FakeConnection(self)
+
+    def roundtrip(self):
+        if self.delay:
+            time.sleep(self.delay)
+
+    # Ausführen einer Abfrage, Rückgabe: (Spalten, Zeilen)
+    def query(self, sql, params):
+        with self._lock:
+            handler = self._statements.get(sql)
+            if handler is not None:
+                return handler(*params)
+            for prefix, handler in self._many:
+                if sql.startswith(prefix):
+                    return handler(params)
+            words = sql.split()
+            if len(words) == 4 and words[0].upper() == 'SELECT' and words[1] == '*' and words[2].upper() == 'FROM':
+                return self._select_all(words[3])
+        raise ValueError(f"Statement not supported by FakeDatabase: {sql}")
+
+    def _select_all(self, table):
+        columns = COLUMNS.get(table)
+        if columns is None:
+            raise ValueError(f"Table not supported by FakeDatabase: {table}")
+        if table == 'hub':
+            rows = [(hub_id, mac, hub_timestamp) for mac, (hub_id, hub_timestamp) in self.hubs.items()]
+        elif table == 'beacon_left_join_mp':
+            rows = [tuple(row) for row in self.beacons.values()]
+        elif table == 'mp_mapping':
+            rows = [tuple(row) for row in self.mp_mapping]
+        else:
+            rows = [tuple(row) for row in self.beaconpairs]
+        return columns, rows
+
+    def _hub_select(self, hub_MAC):
+        hub = self.hubs.get(hub_MAC)
+        return ('hub_id', 'hub_timestamp'), [tuple(hub)] if hub is not None else []
+
+    def _beacon_select(self, beacon_MAC):
+        row = self.beacons.get(beacon_MAC)
+        columns = COLUMNS['beacon_left_join_mp']
+        if row is None:
+            return columns[:1] + columns[2:], []
+        return columns[:1] + columns[2:], [(row[0],) + tuple(row[2:])]
+
+    def _hub_select_many(self, hub_MACs):
+        return ('hub_MAC', 'hub_id', 'hub_timestamp'), [(mac,) + tuple(self.hubs[mac]) for mac in hub_MACs if mac in self.hubs]
+
+    def _beacon_select_many(self, beacon_MACs):
+        columns = COLUMNS['beacon_left_join_mp']
+        rows = [(mac, row[0]) + tuple(row[2:]) for mac, row in ((mac, self.beacons.get(mac)) for mac in beacon_MACs) if row is not None]
+        return (columns[1], columns[0]) + columns[2:], rows
+
+    def _hub_update(self, hub_timestamp, hub_id):
+        for hub in self.hubs.values():
+            if hub[0] == hub_id:
+                hub[1] = hub_timestamp
+        return (), []
+
+    def _beacon_update(self, hub_id, rssi, timestamp, ts_beginn, batterie, beacon_id):
+        row = self.beacons.get(self.beacon_macs.get(beacon_id))
+        if row is not None:
+            row[2:7] = [hub_id, rssi, timestamp, ts_beginn, batterie]
+        return (), []
+
+    def _beaconpair_insert(self, beacon_id_1, beacon_id_2, timestamp, hub_id):
+        self.beaconpairs.append([beacon_id_1, beacon_id_2, timestamp, hub_id])
+        return (), []
+
+    def _beaconpair_delete(self, beacon_id_1, beacon_id_2, beacon_id_3, beacon_id_4):
+        pairs = {(beacon_id_1, beacon_id_2), (beacon_id_3, beacon_id_4)}
+        self.beaconpairs = [row for row in self.beaconpairs if (row[0], row[1]) not in pairs]
+        return (), []
+
+
+# Verbindung und Cursor mit den Aufrufen, die DB_Pool, SQL_Statements und der Warm-up nutzen
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, prepared=False, dictionary=False, buffered=None):
+        return FakeCursor(self.database, dictionary)
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, database, dictionary=False):
+        self.database = database
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        self.database.roundtrip()
+        columns, rows = self.database.query(sql, tuple(params or ()))
+        if self.dictionary:
+            rows = [dict(zip(columns, row)) for row in rows]
+        self.rows = rows
+        self.rowcount = len(rows)
+
+    # Ein Aufruf für alle Parametersätze, wie beim Server
+    def executemany(self, sql, rows):
+        self.database.roundtrip()
+        for params in rows:
+            self.database.query(sql, tuple(params))
+        self.rows = []
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        self.rows = []
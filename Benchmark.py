@@ -0,0 +1,378 @@
+import argparse
+import collections
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from Workload import Workload
+
+# Benchmark der gesamten Verarbeitung mit reproduzierbarer Last (siehe Workload.py).
+# Der Microservice läuft in diesem Prozess mit seiner Konfiguration aus Default_Config.env (Pipeline, Micro-Batch,
+# Raumzuordnung, ...). Einzelne Werte lassen sich mit --set KEY=VALUE überschreiben, ohne die Datei zu ändern.
+# Transport:
+#   inprocess  die Nachrichten gehen direkt an nachricht_annehmen, wie aus dem MQTT Callback
+#   broker     die Nachrichten werden über den konfigurierten Broker gesendet und vom Microservice empfangen
+#              (ein lokaler Broker ohne Zeitstempel-Erweiterung, z.B. mosquitto -p 1883, MQTT_SERVER = localhost)
+# Backend:
+#   fake       memcache und Datenbank im Speicher (Bench_Fakes.py), gefüllt aus der Welt der Workload
+#   local      der konfigurierte memcached und die MySQL Datenbank, z.B. lokale Instanzen mit Testdaten
+# Gemessen wird nach einem Aufwärmen (--warmup-messages): Durchsatz, Latenz je Nachricht von der Annahme bis zum Ende
+# der Verarbeitung (p50/p99/max) und die memcache- und DB-Operationen je Nachricht (aus ats_memcache_seconds und
+# ats_db_statement_seconds, einschließlich der Schreibvorgänge im Hintergrund bis zum Beenden).
+# Ohne --paced wird so schnell wie möglich gesendet: das misst den Durchsatz, die Latenz enthält dann im Pipeline- und
+# Micro-Batch Modus die Wartezeit im Puffer. Für den Vergleich der Latenz mit --paced und einer Rate unter dem Durchsatz messen.
+# Der Bericht wird als JSON geschrieben (--output) und kann mit einem früheren Bericht verglichen werden (--compare).
+# Aufruf:
+#   python Benchmark.py --messages 20000 --output bench/1.4.json
+#   python Benchmark.py --set BATCH_SIZE=50 --compare bench/1.4.json
+#   python Benchmark.py --transport broker --rate 500 --paced --backend local
+
+PERCENTILES = (('p50', 0.50), ('p90', 0.90), ('p99', 0.99))
+
+
+# Festhalten der Annahme und des Endes der Verarbeitung jeder Nachricht. parse_message, wiederholung und
+# nachricht_verarbeiten des Microservice werden dazu ersetzt, der Weg durch Pipeline, Micro-Batch oder MQTT bleibt unverändert.
+class LatencyProbe:
+    def __init__(self, service):
+        self.submitted = {}   # Nachricht (bytes): Zeitpunkte der Annahme, mehrere bei gleichen Nachrichten
+        self.started = {}     # id der zerlegten Nachricht: Zeitpunkt der Annahme
+        self.latencies = []
+        self.completed = 0
+        self.last_done = 0.0
+        self._lock = threading.Lock()
+        parse_message = service.parse_message
+        wiederholung = service.wiederholung
+        nachricht_verarbeiten = service.nachricht_verarbeiten
+
+        def timed_parse_message(message):
+            submitted = self.taken(message)
+            try:
+                data_values = parse_message(message)
+            except Exception:
+                self.done(None)
+                raise
+            self.started[id(data_values)] = submitted
+            return data_values
+
+        # Vom Dedup-Index verworfene Nachrichten sind damit fertig
+        def timed_wiederholung(data_values):
+            if wiederholung(data_values):
+                self.done(self.started.pop(id(data_values), None))
+                return True
+            return False
+
+        def timed_nachricht_verarbeiten(data_values):
+            try:
+                nachricht_verarbeiten(data_values)
+            finally:
+                self.done(self.started.pop(id(data_values), None))
+
+        service.parse_message = timed_parse_message
+        service.wiederholung = timed_wiederholung
+        service.nachricht_verarbeiten = timed_nachricht_verarbeiten
+
+    def submit(self, message):
+        now = time.perf_counter()
+        with self._lock:
+            self.submitted.setdefault(message, collections.deque()).append(now)
+
+    def taken(self, message):
+        with self._lock:
+            times = self.submitted.get(message)
+            if not times:
+                return None
+            submitted = times.popleft()
+            if not times:
+                del self.submitted[message]
+            return submitted
+
+    def done(self, submitted):
+        now = time.perf_counter()
+        with self._lock:
+            self.completed += 1
+            self.last_done = now
+            if submitted is not None:
+                self.latencies.append(now - submitted)
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.completed = 0
+
+    # Warten, bis count Nachrichten verarbeitet oder verworfen sind. Rückgabe: False bei Ablauf von timeout
+    def wait(self, count, dropped, timeout):
+        deadline = time.monotonic() + timeout
+        while self.completed + dropped() < count:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+
+# Zählerstände der Kennzahlen je Label: Anzahl Beobachtungen der Histogramme bzw. Wert der Zähler
+def zaehlerstaende(metrics):
+    result = {}
+    for name in ('ats_memcache_seconds', 'ats_db_statement_seconds', 'ats_messages_total', 'ats_pairing_total',
+                 'ats_critical_pairs_total'):
+        family = metrics.registry.families.get(name)
+        if family is None:
+            continue
+        values = {}
+        for labels, child in list(family.children.items()):
+            values[labels[0]] = sum(child.counts) if isinstance(child, metrics.Histogram) else child.value
+        result[name] = values
+    return result
+
+def differenz(before, after):
+    result = {}
+    for name, values in after.items():
+        previous = before.get(name, {})
+        result[name] = {label: value - previous.get(label, 0) for label, value in values.items()
+                        if value - previous.get(label, 0)}
+    return result
+
+def je_nachricht(values, count):
+    result = {label: round(value / count, 4) for label, value in sorted(values.items())}
+    result['total'] = round(sum(values.values()) / count, 4)
+    return result
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Senden der Nachrichten. paced: im Takt von workload.rate, sonst so schnell wie möglich.
+def senden(messages, rate, paced, send):
+    start = time.perf_counter()
+    for index, message in enumerate(messages):
+        if paced:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0.001:
+                time.sleep(delay)
+        send(message)
+    return start
+
+def inprocess_senden(service, probe, messages, rate, paced):
+    def send(message):
+        probe.submit(message)
+        service.nachricht_annehmen(message)
+    return senden(messages, rate, paced, send)
+
+def broker_senden(service, probe, messages, rate, paced):
+    import paho.mqtt.client as mqtt
+    publisher = mqtt.Client()
+    publisher.username_pw_set(os.getenv('MQTT_USER'), os.getenv('MQTT_PW'))
+    publisher.connect(service.mqtt_server, service.mqtt_port, 60)
+    publisher.loop_start()
+
+    def send(message):
+        probe.submit(message)
+        publisher.publish(service.mqtt_topic, message)
+    try:
+        return senden(messages, rate, paced, send)
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+
+# Empfang über den Broker wie in mqtt_loop, ohne dessen Endlosschleife
+def broker_verbinden(service):
+    service.client.on_connect = service.on_mqtt_connect
+    service.client.on_message = service.on_mqtt_message
+    service.client.connect(service.mqtt_server, service.mqtt_port, 60)
+    service.client.loop_start()
+    deadline = time.monotonic() + 10
+    while not service.client.is_connected():
+        if time.monotonic() >= deadline:
+            raise SystemExit(f"No connection to MQTT broker {service.mqtt_server}:{service.mqtt_port}")
+        time.sleep(0.05)
+    time.sleep(0.5)   # Abonnement bestätigen lassen
+
+
+# Laden des Microservice mit den Werten aus --set, ohne Endpunkt der Kennzahlen
+def dienst_laden(settings):
+    for setting in settings:
+        key, _, value = setting.partition('=')
+        os.environ[key] = value
+    import Main_Microservice as service
+    if service.runtime_mode == 'asyncio':
+        raise SystemExit("RUNTIME_MODE = asyncio is not supported by the benchmark, use blocking")
+    service.metrics_port = 0
+    service.capture = None   # kein Mitschnitt der eigenen Last
+    return service
+
+# Backend fake: Datenbank und memcache des Microservice durch die Stand-ins aus Bench_Fakes.py ersetzen
+def fakes_einsetzen(service, database, delay):
+    import Cache_Serializer
+    from Bench_Fakes import FakeMemcache
+    database.delay = delay
+    service.db_pool.connect = database.connect
+    service.memcache.use(FakeMemcache(service.cache_serializer, Cache_Serializer.deserializer, delay))
+
+def konfiguration(service, settings):
+    return {'pipeline_workers': service.pipeline_workers, 'batch_size': service.batch_size,
+            'runtime_mode': service.runtime_mode, 'cache_format': service.cache_format,
+            'room_assignment': service.room_assignment_mode, 'db_write_batch_size': service.db_write_batch_size,
+            'state_flush_interval': service.state_flush_interval, 'settings': settings}
+
+# Messwerte eines Laufs: count gesendete Nachrichten ab start, counts aus differenz()
+def messwerte(probe, count, start, complete, lost, counts):
+    duration = probe.last_done - start
+    latencies = sorted(probe.latencies)
+    result = {
+        'messages': count,
+        'complete': complete,
+        'dropped': lost,
+        'seconds': round(duration, 4),
+        'throughput': round(probe.completed / duration, 1) if duration > 0 else None,
+        'latency_ms': {name: round(percentile(latencies, fraction) * 1000, 4) if latencies else None
+                       for name, fraction in PERCENTILES},
+        'cache_ops_per_message': je_nachricht(counts.get('ats_memcache_seconds', {}), count),
+        'db_ops_per_message': je_nachricht(counts.get('ats_db_statement_seconds', {}), count),
+        'outcomes': counts.get('ats_messages_total', {}),
+        'pairing': counts.get('ats_pairing_total', {}),
+        'critical_pairs': counts.get('ats_critical_pairs_total', {}),
+    }
+    result['latency_ms']['max'] = round(latencies[-1] * 1000, 4) if latencies else None
+    result['latency_ms']['mean'] = round(sum(latencies) / len(latencies) * 1000, 4) if latencies else None
+    return result
+
+
+def run(args):
+    workload = Workload(args.seed, args.beacons, args.hubs, args.rate, args.hub_change_ratio, args.noise_ratio,
+                        args.button_ratio, args.pairing_ratio, args.unknown_ratio)
+    service = dienst_laden(args.set)
+    import Metrics
+    if args.backend == 'fake':
+        from Bench_Fakes import FakeDatabase
+        fakes_einsetzen(service, FakeDatabase.from_workload(workload), args.fake_delay_us / 1e6)
+    probe = LatencyProbe(service)
+    service.start_services()
+    if args.transport == 'broker':
+        broker_verbinden(service)
+    send = broker_senden if args.transport == 'broker' else inprocess_senden
+    messages = list(workload.messages(args.warmup_messages + args.messages))
+    dropped_start = service.verworfen()
+
+    def dropped():
+        return service.verworfen() - dropped_start
+
+    # Aufwärmen: Zustand im Prozess, vorbereitete Statements, Fenster der Raumzuordnung
+    send(service, probe, messages[:args.warmup_messages], workload.rate, args.paced)
+    complete = probe.wait(args.warmup_messages, dropped, args.timeout)
+    probe.reset()
+    before = zaehlerstaende(Metrics)
+    dropped_start = service.verworfen()
+    measured = messages[args.warmup_messages:]
+    start = send(service, probe, measured, workload.rate, args.paced)
+    complete = probe.wait(len(measured), dropped, args.timeout) and complete
+    lost = dropped()
+    service.shutdown()
+    report = {
+        'label': args.label,
+        'revision': revision(),
+        'python': platform.python_version(),
+        'transport': args.transport,
+        'backend': args.backend,
+        'paced': args.paced,
+        'workload': workload.settings(),
+        'config': konfiguration(service, args.set),
+    }
+    report.update(messwerte(probe, len(measured), start, complete, lost, differenz(before, zaehlerstaende(Metrics))))
+    return report
+
+
+def bezeichnung(report):
+    revision_text = report.get('revision') or 'ohne git'
+    return f"{report['label']} ({revision_text})" if report.get('label') else revision_text
+
+def ausgeben(report):
+    print(f"Benchmark {bezeichnung(report)}, Python {report['python']}: {report['messages']} Nachrichten, "
+          f"{report['transport']}/{report['backend']}, Seed {report['workload']['seed']}")
+    messwerte_ausgeben(report)
+
+def messwerte_ausgeben(report):
+    if not report['complete']:
+        print("  Achtung: nicht alle Nachrichten wurden innerhalb des Timeouts verarbeitet")
+    if report['dropped']:
+        print(f"  Verworfen (Pipeline voll): {report['dropped']}")
+    latency = report['latency_ms']
+    print(f"  Durchsatz           {report['throughput']} Nachrichten/s ({report['seconds']} s)")
+    print(f"  Latenz ms           p50 {latency['p50']}  p90 {latency['p90']}  p99 {latency['p99']}  max {latency['max']}")
+    for name, key in (('memcache/Nachricht', 'cache_ops_per_message'), ('DB/Nachricht', 'db_ops_per_message')):
+        values = report[key]
+        details = ', '.join(f"{label} {value}" for label, value in values.items() if label != 'total')
+        print(f"  {name:<19} {values['total']}  ({details})")
+    print(f"  Ergebnisse          {', '.join(f'{label} {value}' for label, value in sorted(report['outcomes'].items()))}")
+    if report['pairing'] or report['critical_pairs']:
+        print(f"  Paarungen           {report['pairing']}  Gefährdungseinträge {report['critical_pairs']}")
+
+# Gegenüberstellung mit einem früheren Bericht. Die Änderung ist so gerechnet, dass positiv besser bedeutet.
+def vergleichen(report, baseline):
+    if baseline.get('workload') != report['workload'] or baseline.get('messages') != report['messages']:
+        print("Achtung: Last des Vergleichsberichts weicht ab, die Werte sind nur bedingt vergleichbar")
+    print(f"Vergleich mit {bezeichnung(baseline)}:")
+    rows = [('Durchsatz', ('throughput',), True)]
+    rows += [(f"Latenz {name}", ('latency_ms', name), False) for name in ('p50', 'p99', 'max')]
+    rows += [('memcache/Nachricht', ('cache_ops_per_message', 'total'), False),
+             ('DB/Nachricht', ('db_ops_per_message', 'total'), False)]
+    for name, path, higher_is_better in rows:
+        old, new = baseline, report
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if not old or new is None:
+            print(f"  {name:<19} {old} -> {new}")
+            continue
+        change = (new - old) / old * 100 if higher_is_better else (old - new) / old * 100
+        print(f"  {name:<19} {old} -> {new}  ({change:+.1f} %)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des Microservice mit reproduzierbarer Last")
+    parser.add_argument('--transport', choices=('inprocess', 'broker'), default='inprocess')
+    parser.add_argument('--backend', choices=('fake', 'local'), default='fake')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--warmup-messages', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=1000, help="Nachrichten je Sekunde (Zeitstempel, mit --paced auch Sendetakt)")
+    parser.add_argument('--paced', action='store_true', help="im Takt von --rate senden statt so schnell wie möglich")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--beacons', type=int, default=None, help="Anzahl Beacons aus beacon_mac.txt (Standard: alle)")
+    parser.add_argument('--hubs', type=int, default=9)
+    parser.add_argument('--hub-change-ratio', type=float, default=0.01)
+    parser.add_argument('--noise-ratio', type=float, default=0.1)
+    parser.add_argument('--button-ratio', type=float, default=0.005)
+    parser.add_argument('--pairing-ratio', type=float, default=0.002)
+    parser.add_argument('--unknown-ratio', type=float, default=0.01)
+    parser.add_argument('--fake-delay-us', type=float, default=0, help="künstliche Dauer je Aufruf im Backend fake")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="Konfiguration überschreiben")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--output', help="Bericht als JSON schreiben")
+    parser.add_argument('--compare', help="früheren Bericht (JSON) zum Vergleich")
+    args = parser.parse_args(argv)
+    report = run(args)
+    ausgeben(report)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            vergleichen(report, json.load(file))
+    return 0 if report['complete'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
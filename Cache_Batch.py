@@ -0,0 +1,109 @@
+import logging
+import time
+
+# Gebündelter Zugriff auf den memcache für Abläufe, die mehrere zusammengehörige Schlüssel lesen und ändern.
+# Alle benötigten Schlüssel werden mit einem get_many geholt, Änderungen werden gesammelt und bei commit()
+# mit set_many (je Ablaufzeit) und delete_many geschrieben. Statt einer Anfrage je Schlüssel entstehen so
+# zwei bis drei Anfragen je Ablauf.
+# Nutzung:
+#   with CacheBatch(memcache) as batch:
+#       batch.fetch([key_1, key_2])
+#       if batch.get(key_1): batch.delete(key_2)
+# Beim Verlassen ohne Fehler wird commit() ausgeführt.
+# CacheLock: kurzlebige Sperre über memcache add(), z.B. damit Paarungsanfragen auf einem Hub auch über mehrere
+# Prozesse hinweg nacheinander geprüft werden. Die Ablaufzeit gibt die Sperre frei, falls ein Prozess abbricht.
+
+log = logging.getLogger(__name__)
+
+
+class CacheBatch:
+    def __init__(self, memcache):
+        self.memcache = memcache
+        self.values = {}     # Schlüssel: Wert, None für nicht vorhandene Schlüssel
+        self._sets = {}      # Ablaufzeit: {Schlüssel: Wert}
+        self._deletes = set()
+
+    # Holen aller noch nicht bekannten Schlüssel mit einem get_many
+    def fetch(self, keys):
+        missing = [key for key in keys if key not in self.values]
+        if missing:
+            found = self.memcache.get_many(missing)
+            for key in missing:
+                self.values[key] = found.get(key)
+        return {key: self.values[key] for key in keys}
+
+    # Wert eines Schlüssels, vorgemerkte Änderungen sind bereits berücksichtigt
+    def get(self, key):
+        if key not in self.values:
+            self.fetch([key])
+        return self.values[key]
+
+    def set(self, key, value, expire=0):
+        for values in self._sets.values():
+            values.pop(key, None)
+        self._sets.setdefault(expire, {})[key] = value
+        self._deletes.discard(key)
+        self.values[key] = value
+
+    def delete(self, key):
+        for values in self._sets.values():
+            values.pop(key, None)
+        self._deletes.add(key)
+        self.values[key] = None
+
+    def pending(self):
+        return sum(len(values) for values in self._sets.values()) + len(self._deletes)
+
+    # Schreiben aller vorgemerkten Änderungen. Rückgabe: Liste der Schlüssel, die nicht geschrieben werden konnten
+    def commit(self):
+        failed = []
+        for expire, values in self._sets.items():
+            if values:
+                failed.extend(self.memcache.set_many(values, expire) or [])
+        if self._deletes:
+            self.memcache.delete_many(list(self._deletes))
+        self._sets = {}
+        self._deletes = set()
+        return failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+
+class CacheLock:
+    # expire: Sekunden bis zur automatischen Freigabe, timeout: maximale Wartezeit auf die Sperre
+    def __init__(self, memcache, key, expire=5, timeout=2.0):
+        self.memcache = memcache
+        self.key = key
+        self.expire = expire
+        self.timeout = timeout
+        self.acquired = False
+
+    # Rückgabe: True, wenn die Sperre erhalten wurde. Nach Ablauf von timeout wird ohne Sperre fortgefahren.
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while not self.memcache.add(self.key, 1, self.expire, noreply=False):
+            if time.monotonic() >= deadline:
+                log.warning("Lock %s not acquired within %s seconds, continuing without lock", self.key, self.timeout)
+                return False
+            time.sleep(0.005)
+        self.acquired = True
+        return True
+
+    def release(self):
+        if self.acquired:
+            self.memcache.delete(self.key)
+            self.acquired = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
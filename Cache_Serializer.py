@@ -0,0 +1,110 @@
+import array
+import json
+import struct
+import sys
+from Beacon_State import BeaconRecord, HubRecord
+
+# Serializer für die memcache Einträge beider Programme. Das Format eines Eintrags steht in den memcache flags:
+#   1  JSON (bisheriges Format, wird weiterhin gelesen und für alle anderen Werte geschrieben)
+#   2  BeaconRecord, struct-gepackt
+#   3  HubRecord, struct-gepackt
+#   4  Liste von Ganzzahlen (Id-Listen, Shards des Pair Registry, Gefährdungseinträge), als gepacktes Array
+# Jeder binäre Eintrag beginnt mit einem Versions-Byte, danach folgt bei Records eine Bitmaske der Felder,
+# die None sind. Records werden als BeaconRecord/HubRecord gelesen, Listen aus JSON-Einträgen bleiben Listen
+# (siehe as_beacon/as_hub in Beacon_State). Passt ein Wert nicht in das binäre Format, wird er als JSON geschrieben.
+# Umstellung im Betrieb: zuerst alle Programme mit diesem Modul und CACHE_FORMAT = json starten (lesen beide
+# Formate), danach auf CACHE_FORMAT = binary umstellen.
+
+FLAG_JSON = 1
+FLAG_BEACON = 2
+FLAG_HUB = 3
+FLAG_INTS = 4
+
+VERSION = 1
+
+# Versions-Byte, None-Maske, id, hub_id, rssi, timestamp, hub_ts_beginn, batterie, mp_typ, db_sync_timestamp
+beacon_struct = struct.Struct('<BBiihIIhiI')
+# Versions-Byte, None-Maske, hub_id, timestamp, db_sync_timestamp
+hub_struct = struct.Struct('<BBiII')
+# Versions-Byte, Typcode des Arrays ('i' oder 'q'), danach die Werte little-endian
+ints_header = struct.Struct('<BB')
+
+
+def _pack_record(packer, values):
+    mask = 0
+    packed = []
+    for position, value in enumerate(values):
+        if value is None:
+            mask |= 1 << position
+            packed.append(0)
+        else:
+            packed.append(value)
+    return packer.pack(VERSION, mask, *packed)
+
+def _unpack_record(packer, data):
+    version, mask, *values = packer.unpack(data)
+    if version != VERSION:
+        raise ValueError(f"Unknown record version {version}")
+    return [None if mask & (1 << position) else value for position, value in enumerate(values)]
+
+# Gepackt als int32, bei größeren Werten als int64. Andere Elemente als int führen zu TypeError (dann JSON).
+def _pack_ints(values):
+    try:
+        packed = array.array('i', values)
+    except OverflowError:
+        packed = array.array('q', values)
+    typecode = packed.typecode
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return ints_header.pack(VERSION, ord(typecode)) + packed.tobytes()
+
+def _unpack_ints(data):
+    version, typecode = ints_header.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unknown int list version {version}")
+    values = array.array(chr(typecode))
+    values.frombytes(data[ints_header.size:])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tolist()
+
+def _json(value):
+    if isinstance(value, (BeaconRecord, HubRecord)):
+        value = value.to_list()
+    return json.dumps(value), FLAG_JSON
+
+
+def json_serializer(key, value):
+    return _json(value)
+
+def binary_serializer(key, value):
+    try:
+        if isinstance(value, BeaconRecord):
+            return _pack_record(beacon_struct, value.to_list()), FLAG_BEACON
+        if isinstance(value, HubRecord):
+            return _pack_record(hub_struct, value.to_list()), FLAG_HUB
+        if isinstance(value, (list, tuple)):
+            return _pack_ints(value), FLAG_INTS
+    except (struct.error, OverflowError, TypeError):
+        pass  # z.B. Zeitstempel als float oder Wert außerhalb des Wertebereichs
+    return _json(value)
+
+# Lesen aller Formate, unabhängig vom eingestellten Schreibformat
+def deserializer(key, value, flags):
+    if flags == FLAG_JSON:
+        return json.loads(value)
+    if flags == FLAG_BEACON:
+        return BeaconRecord(*_unpack_record(beacon_struct, value))
+    if flags == FLAG_HUB:
+        return HubRecord(*_unpack_record(hub_struct, value))
+    if flags == FLAG_INTS:
+        return _unpack_ints(value)
+    raise Exception("Unknown serialization format")
+
+# Serializer zum konfigurierten Format (CACHE_FORMAT): 'binary' oder 'json'
+def serializer_for(cache_format):
+    if cache_format == 'binary':
+        return binary_serializer
+    if cache_format == 'json':
+        return json_serializer
+    raise ValueError(f"Unknown cache format {cache_format}")
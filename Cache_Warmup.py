@@ -0,0 +1,129 @@
+import logging
+import time
+from Beacon_State import BeaconRecord, as_beacon
+
+# Bulk Warm-up beim Programmstart (WARMUP_MODE = bulk).
+# Statt je Zeile mehrere memcache Zugriffe auszuführen, werden die Tabellen mit einem serverseitigen
+# (ungepufferten) Cursor gestreamt, die Zuordnungen im Speicher aufgebaut und in Blöcken per
+# get_many/set_many mit dem memcache abgeglichen. Die Dauer jeder Phase wird ausgegeben.
+
+log = logging.getLogger(__name__)
+
+
+# Streamen einer Abfrage in Blöcken von chunk_size Zeilen, ohne das gesamte Ergebnis im Speicher zu halten
+def stream_rows(connection, query, chunk_size, params=()):
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+    cursor.close()
+
+def chunks(items, chunk_size):
+    items = list(items)
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+# Schreiben eines Dictionaries in Blöcken, Rückgabe: Anzahl nicht geschriebener Schlüssel
+def set_chunked(memcache, values, chunk_size):
+    failed = 0
+    for keys in chunks(values, chunk_size):
+        failed += len(memcache.set_many({key: values[key] for key in keys}) or [])
+    return failed
+
+# Zusammenführen einer Id-Liste aus dem memcache mit den Ids aus der Datenbank, Reihenfolge bleibt erhalten
+def merge_ids(cached, ids):
+    merged = list(cached) if cached else []
+    known = set(merged)
+    for value in ids:
+        if value not in known:
+            merged.append(value)
+            known.add(value)
+    return merged
+
+# Abgleich von Id-Listen mit dem memcache: je Block ein get_many und ein set_many
+def merge_chunked(memcache, values, chunk_size):
+    for keys in chunks(values, chunk_size):
+        cached = memcache.get_many(keys)
+        memcache.set_many({key: merge_ids(cached.get(key), values[key]) for key in keys})
+
+
+# Datensatz aus einer Zeile von beacon_left_join_mp, der DB-Stand gilt als zuletzt synchronisiert
+def beacon_from_row(data_values):
+    return BeaconRecord(data_values['beacon_id'], data_values['beacon_hub_id'], data_values['beacon_RSSI'],
+                        data_values['beacon_timestamp'], data_values['beacon_hub_ts_beginn'], data_values['beacon_batterie'],
+                        data_values['mp_mp_typ_id'], data_values['beacon_timestamp'])
+
+
+class WarmupReport:
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name, rows, duration):
+        self.phases.append((name, rows, duration))
+        log.info("Warm-up %s: %s Zeilen in %.3f Sekunden", name, rows, duration)
+
+
+# Phase 1: Beacondaten. Ein Datensatz aus dem memcache, der neuer ist als die Datenbank, bleibt erhalten.
+def warmup_beacons(connection, memcache, state, chunk_size):
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM beacon_left_join_mp', chunk_size):
+        records = {}
+        for data_values in rows:
+            records[data_values['beacon_MAC']] = beacon_from_row(data_values)
+        cached = memcache.get_many(list(records))
+        values = {}
+        for beacon_MAC, record in records.items():
+            cached_record = as_beacon(cached.get(beacon_MAC))
+            if cached_record is not None and record.timestamp is not None \
+                    and cached_record.timestamp is not None and cached_record.timestamp > record.timestamp:
+                # Der memcache kennt einen neueren Stand als die Datenbank (z.B. noch nicht synchronisiert)
+                state.put_beacon(beacon_MAC, cached_record, write_through=False)
+            else:
+                state.put_beacon(beacon_MAC, record, write_through=False)
+                values[beacon_MAC] = record
+        set_chunked(memcache, values, chunk_size)
+        count += len(rows)
+    return count
+
+# Phase 2: zulässige MP-Typ Paarungen, Notation: mp_typ_mapping_mp_typ_ID: [MappedMpID1, MappedMpID2, ...]
+def warmup_mp_mapping(connection, memcache, chunk_size):
+    mapping = {}
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM mp_mapping', chunk_size):
+        for data_values in rows:
+            mp_typ_id_1 = data_values['mp_mapping_mp_typ_id_1']
+            mp_typ_id_2 = data_values['mp_mapping_mp_typ_id_2']
+            mapping.setdefault(mp_typ_id_1, []).append(mp_typ_id_2)
+            mapping.setdefault(mp_typ_id_2, []).append(mp_typ_id_1)
+        count += len(rows)
+    merge_chunked(memcache, {f'mp_typ_mapping_{mp_typ_id}': ids for mp_typ_id, ids in mapping.items()}, chunk_size)
+    return count
+
+# Phase 3: bestehende Beaconpaare, eingetragen in das Pair Registry (Nachbarschaften und Shards).
+# Jeder betroffene Schlüssel wird dabei einmal geschrieben, nicht einmal je Paar.
+def warmup_beaconpairs(connection, registry, chunk_size):
+    pairs = []
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM beaconpair', chunk_size):
+        for data_values in rows:
+            pairs.append((data_values['beaconpair_beacon_id_1'], data_values['beaconpair_beacon_id_2']))
+        count += len(rows)
+    registry.add_many(pairs)
+    return count
+
+
+def bulk_warmup(db_pool, memcache, state, registry, chunk_size=1000):
+    report = WarmupReport()
+    total_start = time.perf_counter()
+    for name, phase in (('beacon_left_join_mp', lambda connection: warmup_beacons(connection, memcache, state, chunk_size)),
+                        ('mp_mapping', lambda connection: warmup_mp_mapping(connection, memcache, chunk_size)),
+                        ('beaconpair', lambda connection: warmup_beaconpairs(connection, registry, chunk_size))):
+        start = time.perf_counter()
+        with db_pool.connection() as connection:
+            rows = phase(connection)
+        report.phase(name, rows, time.perf_counter() - start)
+    log.info("Warm-up gesamt: %.3f Sekunden", time.perf_counter() - total_start)
+    return report
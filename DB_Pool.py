@@ -0,0 +1,182 @@
+import contextlib
+import logging
+import queue
+import threading
+import time
+import mysql.connector
+
+# Pool von MySQL Verbindungen für alle DB-Zugriffe beider Programme.
+# Verbindungen werden im Hintergrund geprüft und bei Bedarf mit Backoff neu aufgebaut,
+# so dass bei der Verarbeitung einer Nachricht keine Verbindungsprüfung mehr nötig ist.
+
+log = logging.getLogger(__name__)
+
+
+# Fehler, wenn keine Verbindung verfügbar ist. Abgeleitet von mysql.connector.Error, damit die
+# bestehenden Fehlerbehandlungen greifen.
+class PoolError(mysql.connector.Error):
+    pass
+
+
+# Eine Verbindung aus dem Pool. Aufrufe wie cursor() oder commit() gehen an die MySQL Verbindung.
+# Vorbereitete Statements (cursor(prepared=True)) werden je Verbindung einmal angelegt und wiederverwendet.
+class PooledConnection:
+    __slots__ = ('raw', 'prepared_cursors', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.prepared_cursors = {}
+        self.last_used = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def prepared(self, sql):
+        cursor = self.prepared_cursors.get(sql)
+        if cursor is None:
+            cursor = self.raw.cursor(prepared=True)
+            self.prepared_cursors[sql] = cursor
+        return cursor
+
+    def close(self):
+        self.prepared_cursors.clear()
+        try:
+            self.raw.close()
+        except mysql.connector.Error:
+            pass
+
+
+class ConnectionPool:
+    # size: Anzahl Verbindungen, health_interval: Sekunden, nach denen eine ungenutzte Verbindung geprüft wird,
+    # backoff_max: maximale Wartezeit zwischen zwei Verbindungsversuchen, timeout: maximale Wartezeit auf eine freie Verbindung,
+    # connect: Aufbau einer Verbindung mit db_config (im Benchmark z.B. FakeDatabase.connect, siehe Bench_Fakes.py)
+    def __init__(self, db_config, size=4, health_interval=30, backoff_max=60, timeout=10, connect=mysql.connector.connect):
+        self.db_config = db_config
+        self.connect = connect
+        self.size = size
+        self.health_interval = health_interval
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        # Freie Plätze des Pools. None steht für einen Platz ohne (funktionierende) Verbindung.
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+        self._backoff = 0
+        self._next_attempt = 0.0
+        self._backoff_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Neuer Verbindungsaufbau. Nach einem Fehlschlag wird bis zum nächsten Versuch exponentiell länger gewartet,
+    # in dieser Zeit schlagen Anfragen sofort fehl, statt die Verarbeitung aufzuhalten.
+    def _connect(self):
+        with self._backoff_lock:
+            if time.monotonic() < self._next_attempt:
+                raise PoolError("database unavailable, waiting before next connection attempt")
+        try:
+            connection = PooledConnection(self.connect(**self.db_config))
+        except mysql.connector.Error as err:
+            with self._backoff_lock:
+                self._backoff = min(self.backoff_max, max(1, self._backoff * 2))
+                self._next_attempt = time.monotonic() + self._backoff
+            log.error("Error connecting to MySQL: %s. Next attempt in %s seconds.", err, self._backoff)
+            raise
+        with self._backoff_lock:
+            self._backoff = 0
+            self._next_attempt = 0.0
+        return connection
+
+    def _acquire(self):
+        try:
+            connection = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolError(f"no free database connection within {self.timeout} seconds") from None
+        if connection is None:
+            try:
+                connection = self._connect()
+            except mysql.connector.Error:
+                self._idle.put(None)
+                raise
+        return connection
+
+    def _release(self, connection):
+        connection.last_used = time.monotonic()
+        self._idle.put(connection)
+
+    # Nutzung: with db_pool.connection() as connection: ...
+    # Verbindungsfehler (OperationalError/InterfaceError) führen zum Verwerfen der Verbindung.
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            connection.close()
+            self._idle.put(None)
+            raise
+        except BaseException:
+            self._release(connection)
+            raise
+        else:
+            self._release(connection)
+
+    # Prüfung beim Programmstart: eine Verbindung muss aufgebaut werden können
+    def check(self):
+        with self.connection() as connection:
+            connection.ping(reconnect=False)
+
+    # Hintergrundprüfung: länger ungenutzte Verbindungen anpingen, fehlende neu aufbauen.
+    # Es wird immer nur eine Verbindung entnommen und gleich wieder zurückgelegt, die übrigen bleiben für die
+    # Verarbeitung verfügbar. Frisch genutzte Verbindungen (innerhalb health_interval) bleiben im Pool.
+    # Verbindungen, die gerade in Benutzung sind, werden beim nächsten Lauf geprüft.
+    def _health_check(self):
+        for _ in range(self.size):
+            found, connection = self._take_stale()
+            if not found:
+                return
+            try:
+                if connection is None:
+                    connection = self._connect()
+                else:
+                    try:
+                        connection.ping(reconnect=False)
+                        connection.last_used = time.monotonic()
+                    except mysql.connector.Error:
+                        connection.close()
+                        connection = self._connect()
+            except mysql.connector.Error:
+                connection = None
+            self._idle.put(connection)
+
+    # Entnehmen eines freien Platzes ohne Verbindung oder einer länger ungenutzten Verbindung.
+    # Rückgabe (gefunden, Verbindung oder None)
+    def _take_stale(self):
+        now = time.monotonic()
+        with self._idle.mutex:
+            for index, connection in enumerate(self._idle.queue):
+                if connection is None or now - connection.last_used >= self.health_interval:
+                    del self._idle.queue[index]
+                    return True, connection
+        return False, None
+
+    def _run(self):
+        while not self._stop.wait(min(self.health_interval, max(1, self._backoff or self.health_interval))):
+            self._health_check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-pool-health", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if connection is not None:
+                connection.close()
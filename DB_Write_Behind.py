@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import mysql.connector
+import SQL_Statements
+from DB_Pool import PoolError
+
+# Write-Behind für die Datenbank. Updates der Beacons, Hubs und neue Beaconpaare werden nicht mehr im
+# MQTT Callback geschrieben, sondern gesammelt und pro Datensatz zusammengefasst: je beacon_id / hub_id / Paar
+# gewinnt der zuletzt eingereichte Stand. Geschrieben wird per executemany in einer Transaktion,
+# sobald batch_size Datensätze anstehen oder spätestens nach flush_interval Sekunden.
+# Ist die Datenbank nicht erreichbar (TRANSIENT), wird der Block später erneut geschrieben. Bei jedem anderen Fehler
+# (z.B. IntegrityError eines doppelten Paares) wird der Block einzeln geschrieben und nur die fehlerhaften Datensätze
+# werden protokolliert und verworfen, damit ein einzelner Datensatz nicht alle folgenden Blöcke aufhält.
+
+log = logging.getLogger(__name__)
+
+# Statement je Art des Eintrags (siehe SQL_Statements.py), die Parameter werden in dieser Reihenfolge übergeben
+statements = {
+    'hub': 'hub_update',
+    'beacon': 'beacon_update',
+    'beaconpair': 'beaconpair_insert',
+}
+
+# Fehler, nach denen derselbe Block später erneut geschrieben wird
+TRANSIENT = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError, PoolError)
+
+
+class WriteBehindQueue:
+    # db_pool: ConnectionPool (siehe DB_Pool.py), je Flush wird eine Verbindung entnommen.
+    # max_pending: maximale Anzahl wartender Datensätze. Ist sie erreicht, wartet der Aufrufer (Backpressure).
+    def __init__(self, db_pool, batch_size=500, flush_interval=1.0, max_pending=20000, block_timeout=5.0):
+        self.db_pool = db_pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self._pending = {kind: {} for kind in statements}
+        self._depth = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+    # Einreichen eines Datensatzes. Ein bereits wartender Eintrag mit gleichem Schlüssel wird überschrieben.
+    def submit(self, kind, key, params):
+        with self._cond:
+            pending = self._pending[kind]
+            if key not in pending:
+                while self._depth >= self.max_pending and not self._stopped:
+                    self._cond.notify_all()
+                    if not self._cond.wait(self.block_timeout):
+                        log.warning("DB write-behind queue full (%s pending), waiting for the database.", self._depth)
+                self._depth += 1
+            pending[key] = params
+            if self._depth >= self.batch_size:
+                self._cond.notify_all()
+
+    def depth(self):
+        return self._depth
+
+    # Schreiben aller wartenden Datensätze in einer Transaktion. Ist die Datenbank nicht erreichbar, werden die
+    # Datensätze wieder vorgemerkt, sofern inzwischen kein neuerer Stand eingereicht wurde, und -1 zurückgegeben.
+    # Sonst Rückgabe: Anzahl geschriebener Datensätze
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                if self._depth == 0:
+                    return 0
+                batch, self._pending = self._pending, {kind: {} for kind in statements}
+                self._depth = 0
+                self._cond.notify_all()
+            count = sum(len(rows) for rows in batch.values())
+            try:
+                with self.db_pool.connection() as connection:
+                    try:
+                        for kind, rows in batch.items():
+                            if rows:
+                                SQL_Statements.executemany(connection, statements[kind], rows.values())
+                        connection.commit()
+                    except TRANSIENT:
+                        _rollback(connection)
+                        raise
+                    except (mysql.connector.Error, ValueError, TypeError) as err:
+                        _rollback(connection)
+                        log.warning("Error writing batch of %s rows to MySQL, writing rows one by one: %s", count, err)
+                        return count - self._write_rows(connection, batch)
+                return count
+            except TRANSIENT as err:
+                log.error("Error writing batch of %s rows to MySQL: %s", count, err)
+                self._requeue(batch)
+                return -1
+
+    # Einzeln schreiben, jeder Datensatz in einer eigenen Transaktion. Erledigte Datensätze werden aus batch entfernt,
+    # damit bei einem Abbruch (TRANSIENT) nur die übrigen wieder vorgemerkt werden. Rückgabe: Anzahl verworfener
+    def _write_rows(self, connection, batch):
+        dropped = 0
+        for kind, rows in batch.items():
+            for key in list(rows):
+                try:
+                    SQL_Statements.execute(connection, statements[kind], rows[key])
+                    connection.commit()
+                except TRANSIENT:
+                    _rollback(connection)
+                    raise
+                except (mysql.connector.Error, ValueError, TypeError) as err:
+                    _rollback(connection)
+                    log.error("Dropping %s %s, not writable to MySQL: %s", kind, key, err)
+                    dropped += 1
+                del rows[key]
+        return dropped
+
+    def _requeue(self, batch):
+        with self._cond:
+            for kind, rows in batch.items():
+                pending = self._pending[kind]
+                for key, params in rows.items():
+                    if key not in pending:
+                        pending[key] = params
+                        self._depth += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._depth < self.batch_size and not self._stopped:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+            written = self.flush()
+            if stopped:
+                return
+            if written < 0:
+                time.sleep(self.flush_interval)  # DB nicht erreichbar, nicht im Kreis schreiben
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+            self._thread.start()
+
+    # Beenden beim Herunterfahren: alle wartenden Datensätze werden noch geschrieben
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+def _rollback(connection):
+    try:
+        connection.rollback()
+    except mysql.connector.Error:
+        pass
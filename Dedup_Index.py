@@ -0,0 +1,53 @@
+import collections
+import threading
+import time
+
+# Index der zuletzt verarbeiteten Nachrichten, um erneut gesendete Nachrichten (Reconnect von mosquitto oder eines
+# Mesh-Gateways) vor jedem Zugriff auf Zustand, memcache und Datenbank zu verwerfen. Die bisherige Prüfung
+# (Zeitstempel gleich dem letzten des Beacons) braucht dafür die Altdaten des Beacons und erkennt ältere
+# Wiederholungen nicht, die nach neueren Nachrichten eintreffen.
+# Schlüssel: (MAC_SENSOR, MAC_ROOM, Zeitstempel), gespeichert wird nur der Hashwert (int) in einem set.
+# Die Sets bilden Generationen: neue Schlüssel kommen in die jüngste, gesucht wird in allen. Alle window / (generations - 1)
+# Sekunden (Uhrzeit des Prozesses) entsteht eine neue Generation und die älteste entfällt, jeder Schlüssel bleibt also
+# mindestens window Sekunden erhalten. Erreicht die jüngste Generation max_entries / generations Einträge, wird früher
+# gewechselt, der Speicher bleibt damit begrenzt (das Fenster ist dann kürzer, gezählt in early_rotations).
+
+class DedupIndex:
+    def __init__(self, window=300, max_entries=500000, generations=4):
+        if window <= 0 or generations < 2:
+            raise ValueError("Dedup index needs a positive window and at least two generations")
+        self.window = window
+        self.generation_size = max(1, max_entries // generations)
+        self.rotate_interval = window / (generations - 1)
+        self.generations = collections.deque(set() for _ in range(generations))
+        self.hits = 0
+        self.early_rotations = 0
+        self._next_rotation = time.monotonic() + self.rotate_interval
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        self.generations.pop()
+        self.generations.appendleft(set())
+        self._next_rotation = time.monotonic() + self.rotate_interval
+
+    # True, wenn die Nachricht im Fenster schon einmal vorkam. Sonst wird sie eingetragen.
+    def seen(self, beacon_MAC, hub_MAC, timestamp):
+        key = hash((beacon_MAC, hub_MAC, timestamp))
+        with self._lock:
+            for generation in self.generations:
+                if key in generation:
+                    self.hits += 1
+                    return True
+            current = self.generations[0]
+            if len(current) >= self.generation_size:
+                self.early_rotations += 1
+                self._rotate()
+                current = self.generations[0]
+            elif time.monotonic() >= self._next_rotation:
+                self._rotate()
+                current = self.generations[0]
+            current.add(key)
+        return False
+
+    def __len__(self):
+        return sum(len(generation) for generation in self.generations)
@@ -0,0 +1,162 @@
+import collections
+import json
+import logging
+import threading
+import time
+
+# Ausgabe von Ereignissen für nachgelagerte Systeme (Web-Backend, Frontend), damit diese nicht die Tabelle beacon
+# abfragen müssen, die ohnehin nur alle DB_UPDATE_CYCLE_BEACON Sekunden geschrieben wird.
+# Ereignisse (jeweils mit fortlaufender Nummer seq, je Quelle):
+#   location  {beacon, mac, hub, previous, ts}    Beacon einem Hub zugewiesen (Erstzuweisung: previous = null) oder gewechselt
+#   pair      {beacons: [id1, id2], hub, ts}      Beaconpaar verbunden
+#   unpair    {beacons: [id1, id2], ts}           Beaconpaar aufgelöst (Validity Check)
+#   critical  {beacons: [id1, id2], action, hub, ts}  Gefährdungseintrag created/updated/cleared
+#   alert     {beacon, kind, battery, rate, last_seen, ts}  Alarm der Überwachung (siehe Beacon_Monitor.py)
+# Die Ereignisse werden gesammelt und alle interval Sekunden in Blöcken zu höchstens batch_size geschrieben:
+#   MQTT   <topic>/<source>/delta                 {type: delta, source, first, last, events: [...]}
+#          <topic>/<source>/snapshot (retained)   {type: snapshot, source, seq, time, beacons, pairs, critical}
+#   Datei  eine Zeile JSON je delta oder snapshot, nur angehängt
+# Snapshot plus Delta: Ein Snapshot enthält mindestens alle Änderungen bis seq, je Beacon [Hub, seit, MAC], die Paare
+# und die kritischen Paare. Ein Verbraucher übernimmt den Snapshot und danach alle Ereignisse mit größerer seq. Die
+# Ereignisse tragen absolute Werte, doppelt angewendete (seq knapp über dem Snapshot) schaden nicht.
+# Fehlt eine seq (Ereignisse verworfen, weil die Warteschlange voll war), folgt automatisch ein neuer Snapshot.
+# Einen Snapshot außer der Reihe fordert eine beliebige Nachricht auf <topic>/request an. Er wird außerdem beim
+# Start, nach jedem (Wieder-)Verbinden und alle snapshot_interval Sekunden geschrieben.
+# Im Scale-Out schreibt jeder Worker als eigene Quelle (source) mit eigener seq.
+
+log = logging.getLogger(__name__)
+
+
+class EventFeed:
+    # snapshot: Funktion ohne Parameter, die den aktuellen Stand liefert ({'beacons': ..., 'pairs': ..., 'critical': ...})
+    # client: paho Client für die Ausgabe auf MQTT (None = nur Datei), verbunden mit server/port
+    # log_path: Datei für das Ereignisprotokoll (leer = keine)
+    def __init__(self, snapshot, client=None, server=None, port=1883, topic='', log_path='', source='main',
+                 interval=0.2, batch_size=500, snapshot_interval=300, queue_size=100000):
+        self.snapshot = snapshot
+        self.client = client
+        self.server = server
+        self.port = port
+        self.topic = topic
+        self.log_path = log_path
+        self.source = source
+        self.interval = interval
+        self.batch_size = batch_size
+        self.snapshot_interval = snapshot_interval
+        self.queue_size = queue_size
+        self.events = collections.deque()
+        self.seq = 0
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+        self.snapshots = 0
+        self._next_snapshot = 0.0   # time.monotonic(), 0 = beim nächsten Schreiben
+        self._lock = threading.Lock()
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Aufruf nach der Änderung im Zustand, damit ein Snapshot mit größerer seq sie sicher enthält
+    def emit(self, kind, **fields):
+        with self._lock:
+            self.seq += 1
+            if len(self.events) >= self.queue_size:
+                self.dropped += 1
+                self._next_snapshot = 0.0
+                return
+            fields['seq'] = self.seq
+            fields['type'] = kind
+            self.events.append(fields)
+
+    def request_snapshot(self):
+        self._next_snapshot = 0.0
+
+    def _send(self, kind, message):
+        payload = json.dumps(message, separators=(',', ':'))
+        if self._file is not None:
+            try:
+                self._file.write(payload + '\n')
+            except OSError as e:
+                log.error("Error writing event log %s: %s", self.log_path, e)
+        if self.client is not None:
+            # Ohne Verbindung hält paho Nachrichten mit QoS 1 zurück und sendet sie nach dem Wiederverbinden
+            info = self.client.publish(f"{self.topic}/{self.source}/{kind}", payload, qos=1, retain=kind == 'snapshot')
+            if info.rc != 0:
+                self.failed += 1
+
+    def _write_snapshot(self):
+        with self._lock:
+            seq = self.seq
+        try:
+            data = self.snapshot()
+        except Exception as e:
+            log.error("Error building event snapshot: %s", e)
+            self._next_snapshot = time.monotonic() + 1
+            return
+        self._next_snapshot = time.monotonic() + self.snapshot_interval if self.snapshot_interval > 0 else float('inf')
+        message = {'type': 'snapshot', 'source': self.source, 'seq': seq, 'time': int(time.time())}
+        message.update(data)
+        self._send('snapshot', message)
+        self.snapshots += 1
+
+    # Snapshot, wenn fällig, danach alle wartenden Ereignisse in Blöcken
+    def flush(self):
+        if time.monotonic() >= self._next_snapshot:
+            self._write_snapshot()
+        while True:
+            with self._lock:
+                if not self.events:
+                    break
+                batch = [self.events.popleft() for _ in range(min(self.batch_size, len(self.events)))]
+            self._send('delta', {'type': 'delta', 'source': self.source, 'first': batch[0]['seq'],
+                                 'last': batch[-1]['seq'], 'events': batch})
+            self.published += len(batch)
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError as e:
+                log.error("Error writing event log %s: %s", self.log_path, e)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(f"{self.topic}/request")
+            self.request_snapshot()
+        else:
+            log.warning("Event feed connection failed with code %s", rc)
+
+    def _on_request(self, client, userdata, msg):
+        self.request_snapshot()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("Error publishing events: %s", e)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.log_path:
+            self._file = open(self.log_path, 'a')
+        if self.client is not None:
+            self.client.on_connect = self._on_connect
+            self.client.on_message = self._on_request
+            self.client.connect_async(self.server, self.port, 60)
+            self.client.loop_start()   # paho verbindet sich bei Abbruch selbstständig neu
+        self._thread = threading.Thread(target=self._run, name="event-feed", daemon=True)
+        self._thread.start()
+        log.info("Publishing events to %s", ', '.join(filter(None, (self.topic if self.client else '', self.log_path))))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
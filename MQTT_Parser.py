@@ -0,0 +1,112 @@
+import json
+import re
+
+# Parser für die MQTT Nachrichten der Hubs.
+# Format: {"time": <unix ts>, "data": "layer=1, MAC_ROOM=.., MAC_SENSOR=.., BATT=.., BUTTON=.., RSSI=.."}
+# Der data-String wird in einem Durchlauf zerlegt, ohne Zwischenlisten und ohne Dictionary.
+
+# Schnelleres JSON Backend, falls installiert
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+
+# Fehler bei einer nicht dem Format entsprechenden Nachricht
+class MessageFormatError(ValueError):
+    pass
+
+
+# Zerlegte Nachricht. Nicht gesendete Werte sind wie bisher None (MACs) bzw. 0 (Zahlen).
+class BeaconMessage:
+    __slots__ = ('timestamp', 'layer', 'hub_MAC', 'beacon_MAC', 'batterie', 'taster', 'rssi')
+
+    def __init__(self, timestamp, layer, hub_MAC, beacon_MAC, batterie, taster, rssi):
+        self.timestamp = timestamp
+        self.layer = layer
+        self.hub_MAC = hub_MAC
+        self.beacon_MAC = beacon_MAC
+        self.batterie = batterie
+        self.taster = taster
+        self.rssi = rssi
+
+    def __repr__(self):
+        return (f"BeaconMessage(time={self.timestamp}, layer={self.layer}, MAC_ROOM={self.hub_MAC}, "
+                f"MAC_SENSOR={self.beacon_MAC}, BATT={self.batterie}, BUTTON={self.taster}, RSSI={self.rssi})")
+
+
+def _to_int(key, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise MessageFormatError(f"Invalid value for {key}: {value!r}") from None
+
+
+# Regulärer Ausdruck für die Reihenfolge der Felder, wie sie die Hubs senden. Er zerlegt den String in einem
+# Durchlauf im C-Code der re-Bibliothek und ist damit der schnelle Weg für nahezu alle Nachrichten.
+canonical_data = re.compile(
+    r'layer=(-?\d+), MAC_ROOM=([^,=]+), MAC_SENSOR=([^,=]+), BATT=(-?\d+), BUTTON=(-?\d+), RSSI=(-?\d+)\Z')
+
+
+# Zerlegen des data-Strings. Felder werden durch ", " getrennt, Schlüssel und Wert durch das erste "=".
+# Abweichende Reihenfolge oder fehlende Felder werden im allgemeinen Weg behandelt.
+def parse_data(data, timestamp):
+    match = canonical_data.match(data)
+    if match is not None:
+        layer, hub_MAC, beacon_MAC, batterie, taster, rssi = match.groups()
+        return BeaconMessage(timestamp, int(layer), hub_MAC, beacon_MAC, int(batterie), int(taster), int(rssi))
+    return parse_data_general(data, timestamp)
+
+
+# Allgemeiner Weg: ein Durchlauf über den String, unbekannte Schlüssel werden übersprungen.
+# Jedes Feld muss genau ein "=" enthalten, sonst MessageFormatError (z.B. "MAC_SENSOR" oder "MAC_SENSOR=a=b").
+def parse_data_general(data, timestamp):
+    layer = batterie = taster = rssi = 0
+    hub_MAC = beacon_MAC = None
+    length = len(data)
+    pos = 0
+    while pos < length:
+        end = data.find(', ', pos)
+        if end < 0:
+            end = length
+        eq = data.find('=', pos, end)
+        if eq <= pos:
+            raise MessageFormatError(f"Field without key or '=' in data: {data!r}")
+        if data.find('=', eq + 1, end) >= 0:
+            raise MessageFormatError(f"Field with more than one '=' in data: {data!r}")
+        key = data[pos:eq]
+        if key == 'MAC_SENSOR':
+            beacon_MAC = data[eq + 1:end]
+        elif key == 'MAC_ROOM':
+            hub_MAC = data[eq + 1:end]
+        elif key == 'RSSI':
+            rssi = _to_int(key, data[eq + 1:end])
+        elif key == 'BATT':
+            batterie = _to_int(key, data[eq + 1:end])
+        elif key == 'BUTTON':
+            taster = _to_int(key, data[eq + 1:end])
+        elif key == 'layer':
+            layer = _to_int(key, data[eq + 1:end])
+        pos = end + 2
+    return BeaconMessage(timestamp, layer, hub_MAC, beacon_MAC, batterie, taster, rssi)
+
+
+# Zerlegen einer vollständigen Nachricht (str oder bytes, so wie sie von paho geliefert wird)
+def parse_message(message):
+    try:
+        envelope = json_loads(message)
+    except ValueError as e:
+        raise MessageFormatError(f"Message is not valid JSON: {e}") from None
+    if not isinstance(envelope, dict):
+        raise MessageFormatError("Message is not a JSON object")
+    try:
+        timestamp = int(envelope['time'])
+        data = envelope['data']
+    except KeyError as e:
+        raise MessageFormatError(f"Message without {e.args[0]!r}") from None
+    except (TypeError, ValueError):
+        raise MessageFormatError(f"Invalid time in message: {envelope['time']!r}") from None
+    if not isinstance(data, str):
+        raise MessageFormatError("Message data is not a string")
+    return parse_data(data, timestamp)
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+import zlib
+
+# Entkopplung von MQTT Empfang und Verarbeitung.
+# Der MQTT Callback legt die rohe Nachricht nur noch in einen begrenzten Ringpuffer, ein Pool von Workern
+# verarbeitet sie. Nachrichten werden anhand der MAC_SENSOR auf die Worker verteilt, damit die Reihenfolge
+# der Nachrichten eines Beacons erhalten bleibt.
+# Im Micro-Batch Modus (batch_size > 1) entnimmt ein Worker bis zu batch_size Nachrichten oder wartet höchstens
+# batch_delay Sekunden auf weitere, und übergibt sie als Liste an den Handler.
+
+log = logging.getLogger(__name__)
+
+SENSOR_FIELD = b'MAC_SENSOR='
+
+
+# Ringpuffer fester Größe. put() blockiert oder verwirft bei vollem Puffer, get() blockiert bis eine Nachricht vorliegt.
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._head = 0      # Position des ältesten Eintrags
+        self._count = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._count
+
+    def put(self, item, block=True, timeout=None):
+        with self._cond:
+            if self._count == self.capacity:
+                if not block or self._closed:
+                    return False
+                if not self._cond.wait_for(lambda: self._count < self.capacity or self._closed, timeout):
+                    return False
+                if self._closed:
+                    return False
+            self._items[(self._head + self._count) % self.capacity] = item
+            self._count += 1
+            self._cond.notify_all()
+            return True
+
+    # Liefert None, wenn der Puffer geschlossen und leer ist
+    def get(self):
+        with self._cond:
+            while self._count == 0:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            item = self._items[self._head]
+            self._items[self._head] = None
+            self._head = (self._head + 1) % self.capacity
+            self._count -= 1
+            self._cond.notify_all()
+            return item
+
+    # Bis zu max_items Einträge. Gewartet wird auf den ersten Eintrag, danach höchstens max_delay Sekunden
+    # auf weitere. Liefert None, wenn der Puffer geschlossen und leer ist.
+    def get_batch(self, max_items, max_delay):
+        with self._cond:
+            while self._count == 0:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            deadline = time.monotonic() + max_delay
+            while self._count < max_items and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            items = []
+            while self._count > 0 and len(items) < max_items:
+                items.append(self._items[self._head])
+                self._items[self._head] = None
+                self._head = (self._head + 1) % self.capacity
+                self._count -= 1
+            self._cond.notify_all()
+            return items
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+# Bestimmen des Workers zu einer Nachricht. Gesucht wird direkt in den Bytes, ohne die Nachricht zu zerlegen.
+# crc32 statt hash(), damit die Zuordnung auch über Prozessgrenzen hinweg stabil ist.
+def shard_for(payload, shard_count):
+    start = payload.find(SENSOR_FIELD)
+    if start < 0:
+        return 0
+    start += len(SENSOR_FIELD)
+    end = payload.find(b',', start)
+    if end < 0:
+        end = payload.find(b'"', start)
+    return zlib.crc32(payload[start:end] if end >= 0 else payload[start:]) % shard_count
+
+
+class MessagePipeline:
+    # handler: Verarbeitung einer Nachricht als bytes (process_message), bei batch_size > 1 einer Liste von Nachrichten
+    # full_policy: 'block' hält den MQTT Thread an, bis Platz frei ist, 'drop' verwirft die neue Nachricht
+    # batch_size, batch_delay: maximale Anzahl Nachrichten und maximale Wartezeit in Sekunden je Micro-Batch
+    def __init__(self, handler, worker_count=4, queue_size=10000, full_policy='block', batch_size=1, batch_delay=0.0):
+        if full_policy not in ('block', 'drop'):
+            raise ValueError(f"Unknown pipeline full policy: {full_policy}")
+        self.handler = handler
+        self.worker_count = worker_count
+        self.block = full_policy == 'block'
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # Die Gesamtgröße wird auf die Worker aufgeteilt, jeder Worker hat seinen eigenen Puffer
+        self.buffers = [RingBuffer(max(1, queue_size // worker_count)) for _ in range(worker_count)]
+        self.dropped = 0
+        self._threads = []
+
+    def submit(self, payload):
+        shard = shard_for(payload, self.worker_count)
+        if not self.buffers[shard].put(payload, self.block):
+            self.dropped += 1
+            return False
+        return True
+
+    def depth(self):
+        return sum(len(buffer) for buffer in self.buffers)
+
+    def _worker(self, buffer):
+        while True:
+            if self.batch_size > 1:
+                payload = buffer.get_batch(self.batch_size, self.batch_delay)
+            else:
+                payload = buffer.get()
+            if payload is None:
+                return
+            try:
+                self.handler(payload)
+            except Exception as e:
+                log.error("Fehler im Pipeline-Worker: %s", e)
+
+    def start(self):
+        for index, buffer in enumerate(self.buffers):
+            thread = threading.Thread(target=self._worker, args=(buffer,), name=f"pipeline-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Keine neuen Nachrichten mehr annehmen, bereits gepufferte werden noch verarbeitet
+    def stop(self):
+        for buffer in self.buffers:
+            buffer.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -1,9 +1,17 @@
 import time
 import threading
 import paho.mqtt.client as mqtt
-import random 
+import json
 import os
+import sys
 from dotenv import load_dotenv, find_dotenv
+from Workload import Workload
+
+# Last für den Microservice über einen Broker, mit der reproduzierbaren Last aus Workload.py (Beacons aus beacon_mac.txt).
+# Der Broker mit Zeitstempel-Erweiterung (mosquitto-UNIX-time) verpackt die Nachricht selbst in {"time":.., "data":..}.
+# Mit --envelope wird bereits verpackt gesendet, für einen Broker ohne diese Erweiterung.
+# Aufruf: python MQTT_spam.py [--envelope]
+# Für reproduzierbare Messungen mit Durchsatz und Latenz siehe Benchmark.py.
 
 # Laden der umgebungsabhängigen Konfigurationsparameter
 load_dotenv(find_dotenv('Config.env'))
@@ -15,14 +23,9 @@ mqtt_topic = os.getenv('MQTT_TOPIC')
 mqtt_username = os.getenv('MQTT_USER')
 mqtt_password = os.getenv('MQTT_PW')
 messages_per_second = 100
+envelope = '--envelope' in sys.argv[1:]
 
-# MAC-Adressen aus der Datei laden
-def load_mac_addresses(file_path):
-    with open(file_path, 'r') as file:
-        mac_addresses = [line.strip() for line in file.readlines()]
-    return mac_addresses
-
-mac_addresses = load_mac_addresses("./beacon_mac.txt")
+workload = Workload(rate=messages_per_second)
 
 def on_disconnect(client, userdata, rc):
     if rc != 0:
@@ -37,25 +40,14 @@ def on_disconnect(client, userdata, rc):
                 time.sleep(5)
 
 def publish_messages(client):
-    i = 1
+    data = workload.data()
     while True:
         for _ in range(messages_per_second):
-            mac_index = (i - 1) % len(mac_addresses)
-            mac_address = mac_addresses[mac_index]
-            randRSSI = random.randint(100,250)
-            if i % 4 == 0:
-                lastNum = random.randint(1, 9)
-            else:
-                lastNum = 2
-            if i % 44 == 0 or i % 45 == 0:
-                randButton = random.randint(0, 1)
-            else:
-                randButton = 0
-            message_content = f"layer=1, MAC_ROOM=00:00:00:00:00:0{lastNum}, MAC_SENSOR={mac_address}, BATT=100, BUTTON={randButton}, RSSI={randRSSI}"
-            
+            timestamp, message_content = next(data)
+            if envelope:
+                message_content = json.dumps({"time": int(time.time()), "data": message_content})
             client.publish(mqtt_topic, message_content)
             print(message_content)
-            i += 1
         time.sleep(1)
 
 def main():
@@ -1,11 +1,34 @@
 import paho.mqtt.client as mqtt  # für die MQTT Verbindung
 import mysql.connector  # für die Datenbank-Verbindung
 import time  # zur Nutzung von Methoden zur Zeitberechnung
-import json  # zum einfachen Separieren der MQTT Nachricht
+import Cache_Serializer  # Formate der memcache Einträge (JSON, gepackte Records und Id-Listen)
 from pymemcache.client import base  # eine Bibliothek für serverseitigen memcache
 import sys  # um Fehlercode bei einem Abbruch zurückzugeben
 import os
+import signal  # zum geordneten Beenden (SIGTERM)
+import logging  # Meldungen über Service_Log, formatiert und geschrieben im Hintergrund
+import Service_Log
 from dotenv import load_dotenv, find_dotenv
+from Beacon_State import StateStore, HubRecord, BeaconRecord, as_hub, as_beacon  # In-Prozess Zustand mit write-behind zum memcache
+import Beacon_Table  # spaltenweise Beacon-Tabelle für große Flotten
+import State_Snapshot  # Snapshot des Zustands auf Platte, schneller Neustart
+from DB_Write_Behind import WriteBehindQueue  # gesammeltes Schreiben in die Datenbank
+from DB_Pool import ConnectionPool  # Verbindungspool für MySQL
+import SQL_Statements  # vorbereitete, parametrisierte SQL Statements
+from Cache_Warmup import bulk_warmup  # Vorbefüllung des memcache in Blöcken
+from Pair_Registry import PairRegistry, canonical  # Register der Beaconpaare, gemeinsam mit dem Validity Check
+from Cache_Batch import CacheBatch, CacheLock  # get_many/set_many/delete_many für zusammengehörige Schlüssel, Sperren
+from Room_Assignment import RoomAssignment  # Hubwechsel anhand geglätteter RSSI-Werte mit Hysterese
+from MQTT_Pipeline import MessagePipeline  # Entkopplung von MQTT Empfang und Verarbeitung
+from MQTT_Parser import parse_message, MessageFormatError  # Zerlegen der MQTT Nachricht
+from Async_Runtime import AsyncRuntime  # optionale asyncio Laufzeit
+from Traffic_Capture import TrafficRecorder  # Mitschnitt der empfangenen Nachrichten (Traffic_Replay.py)
+from Dedup_Index import DedupIndex  # Verwerfen wiederholt gesendeter Nachrichten vor jedem Zugriff
+from Event_Feed import EventFeed  # Ereignisse (Raumwechsel, Paare, Gefährdungen) für nachgelagerte Systeme
+from Presence_Index import PresenceIndex  # anwesende Beacons je Hub, Partner für Paarungen
+from Beacon_Monitor import BeaconMonitor  # Batteriestand und stille Beacons, gesammelte Alarme
+import Metrics  # Zähler und Latenz-Histogramme, Abruf im Prometheus Format
+import Beaconpair_Validity_check as validity_check  # Ablaufsteuerung der Gefährdungseinträge läuft im Microservice mit
 
 # Laden der ungebungsabhängigen Konfigurationsparameter
 load_dotenv(find_dotenv('Default_Config.env'))
@@ -17,59 +40,281 @@ db_config = {
     'password': os.getenv('DB_PASSWORD'),
     'database': os.getenv('DB_DATABASE')
 }
-db_connection = None    # Globale Variable zum Halten des DB connectors
+# Anzahl der DB Verbindungen im Pool, Intervall der Verbindungsprüfung, maximaler Backoff und Wartezeit auf eine Verbindung
+db_pool_size = int(os.getenv('DB_POOL_SIZE', 4))
+db_pool_health_interval = int(os.getenv('DB_POOL_HEALTH_INTERVAL', 30))
+db_pool_backoff_max = int(os.getenv('DB_POOL_BACKOFF_MAX', 60))
+db_pool_timeout = int(os.getenv('DB_POOL_TIMEOUT', 10))
 # MQTT Broker Konfiguration
 memcache_server = os.getenv('MEMCACHE_SERVER')
 memcache_port = int(os.getenv('MEMCACHE_PORT'))
+# Schreibformat der memcache Einträge: 'binary' oder 'json' (bisheriges Format, für die Umstellung im Betrieb)
+cache_format = os.getenv('CACHE_FORMAT', 'json')
 mqtt_server = os.getenv('MQTT_SERVER')
 mqtt_port = int(os.getenv('MQTT_PORT'))
 mqtt_topic = os.getenv('MQTT_TOPIC')
 #client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
 client = mqtt.Client()
 client.username_pw_set(os.getenv('MQTT_USER'), os.getenv('MQTT_PW'))
+# Abonnierte Topics. Im Scale-Out mit Shared Subscriptions ersetzt Scale_Out.py diese Liste.
+mqtt_subscriptions = [mqtt_topic]
 # Raumwechsel bei niedrigerem RSSI nach Zeitlücke
 room_timegap = int(os.getenv('ROOM_TIMEGAP'))
 pairing_timegap = int(os.getenv('TIMEGAP'))
 db_update_cycle_beacon = int(os.getenv('DB_UPDATE_CYCLE_BEACON'))
 db_update_cycle_hub = int(os.getenv('DB_UPDATE_CYCLE_HUB'))
+# Raumzuordnung: 'smoothed' (RSSI-Fenster je Beacon und Hub) oder 'legacy' (einzelner Wert wie bisher),
+# Fenstergröße, Glättung (mean/median), Hysterese in RSSI-Einheiten, Mindestanzahl Werte und Gültigkeit der Werte in Sekunden
+room_assignment_mode = os.getenv('ROOM_ASSIGNMENT', 'smoothed')
+room_window = int(os.getenv('ROOM_WINDOW', 8))
+room_smoothing = os.getenv('ROOM_SMOOTHING', 'median')
+room_hysteresis = int(os.getenv('ROOM_HYSTERESIS', 10))
+room_min_samples = int(os.getenv('ROOM_MIN_SAMPLES', 3))
+room_sample_timeout = int(os.getenv('ROOM_SAMPLE_TIMEOUT', 30))
+# Intervall des write-behind in den memcache, Wartezeit bis zur erneuten Suche unbekannter MACs und deren Höchstzahl
+state_flush_interval = float(os.getenv('STATE_FLUSH_INTERVAL', 1))
+state_unknown_retry = int(os.getenv('STATE_UNKNOWN_RETRY', 60))
+state_unknown_max = int(os.getenv('STATE_UNKNOWN_MAX', 100000))
+# Speicher der Beacon-Datensätze: 'dict' (ein Objekt je Beacon) oder 'table' (Spalten, siehe Beacon_Table.py)
+state_beacon_store = os.getenv('STATE_BEACON_STORE', 'dict')
+# Snapshot des Zustands in diese Datei (leer = aus), alle STATE_SNAPSHOT_INTERVAL Sekunden und beim Beenden.
+# Mit STATE_RESTORE = 1 startet der Microservice aus dem Snapshot statt alle Daten neu zu laden (siehe State_Snapshot.py).
+state_snapshot_file = os.getenv('STATE_SNAPSHOT_FILE', '')
+state_snapshot_interval = int(os.getenv('STATE_SNAPSHOT_INTERVAL', 300))
+state_restore = os.getenv('STATE_RESTORE', '1') == '1'
+# Write-Behind der Datenbank: Batchgröße, maximales Intervall, maximale Anzahl wartender Datensätze
+db_write_batch_size = int(os.getenv('DB_WRITE_BATCH_SIZE', 500))
+db_write_interval = float(os.getenv('DB_WRITE_INTERVAL', 1))
+db_write_max_pending = int(os.getenv('DB_WRITE_MAX_PENDING', 20000))
+# Warm-up beim Start: 'bulk' (gestreamt, Abgleich mit dem memcache in Blöcken) oder 'legacy' (zeilenweise)
+warmup_mode = os.getenv('WARMUP_MODE', 'bulk')
+warmup_chunk_size = int(os.getenv('WARMUP_CHUNK_SIZE', 1000))
+# Anzahl der Shards, auf die das Pair Registry die Liste aller Beaconpaare verteilt (in allen Workern gleich!)
+pair_shards = int(os.getenv('PAIR_SHARDS', 64))
+# Pipeline-Modus: Anzahl Worker (0 = Verarbeitung direkt im MQTT Callback), Puffergröße, Verhalten bei vollem Puffer (block/drop)
+pipeline_workers = int(os.getenv('PIPELINE_WORKERS', 0))
+pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', 10000))
+pipeline_full_policy = os.getenv('PIPELINE_FULL_POLICY', 'block')
+# Micro-Batch Modus: maximale Anzahl Nachrichten je Batch (1 = aus) und maximale Wartezeit auf weitere Nachrichten in ms
+batch_size = int(os.getenv('BATCH_SIZE', 1))
+batch_delay_ms = int(os.getenv('BATCH_DELAY_MS', 20))
+# Laufzeit: 'blocking' (paho loop_start, wie bisher) oder 'asyncio' (Verarbeitung in einer Event-Loop)
+runtime_mode = os.getenv('RUNTIME_MODE', 'blocking')
+async_workers = int(os.getenv('ASYNC_WORKERS', 64))
+async_io_threads = int(os.getenv('ASYNC_IO_THREADS', 64))
+# Verarbeiten mehrere Worker gleichzeitig Nachrichten? Nur dann werden gemeinsam genutzte Einträge im memcache
+# zusätzlich abgesichert (siehe beacon_pairing_hubwechsel). Im Scale-Out setzt Scale_Out.py den Wert.
+parallel = async_workers > 1 and async_io_threads > 1 if runtime_mode == 'asyncio' else pipeline_workers > 1
+# Endpunkt der Kennzahlen, METRICS_PORT = 0 schaltet den Endpunkt ab (gezählt wird trotzdem)
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(os.getenv('METRICS_PORT', 9108))
+# Mitschnitt der empfangenen Nachrichten in diese Datei (leer = aus), maximale Größe in MB (0 = unbegrenzt)
+capture_file = os.getenv('CAPTURE_FILE', '')
+capture_max_mb = int(os.getenv('CAPTURE_MAX_MB', 1024))
+# Fenster des Dedup-Index in Sekunden (0 = aus) und maximale Anzahl gemerkter Nachrichten
+dedup_window = int(os.getenv('DEDUP_WINDOW', 300))
+dedup_max_entries = int(os.getenv('DEDUP_MAX_ENTRIES', 500000))
+# Ereignisse auf MQTT (Basis-Topic) und/oder in eine Datei (leer = aus), Schreibintervall, Blockgröße, Snapshot-Intervall
+events_topic = os.getenv('EVENTS_TOPIC', '')
+events_log_file = os.getenv('EVENTS_LOG_FILE', '')
+events_interval_ms = int(os.getenv('EVENTS_INTERVAL_MS', 200))
+events_batch_size = int(os.getenv('EVENTS_BATCH_SIZE', 500))
+events_snapshot_interval = int(os.getenv('EVENTS_SNAPSHOT_INTERVAL', 300))
+# Sekunden ohne Nachricht, nach denen ein Beacon nicht mehr als anwesend gilt.
+# PRESENCE_PAIRING = 1: Paarungsanfragen im Prozess statt im memcache (im Scale-Out immer über den memcache)
+presence_timeout = int(os.getenv('PRESENCE_TIMEOUT', 300))
+presence_pairing = os.getenv('PRESENCE_PAIRING', '1') == '1'
+# Überwachung der Beacons (siehe Beacon_Monitor.py): Schwelle und Hysterese des Batteriestands, Sekunden ohne Nachricht
+# bis zum Alarm (beide 0 = aus), Glättung des Batteriestands, Sekunden zwischen zwei Ausgaben der Alarme
+monitor_battery_threshold = int(os.getenv('MONITOR_BATTERY_THRESHOLD', 20))
+monitor_battery_hysteresis = int(os.getenv('MONITOR_BATTERY_HYSTERESIS', 5))
+monitor_silence = int(os.getenv('MONITOR_SILENCE', 900))
+monitor_smoothing = float(os.getenv('MONITOR_SMOOTHING', 0.3))
+monitor_interval = float(os.getenv('MONITOR_INTERVAL', 5))
 
-# Debug Level und Filter Funktion, Debug Meldungen aus dem Text können bitweise auf Leveln definiert werden
-debug_level = int(os.getenv('DEBUG_LEVEL'))
+# Protokollierung (siehe Service_Log.py). Ohne LOG_LEVEL gilt wie bisher DEBUG_LEVEL, bitweise je Logger.
+log_level = os.getenv('LOG_LEVEL')
+log_format = os.getenv('LOG_FORMAT', 'text')
+log_sample = int(os.getenv('LOG_SAMPLE', 1))
+log_queue_size = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+debug_level = int(os.getenv('DEBUG_LEVEL', 0))
 debug_count = 0
-def do_debug(k):
-    temp = debug_level >> (k - 1)
-    return temp & 1 != 0
-
-# Serializer zur Memcache Nutzung, erleichten den Zugriff (Strings/Arrays statt bytes).
-def json_serializer(key, value):
-    return json.dumps(value), 1
-def json_deserializer(key, value, flags):
-    if flags == 1:
-        return json.loads(value)
-    raise Exception("Unknown serialization format")
-
-# Verbindung zur Datenbank herstellen
-def connect_to_db():
-    try:
-        return mysql.connector.connect(**db_config)
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
-        return None
+log = logging.getLogger('ats')
+detail_log = logging.getLogger('ats.detail')
+
+# Serializer zur Memcache Nutzung, erleichten den Zugriff (Records/Arrays statt bytes).
+# Gelesen werden alle Formate, geschrieben wird im Format CACHE_FORMAT (siehe Cache_Serializer.py).
+cache_serializer = Cache_Serializer.serializer_for(cache_format)
+
+# Pool der Datenbankverbindungen für alle DB-Zugriffe. Verbindungen werden im Hintergrund geprüft
+# und neu aufgebaut, bei der Verarbeitung einer Nachricht ist keine Prüfung nötig.
+db_pool = ConnectionPool(db_config, db_pool_size, db_pool_health_interval, db_pool_backoff_max, db_pool_timeout)
+
+# Schreiben der Beacon-, Hub- und Paar-Updates im Hintergrund, mit Verbindungen aus dem Pool
+db_writer = WriteBehindQueue(db_pool, db_write_batch_size, db_write_interval, db_write_max_pending)
+
+# Pipeline aus Ringpuffer und Workern, nur wenn konfiguriert. Sonst wird im MQTT Callback verarbeitet.
+# Im Micro-Batch Modus verarbeitet jeder Worker (mindestens einer) Listen von Nachrichten mit process_batch.
+pipeline = None
+if batch_size > 1 and runtime_mode != 'asyncio':
+    pipeline = MessagePipeline(lambda messages: process_batch(messages), max(1, pipeline_workers), pipeline_queue_size,
+                               pipeline_full_policy, batch_size, batch_delay_ms / 1000)
+elif pipeline_workers > 0 and runtime_mode != 'asyncio':
+    pipeline = MessagePipeline(lambda message: process_message(message), pipeline_workers, pipeline_queue_size, pipeline_full_policy)
+
+# Aufbau der globalen Verbindung zum memcached. PooledClient, da der write-behind und die Pipeline-Worker
+# aus eigenen Threads zugreifen.
+# Die Dauer jeder memcache Operation wird festgehalten (ats_memcache_seconds).
+memcache_seconds = Metrics.histogram('ats_memcache_seconds', 'Duration of memcache operations', ('operation',))
+memcache = Metrics.TimedClient(base.PooledClient((memcache_server, memcache_port), serializer=cache_serializer,
+                                                 deserializer=Cache_Serializer.deserializer), memcache_seconds)
+# Zustand von Hubs und Beacons im Prozess. Der memcache wird im Hintergrund aktualisiert.
+state = StateStore(memcache, state_flush_interval, state_unknown_retry,
+                   Beacon_Table.BeaconTable() if state_beacon_store == 'table' else {},
+                   (lambda: zustand_sichern()) if state_snapshot_file else None,
+                   state_snapshot_interval, state_unknown_max)
+# Entscheidung über Hubwechsel (Case 3), mit Zählern für vermiedene Wechsel
+room_assignment = RoomAssignment(room_assignment_mode, room_window, room_smoothing, room_hysteresis,
+                                 room_min_samples, room_sample_timeout, room_timegap)
+# Beaconpaare mit Nachbarschaft je Beacon und auf Shards verteilter Gesamtliste
+registry = PairRegistry(memcache, pair_shards)
+
+# Der Validity Check nutzt denselben Verbindungspool, memcache Client (PooledClient, sicher bei Aufrufen aus
+# mehreren Threads) und dasselbe Pair Registry. Neue Gefährdungseinträge werden direkt in dessen Ablaufsteuerung eingetragen.
+validity_check.db_pool = db_pool
+validity_check.memcache = memcache
+validity_check.registry = registry
+expiry = validity_check.expiry
+# asyncio Laufzeit, nur bei RUNTIME_MODE = asyncio (siehe main_async)
+runtime = None
+# Mitschnitt, nur mit CAPTURE_FILE. Im Scale-Out schreibt jeder Worker eine eigene Datei (siehe Scale_Out.py).
+capture = TrafficRecorder(capture_file, capture_max_mb * 1024 * 1024) if capture_file else None
+# Zuletzt verarbeitete (Beacon, Hub, Zeitstempel), nur mit DEDUP_WINDOW > 0 (siehe Dedup_Index.py)
+dedup = DedupIndex(dedup_window, dedup_max_entries) if dedup_window > 0 else None
+
+# Anwesende Beacons je Hub (siehe Presence_Index.py), Abfrage über den Endpunkt der Kennzahlen (/presence)
+presence = PresenceIndex(presence_timeout)
+
+# Snapshot des Zustands für den Neustart, im Thread des StateStore (siehe State_Snapshot.py)
+def zustand_sichern():
+    State_Snapshot.save(state_snapshot_file, memcache, state, registry, expiry, presence, room_assignment, monitor)
+
+# Stand für den Snapshot des Ereignis-Feeds: je Beacon mit Hub [Hub, seit, MAC], Paare und kritische Paare
+def ereignis_snapshot():
+    beacons = {record.beacon_id: [record.hub_id, record.hub_ts_beginn, mac]
+               for mac, record in list(state.beacons.items()) if record.hub_id is not None}
+    return {'beacons': beacons, 'pairs': sorted(list(pair) for pair in registry.pairs()),
+            'critical': sorted(list(pair) for pair in expiry.critical())}
+
+# Ereignis-Feed, nur mit EVENTS_TOPIC oder EVENTS_LOG_FILE. Für MQTT mit eigener Verbindung, da im Scale-Out nicht jeder
+# Worker mit dem Broker verbunden ist. Im Scale-Out schreibt jeder Worker als eigene Quelle (siehe Scale_Out.py).
+events = None
+if events_topic or events_log_file:
+    events_client = None
+    if events_topic:
+        events_client = mqtt.Client()
+        events_client.username_pw_set(os.getenv('MQTT_USER'), os.getenv('MQTT_PW'))
+    events = EventFeed(ereignis_snapshot, events_client, mqtt_server, mqtt_port, events_topic, events_log_file,
+                       interval=events_interval_ms / 1000, batch_size=events_batch_size,
+                       snapshot_interval=events_snapshot_interval)
+validity_check.events = events
 
-# Optimierungsbedarf: Globale Datenbankverbindung, einmal geöffnet für die Laufzeit des Programms
-db_connection = connect_to_db()
+# Ausgabe gesammelter Alarme der Überwachung: eine Meldung je Block, Ereignisse für den Feed
+def alarme_melden(alarme):
+    beacons = {}
+    for alarm in alarme:
+        beacons.setdefault(alarm['kind'], []).append(alarm['beacon'])
+        if events is not None:
+            events.emit('alert', **alarm)
+    log.warning("Beacon alerts: %s", {kind: sorted(beacon_ids) for kind, beacon_ids in beacons.items()})
 
-# Aufbau der globalen Verbindung zum memcached
-memcache = base.Client((memcache_server, memcache_port), serializer=json_serializer, deserializer=json_deserializer)
+# Überwachung von Batteriestand und Meldungen, nur mit MONITOR_BATTERY_THRESHOLD oder MONITOR_SILENCE > 0.
+# monitor_seed: beim Start alle Beacons aus dem Zustand übernehmen (im Scale-Out aus, siehe Scale_Out.py)
+monitor = None
+monitor_seed = True
+if monitor_battery_threshold > 0 or monitor_silence > 0:
+    monitor = BeaconMonitor(alarme_melden, monitor_battery_threshold, monitor_battery_hysteresis, monitor_silence,
+                            monitor_smoothing, monitor_interval)
+
+# Kennzahlen der Verarbeitung (siehe Metrics.py). Die Objekte je Label werden hier einmal geholt.
+message_seconds = Metrics.histogram('ats_message_seconds', 'Processing time per message')
+parse_seconds = Metrics.histogram('ats_parse_seconds', 'Time to parse a message')
+lookup_seconds = Metrics.histogram('ats_lookup_seconds', 'Hub and beacon lookups by source', ('kind', 'source'))
+hub_lookup = {source: lookup_seconds.labels('hub', source) for source in ('process', 'memcache', 'db', 'unknown')}
+beacon_lookup = {source: lookup_seconds.labels('beacon', source) for source in ('process', 'memcache', 'db', 'unknown')}
+messages_total = Metrics.counter('ats_messages_total', 'Messages by outcome', ('outcome',))
+ergebnis = {outcome: messages_total.labels(outcome) for outcome in
+            ('case1', 'case2', 'case3_change', 'case3_stay', 'duplicate', 'replay', 'unknown_hub', 'unknown_beacon',
+             'invalid', 'error')}
+pairing_total = Metrics.counter('ats_pairing_total', 'Pairing requests by result', ('result',))
+pairing_ergebnis = {result: pairing_total.labels(result) for result in
+                    ('paired', 'waiting', 'expired', 'no_mapping', 'error')}
+critical_total = Metrics.counter('ats_critical_pairs_total', 'Changes of critical pair entries on hub changes', ('action',))
+critical_ergebnis = {action: critical_total.labels(action) for action in ('created', 'updated', 'cleared')}
+batch_seconds = Metrics.histogram('ats_batch_seconds', 'Processing time per micro-batch')
+batch_preload_seconds = Metrics.histogram('ats_batch_preload_seconds', 'Time to preload hubs and beacons of a micro-batch')
+batch_messages = Metrics.histogram('ats_batch_messages', 'Messages per micro-batch', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+metrics_server = None
+
+# Länge der Warteschlangen, gelesen erst beim Abruf
+def warteschlangen():
+    depth = {'db_write_behind': db_writer.depth(), 'state_write_behind': state.pending(), 'expiry': expiry.pending()}
+    if pipeline is not None:
+        depth['pipeline'] = pipeline.depth()
+    if runtime is not None:
+        depth['pipeline'] = sum(queue.qsize() for queue in runtime.queues)
+    return depth
+
+def verworfen():
+    if pipeline is not None:
+        return pipeline.dropped
+    if runtime is not None:
+        return runtime.dropped
+    return 0
+
+Metrics.gauge('ats_queue_depth', 'Entries waiting in internal queues', warteschlangen, 'queue')
+Metrics.gauge('ats_messages_dropped_total', 'Messages dropped because the pipeline was full', verworfen, kind='counter')
+Metrics.gauge('ats_room_assignment_total', 'Room assignment decisions (see Room_Assignment.py)',
+              lambda: {result: count for result, count in room_assignment.stats().items() if result != 'beacons'},
+              'result', kind='counter')
+Metrics.gauge('ats_room_assignment_beacons', 'Beacons with RSSI windows', lambda: room_assignment.stats()['beacons'])
+Metrics.gauge('ats_capture_total', 'Received messages written to or dropped from the capture file',
+              lambda: {'recorded': capture.recorded, 'dropped': capture.dropped} if capture is not None else {},
+              'result', kind='counter')
+Metrics.gauge('ats_dedup_entries', 'Messages remembered by the dedup index', lambda: len(dedup) if dedup is not None else 0)
+Metrics.gauge('ats_dedup_early_rotations_total', 'Generations of the dedup index rotated early because they were full',
+              lambda: dedup.early_rotations if dedup is not None else 0, kind='counter')
+Metrics.gauge('ats_events_total', 'Events published to or dropped from the event feed',
+              lambda: {'published': events.published, 'dropped': events.dropped} if events is not None else {},
+              'result', kind='counter')
+Metrics.gauge('ats_beacons_stale', 'Beacons in the process state without a message for ROOM_TIMEGAP seconds',
+              lambda: len(state.stale_beacons(int(time.time()) - room_timegap)))
+Metrics.gauge('ats_presence_beacons', 'Beacons present in a hub', lambda: len(presence))
+Metrics.gauge('ats_presence_expired_total', 'Beacons removed from their hub after PRESENCE_TIMEOUT without a message',
+              lambda: presence.expired, kind='counter')
+Metrics.gauge('ats_beacon_alerts_total', 'Battery and silence alerts reported by the beacon monitor',
+              lambda: dict(monitor.alerts) if monitor is not None else {}, 'kind', kind='counter')
+Metrics.gauge('ats_beacons_low_battery', 'Beacons with a smoothed battery level below MONITOR_BATTERY_THRESHOLD',
+              lambda: len(monitor.low_battery()) if monitor is not None else 0)
+Metrics.gauge('ats_beacons_silent', 'Beacons without a message for MONITOR_SILENCE seconds',
+              lambda: len(monitor.silent()) if monitor is not None else 0)
+Metrics.gauge('ats_log_dropped_total', 'Log records dropped because the log queue was full', Service_Log.dropped, kind='counter')
 
 # Initalisieren von relevanten Daten bei Programmstart aus der Maria-DB
 def load_initial_data():
+    if warmup_mode == 'bulk':
+        try:
+            bulk_warmup(db_pool, memcache, state, registry, warmup_chunk_size)
+        except Exception as e:
+            log.error("An error occurred: %s", e)
+        return
     # Initialisieren von Beacondaten mit und ohne MP
     try:
-        cursor = db_connection.cursor(dictionary=True)
-        query = ''' SELECT * from beacon_left_join_mp '''
-        cursor.execute(query)
-        beacon_mp_cache = cursor.fetchall()
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            query = ''' SELECT * from beacon_left_join_mp '''
+            cursor.execute(query)
+            beacon_mp_cache = cursor.fetchall()
         for data_values in beacon_mp_cache:
             if isinstance(data_values, dict):
                 beacon_id = data_values['beacon_id']
@@ -81,23 +326,25 @@ def load_initial_data():
                 mp_mp_typ_id = data_values['mp_mp_typ_id']  # Null, falls noch nicht zugeordnet
                 beacon_MAC = data_values['beacon_MAC']
                 beacon_db_sync_timestamp = data_values['beacon_timestamp']
-                beacon_neudaten = (beacon_id, beacon_hub_id, beacon_rssi, beacon_timestamp, beacon_hub_ts_beginn, beacon_batterie, mp_mp_typ_id, beacon_db_sync_timestamp)
+                beacon_neudaten = BeaconRecord(beacon_id, beacon_hub_id, beacon_rssi, beacon_timestamp, beacon_hub_ts_beginn, beacon_batterie, mp_mp_typ_id, beacon_db_sync_timestamp)
                 # Falls neu oder aktueller als im Memcache, dort aktualisieren
-                if memcache.get(beacon_MAC) is None or memcache.get(beacon_MAC)[7] <= beacon_timestamp:
+                beacon_cache = as_beacon(memcache.get(beacon_MAC))
+                if beacon_cache is None or beacon_cache.db_sync_timestamp <= beacon_timestamp:
                     beacon_initial_anlegen(beacon_MAC, beacon_neudaten)
                 else:
                     beacon_aktualisieren(beacon_MAC, beacon_neudaten)
             else:
-                print(f"Unexpected data format: {data_values}")
+                log.warning("Unexpected data format: %s", data_values)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
 
     # Initialisieren von zulässigen MP-Verbindungen (für Beaconpaare relevant)
     try:
-        cursor = db_connection.cursor(dictionary=True)
-        query = ''' SELECT * from mp_mapping '''
-        cursor.execute(query)
-        mp_mapping_cache = cursor.fetchall()
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            query = ''' SELECT * from mp_mapping '''
+            cursor.execute(query)
+            mp_mapping_cache = cursor.fetchall()
         # Aktualisieren des Memcache für alle Paarungen
         for data_values in mp_mapping_cache:
             if isinstance(data_values, dict):
@@ -105,16 +352,17 @@ def load_initial_data():
                 mp_typ_id2 = data_values['mp_mapping_mp_typ_id_2']
                 update_mp_typ_mapping(mp_typ_id1, mp_typ_id2)
             else:    
-                print(f"Unexpected data format: {data_values}")
+                log.warning("Unexpected data format: %s", data_values)
     except mysql.connector.Error as err:
-        print(f"Error loading initial data: {err}")
+        log.error("Error loading initial data: %s", err)
 
     # Initialisieren von bereits vorhandenen Beaconpaaren
     try:
-        cursor = db_connection.cursor(dictionary=True)
-        query = ''' SELECT * FROM beaconpair '''
-        cursor.execute(query)
-        mp_beaconpair_cache = cursor.fetchall()
+        with db_pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            query = ''' SELECT * FROM beaconpair '''
+            cursor.execute(query)
+            mp_beaconpair_cache = cursor.fetchall()
         # Aktualisieren des Memcache für alle Paarungen
         for data_values in mp_beaconpair_cache:
             if isinstance(data_values, dict):
@@ -122,13 +370,13 @@ def load_initial_data():
                 beaconpair_beacon_id_2 = int(data_values['beaconpair_beacon_id_2'])
                 update_beaconpairs(beaconpair_beacon_id_1, beaconpair_beacon_id_2)
             else:
-                print(f"Unexpected data format: {data_values}")
+                log.warning("Unexpected data format: %s", data_values)
     except mysql.connector.Error as err:
-        print(f"Error loading initial data: {err}")
+        log.error("Error loading initial data: %s", err)
 
 
 def beacon_initial_anlegen(beacon_MAC, beacon_neudaten):
-    memcache.set(beacon_MAC, beacon_neudaten)
+    state.put_beacon(beacon_MAC, beacon_neudaten)
     return None
 
 # Befüllen des Memcache mit zulässigen Mappings (aus der Datenbank)
@@ -143,7 +391,7 @@ def update_mp_typ_mapping(mp_typ_id_1, mp_typ_id_2):
     if mp_typ_id_2 not in mp_typ_mapping_temp: 
         mp_typ_mapping_temp.append(mp_typ_id_2)
         memcache.set(mp_typ_mapping_key, mp_typ_mapping_temp)
-    if do_debug(2): print(f"Mapping Data von {mp_typ_id_1} in Memcache: {memcache.get(mp_typ_mapping_key)}")
+    log.debug("Mapping Data von %s in Memcache: %s", mp_typ_id_1, mp_typ_mapping_temp)
 
     # Eintrag in der zweiten Richtung
     mp_typ_mapping_key = f'mp_typ_mapping_{mp_typ_id_2}'
@@ -152,160 +400,134 @@ def update_mp_typ_mapping(mp_typ_id_1, mp_typ_id_2):
     if mp_typ_id_1 not in mp_typ_mapping_temp:
         mp_typ_mapping_temp.append(mp_typ_id_1)
         memcache.set(mp_typ_mapping_key, mp_typ_mapping_temp)
-    if do_debug(2): print(f"Mapping Data von {mp_typ_id_2} in Memcache: {memcache.get(mp_typ_mapping_key)}")
+    log.debug("Mapping Data von %s in Memcache: %s", mp_typ_id_2, mp_typ_mapping_temp)
 
 # Funktion um ein Beaconpaar einzutragen
 # Notation: beaconpairs_BeaconID: [MappedBeaconID1, MappendBeacon_ID2, MappedBeaconID...]
 def update_beaconpairs(beacon_id_1, beacon_id_2):
-    # Für jedes Beacon die jeweils andere ID in den Pairs hinzufügen
-    beaconpairs_key = f'beaconpairs_{beacon_id_1}'
-    # Bestehende Paarungen holen.
-    beaconpairs_temp = memcache.get(beaconpairs_key)
-    if beaconpairs_temp is None: beaconpairs_temp = []
-    # Neue ID anhängen und Speichern
-    if beacon_id_2 not in beaconpairs_temp: beaconpairs_temp.append(beacon_id_2)
-    memcache.set(beaconpairs_key, beaconpairs_temp)
-    # Für zweite ID entsprechend
-    beaconpairs_key = f'beaconpairs_{beacon_id_2}'
-    beaconpairs_temp = memcache.get(beaconpairs_key)
-    if beaconpairs_temp is None: beaconpairs_temp = []
-    if beacon_id_1 not in beaconpairs_temp: beaconpairs_temp.append(beacon_id_1)
-    memcache.set(beaconpairs_key, beaconpairs_temp)
-
-    # Hinzufügen der Beaconpaare in Array für Crawler
-    tmp_pair_1 = f"{beacon_id_1},{beacon_id_2}"
-    tmp_pair_2 = f"{beacon_id_2},{beacon_id_1}" 
-    tmp_beaconpairs = memcache.get('beaconpairs')
-    # Gibt es noch keine Paare? Dann leer.
-    if tmp_beaconpairs is None: tmp_beaconpairs = []
-    # Nur hinzufügen, wenn nicht schon existent
-    if tmp_pair_1 not in tmp_beaconpairs and tmp_pair_2 not in tmp_beaconpairs:
-        tmp_beaconpairs.append(f"{beacon_id_1},{beacon_id_2}")
-        memcache.set('beaconpairs', tmp_beaconpairs)
-    if do_debug(2): print(f"Beaconpair Data von {beacon_id_2} in Memcache: {memcache.get(beaconpairs_key)}")
+    # Eintragen in die Nachbarschaften beider Beacons und in den Shard des Paares (Pair_Registry)
+    registry.add(beacon_id_1, beacon_id_2)
+    # Zusätzliches Lesen aus dem memcache nur, wenn die Meldung ausgegeben wird
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Beaconpair Data von %s in Memcache: %s", beacon_id_2, registry.partners(beacon_id_2))
 
 
 # Hub-Zuordnung zu Beacon in DB und Memcache aktualisieren
 def hub_aktualisieren(hub_MAC, timestamp):
-    hub_data = memcache.get(hub_MAC)  # Suche im Cache
-    if hub_data is not None:  # [0]: id, [1]: ts, [2]: ts des letzten updates der Datenbank
-        if do_debug(2): print("Aktualisierung Hub: Bereits im Cache: ", memcache.get(hub_MAC))
-        hub_id = hub_data[0]
+    start_time = time.perf_counter()
+    source = 'process'
+    hub_id = 0
+    hub_data = state.get_hub(hub_MAC)  # Suche im Prozess, ohne Netzwerkzugriff
+    if hub_data is None and not state.is_unknown(hub_MAC, timestamp):
+        hub_data = state.load_hub(hub_MAC)  # Suche im Cache, z.B. nach Neustart des Programms
+        source = 'memcache'
+    if hub_data is not None:
+        log.debug("Aktualisierung Hub: Bereits im Cache: %s", hub_data)
+        hub_id = hub_data.hub_id
         # Hub Timestamp in DB aktualisieren, dies dient der Nachvollziehbarkeit, dass der Hub noch aktiv ist
-        if hub_data[2] + db_update_cycle_hub < timestamp:  
-            if do_debug(4): print("Aktualisierung Hub: Bereits im Cache, aber DB Eintrag zu alt: ", memcache.get(hub_MAC))
-            try:
-                my_cursor = db_connection.cursor()
-                my_query = 'update hub set hub_timestamp = %(ts)s where hub_id = "%(id)s"' % {'ts': timestamp, 'id': hub_id}
-                my_cursor.execute(my_query)
-                db_connection.commit()
-                memcache.set(hub_MAC, [hub_id, timestamp, timestamp])
-            except mysql.connector.Error as err:
-                print(f"Error updating hub in MySQL: {err}")
+        if hub_data.db_sync_timestamp + db_update_cycle_hub < timestamp:
+            detail_log.debug("Aktualisierung Hub: Bereits im Cache, aber DB Eintrag zu alt: %s", hub_data)
+            db_writer.submit('hub', hub_id, (timestamp, hub_id))
+            state.put_hub(hub_MAC, HubRecord(hub_id, timestamp, timestamp))
         else:
-            if hub_data[1] < timestamp:
-                memcache.set(hub_MAC, [hub_id, timestamp, hub_data[2]])
-                if do_debug(2): print("Aktualisierung Hub: Bereits im Cache, aber neuer TS: ", memcache.get(hub_MAC))
-    else:
+            if hub_data.timestamp < timestamp:
+                hub_data = HubRecord(hub_id, timestamp, hub_data.db_sync_timestamp)
+                state.put_hub(hub_MAC, hub_data)
+                log.debug("Aktualisierung Hub: Bereits im Cache, aber neuer TS: %s", hub_data)
+    elif not state.is_unknown(hub_MAC, timestamp):
         # Hub neu/noch nicht im Cache
+        source = 'db'
         try:
-            my_cursor = db_connection.cursor()
-            my_query = 'Select hub_id, hub_timestamp from hub where hub_MAC = "%(hub)s"' % {'hub': hub_MAC}
-            my_cursor.execute(my_query)
-            my_result = my_cursor.fetchone()
+            with db_pool.connection() as connection:
+                my_result = SQL_Statements.fetchone(connection, 'hub_select', (hub_MAC,))
             if my_result is not None:  # hub gefunden, im memcache mit aktuellem ts eintragen
                 hub_id = my_result[0]
-                memcache.set(hub_MAC, [hub_id, timestamp, timestamp])
-            if do_debug(2): print("Hub noch nicht im Cache. Cache geladen mit: ", memcache.get(hub_MAC))
+                hub_data = HubRecord(hub_id, timestamp, timestamp)
+                state.put_hub(hub_MAC, hub_data)
+            else:
+                state.mark_unknown(hub_MAC, timestamp)
+            log.debug("Hub noch nicht im Cache. Cache geladen mit: %s", hub_data)
         except mysql.connector.Error as err:
-            print(f"Error querying hub from MySQL: {err}")
+            log.error("Error querying hub from MySQL: %s", err)
+    else:
+        source = 'unknown'
+    hub_lookup[source].observe(time.perf_counter() - start_time)
     return hub_id
 
-# Holen der zuletzt bekannten Beacondaten. Aus Memcache oder bei nach Start des Programms hinzugekommenen Beacons aus der Datenbank.
+# Holen der zuletzt bekannten Beacondaten. Aus dem Prozess, dem Memcache oder bei nach Start des Programms hinzugekommenen Beacons aus der Datenbank.
 def beacon_altdaten_holen(beacon_MAC, timestamp):
-    beacon_altdaten = memcache.get(beacon_MAC)
-    if do_debug(2): print("beacon-Altdaten im cache: ", beacon_altdaten)
+    start_time = time.perf_counter()
+    beacon_altdaten = state.get_beacon(beacon_MAC)
+    if beacon_altdaten is not None or state.is_unknown(beacon_MAC, timestamp):
+        beacon_lookup['process' if beacon_altdaten is not None else 'unknown'].observe(time.perf_counter() - start_time)
+        return beacon_altdaten
+    beacon_altdaten = state.load_beacon(beacon_MAC)
+    source = 'memcache'
+    log.debug("beacon-Altdaten im cache: %s", beacon_altdaten)
     if beacon_altdaten is None:
+        source = 'db'
         try:
-            my_cursor = db_connection.cursor()
-            my_query = 'SELECT beacon_id, beacon_hub_id, beacon_RSSI, beacon_timestamp, beacon_hub_ts_beginn, beacon_batterie FROM beacon where beacon_MAC = "%(beacon)s"' % {'beacon': beacon_MAC}
-            my_cursor.execute(my_query)
-            beacon_altdaten = my_cursor.fetchone()
-            if beacon_altdaten is not None:
+            with db_pool.connection() as connection:
+                my_result = SQL_Statements.fetchone(connection, 'beacon_select', (beacon_MAC,))
+            if my_result is not None:
                 # In der Datenbank existiert noch kein Timestamp, zur weiteren Verarbeitung ist er erforderlich
-                beacon_altdaten = beacon_altdaten + (timestamp,)
-                memcache.set(beacon_MAC, beacon_altdaten)
-            if do_debug(2): print("beacon-Altdaten im cache: ", beacon_altdaten)
+                beacon_altdaten = BeaconRecord(*my_result, timestamp)
+                state.put_beacon(beacon_MAC, beacon_altdaten)
+            else:
+                state.mark_unknown(beacon_MAC, timestamp)
+            log.debug("beacon-Altdaten im cache: %s", beacon_altdaten)
         except mysql.connector.Error as err:
-            print(f"Error querying beacon from MySQL: {err}")
+            log.error("Error querying beacon from MySQL: %s", err)
+    beacon_lookup[source].observe(time.perf_counter() - start_time)
     return beacon_altdaten
 
+# Vormerken des aktuellen Stands eines Beacons zum Schreiben in die Datenbank (write-behind).
+# Mehrere Updates desselben Beacons vor dem nächsten Flush werden zu einem zusammengefasst.
+def beacon_db_vormerken(beacon_neudaten):
+    db_writer.submit('beacon', beacon_neudaten.beacon_id,
+                     (beacon_neudaten.hub_id, beacon_neudaten.rssi, beacon_neudaten.timestamp,
+                      beacon_neudaten.hub_ts_beginn, beacon_neudaten.batterie, beacon_neudaten.beacon_id))
+
 # Funktion, die einem existenten Beacon zum ersten Mal einem Hub zuweist.
 def beacon_erstspeicherung(beacon_MAC, beacon_neudaten):
-    if do_debug(2): print("beacon Neudaten speichern (Erstzuweisung)")
-    try:
-        my_cursor = db_connection.cursor()
-        my_query = 'update beacon set beacon_hub_id = "%(hub_id)s", beacon_RSSI = "%(rssi)s", beacon_timestamp = "%(ts)s", beacon_hub_ts_beginn = "%(ts)s", beacon_batterie = "%(bat)s" where beacon_id = "%(id)s"' % {
-            'hub_id': beacon_neudaten[1], 'rssi': beacon_neudaten[2], 'ts': beacon_neudaten[3], 'id': beacon_neudaten[0], 'bat': beacon_neudaten[5]}
-        my_cursor.execute(my_query)
-        db_connection.commit()
-        memcache.set(beacon_MAC, beacon_neudaten)
-    except mysql.connector.Error as err:
-        print(f"Error inserting new beacon data into MySQL: {err}")
+    log.debug("beacon Neudaten speichern (Erstzuweisung)")
+    beacon_db_vormerken(beacon_neudaten)
+    state.put_beacon(beacon_MAC, beacon_neudaten)
 
 # Beacondaten im Memcache und bei Bedarf (z.B. letzter Eintrag mehr als 10 Minuten alt)
 # auch in der DB aktualisieren. Es hat aber kein Hubwechsel stattgefunden.
 def beacon_aktualisieren(beacon_MAC, beacon_neudaten):
-    if do_debug(2): print("beacon im Vergleich speichern")
-    if beacon_neudaten[7] + db_update_cycle_beacon < beacon_neudaten[3]:
-        if do_debug(2): print("beacon Update in DB speichern (Timer)")
-        try:
-            my_cursor = db_connection.cursor()
-            my_query = 'update beacon set beacon_hub_id = "%(hub_id)s", beacon_RSSI = "%(rssi)s", beacon_timestamp = "%(ts)s", beacon_hub_ts_beginn = "%(ts)s", beacon_batterie = "%(bat)s" where beacon_id = "%(id)s"' % {
-                'hub_id': beacon_neudaten[1], 'rssi': beacon_neudaten[2], 'ts': beacon_neudaten[3], 'id': beacon_neudaten[0], 'bat': beacon_neudaten[5]}
-            my_cursor.execute(my_query)
-            db_connection.commit()
-            beacon_neudaten[7] = beacon_neudaten[3]
-        except mysql.connector.Error as err:
-            print(f"Error updating beacon data in MySQL: {err}")
-    memcache.set(beacon_MAC, beacon_neudaten)
-    if do_debug(2): print("beacon im Cache/in DB aktualisiert.")
+    log.debug("beacon im Vergleich speichern")
+    if beacon_neudaten.db_sync_timestamp + db_update_cycle_beacon < beacon_neudaten.timestamp:
+        log.debug("beacon Update in DB speichern (Timer)")
+        beacon_db_vormerken(beacon_neudaten)
+        beacon_neudaten.db_sync_timestamp = beacon_neudaten.timestamp
+    state.put_beacon(beacon_MAC, beacon_neudaten)
+    log.debug("beacon im Cache/in DB aktualisiert.")
 
 # Hubwechsel. Beacondaten im Memcache und der DB aktualisieren.
 def beacon_hubwechsel(beacon_MAC, beacon_neudaten):
-    if do_debug(2): print("beacon zu anderem Hub wechseln (DB und Cache)")
-    try:
-        my_cursor = db_connection.cursor()
-        my_query = 'update beacon set beacon_hub_id = "%(hub_id)s", beacon_RSSI = "%(rssi)s", beacon_timestamp = "%(ts)s", beacon_hub_ts_beginn = "%(ts)s", beacon_batterie = "%(bat)s" where beacon_id = "%(id)s"' % {
-            'hub_id': beacon_neudaten[1], 'rssi': beacon_neudaten[2], 'ts': beacon_neudaten[3], 'id': beacon_neudaten[0], 'bat': beacon_neudaten[5]}
-        my_cursor.execute(my_query)
-        db_connection.commit()
-        memcache.set(beacon_MAC, beacon_neudaten)
-        if do_debug(2): print("beacon im Cache/in DB aktualisiert.")
-    except mysql.connector.Error as err:
-        print(f"Error updating beacon hub data in MySQL: {err}")
+    log.debug("beacon zu anderem Hub wechseln (DB und Cache)")
+    beacon_db_vormerken(beacon_neudaten)
+    state.put_beacon(beacon_MAC, beacon_neudaten)
+    log.debug("beacon im Cache/in DB aktualisiert.")
 
 # Neues Beaconpair in die Datenbank eintragen
 def beaconpairing_DB_insert(beacon_id_1, beacon_id_2, hub_id, timestamp):
-    try:
-        my_cursor = db_connection.cursor()
-        insert_query = '''
-            INSERT INTO beaconpair (beaconpair_beacon_id_1, beaconpair_beacon_id_2, beaconpair_timestamp, beaconpair_hub_id)
-            VALUES (%(beacon_id_1)s, %(beacon_id_2)s, %(timestamp)s, %(hub_id)s)
-            '''
-        insert_data = {
-            'beacon_id_1': min(int(beacon_id_1), int(beacon_id_2)),
-            'beacon_id_2': max(int(beacon_id_1), int(beacon_id_2)),
-            'timestamp': timestamp,
-            'hub_id': hub_id,
-            }
-        my_cursor.execute(insert_query, insert_data)
-        db_connection.commit()
-        if do_debug(2): print("Eintrag in die DB-Tabelle 'beaconpair' erfolgt oder aktualisiert")
-    except mysql.connector.Error as err:
-        print(f"Error handling beacon pairing data in MySQL: {err}")
+    beacon_id_min = min(int(beacon_id_1), int(beacon_id_2))
+    beacon_id_max = max(int(beacon_id_1), int(beacon_id_2))
+    db_writer.submit('beaconpair', (beacon_id_min, beacon_id_max), (beacon_id_min, beacon_id_max, timestamp, hub_id))
+    log.debug("Eintrag in die DB-Tabelle 'beaconpair' vorgemerkt")
 
 
+# Eintragen eines gefundenen Paares in Pair Registry und Datenbank
+def beaconpaar_eintragen(beacon_id, partner_id, hub_id, timestamp):
+    update_beaconpairs(beacon_id, partner_id)
+    beaconpairing_DB_insert(beacon_id, partner_id, hub_id, timestamp)
+    pairing_ergebnis['paired'].inc()
+    if events is not None:
+        events.emit('pair', beacons=[beacon_id, partner_id], hub=hub_id, ts=timestamp)
+
 # Funktion, die zwei zulässige Beacons miteinander paart und die Paarung im Memcache und der DB einträgt
 # Notation des Caches: beaconpairing_cache_hub_id_mp_typ: {beacon_id , timestamp}
 def beaconpairing(hub_id, mp_typ_id, beacon_id, timestamp):
@@ -313,243 +535,532 @@ def beaconpairing(hub_id, mp_typ_id, beacon_id, timestamp):
         beacon_mapping_mp_typen = memcache.get(f"mp_typ_mapping_{mp_typ_id}")
         # Darf dieses Beacon mit anderen Typen gepaart werden?
         if beacon_mapping_mp_typen is not None:
-            array_length = len(beacon_mapping_mp_typen)
-            i = 0
-            # Für jeden Typen nach Partnern suchen, die auf ein Paaren warten
-            while i < array_length:
-                beaconpairing_temp_key = f"beaconpairing_cache_{hub_id}_{beacon_mapping_mp_typen[i]}"
-                moeglicher_partner = memcache.get(beaconpairing_temp_key)
-                # Wenn Partner gefunden und Anfrage noch nicht zu alt
-                if moeglicher_partner is not None:
-                    if timestamp - moeglicher_partner[1] <= pairing_timegap:
-                        # Eintragen des Paares in Memcached und Datenbank, Löschen der temporären Paarungsanfrage
-                        update_beaconpairs(beacon_id, moeglicher_partner[0])
-                        beaconpairing_DB_insert(beacon_id, moeglicher_partner[0], hub_id, timestamp)
-                        memcache.delete(beaconpairing_temp_key) 
-                        return
-                    else:
-                        print("Fehler bei Löschen von Cachedaten älter " + str(pairing_timegap) + " Sekunden")
-                        return
-                i += 1
-            # Wenn Funktion bis hierhin kein Return ausgelöst hat, wurde kein Beacon zum Mapping gefunden.
-            # Also folgt ein Eintrag in den Cache, der pairing_timegap Sekunden gespeichert wird
-            # Der Timestamp ist lediglich eine Sicherheitsmaßnahme
-            beaconpairing_temp_key = f"beaconpairing_cache_{hub_id}_{mp_typ_id}"
-            beaconpairing_temp_value = (beacon_id, timestamp)
-            memcache.set(beaconpairing_temp_key, beaconpairing_temp_value, pairing_timegap)
+            # In einem Prozess liegen alle Beacons im Anwesenheitsindex, Anfragen und Partner ohne memcache und Sperre.
+            # Partner ist nur ein Beacon, der noch in diesem Hub ist.
+            if presence_pairing:
+                partner_id = presence.pairing(hub_id, mp_typ_id, beacon_mapping_mp_typen, beacon_id, timestamp, pairing_timegap)
+                if partner_id is not None:
+                    beaconpaar_eintragen(beacon_id, partner_id, hub_id, timestamp)
+                else:
+                    pairing_ergebnis['waiting'].inc()
+                return
+            # Paarungsanfragen eines Hubs werden nacheinander geprüft, auch über mehrere Worker-Prozesse hinweg.
+            # Sonst könnten zwei passende Beacons gleichzeitig keinen Partner finden und nur ihre eigene Anfrage eintragen.
+            with CacheLock(memcache, f"beaconpairing_lock_{hub_id}"), CacheBatch(memcache) as batch:
+                # Alle möglichen Paarungsanfragen auf diesem Hub mit einem get_many holen
+                beaconpairing_temp_keys = [f"beaconpairing_cache_{hub_id}_{mp_typ}" for mp_typ in beacon_mapping_mp_typen]
+                batch.fetch(beaconpairing_temp_keys)
+                # Für jeden Typen nach Partnern suchen, die auf ein Paaren warten
+                for beaconpairing_temp_key in beaconpairing_temp_keys:
+                    moeglicher_partner = batch.get(beaconpairing_temp_key)
+                    # Wenn Partner gefunden und Anfrage noch nicht zu alt
+                    if moeglicher_partner is not None:
+                        if timestamp - moeglicher_partner[1] <= pairing_timegap:
+                            # Eintragen des Paares in Memcached und Datenbank, Löschen der temporären Paarungsanfrage
+                            beaconpaar_eintragen(beacon_id, moeglicher_partner[0], hub_id, timestamp)
+                            batch.delete(beaconpairing_temp_key)
+                            return
+                        else:
+                            log.warning("Fehler bei Löschen von Cachedaten älter %s Sekunden", pairing_timegap)
+                            pairing_ergebnis['expired'].inc()
+                            return
+                # Wenn Funktion bis hierhin kein Return ausgelöst hat, wurde kein Beacon zum Mapping gefunden.
+                # Also folgt ein Eintrag in den Cache, der pairing_timegap Sekunden gespeichert wird
+                # Der Timestamp ist lediglich eine Sicherheitsmaßnahme
+                beaconpairing_temp_key = f"beaconpairing_cache_{hub_id}_{mp_typ_id}"
+                beaconpairing_temp_value = (beacon_id, timestamp)
+                batch.set(beaconpairing_temp_key, beaconpairing_temp_value, pairing_timegap)
+                pairing_ergebnis['waiting'].inc()
         else:
-            if do_debug(2):
-                print("Zu diesem MP gibt es keinen zugelassenen Partner")
+            log.debug("Zu diesem MP gibt es keinen zugelassenen Partner")
+            pairing_ergebnis['no_mapping'].inc()
             return
     
     except Exception as e:
-        print(f"An error occurred: {e}")
+        pairing_ergebnis['error'].inc()
+        log.error("An error occurred: %s", e)
     
 
-# Funktion, die ein Beaconpaar als 'kritisch' markiert, wenn einer der Beacons den Hub/Raum gewechselt hat
+# Zählen einer Änderung an einem Gefährdungseintrag (created/updated/cleared) und Ereignis für den Feed
+def gefaehrdung_zaehlen(action, beacon_id, mapped_beacon_id, hub_id, timestamp):
+    critical_ergebnis[action].inc()
+    if events is not None:
+        events.emit('critical', beacons=[beacon_id, mapped_beacon_id], action=action, hub=hub_id, ts=timestamp)
+
+# Funktion, die ein Beaconpaar als 'kritisch' markiert, wenn einer der Beacons den Hub/Raum gewechselt hat.
+# Die Gefährdungseinträge aller Partner werden mit einem get_many geholt und gesammelt geschrieben (CacheBatch).
+# Verarbeiten mehrere Worker gleichzeitig (parallel), wechseln womöglich beide Beacons eines Paares zugleich in denselben
+# Raum und legen je ihren eigenen Eintrag an, statt das Paar als wieder zusammen zu erkennen. Daher werden die Einträge
+# nach dem Schreiben noch einmal gelesen (paare_nachpruefen): da jeder Worker erst schreibt und dann liest, sieht
+# mindestens einer den Eintrag des anderen. Das kostet ein get_many je Hubwechsel, ohne Sperren und Wartezeit.
 def beacon_pairing_hubwechsel(beacon_id, new_hub_id, timestamp):
     try:
-        beaconpair_key = f'beaconpairs_{beacon_id}'
-        beaconpairs = memcache.get(beaconpair_key)
+        beaconpairs = registry.partners(beacon_id)
         # Gibt es Beacon-Paare für das zu prüfende Beacon? Wenn nein: Ende.
         if not beaconpairs:
-            if do_debug(2): print(f"Keine Mappings für Beacon ID {beacon_id} gefunden.")
+            log.debug("Keine Mappings für Beacon ID %s gefunden.", beacon_id)
             return
-        # Für jede ID, die in den destehenden Paarungen angegeben is, eine Prüfung durchführen
-        for mapped_beacon_id in beaconpairs:
-            # Vorbereitung der Key-Namen, Holen der Paarungen zu den IDs, Prüfen
-            beaconpair_krit_key_1 = f'beacon_mapping_krit_{mapped_beacon_id}_{beacon_id}'
-            beaconpair_krit_key_2 = f'beacon_mapping_krit_{beacon_id}_{mapped_beacon_id}'
-            beaconpair_krit_data_1 = memcache.get(beaconpair_krit_key_1)
-            beaconpair_krit_data_2 = memcache.get(beaconpair_krit_key_2)
-            if beaconpair_krit_data_1:
-                # Wenn auch das Paarungsziel auf neuem Hub bekannt, kritischen Eintrag löschen
-                if beaconpair_krit_data_1[1] == new_hub_id:
-                    memcache.delete(beaconpair_krit_key_1)
-                    memcache.delete(beaconpair_krit_key_2)
-                    if do_debug(2): 
-                        print(f"Gefährdungseintrag {beaconpair_krit_key_1} und {beaconpair_krit_key_2} gelöscht.")
-                else:
-                    # Timestamp des bestehenden Eintrags aktualisieren
-                    memcache.set(beaconpair_krit_key_2, [timestamp, new_hub_id])
-                    if do_debug(2): print(f"Gefährdungseintrag {beaconpair_krit_key_2} aktualisiert.")
-            elif beaconpair_krit_data_2:
-                if beaconpair_krit_data_2[1] == new_hub_id:
-                    memcache.delete(beaconpair_krit_key_1)
-                    memcache.delete(beaconpair_krit_key_2)
-                    if do_debug(2):
-                        print(f"Gefährdungseintrag {beaconpair_krit_key_1} und {beaconpair_krit_key_2} gelöscht.")
+        # Partner, deren Eintrag in diesem Aufruf angelegt oder aktualisiert wurde, mit dem geschriebenen Schlüssel
+        written = {}
+        with CacheBatch(memcache) as batch:
+            batch.fetch([key for mapped_beacon_id in beaconpairs
+                         for key in (f'beacon_mapping_krit_{mapped_beacon_id}_{beacon_id}',
+                                     f'beacon_mapping_krit_{beacon_id}_{mapped_beacon_id}')])
+            # Für jede ID, die in den destehenden Paarungen angegeben is, eine Prüfung durchführen
+            for mapped_beacon_id in beaconpairs:
+                # Vorbereitung der Key-Namen, Holen der Paarungen zu den IDs, Prüfen
+                beaconpair_krit_key_1 = f'beacon_mapping_krit_{mapped_beacon_id}_{beacon_id}'
+                beaconpair_krit_key_2 = f'beacon_mapping_krit_{beacon_id}_{mapped_beacon_id}'
+                beaconpair_krit_data_1 = batch.get(beaconpair_krit_key_1)
+                beaconpair_krit_data_2 = batch.get(beaconpair_krit_key_2)
+                if beaconpair_krit_data_1:
+                    # Wenn auch das Paarungsziel auf neuem Hub bekannt, kritischen Eintrag löschen
+                    if beaconpair_krit_data_1[1] == new_hub_id:
+                        batch.delete(beaconpair_krit_key_1)
+                        batch.delete(beaconpair_krit_key_2)
+                        expiry.cancel(beacon_id, mapped_beacon_id)
+                        gefaehrdung_zaehlen('cleared', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+                        log.debug("Gefährdungseintrag %s und %s gelöscht.", beaconpair_krit_key_1, beaconpair_krit_key_2)
+                    else:
+                        # Timestamp des bestehenden Eintrags aktualisieren. Maßgeblich bleibt die Frist des älteren Eintrags.
+                        batch.set(beaconpair_krit_key_2, [timestamp, new_hub_id])
+                        written[mapped_beacon_id] = beaconpair_krit_key_2
+                        expiry.schedule(beacon_id, mapped_beacon_id, beaconpair_krit_data_1[0])
+                        gefaehrdung_zaehlen('updated', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+                        log.debug("Gefährdungseintrag %s aktualisiert.", beaconpair_krit_key_2)
+                elif beaconpair_krit_data_2:
+                    if beaconpair_krit_data_2[1] == new_hub_id:
+                        batch.delete(beaconpair_krit_key_1)
+                        batch.delete(beaconpair_krit_key_2)
+                        expiry.cancel(beacon_id, mapped_beacon_id)
+                        gefaehrdung_zaehlen('cleared', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+                        log.debug("Gefährdungseintrag %s und %s gelöscht.", beaconpair_krit_key_1, beaconpair_krit_key_2)
+                    else:
+                        batch.set(beaconpair_krit_key_1, [timestamp, new_hub_id])
+                        written[mapped_beacon_id] = beaconpair_krit_key_1
+                        expiry.schedule(beacon_id, mapped_beacon_id, beaconpair_krit_data_2[0])
+                        gefaehrdung_zaehlen('updated', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+                        log.debug("Gefährdungseintrag %s aktualisiert.", beaconpair_krit_key_1)
                 else:
-                    memcache.set(beaconpair_krit_key_1, [timestamp, new_hub_id])
-                    if do_debug(2): print(f"Gefährdungseintrag {beaconpair_krit_key_1} aktualisiert.")
-            else:
-                # Es gibt noch keinen Gefährdungseintrag. Erster Beacon einer Paarung, der einen anderen Raum meldet.
-                memcache.set(beaconpair_krit_key_1, [timestamp, new_hub_id])
-                if do_debug(2): print(f"Neuer Gefährdungseintrag {beaconpair_krit_key_1} erstellt.")
+                    # Es gibt noch keinen Gefährdungseintrag. Erster Beacon einer Paarung, der einen anderen Raum meldet.
+                    batch.set(beaconpair_krit_key_1, [timestamp, new_hub_id])
+                    written[mapped_beacon_id] = beaconpair_krit_key_1
+                    expiry.schedule(beacon_id, mapped_beacon_id, timestamp)
+                    gefaehrdung_zaehlen('created', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+                    log.debug("Neuer Gefährdungseintrag %s erstellt.", beaconpair_krit_key_1)
+        if parallel and written:
+            paare_nachpruefen(beacon_id, new_hub_id, timestamp, written)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
+
+# Nachprüfen der eben geschriebenen Gefährdungseinträge, nur mit mehreren Workern (siehe beacon_pairing_hubwechsel).
+# Steht im Eintrag des Partners inzwischen derselbe Hub, ist das Paar wieder zusammen. Prüfen beide Worker gleichzeitig,
+# löscht nur derjenige, dessen delete den Eintrag mit der kleineren ID zuerst entfernt, und zählt die Aufhebung.
+def paare_nachpruefen(beacon_id, new_hub_id, timestamp, written):
+    # Je Partner der Eintrag, den dieser Aufruf nicht geschrieben hat
+    other_keys = {}
+    for mapped_beacon_id, key in written.items():
+        beaconpair_krit_key_1 = f'beacon_mapping_krit_{mapped_beacon_id}_{beacon_id}'
+        beaconpair_krit_key_2 = f'beacon_mapping_krit_{beacon_id}_{mapped_beacon_id}'
+        other_keys[mapped_beacon_id] = beaconpair_krit_key_2 if key == beaconpair_krit_key_1 else beaconpair_krit_key_1
+    current = memcache.get_many(list(other_keys.values()))
+    for mapped_beacon_id, other_key in other_keys.items():
+        other_data = current.get(other_key)
+        if not other_data or other_data[1] != new_hub_id:
+            continue
+        beacon_id_1, beacon_id_2 = canonical(beacon_id, mapped_beacon_id)
+        expiry.cancel(beacon_id, mapped_beacon_id)
+        if memcache.delete(f'beacon_mapping_krit_{beacon_id_1}_{beacon_id_2}', noreply=False):
+            memcache.delete(f'beacon_mapping_krit_{beacon_id_2}_{beacon_id_1}')
+            gefaehrdung_zaehlen('cleared', beacon_id, mapped_beacon_id, new_hub_id, timestamp)
+            log.debug("Gefährdungseinträge von %s und %s nach gleichzeitigem Wechsel gelöscht.", beacon_id, mapped_beacon_id)
 
 # Vorverarbeiten der MQTT Nachricht: Zerlegen in die einzelnen Werte, Weitergabe an die Verarbeitung, Laufzeitmessung
 def process_message(message):
     global debug_count
-    start_time = time.time() # Festhalten des Starts der Verarbeitung zur Laufzeitmessung
-    # Startparameter und Positionen von Werten in den Memcached Datenstrukturen
+    start_time = time.perf_counter() # Festhalten des Starts der Verarbeitung zur Laufzeitmessung
+    try:
+        # Zerlegen der Nachricht in die Einzelwerte (siehe MQTT_Parser.py).
+        # Der Zeitstempel ist der Zeitpunkt, zu dem die Nachricht im MQTT angekommen ist.
+        data_values = parse_message(message)
+        parse_seconds.observe(time.perf_counter() - start_time)
+        if wiederholung(data_values):
+            return
+        nachricht_verarbeiten(data_values)
+        duration = time.perf_counter() - start_time
+        message_seconds.observe(duration)
+        if log.isEnabledFor(logging.DEBUG): # Ausgabe der Laufzeit einer Verarbeitung
+            debug_count += 1
+            log.debug("Extraktion und Schicken der Nachricht %05d hat %.5f Sekunden gedauert", debug_count, duration)
+    except MessageFormatError as e:
+        ergebnis['invalid'].inc()
+        log.warning("Nachricht verworfen, ungültiges Format: %s", e)
+    except Exception as e:
+        ergebnis['error'].inc()
+        log.error("Fehler bei der Verarbeitung der Nachricht: %s", e) # ohne debug-filter, das darf nicht passieren.
+
+# Micro-Batch: alle Nachrichten zerlegen, die benötigten Hubs und Beacons mit je einem get_many und einer
+# Datenbankabfrage vorladen, danach jede Nachricht in Eingangsreihenfolge verarbeiten. Die Entscheidungen
+# (Case 1/2/3) laufen damit nur noch im Speicher. Zwischenstände eines Beacons verlassen den Prozess nicht,
+# da state und db_writer je Beacon zusammenfassen; geschrieben wird nur der letzte Stand.
+# In ats_message_seconds wird je Nachricht nur die Verarbeitung nach dem Vorladen gemessen.
+def process_batch(messages):
+    global debug_count
+    start_time = time.perf_counter()
+    nachrichten = []
+    for message in messages:
+        parse_start = time.perf_counter()
+        try:
+            data_values = parse_message(message)
+            parse_seconds.observe(time.perf_counter() - parse_start)
+            # Wiederholungen werden nicht vorgeladen
+            if not wiederholung(data_values):
+                nachrichten.append(data_values)
+        except MessageFormatError as e:
+            ergebnis['invalid'].inc()
+            log.warning("Nachricht verworfen, ungültiges Format: %s", e)
+    preload_start = time.perf_counter()
+    try:
+        batch_vorladen(nachrichten)
+    except Exception as e:
+        # Ohne Vorladen werden fehlende Daten je Nachricht einzeln gesucht
+        log.error("Fehler beim Vorladen des Batches: %s", e)
+    batch_preload_seconds.observe(time.perf_counter() - preload_start)
+    for data_values in nachrichten:
+        message_start = time.perf_counter()
+        try:
+            nachricht_verarbeiten(data_values)
+            message_seconds.observe(time.perf_counter() - message_start)
+        except Exception as e:
+            ergebnis['error'].inc()
+            log.error("Fehler bei der Verarbeitung der Nachricht: %s", e) # ohne debug-filter, das darf nicht passieren.
+    duration = time.perf_counter() - start_time
+    batch_seconds.observe(duration)
+    batch_messages.observe(len(messages))
+    if log.isEnabledFor(logging.DEBUG):
+        debug_count += len(nachrichten)
+        log.debug("Batch mit %s Nachrichten hat %.5f Sekunden gedauert", len(nachrichten), duration)
+
+# Vorladen der Hubs und Beacons eines Batches in den Zustand im Prozess. Das Ergebnis entspricht dem, was
+# hub_aktualisieren und beacon_altdaten_holen bei der ersten Nachricht zu einer MAC eintragen würden.
+def batch_vorladen(nachrichten):
+    # Erste Nachricht je Hub, deren Hub weder im Prozess noch als unbekannt vermerkt ist
+    hubs = {}
+    for data_values in nachrichten:
+        hub_MAC = data_values.hub_MAC
+        if hub_MAC is not None and hub_MAC not in hubs and state.get_hub(hub_MAC) is None \
+                and not state.is_unknown(hub_MAC, data_values.timestamp):
+            hubs[hub_MAC] = data_values.timestamp
+    if hubs:
+        for hub_MAC, cached in memcache.get_many(list(hubs)).items():
+            hub_data = as_hub(cached)
+            if hub_data is not None:
+                state.put_hub(hub_MAC, hub_data, write_through=False)
+                del hubs[hub_MAC]
+    if hubs:
+        try:
+            with db_pool.connection() as connection:
+                rows = SQL_Statements.fetch_many(connection, 'hub_select_many', hubs)
+            rows = {hub_MAC.lower(): row for hub_MAC, row in rows.items()}
+            for hub_MAC, timestamp in hubs.items():
+                row = rows.get(hub_MAC.lower())
+                if row is not None:
+                    state.put_hub(hub_MAC, HubRecord(row[0], timestamp, timestamp))
+                else:
+                    state.mark_unknown(hub_MAC, timestamp)
+        except mysql.connector.Error as err:
+            log.error("Error querying hubs from MySQL: %s", err)
+
+    # Erste Nachricht je Beacon, nur für Nachrichten von bekannten Hubs (wie in process_message)
+    beacons = {}
+    for data_values in nachrichten:
+        beacon_MAC = data_values.beacon_MAC
+        if beacon_MAC is not None and beacon_MAC not in beacons and data_values.hub_MAC is not None \
+                and state.get_hub(data_values.hub_MAC) is not None and state.get_beacon(beacon_MAC) is None \
+                and not state.is_unknown(beacon_MAC, data_values.timestamp):
+            beacons[beacon_MAC] = data_values.timestamp
+    if beacons:
+        for beacon_MAC, cached in memcache.get_many(list(beacons)).items():
+            beacon_altdaten = as_beacon(cached)
+            if beacon_altdaten is not None:
+                state.put_beacon(beacon_MAC, beacon_altdaten, write_through=False)
+                del beacons[beacon_MAC]
+    if beacons:
+        try:
+            with db_pool.connection() as connection:
+                rows = SQL_Statements.fetch_many(connection, 'beacon_select_many', beacons)
+            rows = {beacon_MAC.lower(): row for beacon_MAC, row in rows.items()}
+            for beacon_MAC, timestamp in beacons.items():
+                row = rows.get(beacon_MAC.lower())
+                if row is not None:
+                    state.put_beacon(beacon_MAC, BeaconRecord(*row, timestamp))
+                else:
+                    state.mark_unknown(beacon_MAC, timestamp)
+        except mysql.connector.Error as err:
+            log.error("Error querying beacons from MySQL: %s", err)
+
+# Nachricht schon verarbeitet (gleicher Beacon, Hub und Zeitstempel im Fenster des Dedup-Index)? Z.B. von einem Gateway
+# nach einem Reconnect erneut gesendet, auch wenn inzwischen neuere Nachrichten des Beacons kamen. Wird vor jedem
+# Zugriff auf Zustand, memcache und Datenbank verworfen und als 'replay' gezählt.
+def wiederholung(data_values):
+    if dedup is not None and dedup.seen(data_values.beacon_MAC, data_values.hub_MAC, data_values.timestamp):
+        ergebnis['replay'].inc()
+        detail_log.debug("Wiederholte Nachricht verworfen: %s", data_values)
+        return True
+    return False
+
+# Verarbeitung einer zerlegten Nachricht (BeaconMessage): Hub aktualisieren, Beacon Altdaten holen, Case 1/2/3
+def nachricht_verarbeiten(data_values):
+    # Startparameter. Die Werte eines Beacons liegen als BeaconRecord vor (siehe Beacon_State.py)
     hub_id = 0  # 0 = kein Hub gefunden. -> keine weitere Verarbeitung.
     beacon_altdaten = None  # None = keine Altdaten/ kein Beacon Datensatz gefunden
-    index_beacon_id = 0  # Ab hier: Positionen der einzelnen Werte innerhalb eines gespeicherten Arrays rsp. der Datenbankrückmeldung
-    index_beacon_hub_id = 1  # Position der Hub ID im Array
-    index_beacon_rssi = 2  # Position des RSSI Wertes im Array
-    index_beacon_timestamp = 3  # Position des Timestamp im Array
-    index_beacon_hub_timestamp_beginn = 4  # Position der Erstmeldung des beacons am Hub 
-    index_beacon_batterie = 5  # Position des Batterie-Werts, nur von Relevanz bei Aktualisierung des beacons
-    index_beacon_mp_typ = 6 # Position des dem zugeordneten MP eigenen MP Typs
-    index_beacon_db_sync_timestamp = 7  # Position des Zeitpunktes, zu dem der letzte DB Abgleich erfolgte
-    
-    # Verarbeiten der Nachricht
-    try:
-        # Konvertierung des JSON-Strings in ein Dictionary
-        message_dict = json.loads(message)
-        # Direkter Zugriff auf den Zeitpunkt, zu dem die Nachricht im MQTT angekommen ist
-        timestamp = int(message_dict["time"])
-        # Verarbeitung des data-Strings: Auslesen und den Text in Einzelwerte aufteilen
-        data_parts = message_dict["data"].split(", ")
-        data_values = {part.split('=')[0]: part.split('=')[1] for part in data_parts}
-        # Direkter Zugriff auf die Werte der MQTT Nachricht
-        hub_MAC = data_values.get('MAC_ROOM', None)
-        beacon_MAC = data_values.get('MAC_SENSOR', None)
-        beacon_batterie = int(data_values.get('BATT', 0))
-        beacon_taster = int(data_values.get('BUTTON', 0))
-        beacon_rssi = int(data_values.get('RSSI', 0))
-
-        # Verarbeitet wird nur bei gültigem Hub!
-        # Hub-aktiv-Timestamp aktualisieren. Wenn es den Hub gibt, ist nach Aufruf die hub_id > 0. 
-        if hub_MAC is not None:
-            hub_id = hub_aktualisieren(hub_MAC, timestamp)
-        # Wenn es den Hub gibt: Holen der letzten Meldungsdaten des beacons. Wenn es den beacon gibt, ist nach Aufruf die beacon_id > 0
-        if hub_id > 0 and beacon_MAC is not None:
-            beacon_altdaten = beacon_altdaten_holen(beacon_MAC, timestamp)
+    timestamp = data_values.timestamp
+    hub_MAC = data_values.hub_MAC
+    beacon_MAC = data_values.beacon_MAC
+    beacon_batterie = data_values.batterie
+    beacon_taster = data_values.taster
+    beacon_rssi = data_values.rssi
+
+    # Verarbeitet wird nur bei gültigem Hub!
+    # Hub-aktiv-Timestamp aktualisieren. Wenn es den Hub gibt, ist nach Aufruf die hub_id > 0. 
+    if hub_MAC is not None:
+        hub_id = hub_aktualisieren(hub_MAC, timestamp)
+    # Wenn es den Hub gibt: Holen der letzten Meldungsdaten des beacons. Wenn es den beacon gibt, ist nach Aufruf die beacon_id > 0
+    if hub_id > 0 and beacon_MAC is not None:
+        beacon_altdaten = beacon_altdaten_holen(beacon_MAC, timestamp)
+    else:
+        detail_log.debug("Unberkannte Beacondaten: %s", data_values)
+    # Wenn es den beacon und Hub in der Datenbank gibt, verarbeite die neuen Daten
+    if beacon_altdaten is not None:
+        log.debug("beacon Altdaten: %s", beacon_altdaten)
+        # Wenn Timestamp der neuen Daten noch nicht im Cache, akualisiere, 
+        # sonst ignorieren, da Nachrict des Beacons vor Reconnect schon prozessiert wurde 
+        if timestamp == beacon_altdaten.timestamp:
+            ergebnis['duplicate'].inc()
         else:
-            if do_debug(4): print("Unberkannte Beacondaten: ", data_parts)
-        # Wenn es den beacon und Hub in der Datenbank gibt, verarbeite die neuen Daten
-        if beacon_altdaten is not None:
-            if do_debug(2): print("beacon Altdaten: ", beacon_altdaten)
-            # Wenn Timestamp der neuen Daten noch nicht im Cache, akualisiere, 
-            # sonst ignorieren, da Nachrict des Beacons vor Reconnect schon prozessiert wurde 
-            if timestamp != beacon_altdaten[index_beacon_timestamp]:
-                # Wenn noch kein Hub zugewiesen, wurde ist noch kein Zeitstempel der Zuweisung in den Altdaten, daher aktuellen TS nutzen
-                # Wenn schon ein Hub zugewiesen wurde, aber ein Datensatz mit anderm Hub und höherem RSSI kommt, ebenfalls aktuellen TS nutzen
-                # Ansonsten Timestamp der Erstverbindung weiterführen, ebenso der letzten Datenbanksynchronisation
-                if beacon_altdaten[index_beacon_hub_id] is None:
-                    # Case 1: Beacon wurde noch nie in einem Hub gefunden. Daten eintragen. 
-                    beacon_neudaten = [beacon_altdaten[index_beacon_id], hub_id, beacon_rssi, timestamp, timestamp, \
-                                       beacon_batterie, beacon_altdaten[index_beacon_mp_typ], timestamp] 
-                    beacon_erstspeicherung(beacon_MAC, beacon_neudaten)
-                    if do_debug(2): print("Ersteintrag Beacon erfolgt.")
-                    if do_debug(2): print("Beacon Neudaten sind: ", beacon_neudaten)
+            room_assignment.observe(beacon_altdaten.beacon_id, hub_id, beacon_rssi, timestamp)
+            if monitor is not None:
+                monitor.seen(beacon_altdaten.beacon_id, beacon_batterie, timestamp)
+            # Wenn noch kein Hub zugewiesen, wurde ist noch kein Zeitstempel der Zuweisung in den Altdaten, daher aktuellen TS nutzen
+            # Wenn schon ein Hub zugewiesen wurde, aber ein Datensatz mit anderm Hub und höherem RSSI kommt, ebenfalls aktuellen TS nutzen
+            # Ansonsten Timestamp der Erstverbindung weiterführen, ebenso der letzten Datenbanksynchronisation
+            if beacon_altdaten.hub_id is None:
+                # Case 1: Beacon wurde noch nie in einem Hub gefunden. Daten eintragen. 
+                beacon_neudaten = BeaconRecord(beacon_altdaten.beacon_id, hub_id, beacon_rssi, timestamp, timestamp, \
+                                               beacon_batterie, beacon_altdaten.mp_typ, timestamp)
+                beacon_erstspeicherung(beacon_MAC, beacon_neudaten)
+                presence.seen(beacon_neudaten.beacon_id, hub_id, timestamp)
+                ergebnis['case1'].inc()
+                if events is not None:
+                    events.emit('location', beacon=beacon_neudaten.beacon_id, mac=beacon_MAC, hub=hub_id, previous=None,
+                                ts=timestamp)
+                log.debug("Ersteintrag Beacon erfolgt.")
+                log.debug("Beacon Neudaten sind: %s", beacon_neudaten)
+            else:
+                if beacon_altdaten.hub_id == hub_id:
+                    # Case 2: Hub gleich? Dann RSSI, Batterie und Zeit des beacons aktualisieren.
+                    # Timestamp der Erstverbindung halten, ebenso der letzten DB Synchronisation
+                    beacon_neudaten = BeaconRecord(beacon_altdaten.beacon_id, hub_id, beacon_rssi, timestamp, \
+                                                   beacon_altdaten.hub_ts_beginn, beacon_batterie, \
+                                                   beacon_altdaten.mp_typ, \
+                                                   beacon_altdaten.db_sync_timestamp)
+                    beacon_aktualisieren(beacon_MAC, beacon_neudaten)
+                    presence.seen(beacon_neudaten.beacon_id, hub_id, timestamp)
+                    ergebnis['case2'].inc()
+                    log.debug("Beacon aktualisiert")
+                    log.debug("Beacon Neudaten sind: %s", beacon_neudaten)
+                    # Taster gedrückt? Aufforderung zur Verknüpfung.
+                    if beacon_taster == 1:
+                        log.debug("Taster wurde gedrückt, Beaconpairing eingeleitet")
+                        beaconpairing(hub_id,beacon_altdaten.mp_typ ,beacon_altdaten.beacon_id , timestamp)
                 else:
-                    if beacon_altdaten[index_beacon_hub_id] == hub_id:
-                        # Case 2: Hub gleich? Dann RSSI, Batterie und Zeit des beacons aktualisieren.
-                        # Timestamp der Erstverbindung halten, ebenso der letzten DB Synchronisation
-                        beacon_neudaten = [beacon_altdaten[index_beacon_id], hub_id, beacon_rssi, timestamp, \
-                                           beacon_altdaten[index_beacon_hub_timestamp_beginn], beacon_batterie, \
-                                           beacon_altdaten[index_beacon_mp_typ], \
-                                           beacon_altdaten[index_beacon_db_sync_timestamp]]
-                        beacon_aktualisieren(beacon_MAC, beacon_neudaten)
-                        if do_debug(2): print("Beacon aktualisiert")
-                        if do_debug(2): print("Beacon Neudaten sind: ", beacon_neudaten)
-                        # Taster gedrückt? Aufforderung zur Verknüpfung.
-                        if beacon_taster == 1:
-                            if do_debug(2): print("Taster wurde gedrückt, Beaconpairing eingeleitet")
-                            beaconpairing(hub_id,beacon_altdaten[index_beacon_mp_typ] ,beacon_altdaten[index_beacon_id] , timestamp)
+                    # Case 3: Wenn neuer Hub mit (geglättet) besserem RSSI 
+                    # oder neuer Hub, aber alter Hub-Eintrag älter als 5 Minuten, aktualisiere Hub (siehe Room_Assignment.py).
+                    if room_assignment.decide(beacon_altdaten, hub_id, beacon_rssi, timestamp):
+                        beacon_neudaten = BeaconRecord(beacon_altdaten.beacon_id, hub_id, beacon_rssi, \
+                                                       timestamp, timestamp, beacon_batterie, \
+                                                       beacon_altdaten.mp_typ, timestamp)
+                        beacon_hubwechsel(beacon_MAC, beacon_neudaten)
+                        presence.seen(beacon_neudaten.beacon_id, hub_id, timestamp)
+                        if events is not None:
+                            events.emit('location', beacon=beacon_neudaten.beacon_id, mac=beacon_MAC, hub=hub_id,
+                                        previous=beacon_altdaten.hub_id, ts=timestamp)
+                        # Überprüfung von Beaconpaaren auf vorliegenden Standortwechsel
+                        beacon_pairing_hubwechsel(beacon_altdaten.beacon_id, hub_id, timestamp)
+                        ergebnis['case3_change'].inc()
+                        detail_log.debug("beacon hat den Hub gewechselt")
+                        detail_log.debug("beacon Neudaten sind: %s", beacon_neudaten)
                     else:
-                        # Case 3: Wenn neuer Hub mit besserem RSSI 
-                        # oder neuer Hub, aber alter Hub-Eintrag älter als 5 Minuten, aktualisiere Hub.
-                        if (beacon_altdaten[index_beacon_rssi] < beacon_rssi) or \
-                            (beacon_altdaten[index_beacon_timestamp] + room_timegap < timestamp):
-                            beacon_neudaten = [beacon_altdaten[index_beacon_id], hub_id, beacon_rssi, \
-                                               timestamp, timestamp, beacon_batterie, \
-                                               beacon_altdaten[index_beacon_mp_typ], timestamp]
-                            beacon_hubwechsel(beacon_MAC, beacon_neudaten)
-                            # Überprüfung von Beaconpaaren auf vorliegenden Standortwechsel
-                            beacon_pairing_hubwechsel(beacon_altdaten[index_beacon_id], hub_id, timestamp)
-                            if do_debug(4): print("beacon hat den Hub gewechselt")
-                            if do_debug(4): print("beacon Neudaten sind: ", beacon_neudaten)
-        else: 
-            if do_debug(4): print("Unberkannte Beacondaten: ", data_parts)
-        if do_debug(2): print(timestamp, data_values)
-        if do_debug(2): # Messen der Laufzeit einer Verarbeitung
-            debug_count += 1
-            print("Extraktion und Schicken der Nachricht ", "{0:05d}".format(debug_count), " hat %.5f" % (time.time() - start_time), " Sekunden gedauert")
-    except Exception as e:
-        print(f"Fehler bei der Verarbeitung der Nachricht: {e}") # ohne debug-filter, das darf nicht passieren.
+                        # Gemeldet von einem anderen Hub, der Beacon bleibt im bisherigen
+                        presence.seen(beacon_altdaten.beacon_id, beacon_altdaten.hub_id, timestamp)
+                        ergebnis['case3_stay'].inc()
+    else: 
+        ergebnis['unknown_hub' if hub_id == 0 else 'unknown_beacon'].inc()
+        detail_log.debug("Unberkannte Beacondaten: %s", data_values)
+    log.debug("%s", data_values)
 
 # MQTT methoden zum Bedienen der connect, disconnect und message events der MQTT Verbindung
-# on_mqtt_message überprüft die Datenbankverbindung und gibt die empfangene Nachricht zur Verarbeitung.
+# on_mqtt_message gibt die empfangene Nachricht zur Verarbeitung (die Datenbankverbindungen prüft der Pool).
 # on_mqtt_connect registriert den Client zum Horchen auf das definierte Topic
 # on_mqtt_disconnect sorgt bei einem Wegfallen der MQTT Verbindung für einen erneuten Verbindungsaufbau, sowie MQTT wieder zur Verfügung steht
 def on_mqtt_message(client, userdata, msg):
-    global db_connection
-    # Sicherstellen, dass die Datenbankverbindung noch steht, Neuaufbau falls nicht
-    loop = 0
-    while db_connection.is_connected() == False:
-        try:
-            db_connection = mysql.connector.connect(**db_config)
-        except mysql.connector.Error as err:
-            time.sleep(5)
-        loop = loop + 1
-        if loop > 50:
-            exit(51)    # Beendigen des Programms nach 50 erfolglosen Verbindungsversuchen.
-    # Verbindung zur Datenbank steht, die Verarbeitung der Nachricht kann starten
-    message = msg.payload.decode()
-    process_message(message)
+    nachricht_annehmen(msg.payload)
+
+# Annahme einer rohen Nachricht, aus dem MQTT Callback oder von der Verteilung im Scale-Out (siehe Scale_Out.py)
+def nachricht_annehmen(payload):
+    if capture is not None:
+        capture.record(payload)
+    # Im Pipeline-Modus wird die Nachricht nur eingereiht, verarbeitet wird sie von einem Worker
+    if pipeline is not None:
+        pipeline.submit(payload)
+    else:
+        process_message(payload)
 
 def on_mqtt_connect(client, userdata, flags, rc):
     if rc == 0:
-        if do_debug(2): print("Mit MQTT-Broker verbunden.")
-        client.subscribe(mqtt_topic)
+        log.info("Mit MQTT-Broker verbunden.")
+        for topic in mqtt_subscriptions:
+            client.subscribe(topic)
     else:
-        if do_debug(2): print(f"Verbindung fehlgeschlagen mit Code {rc}")
+        log.warning("Verbindung fehlgeschlagen mit Code %s", rc)
 
 def on_mqtt_disconnect(client, userdata, rc):
     if rc != 0:
-        if do_debug(2): print("Unerwarteter Verbindungsverlust zum MQTT-Broker.")
+        log.warning("Unerwarteter Verbindungsverlust zum MQTT-Broker.")
         try:
             client.reconnect()
         except Exception as e:
-            if do_debug(2): print(f"Fehler beim Versuch, die Verbindung wiederherzustellen: {e}")
+            log.warning("Fehler beim Versuch, die Verbindung wiederherzustellen: %s", e)
 
-# Hauptprogram - Initialisieren und in die Endlosschleife, auf Nachrichten warten
-def main():
+# Geordnetes Beenden: MQTT stoppen, danach alle noch wartenden Änderungen in DB und memcache schreiben
+def shutdown():
+    client.loop_stop()
+    if capture is not None:
+        capture.stop()
+    if pipeline is not None:
+        pipeline.stop()
+    expiry.stop()
+    if monitor is not None:
+        monitor.stop()
+    if events is not None:
+        events.stop()
+    db_writer.stop()
+    state.stop()
+    db_pool.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    log.info("Raumzuordnung: %s", room_assignment.stats())
+    log.info("Microservice beendet, alle Änderungen geschrieben.")
+    Service_Log.stop()
+
+# asyncio Laufzeit: Nachrichtenverarbeitung in einer Event-Loop.
+# Beendet wird über SIGINT/SIGTERM, danach werden die Warteschlangen geleert.
+def main_async():
+    global runtime
+    # Die Ablaufsteuerung der Gefährdungseinträge läuft in beiden Modi im eigenen Thread (siehe start_services)
+    runtime = AsyncRuntime(client, mqtt_server, mqtt_port, mqtt_subscriptions, process_message, async_workers, async_io_threads,
+                           pipeline_queue_size, pipeline_full_policy, capture)
+    try:
+        runtime.start()
+    finally:
+        shutdown()
+
+# Start aller Dienste: Prüfen von memcache und Datenbank, Vorbefüllung (warmup), Hintergrund-Threads.
+# Im Scale-Out übernimmt nur der erste Worker die Vorbefüllung, die anderen laden aus dem memcache nach.
+def start_services(warmup=True):
+    global metrics_server
+    Service_Log.setup(log_level, log_format, log_sample, log_queue_size, debug_level)
     # Prüfen, ob memcache und Datenbank verbunden sind
     try:
         memcache.set('some_key', 'some value')
     except Exception as e:
         sys.exit(50) # erfolgt, wenn obiger Befehl fehlschlägt / memchaed nicht verfügbar ist
     # memcache.flush_all() # nur zum Testen mit einem leeren memcached
-    # Verbindung zur Datenbank herstellen. Die Connection wird in der globalen 'db_connection' gehalten.
+    # Verbindung zur Datenbank herstellen. Die Verbindungen werden im Pool 'db_pool' gehalten.
     try:
-        db_connection = mysql.connector.connect(**db_config)
+        db_pool.check()
     except mysql.connector.Error as err:
         exit(1) # Beenden des Programms mit dem Returnwert 1. Ohne Datenbank ist keine Verarbeitung möglich.
-    # Aufbau der initialen Verbindung zum MQTT. Da dieser durchaus neu Starten kann, wird diese Verbindung je nach Nutzung wiederhergestellt.
+    db_pool.start()
     # memcache.flush_all()
-    # Vorbefüllung des memcache mit den letzten Daten aus der Datenbank
-    load_initial_data()
+    if warmup:
+        # Übernahme der früheren Liste aller Paare ('beaconpairs') in das Pair Registry
+        registry.migrate_legacy()
+    # Start aus dem letzten Snapshot mit Abgleich der seitdem geänderten Zeilen. Ohne gültigen Snapshot
+    # Vorbefüllung des memcache mit den letzten Daten aus der Datenbank.
+    restored = state_snapshot_file and state_restore and \
+        State_Snapshot.restore(state_snapshot_file, db_pool, memcache, state, registry, presence, room_assignment,
+                               monitor, warmup, warmup_chunk_size)
+    if warmup:
+        if not restored:
+            load_initial_data()
+        # Kennung des memcache, an der ein späterer Start aus dem Snapshot dessen Neustart erkennt
+        State_Snapshot.mark_epoch(memcache)
+    # Ab hier werden Änderungen am Zustand im Hintergrund in den memcache geschrieben
+    if capture is not None:
+        capture.start()
+    if events is not None:
+        events.start()
+    state.start()
+    db_writer.start()
+    if pipeline is not None:
+        pipeline.start()
+    # Ablaufsteuerung der Gefährdungseinträge: beim Start eine vollständige Prüfung, danach zu den Fristen
+    expiry.start()
+    # Überwachung der Beacons, ergänzt um die Beacons im Zustand, die weder der Snapshot noch eine Nachricht kennt
+    if monitor is not None:
+        if monitor_seed:
+            monitor.load(record for _, record in state.beacons.items())
+        monitor.start()
+    # Endpunkt der Kennzahlen. Ohne ihn läuft die Verarbeitung weiter, z.B. wenn der Port belegt ist.
+    if metrics_port > 0:
+        routes = {'/presence': presence.query}
+        if monitor is not None:
+            routes['/monitor'] = monitor.query
+        try:
+            metrics_server = Metrics.MetricsServer(Metrics.registry, metrics_host, metrics_port, routes)
+            metrics_server.start()
+        except OSError as e:
+            metrics_server = None
+            log.warning("Metrics endpoint on %s:%s not available: %s", metrics_host, metrics_port, e)
+
+# Verbindung zum MQTT und Abarbeiten der Nachrichten bis Strg+C oder SIGTERM, danach geordnetes Beenden
+# on_message: Callback für eingehende Nachrichten (im Scale-Out mit Weiterleitung an den zuständigen Worker)
+def mqtt_loop(on_message=on_mqtt_message):
     # Zuweisung der Methoden zur MQTT Verarbeitung
     client.on_connect = on_mqtt_connect          # Bei Aufbau einer Verbindung
-    client.on_message = on_mqtt_message          # Bei Eingang einer Nachricht auf dem konfigurirten Topic
+    client.on_message = on_message               # Bei Eingang einer Nachricht auf dem konfigurirten Topic
     client.on_disconnect = on_mqtt_disconnect    # Bei (i.B. unerwarteten) Verlust der Verbindung
 
+    # SIGTERM (z.B. durch systemd oder docker stop) wie Strg+C behandeln, damit die Warteschlangen geleert werden
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Starten der Verbindung zum MQTT - und damit Abarbeiten der Nachrichten
-    while True:
-        try:
-            client.connect(mqtt_server, mqtt_port, 60)
-            client.loop_start()
-            # Einmal in der Schleife wird bei Wegfall der MQTT Verbindung die für diesen Fall konfiguriesten Methode zum Re-Connect aufgerufen 
-            while True:
-                time.sleep(1)
-        except Exception as e:
-            if do_debug(2): print(f"Fehler bei der Verbindung zum MQTT-Broker: {e}. Versuche, in 5 Sekunden erneut zu verbinden...")
-            time.sleep(5)
+    # Aufbau der initialen Verbindung zum MQTT. Da dieser durchaus neu Starten kann, wird diese Verbindung je nach Nutzung wiederhergestellt.
+    try:
+        while True:
+            try:
+                client.connect(mqtt_server, mqtt_port, 60)
+                client.loop_start()
+                # Einmal in der Schleife wird bei Wegfall der MQTT Verbindung die für diesen Fall konfiguriesten Methode zum Re-Connect aufgerufen 
+                while True:
+                    time.sleep(1)
+            except Exception as e:
+                log.warning("Fehler bei der Verbindung zum MQTT-Broker: %s. Versuche, in 5 Sekunden erneut zu verbinden...", e)
+                time.sleep(5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown()
+
+# Hauptprogram - Initialisieren und in die Endlosschleife, auf Nachrichten warten
+def main():
+    start_services()
+    if runtime_mode == 'asyncio':
+        main_async()
+        return
+    mqtt_loop()
 
-main()
+# Nur als eigenständiges Programm starten. Beim Import (z.B. durch Scale_Out.py) wird nichts ausgeführt.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import bisect
+import json
+import logging
+import threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Kennzahlen des Microservice: Zähler, Latenz-Histogramme und beim Abruf berechnete Werte (z.B. Länge der Warteschlangen).
+# Die Module legen ihre Kennzahlen beim Import im gemeinsamen registry an und halten die Objekte, damit auf dem
+# heißen Pfad nur noch inc() bzw. observe() aufgerufen wird (keine Suche nach Namen oder Labels).
+# Abruf im Prometheus Textformat über einen lokalen HTTP-Endpunkt (MetricsServer, Pfad /metrics).
+# Weitere Abfragen (z.B. /presence, siehe Presence_Index.py) können als routes mit Antwort in JSON eingehängt werden.
+# Nutzung:
+#   messages = Metrics.counter('ats_messages_total', 'Verarbeitete Nachrichten', ('outcome',))
+#   case_1 = messages.labels('case1')
+#   case_1.inc()
+
+log = logging.getLogger(__name__)
+
+# Obergrenzen der Histogramm-Buckets in Sekunden, von 50 µs bis 2,5 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Counter:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # letzter Eintrag: größer als die letzte Obergrenze
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            result.append((name + '_bucket', labels + (('le', _format_value(bound)),), cumulative))
+        cumulative += counts[-1]
+        result.append((name + '_bucket', labels + (('le', '+Inf'),), cumulative))
+        result.append((name + '_sum', labels, total))
+        result.append((name + '_count', labels, cumulative))
+        return result
+
+
+# Wert, der erst beim Abruf über eine Funktion ermittelt wird. Die Funktion liefert eine Zahl oder, bei einer
+# Kennzahl mit einem Label, ein Dictionary {Labelwert: Zahl}.
+class Callback:
+    __slots__ = ('function',)
+
+    def __init__(self, function):
+        self.function = function
+
+
+# Alle Ausprägungen einer Kennzahl (je Kombination der Labelwerte ein Objekt)
+class MetricFamily:
+    def __init__(self, kind, name, help_text, labelnames=(), factory=None):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+        self._lock = threading.Lock()
+
+    # Objekt zu den Labelwerten. Aufrufer sollten das Ergebnis halten, statt labels() je Nachricht aufzurufen.
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {values}")
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def samples(self):
+        result = []
+        for values, child in list(self.children.items()):
+            labels = tuple(zip(self.labelnames, values))
+            if isinstance(child, Callback):
+                try:
+                    value = child.function()
+                except Exception as e:
+                    log.error("Error reading metric %s: %s", self.name, e)
+                    continue
+                if isinstance(value, dict):
+                    result.extend((self.name, ((self.labelnames[0], str(key)),), number) for key, number in value.items())
+                else:
+                    result.append((self.name, labels, value))
+            else:
+                result.extend(child.samples(self.name, labels))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, kind, name, help_text, labelnames, factory):
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(kind, name, help_text, labelnames, factory)
+            elif family.kind != kind or family.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type or labels")
+        return family
+
+    # Ohne Labels wird direkt das Objekt geliefert, mit Labels die MetricFamily (siehe labels())
+    def counter(self, name, help_text, labelnames=()):
+        family = self._family('counter', name, help_text, labelnames, Counter)
+        return family.labels() if not labelnames else family
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        family = self._family('histogram', name, help_text, labelnames, lambda: Histogram(buckets))
+        return family.labels() if not labelnames else family
+
+    # function: siehe Callback. kind 'counter' für Zähler, die an anderer Stelle geführt werden (z.B. dropped).
+    # Ein erneuter Aufruf mit demselben Namen ersetzt die Funktion.
+    def gauge(self, name, help_text, function, labelname=None, kind='gauge'):
+        family = self._family(kind + '_callback', name, help_text, (labelname,) if labelname else (), None)
+        family.children[()] = Callback(function)
+        return family
+
+    # Alle Kennzahlen im Prometheus Textformat (Version 0.0.4)
+    def render(self):
+        lines = []
+        for family in list(self.families.values()):
+            kind = family.kind.replace('_callback', '')
+            lines.append(f"# HELP {family.name} {family.help_text}")
+            lines.append(f"# TYPE {family.name} {kind}")
+            for name, labels, value in family.samples():
+                if labels:
+                    label_text = ','.join(f'{key}="{_escape(value_text)}"' for key, value_text in labels)
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Gemeinsames Register aller Module eines Prozesses
+registry = MetricsRegistry()
+counter = registry.counter
+histogram = registry.histogram
+gauge = registry.gauge
+
+
+# memcache Client, der die Dauer jeder Operation in einem Histogramm je Operation festhält.
+# Alle anderen Attribute werden an den eigentlichen Client weitergereicht.
+class TimedClient:
+    OPERATIONS = ('get', 'get_many', 'gets', 'set', 'set_many', 'add', 'cas', 'delete', 'delete_many')
+
+    def __init__(self, client, family):
+        self.family = family
+        self.use(client)
+
+    # Austausch des eigentlichen Clients, z.B. gegen FakeMemcache im Benchmark. Wer diesen TimedClient hält, nutzt danach
+    # den neuen Client, gemessen wird weiter in denselben Histogrammen.
+    def use(self, client):
+        self.client = client
+        for operation in self.OPERATIONS:
+            setattr(self, operation, _timed(getattr(client, operation), self.family.labels(operation)))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def _timed(function, histogram):
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - start)
+    return timed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            self._send(self.server.metrics_registry.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+            return
+        # Abfragen: erster Teil des Pfads wählt die Funktion, der Rest wird als Liste übergeben
+        parts = [part for part in path.split('/') if part]
+        route = self.server.routes.get('/' + parts[0]) if parts else None
+        result = route(parts[1:]) if route is not None else None
+        if result is None:
+            self.send_error(404)
+            return
+        self._send(json.dumps(result).encode(), 'application/json')
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass   # kein Protokoll je Abruf
+
+
+# HTTP-Endpunkt für den Abruf durch Prometheus, in einem eigenen Thread
+class MetricsServer:
+    # routes: {'/pfad': Funktion(Liste der weiteren Pfadteile) -> JSON-fähiges Ergebnis oder None}
+    def __init__(self, metrics_registry=registry, host='127.0.0.1', port=9108, routes=None):
+        self.metrics_registry = metrics_registry
+        self.routes = routes or {}
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server is None:
+            self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+            self._server.daemon_threads = True
+            self._server.metrics_registry = self.metrics_registry
+            self._server.routes = self.routes
+            self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            self._thread = None
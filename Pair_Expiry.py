@@ -0,0 +1,149 @@
+import heapq
+import logging
+import threading
+import time
+from Pair_Registry import canonical
+
+# Ablaufsteuerung kritischer Beaconpaare (beacon_mapping_krit_*), im Microservice (beide Laufzeiten).
+# Statt alle Paare regelmäßig zu prüfen, wird beim Setzen eines Gefährdungseintrags eine Frist (Zeitstempel + TIMEGAP)
+# in einen Min-Heap eingetragen. Der Thread wacht erst auf, wenn die nächste Frist erreicht ist, und übergibt die
+# fälligen Paare an resolve. Der Aufwand hängt damit nur von der Zahl der kritischen Paare ab.
+# Überholte Heap-Einträge werden nicht entfernt, sondern beim Entnehmen verworfen (gültig ist nur die Frist in _deadlines).
+# Eine vollständige Prüfung aller Paare (scan) läuft nur noch selten als Rückfallebene, z.B. für Einträge,
+# die ein anderer Prozess gesetzt hat, und liefert die Fristen der dabei gefundenen kritischen Paare.
+
+log = logging.getLogger(__name__)
+
+
+# Frist eines Gefährdungseintrags: die erste volle Sekunde, in der gilt: Zeit - Zeitstempel > timegap
+def deadline(marker_timestamp, timegap):
+    return marker_timestamp + timegap + 1
+
+
+class ExpiryEngine:
+    # resolve: Funktion, die eine Liste fälliger Paare (kleinere ID, größere ID) prüft und ein Dictionary
+    # {Paar: neue Frist} für Paare zurückgibt, deren Gefährdungseintrag noch nicht abgelaufen ist.
+    # timegap: Sekunden, nach denen ein Gefährdungseintrag abgelaufen ist
+    # scan: optionale Funktion ohne Parameter, die alle Paare prüft und ebenfalls {Paar: Frist} zurückgibt,
+    # scan_interval: Sekunden zwischen zwei vollständigen Prüfungen (0: keine)
+    def __init__(self, resolve, timegap=30, scan=None, scan_interval=0):
+        self.resolve = resolve
+        self.timegap = timegap
+        self.scan = scan
+        self.scan_interval = scan_interval
+        self._next_scan = 0.0
+        self._heap = []         # (Frist, Paar)
+        self._deadlines = {}    # Paar: aktuell gültige Frist
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    # Eintragen einer Frist. Ist für das Paar bereits eine frühere Frist eingetragen, bleibt diese bestehen,
+    # denn ein Paar wird aufgelöst, sobald einer seiner beiden Gefährdungseinträge zu alt ist.
+    def schedule(self, beacon_id_1, beacon_id_2, marker_timestamp):
+        self.schedule_deadline(beacon_id_1, beacon_id_2, deadline(marker_timestamp, self.timegap))
+
+    def schedule_deadline(self, beacon_id_1, beacon_id_2, due_time):
+        pair = canonical(beacon_id_1, beacon_id_2)
+        with self._condition:
+            current = self._deadlines.get(pair)
+            if current is not None and current <= due_time:
+                return
+            self._deadlines[pair] = due_time
+            heapq.heappush(self._heap, (due_time, pair))
+            # Nur wecken, wenn sich die nächste Frist nach vorne verschoben hat
+            if self._heap[0][1] == pair:
+                self._condition.notify()
+
+    # Beide Gefährdungseinträge wurden gelöscht (Paar wieder zusammen), Frist verwerfen
+    def cancel(self, beacon_id_1, beacon_id_2):
+        with self._condition:
+            self._deadlines.pop(canonical(beacon_id_1, beacon_id_2), None)
+
+    def pending(self):
+        return len(self._deadlines)
+
+    # Paare mit eingetragener Frist (kritisch), als Kopie
+    def critical(self):
+        with self._condition:
+            return list(self._deadlines)
+
+    # Entnehmen aller Paare mit Frist <= now. Muss mit gehaltenem _condition aufgerufen werden.
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_time, pair = heapq.heappop(self._heap)
+            if self._deadlines.get(pair) == due_time:
+                del self._deadlines[pair]
+                due.append(pair)
+        return due
+
+    # Sekunden bis zur nächsten gültigen Frist oder vollständigen Prüfung, None wenn nichts ansteht
+    def _wait_time(self, now):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        wait_time = None
+        if self._heap:
+            wait_time = max(0.0, self._heap[0][0] - now)
+        if self.scan is not None and self.scan_interval > 0:
+            scan_wait = max(0.0, self._next_scan - now)
+            wait_time = scan_wait if wait_time is None else min(wait_time, scan_wait)
+        return wait_time
+
+    def _schedule_pending(self, pending):
+        for (beacon_id_1, beacon_id_2), due_time in pending.items():
+            self.schedule_deadline(beacon_id_1, beacon_id_2, due_time)
+
+    # Vollständige Prüfung aller Paare, die gefundenen kritischen Paare werden mit ihrer Frist eingetragen
+    def run_scan(self):
+        self._next_scan = time.time() + self.scan_interval
+        try:
+            pending = self.scan() or {}
+        except Exception as e:
+            log.error("Error checking beacon pairs: %s", e)
+            return 0
+        self._schedule_pending(pending)
+        return len(pending)
+
+    # Ein Durchlauf: fällige Paare prüfen, noch nicht abgelaufene mit ihrer neuen Frist wieder eintragen
+    def run_due(self, now=None):
+        with self._condition:
+            due = self._pop_due(time.time() if now is None else now)
+        if not due:
+            return 0
+        try:
+            pending = self.resolve(due) or {}
+        except Exception as e:
+            # Bei einem Fehler (z.B. memcache nicht erreichbar) in einer Sekunde erneut versuchen
+            log.error("Error resolving critical beacon pairs: %s", e)
+            pending = {pair: time.time() + 1 for pair in due}
+        self._schedule_pending(pending)
+        return len(due)
+
+    # Schleife bis stop(), läuft im eigenen Thread (start)
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._stop:
+                    wait_time = self._wait_time(time.time())
+                    if wait_time == 0.0:
+                        break
+                    self._condition.wait(wait_time)
+                if self._stop:
+                    return
+            if self.scan is not None and self.scan_interval > 0 and time.time() >= self._next_scan:
+                self.run_scan()
+            self.run_due()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="pair-expiry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,222 @@
+# Register der Beaconpaare, gemeinsam genutzt vom Microservice und vom Validity Check.
+# Ein Paar wird kanonisch als (kleinere ID, größere ID) geführt. Gespeichert wird im memcache:
+#   beaconpairs_BeaconID:    [PartnerID, PartnerID, ...]      Nachbarschaft je Beacon (wie bisher)
+#   beaconpair_ID1_ID2:      Nummer des Blocks                 ein Schlüssel je Paar, Mitgliedschaft mit einem get
+#   beaconpairs_shard_N:     [ID1, ID2, ID1, ID2, ...]         Block 0 des Shards N
+#   beaconpairs_shard_N_B:   [ID1, ID2, ...]                   Block B > 0 des Shards N
+#   beaconpairs_shard_N_tail Nummer des letzten Blocks (fehlt = 0)
+# Die Paare verteilen sich auf shard_count Shards, jeder Shard ist eine Kette von Blöcken zu höchstens BUCKET_PAIRS
+# Paaren. Neue Paare kommen in den letzten Block, ist er voll, wird ein neuer begonnen. Der Schlüssel je Paar hält
+# die Nummer seines Blocks. Hinzufügen oder Entfernen eines Paares ändert damit höchstens einen Block, den Schlüssel
+# des Paares und die beiden Nachbarschaften, unabhängig von der Gesamtzahl der Paare. Die Liste aller Paare (pairs)
+# liest zwei get_many: die letzten Blocknummern, danach alle Blöcke. Durch entfernte Paare frei gewordene Plätze
+# in früheren Blöcken werden nicht wieder belegt.
+# Änderungen erfolgen per gets/cas, so dass gleichzeitige Schreiber (Threads, Worker im Scale-Out) sich nicht überschreiben.
+# Der frühere Schlüssel 'beaconpairs' (Liste aller Paare als "id1,id2") wird einmalig übernommen. Block 0 hat den
+# Schlüssel der früheren Shards, deren Paare erhalten beim Start ihren Schlüssel je Paar (migrate_legacy).
+
+LEGACY_KEY = 'beaconpairs'
+CAS_RETRIES = 20
+# Höchstzahl der Paare je Block
+BUCKET_PAIRS = 256
+
+
+def canonical(beacon_id_1, beacon_id_2):
+    beacon_id_1 = int(beacon_id_1)
+    beacon_id_2 = int(beacon_id_2)
+    return (beacon_id_1, beacon_id_2) if beacon_id_1 <= beacon_id_2 else (beacon_id_2, beacon_id_1)
+
+def adjacency_key(beacon_id):
+    return f'beaconpairs_{beacon_id}'
+
+def member_key(pair):
+    return f'beaconpair_{pair[0]}_{pair[1]}'
+
+# Flache Liste [a, b, a, b, ...] in eine Menge von Paaren umwandeln und zurück
+def unflatten(values):
+    if not values:
+        return set()
+    return {(values[i], values[i + 1]) for i in range(0, len(values) - 1, 2)}
+
+def flatten(pairs):
+    values = []
+    for beacon_id_1, beacon_id_2 in sorted(pairs):
+        values.append(beacon_id_1)
+        values.append(beacon_id_2)
+    return values
+
+
+class PairRegistry:
+    def __init__(self, memcache, shard_count=64):
+        self.memcache = memcache
+        self.shard_count = shard_count
+
+    def shard(self, pair):
+        return (pair[0] * 1000003 + pair[1]) % self.shard_count
+
+    def bucket_key(self, shard, bucket):
+        return f'beaconpairs_shard_{shard}' if bucket == 0 else f'beaconpairs_shard_{shard}_{bucket}'
+
+    def tail_key(self, shard):
+        return f'beaconpairs_shard_{shard}_tail'
+
+    # Schlüssel aller Blöcke aller Shards: {Schlüssel: (Shard, Block)}
+    def bucket_keys(self):
+        tails = self.memcache.get_many([self.tail_key(shard) for shard in range(self.shard_count)])
+        return {self.bucket_key(shard, bucket): (shard, bucket) for shard in range(self.shard_count)
+                for bucket in range((tails.get(self.tail_key(shard)) or 0) + 1)}
+
+    # Lesen-Ändern-Schreiben eines Schlüssels mit cas. change erhält den aktuellen Wert (oder None) und
+    # liefert den neuen Wert, oder None, wenn nichts zu ändern ist. Rückgabe: True, wenn geschrieben wurde.
+    def _update(self, key, change):
+        for _ in range(CAS_RETRIES):
+            value, token = self.memcache.gets(key)
+            new_value = change(value)
+            if new_value is None:
+                return False
+            if token is None:
+                if self.memcache.add(key, new_value, noreply=False):
+                    return True
+            elif self.memcache.cas(key, new_value, token):
+                return True
+        raise RuntimeError(f"Concurrent updates on {key}, giving up after {CAS_RETRIES} attempts")
+
+    def _add_partners(self, beacon_id, partner_ids):
+        def change(value):
+            current = list(value) if value else []
+            known = set(current)
+            added = [partner_id for partner_id in partner_ids if partner_id not in known]
+            return current + added if added else None
+        return self._update(adjacency_key(beacon_id), change)
+
+    def _remove_partner(self, beacon_id, partner_id):
+        def change(value):
+            if not value or partner_id not in value:
+                return None
+            return [known_id for known_id in value if known_id != partner_id]
+        return self._update(adjacency_key(beacon_id), change)
+
+    # Eintragen von Paaren in den letzten Block eines Shards, bei vollem Block in einen neuen.
+    # Rückgabe: ({Paar: Block}, neu eingetragene Paare). Bereits im Block stehende Paare gelten als eingetragen.
+    def _insert(self, shard, pairs):
+        placed = {}
+        added = set()
+        remaining = set(pairs)
+        while remaining:
+            bucket = self.memcache.get(self.tail_key(shard)) or 0
+            bucket_added = set()
+            present = set()
+            def change(value, remaining=remaining, bucket_added=bucket_added, present=present):
+                current = unflatten(value)
+                bucket_added.clear()
+                present.clear()
+                present.update(remaining & current)
+                for pair in sorted(remaining - current):
+                    if len(current) + len(bucket_added) >= BUCKET_PAIRS:
+                        break
+                    bucket_added.add(pair)
+                return flatten(current | bucket_added) if bucket_added else None
+            self._update(self.bucket_key(shard, bucket), change)
+            for pair in bucket_added | present:
+                placed[pair] = bucket
+            remaining -= bucket_added | present
+            added |= bucket_added
+            if remaining:
+                # Block voll: nächster Block, sofern nicht ein anderer Schreiber schon weitergezählt hat
+                self._update(self.tail_key(shard), lambda value, bucket=bucket: bucket + 1 if (value or 0) == bucket else None)
+        return placed, added
+
+    # Hinzufügen mehrerer Paare. Bereits eingetragene Paare (Schlüssel je Paar) werden übersprungen, jeder
+    # betroffene Block wird einmal geschrieben. Rückgabe: Anzahl der Paare, die noch nicht eingetragen waren
+    def add_many(self, pairs):
+        candidates = set()
+        for beacon_id_1, beacon_id_2 in pairs:
+            pair = canonical(beacon_id_1, beacon_id_2)
+            if pair[0] != pair[1]:
+                candidates.add(pair)
+        if not candidates:
+            return 0
+        known = self.memcache.get_many([member_key(pair) for pair in candidates])
+        by_shard = {}
+        for pair in candidates:
+            if member_key(pair) not in known:
+                by_shard.setdefault(self.shard(pair), set()).add(pair)
+        members = {}
+        adjacency = {}
+        added_total = 0
+        for shard, shard_pairs in by_shard.items():
+            placed, added = self._insert(shard, shard_pairs)
+            members.update({member_key(pair): bucket for pair, bucket in placed.items()})
+            for beacon_id_1, beacon_id_2 in added:
+                adjacency.setdefault(beacon_id_1, []).append(beacon_id_2)
+                adjacency.setdefault(beacon_id_2, []).append(beacon_id_1)
+            added_total += len(added)
+        if members:
+            self.memcache.set_many(members)
+        for beacon_id, partner_ids in adjacency.items():
+            self._add_partners(beacon_id, partner_ids)
+        return added_total
+
+    def add(self, beacon_id_1, beacon_id_2):
+        return self.add_many([(beacon_id_1, beacon_id_2)]) == 1
+
+    # Entfernen eines Paares aus seinem Block und beiden Nachbarschaften. Ohne Schlüssel je Paar (vor der Übernahme
+    # eingetragen) werden alle Blöcke des Shards durchsucht. Rückgabe: True, wenn es eingetragen war
+    def remove(self, beacon_id_1, beacon_id_2):
+        pair = canonical(beacon_id_1, beacon_id_2)
+        shard = self.shard(pair)
+        bucket = self.memcache.get(member_key(pair))
+        if bucket is not None:
+            keys = [self.bucket_key(shard, bucket)]
+        else:
+            keys = [key for key, (key_shard, _) in self.bucket_keys().items() if key_shard == shard]
+        def change(value):
+            current = unflatten(value)
+            if pair not in current:
+                return None
+            current.discard(pair)
+            return flatten(current)
+        removed = False
+        for key in keys:
+            removed |= self._update(key, change)
+        self.memcache.delete(member_key(pair))
+        self._remove_partner(pair[0], pair[1])
+        self._remove_partner(pair[1], pair[0])
+        return removed
+
+    def contains(self, beacon_id_1, beacon_id_2):
+        return self.memcache.get(member_key(canonical(beacon_id_1, beacon_id_2))) is not None
+
+    # Partner eines Beacons (Liste der IDs), direkt aus dem memcache, damit Änderungen des anderen Programms sichtbar sind
+    def partners(self, beacon_id):
+        return self.memcache.get(adjacency_key(beacon_id)) or []
+
+    # Alle Paare als Menge kanonischer Tupel, je ein get_many über die letzten Blocknummern und alle Blöcke
+    def pairs(self):
+        result = set()
+        for value in self.memcache.get_many(list(self.bucket_keys())).values():
+            result |= unflatten(value)
+        return result
+
+    # Einmalige Übernahme der früheren Liste 'beaconpairs', danach Schlüssel je Paar für Paare, die noch keinen haben
+    # (aus Shards einer früheren Version). Rückgabe: Anzahl übernommener Paare
+    def migrate_legacy(self):
+        added = 0
+        legacy = self.memcache.get(LEGACY_KEY)
+        if legacy:
+            pairs = []
+            for entry in legacy:
+                beacon_id_1, beacon_id_2 = entry.split(",")
+                pairs.append((beacon_id_1, beacon_id_2))
+            added = self.add_many(pairs)
+            self.memcache.delete(LEGACY_KEY)
+        keys = self.bucket_keys()
+        members = {}
+        for key, value in self.memcache.get_many(list(keys)).items():
+            for pair in unflatten(value):
+                members[member_key(pair)] = keys[key][1]
+        known = self.memcache.get_many(list(members))
+        missing = {key: bucket for key, bucket in members.items() if key not in known}
+        if missing:
+            self.memcache.set_many(missing)
+        return added
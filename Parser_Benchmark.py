@@ -0,0 +1,59 @@
+import json
+import random
+import timeit
+from MQTT_Parser import parse_message, json_loads
+
+# Micro-Benchmark: bisherige Zerlegung in process_message gegen MQTT_Parser.parse_message.
+# Die Nachrichten entsprechen dem Muster aus MQTT_spam.py, ergänzt um den Zeitstempel des Brokers.
+# Aufruf: python Parser_Benchmark.py
+
+message_count = 10000
+repeat = 5
+
+def load_mac_addresses(file_path):
+    with open(file_path, 'r') as file:
+        return [line.strip() for line in file.readlines() if line.strip()]
+
+def build_messages(mac_addresses, count):
+    rnd = random.Random(1)
+    messages = []
+    for i in range(count):
+        data = (f"layer=1, MAC_ROOM=00:00:00:00:00:0{rnd.randint(1, 9)}, MAC_SENSOR={mac_addresses[i % len(mac_addresses)]}, "
+                f"BATT={rnd.randint(0, 100)}, BUTTON={rnd.randint(0, 1)}, RSSI={rnd.randint(100, 250)}")
+        messages.append(json.dumps({"time": 1700000000 + i, "data": data}).encode())
+    return messages
+
+# Bisheriger Weg aus process_message (json.loads, split, Dictionary mit doppeltem split)
+def parse_bisher(message):
+    message_dict = json.loads(message)
+    timestamp = int(message_dict["time"])
+    data_parts = message_dict["data"].split(", ")
+    data_values = {part.split('=')[0]: part.split('=')[1] for part in data_parts}
+    hub_MAC = data_values.get('MAC_ROOM', None)
+    beacon_MAC = data_values.get('MAC_SENSOR', None)
+    beacon_batterie = int(data_values.get('BATT', 0))
+    beacon_taster = int(data_values.get('BUTTON', 0))
+    beacon_rssi = int(data_values.get('RSSI', 0))
+    return timestamp, hub_MAC, beacon_MAC, beacon_batterie, beacon_taster, beacon_rssi
+
+def run(name, function, messages):
+    def loop():
+        for message in messages:
+            function(message)
+    best = min(timeit.repeat(loop, number=1, repeat=repeat))
+    print(f"{name:<28} {best / len(messages) * 1e6:8.3f} µs/Nachricht")
+    return best
+
+def main():
+    messages = build_messages(load_mac_addresses("./beacon_mac.txt"), message_count)
+    # Beide Wege müssen dieselben Werte liefern
+    for message in messages[:100]:
+        result = parse_message(message)
+        assert parse_bisher(message) == (result.timestamp, result.hub_MAC, result.beacon_MAC,
+                                         result.batterie, result.taster, result.rssi)
+    print(f"JSON Backend: {json_loads.__module__}, {message_count} Nachrichten, bestes von {repeat} Läufen")
+    bisher = run("bisher (process_message)", parse_bisher, messages)
+    neu = run("MQTT_Parser.parse_message", parse_message, messages)
+    print(f"Faktor: {bisher / neu:.2f}")
+
+main()
@@ -0,0 +1,149 @@
+import heapq
+import threading
+
+# Anwesenheit der Beacons je Hub im Prozess: hub_id -> {beacon_id: zuletzt gesehen}, dazu je Beacon Hub, Beginn am Hub
+# und zuletzt gesehen. Aktualisiert bei jeder verarbeiteten Nachricht (Hubwechsel verschieben den Beacon), damit lässt
+# sich "welche Beacons sind gerade in Hub X" ohne Tabellen- oder memcache-Suche beantworten.
+# Ein Beacon gilt als abwesend, wenn timeout Sekunden keine Nachricht von ihm kam. Die Fristen liegen in einem Min-Heap
+# mit höchstens einem Eintrag je anwesendem Beacon: beim Entnehmen wird mit der letzten Meldung verglichen und bei
+# Bedarf neu eingetragen, Meldungen kosten so keinen Heap-Eintrag. Die Zeit ist die der Nachrichten (größter bisher
+# gesehener Zeitstempel), nicht die Uhr des Prozesses, damit auch nachgespielte Mitschnitte stimmen.
+# Nach einem Neustart füllt sich der Index mit den ersten Nachrichten, spätestens nach timeout Sekunden ist er vollständig.
+# Paarungsanfragen (Taster) werden je Hub und MP-Typ gehalten. Partner ist nur ein Beacon, der noch in diesem Hub ist.
+# Im Scale-Out kennt jeder Worker nur seine eigenen Beacons (Abfrage je Worker an dessen Endpunkt).
+# Abfragen (query, über den HTTP-Endpunkt der Kennzahlen, siehe Metrics.MetricsServer):
+#   /presence               Anzahl anwesender Beacons je Hub
+#   /presence/hub/<id>      Beacons im Hub mit Zeitpunkt der letzten Meldung
+#   /presence/beacon/<id>   Hub, Beginn am Hub und letzte Meldung eines Beacons
+# Für den Neustart aus einem Snapshot (State_Snapshot.py) lassen sich Index und Anfragen ausgeben und wieder einlesen.
+
+class PresenceIndex:
+    def __init__(self, timeout=300):
+        self.timeout = timeout
+        self.hubs = {}       # hub_id: {beacon_id: zuletzt gesehen}
+        self.beacons = {}    # beacon_id: [hub_id, Beginn am Hub, zuletzt gesehen]
+        self.requests = {}   # hub_id: {mp_typ: (beacon_id, Zeitstempel)}
+        self.now = 0
+        self.expired = 0
+        self._heap = []      # (Frist, beacon_id)
+        self._lock = threading.Lock()
+
+    # Meldung eines Beacons, hub_id ist der zugewiesene Hub (bei einem Hubwechsel der neue)
+    def seen(self, beacon_id, hub_id, timestamp):
+        with self._lock:
+            record = self.beacons.get(beacon_id)
+            if record is None:
+                record = self.beacons[beacon_id] = [hub_id, timestamp, timestamp]
+                heapq.heappush(self._heap, (timestamp + self.timeout, beacon_id))
+            elif record[0] != hub_id:
+                self._leave(beacon_id, record[0])
+                record[0] = hub_id
+                record[1] = timestamp
+                record[2] = timestamp
+            elif timestamp > record[2]:
+                record[2] = timestamp
+            self.hubs.setdefault(hub_id, {})[beacon_id] = record[2]
+            if timestamp > self.now:
+                self.now = timestamp
+                if self._heap and self._heap[0][0] <= timestamp:
+                    self._expire(timestamp)
+
+    def _leave(self, beacon_id, hub_id):
+        beacons = self.hubs.get(hub_id)
+        if beacons is not None:
+            beacons.pop(beacon_id, None)
+            if not beacons:
+                del self.hubs[hub_id]
+
+    # Entfernen aller Beacons ohne Meldung seit timeout Sekunden. Muss mit gehaltenem _lock aufgerufen werden.
+    def _expire(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            _, beacon_id = heapq.heappop(self._heap)
+            record = self.beacons.get(beacon_id)
+            if record is None:
+                continue
+            due = record[2] + self.timeout
+            if due <= now:
+                del self.beacons[beacon_id]
+                self._leave(beacon_id, record[0])
+                self.expired += 1
+            else:
+                heapq.heappush(self._heap, (due, beacon_id))
+
+    # Beacons im Hub: {beacon_id: zuletzt gesehen}
+    def hub(self, hub_id):
+        with self._lock:
+            return dict(self.hubs.get(hub_id, {}))
+
+    # (hub_id, Beginn am Hub, zuletzt gesehen) oder None
+    def beacon(self, beacon_id):
+        with self._lock:
+            record = self.beacons.get(beacon_id)
+            return tuple(record) if record is not None else None
+
+    # Anzahl anwesender Beacons je Hub
+    def occupancy(self):
+        with self._lock:
+            return {hub_id: len(beacons) for hub_id, beacons in self.hubs.items()}
+
+    # Paarungsanfrage von beacon_id (MP-Typ mp_typ) im Hub. Partner ist die erste Anfrage eines der zulässigen MP-Typen
+    # (mp_typen), deren Beacon noch im Hub ist und die nicht älter als timegap ist, sie wird entfernt. Ohne Partner wird
+    # die Anfrage eingetragen, eine neuere desselben MP-Typs im Hub ersetzt die ältere (wie im memcache).
+    # Suchen und Eintragen unter einer Sperre, damit zwei passende Anfragen gleichzeitig nicht beide warten.
+    # Rückgabe: beacon_id des Partners oder None
+    def pairing(self, hub_id, mp_typ, mp_typen, beacon_id, timestamp, timegap):
+        with self._lock:
+            requests = self.requests.setdefault(hub_id, {})
+            for partner_typ in mp_typen:
+                entry = requests.get(partner_typ)
+                if entry is None or entry[0] == beacon_id:
+                    continue
+                partner_id, request_timestamp = entry
+                del requests[partner_typ]
+                record = self.beacons.get(partner_id)
+                if timestamp - request_timestamp <= timegap and record is not None and record[0] == hub_id:
+                    return partner_id
+            requests[mp_typ] = (beacon_id, timestamp)
+            return None
+
+    # Stand für den Snapshot, JSON-fähig
+    def export(self):
+        with self._lock:
+            return {'now': self.now,
+                    'beacons': [[beacon_id] + record for beacon_id, record in self.beacons.items()],
+                    'requests': [[hub_id, mp_typ, beacon_id, timestamp] for hub_id, requests in self.requests.items()
+                                 for mp_typ, (beacon_id, timestamp) in requests.items()]}
+
+    # Übernahme eines Stands aus export(), bisherige Einträge werden ersetzt
+    def restore(self, data):
+        with self._lock:
+            self.now = data['now']
+            self.beacons = {beacon_id: [hub_id, since, last_seen]
+                            for beacon_id, hub_id, since, last_seen in data['beacons']}
+            self.hubs = {}
+            for beacon_id, (hub_id, _, last_seen) in self.beacons.items():
+                self.hubs.setdefault(hub_id, {})[beacon_id] = last_seen
+            self.requests = {}
+            for hub_id, mp_typ, beacon_id, timestamp in data['requests']:
+                self.requests.setdefault(hub_id, {})[mp_typ] = (beacon_id, timestamp)
+            self._heap = [(record[2] + self.timeout, beacon_id) for beacon_id, record in self.beacons.items()]
+            heapq.heapify(self._heap)
+
+    # Abfrage über HTTP, parts: Pfad nach /presence. Rückgabe None = nicht gefunden
+    def query(self, parts):
+        if not parts:
+            return {str(hub_id): count for hub_id, count in self.occupancy().items()}
+        if len(parts) != 2 or not parts[1].isdigit():
+            return None
+        if parts[0] == 'hub':
+            return {'hub': int(parts[1]), 'beacons': {str(beacon_id): last_seen
+                                                       for beacon_id, last_seen in self.hub(int(parts[1])).items()}}
+        if parts[0] == 'beacon':
+            record = self.beacon(int(parts[1]))
+            if record is None:
+                return None
+            return {'beacon': int(parts[1]), 'hub': record[0], 'since': record[1], 'last_seen': record[2]}
+        return None
+
+    def __len__(self):
+        return len(self.beacons)
@@ -0,0 +1,142 @@
+import array
+
+# Raumzuordnung der Beacons (Case 3 in process_message).
+# Bisher entscheidet ein einzelner RSSI-Wert gegen den letzten Wert im Cache über einen Hubwechsel. Bei verrauschten
+# BLE-Messungen führt das zu ständigen Wechseln zwischen zwei Hubs, jeder davon mit DB-Update und Gefährdungseinträgen
+# aller Paare. Hier wird je Beacon und Hub ein kleines Fenster der letzten RSSI-Werte gehalten (array, fester Größe).
+# Gewechselt wird, wenn der geglättete Wert des neuen Hubs den des aktuellen Hubs um mindestens hysteresis übersteigt,
+# oder wenn der aktuelle Hub länger als room_timegap nichts mehr gemeldet hat (wie bisher).
+# mode 'legacy' entscheidet wie bisher, zählt aber ebenfalls die Wechsel.
+# Die Fenster sind Teil des Snapshots für den Neustart (State_Snapshot.py).
+
+# Wertebereich der Fenster (array 'h'). Werte außerhalb, z.B. aus einer fehlerhaften Nachricht, werden begrenzt.
+RSSI_MIN = -32768
+RSSI_MAX = 32767
+
+
+# Fenster der letzten RSSI-Werte eines Beacons an einem Hub
+class RssiWindow:
+    __slots__ = ('samples', 'count', 'position', 'last_timestamp')
+
+    def __init__(self, size):
+        self.samples = array.array('h', bytes(2 * size))
+        self.count = 0
+        self.position = 0
+        self.last_timestamp = 0
+
+    def add(self, rssi, timestamp):
+        self.samples[self.position] = min(RSSI_MAX, max(RSSI_MIN, rssi))
+        self.position = (self.position + 1) % len(self.samples)
+        if self.count < len(self.samples):
+            self.count += 1
+        self.last_timestamp = timestamp
+
+    def clear(self):
+        self.count = 0
+        self.position = 0
+
+    def values(self):
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return self.samples
+
+    def mean(self):
+        return sum(self.values()) / self.count
+
+    def median(self):
+        values = sorted(self.values())
+        middle = self.count // 2
+        if self.count % 2:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
+
+
+class RoomAssignment:
+    # window: Anzahl RSSI-Werte je Beacon und Hub, smoothing: 'mean' oder 'median',
+    # hysteresis: notwendiger Vorsprung des neuen Hubs, min_samples: Mindestanzahl Werte des neuen Hubs,
+    # sample_timeout: Sekunden, nach denen die Werte eines Hubs verworfen werden, room_timegap: siehe ROOM_TIMEGAP
+    def __init__(self, mode='smoothed', window=8, smoothing='median', hysteresis=10, min_samples=3,
+                 sample_timeout=30, room_timegap=300):
+        if mode not in ('smoothed', 'legacy'):
+            raise ValueError(f"Unknown room assignment mode: {mode}")
+        if smoothing not in ('mean', 'median'):
+            raise ValueError(f"Unknown RSSI smoothing: {smoothing}")
+        self.mode = mode
+        self.window = window
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.min_samples = min_samples
+        self.sample_timeout = sample_timeout
+        self.room_timegap = room_timegap
+        self.windows = {}   # beacon_id: {hub_id: RssiWindow}
+        # Zähler: Wechsel gesamt, davon wegen Zeitlücke, nach bisheriger Regel vermiedene Wechsel
+        self.changes = 0
+        self.timegap_changes = 0
+        self.avoided = 0
+
+    # Neuer RSSI-Wert eines Beacons an einem Hub. Fenster anderer Hubs, die zu lange nichts gemeldet haben, entfallen.
+    def observe(self, beacon_id, hub_id, rssi, timestamp):
+        if self.mode == 'legacy':
+            return
+        hubs = self.windows.get(beacon_id)
+        if hubs is None:
+            hubs = self.windows[beacon_id] = {}
+        window = hubs.get(hub_id)
+        if window is None:
+            window = hubs[hub_id] = RssiWindow(self.window)
+        elif timestamp - window.last_timestamp > self.sample_timeout:
+            window.clear()
+        window.add(rssi, timestamp)
+        if len(hubs) > 1:
+            for stale_hub_id in [known_hub_id for known_hub_id, known in hubs.items()
+                                 if timestamp - known.last_timestamp > self.sample_timeout]:
+                del hubs[stale_hub_id]
+
+    def _smoothed(self, window):
+        return window.median() if self.smoothing == 'median' else window.mean()
+
+    # Entscheidung über einen Hubwechsel. beacon_altdaten: BeaconRecord mit aktuellem Hub, letztem RSSI und Zeitstempel.
+    def decide(self, beacon_altdaten, new_hub_id, new_rssi, timestamp):
+        timegap_passed = beacon_altdaten.timestamp + self.room_timegap < timestamp
+        legacy = beacon_altdaten.rssi < new_rssi or timegap_passed
+        if self.mode == 'legacy' or timegap_passed:
+            change = legacy
+        else:
+            hubs = self.windows.get(beacon_altdaten.beacon_id, {})
+            new_window = hubs.get(new_hub_id)
+            current_window = hubs.get(beacon_altdaten.hub_id)
+            if new_window is None or new_window.count < self.min_samples:
+                change = False
+            else:
+                # Ohne aktuelle Werte des bisherigen Hubs (z.B. nach Neustart) gilt der letzte RSSI im Cache
+                current = self._smoothed(current_window) if current_window is not None else beacon_altdaten.rssi
+                change = self._smoothed(new_window) >= current + self.hysteresis
+        if change:
+            self.changes += 1
+            if timegap_passed:
+                self.timegap_changes += 1
+        elif legacy:
+            self.avoided += 1
+        return change
+
+    # Fenster für den Snapshot, je Beacon und Hub [beacon_id, hub_id, letzter Zeitstempel, Position, Anzahl, Werte]
+    def export(self):
+        return [[beacon_id, hub_id, window.last_timestamp, window.position, window.count, window.samples.tolist()]
+                for beacon_id, hubs in list(self.windows.items()) for hub_id, window in list(hubs.items())]
+
+    # Übernahme der Fenster aus export(). Fenster einer anderen Größe (ROOM_WINDOW geändert) entfallen.
+    def restore(self, windows):
+        self.windows = {}
+        for beacon_id, hub_id, last_timestamp, position, count, samples in windows:
+            if len(samples) != self.window:
+                continue
+            window = RssiWindow(self.window)
+            window.samples = array.array('h', samples)
+            window.position = position
+            window.count = count
+            window.last_timestamp = last_timestamp
+            self.windows.setdefault(beacon_id, {})[hub_id] = window
+
+    def stats(self):
+        return {'changes': self.changes, 'timegap_changes': self.timegap_changes, 'avoided': self.avoided,
+                'beacons': len(self.windows)}
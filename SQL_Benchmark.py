@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import time
+import mysql.connector
+from dotenv import load_dotenv, find_dotenv
+from DB_Pool import ConnectionPool
+import SQL_Statements
+
+# Benchmark der Beacon-Updates gegen die konfigurierte Datenbank (Default_Config.env).
+# Last wie in MQTT_spam.py: Beacons aus beacon_mac.txt, Hub 1 bis 9, RSSI 100 bis 250.
+# Verglichen werden der bisherige Weg (SQL per String-Formatierung, neuer Cursor je Update) und das
+# vorbereitete Statement aus SQL_Statements. Alle Änderungen laufen in einer Transaktion, die am Ende
+# zurückgerollt wird, die Daten bleiben also unverändert.
+# Aufruf: python SQL_Benchmark.py [Anzahl Updates]
+
+load_dotenv(find_dotenv('Default_Config.env'))
+db_config = {
+    'host': os.getenv('DB_HOST'),
+    'port': int(os.getenv('DB_PORT')),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'database': os.getenv('DB_DATABASE')
+}
+
+def load_mac_addresses(file_path):
+    with open(file_path, 'r') as file:
+        return [line.strip() for line in file.readlines() if line.strip()]
+
+# Zu den MACs aus beacon_mac.txt die IDs aus der Datenbank holen
+def load_beacon_ids(connection, mac_addresses):
+    beacon_ids = []
+    for beacon_MAC in mac_addresses:
+        row = SQL_Statements.fetchone(connection, 'beacon_select', (beacon_MAC,))
+        if row is not None:
+            beacon_ids.append(row[0])
+    return beacon_ids
+
+def build_updates(beacon_ids, count):
+    rnd = random.Random(1)
+    timestamp = int(time.time())
+    updates = []
+    for i in range(count):
+        updates.append((rnd.randint(1, 9), rnd.randint(100, 250), timestamp + i, timestamp + i,
+                        rnd.randint(0, 100), beacon_ids[i % len(beacon_ids)]))
+    return updates
+
+# Bisheriger Weg aus beacon_hubwechsel/beacon_aktualisieren
+def update_bisher(connection, updates):
+    for hub_id, rssi, ts, ts_beginn, bat, beacon_id in updates:
+        my_cursor = connection.cursor()
+        my_query = 'update beacon set beacon_hub_id = "%(hub_id)s", beacon_RSSI = "%(rssi)s", beacon_timestamp = "%(ts)s", beacon_hub_ts_beginn = "%(ts)s", beacon_batterie = "%(bat)s" where beacon_id = "%(id)s"' % {
+            'hub_id': hub_id, 'rssi': rssi, 'ts': ts, 'id': beacon_id, 'bat': bat}
+        my_cursor.execute(my_query)
+
+def update_prepared(connection, updates):
+    for params in updates:
+        SQL_Statements.execute(connection, 'beacon_update', params)
+
+def run(name, function, connection, updates):
+    start = time.perf_counter()
+    try:
+        function(connection, updates)
+    finally:
+        connection.rollback()
+    duration = time.perf_counter() - start
+    print(f"{name:<24} {duration / len(updates) * 1e6:9.1f} µs/Update  ({len(updates) / duration:8.0f} Updates/s)")
+    return duration
+
+def main(count):
+    pool = ConnectionPool(db_config, 1)
+    with pool.connection() as connection:
+        beacon_ids = load_beacon_ids(connection, load_mac_addresses("./beacon_mac.txt"))
+        if not beacon_ids:
+            print("Keine der Beacons aus beacon_mac.txt in der Datenbank gefunden.")
+            return
+        updates = build_updates(beacon_ids, count)
+        update_prepared(connection, updates[:100])  # Aufwärmen, Statement vorbereiten
+        connection.rollback()
+        print(f"{count} Updates auf {len(beacon_ids)} Beacons")
+        bisher = run("bisher (String-SQL)", update_bisher, connection, updates)
+        prepared = run("prepared (SQL_Statements)", update_prepared, connection, updates)
+        print(f"Faktor: {bisher / prepared:.2f}")
+    pool.close()
+
+if __name__ == '__main__':
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    except mysql.connector.Error as err:
+        print(f"Error running benchmark against MySQL: {err}")
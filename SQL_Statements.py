@@ -0,0 +1,121 @@
+# Register aller SQL Statements der Verarbeitung.
+# Die Statements werden serverseitig vorbereitet (cursor(prepared=True)) und je Verbindung aus dem Pool
+# wiederverwendet, der Server parst sie also nur einmal. Die Parameter werden typisiert gebunden und
+# nicht mehr per String-Formatierung in das SQL eingesetzt.
+# Die Dauer jeder Ausführung wird je Statement festgehalten (ats_db_statement_seconds, siehe Metrics.py).
+from time import perf_counter
+import Metrics
+
+statement_seconds = Metrics.histogram('ats_db_statement_seconds', 'Duration of SQL statement executions', ('statement',))
+
+
+# Ein Statement: Name, SQL mit %s Platzhaltern und die Typen der Parameter in dieser Reihenfolge
+class Statement:
+    __slots__ = ('name', 'sql', 'types', 'seconds')
+
+    def __init__(self, name, sql, types):
+        self.name = name
+        self.sql = sql
+        self.types = types
+        self.seconds = statement_seconds.labels(name)
+
+    # Umwandeln der Parameter in die vorgesehenen Typen. None bleibt None (NULL in der Datenbank).
+    def bind(self, params):
+        if len(params) != len(self.types):
+            raise ValueError(f"Statement {self.name} expects {len(self.types)} parameters, got {len(params)}")
+        return tuple(None if value is None else kind(value) for kind, value in zip(self.types, params))
+
+
+statements = {}
+
+def register(name, sql, *types):
+    statements[name] = Statement(name, sql, types)
+
+register('hub_select',
+         'SELECT hub_id, hub_timestamp FROM hub WHERE hub_MAC = %s',
+         str)
+register('beacon_select',
+         'SELECT beacon_id, beacon_hub_id, beacon_RSSI, beacon_timestamp, beacon_hub_ts_beginn, beacon_batterie, mp_mp_typ_id '
+         'FROM beacon_left_join_mp WHERE beacon_MAC = %s',
+         str)
+register('hub_update',
+         'UPDATE hub SET hub_timestamp = %s WHERE hub_id = %s',
+         int, int)
+register('beacon_update',
+         'UPDATE beacon SET beacon_hub_id = %s, beacon_RSSI = %s, beacon_timestamp = %s, '
+         'beacon_hub_ts_beginn = %s, beacon_batterie = %s WHERE beacon_id = %s',
+         int, int, int, int, int, int)
+register('beaconpair_insert',
+         'INSERT INTO beaconpair (beaconpair_beacon_id_1, beaconpair_beacon_id_2, beaconpair_timestamp, beaconpair_hub_id) '
+         'VALUES (%s, %s, %s, %s)',
+         int, int, int, int)
+register('beaconpair_delete',
+         'DELETE FROM beaconpair WHERE (beaconpair_beacon_id_1 = %s AND beaconpair_beacon_id_2 = %s) '
+         'OR (beaconpair_beacon_id_1 = %s AND beaconpair_beacon_id_2 = %s)',
+         int, int, int, int)
+
+
+# Abfragen für viele Schlüssel auf einmal (WHERE ... IN), z.B. im Micro-Batch Modus. Die Anzahl der Platzhalter
+# hängt vom Aufruf ab, diese Statements werden daher nicht vorbereitet. Die Werte werden trotzdem gebunden.
+# Die erste Spalte ist der Schlüssel, über den die Zeilen zugeordnet werden.
+many_statements = {}
+MANY_CHUNK_SIZE = 500
+
+def register_many(name, sql, kind):
+    many_statements[name] = Statement(name, sql, (kind,))
+
+register_many('hub_select_many',
+              'SELECT hub_MAC, hub_id, hub_timestamp FROM hub WHERE hub_MAC IN ({placeholders})',
+              str)
+register_many('beacon_select_many',
+              'SELECT beacon_MAC, beacon_id, beacon_hub_id, beacon_RSSI, beacon_timestamp, beacon_hub_ts_beginn, '
+              'beacon_batterie, mp_mp_typ_id FROM beacon_left_join_mp WHERE beacon_MAC IN ({placeholders})',
+              str)
+
+
+# Ausführen eines Statements auf einer Verbindung aus dem Pool (PooledConnection)
+def execute(connection, name, params):
+    statement = statements[name]
+    start = perf_counter()
+    cursor = connection.prepared(statement.sql)
+    cursor.execute(statement.sql, statement.bind(params))
+    statement.seconds.observe(perf_counter() - start)
+    return cursor
+
+# Ausführen für viele Parametersätze, z.B. aus dem write-behind
+def executemany(connection, name, rows):
+    statement = statements[name]
+    start = perf_counter()
+    cursor = connection.prepared(statement.sql)
+    cursor.executemany(statement.sql, [statement.bind(params) for params in rows])
+    statement.seconds.observe(perf_counter() - start)
+    return cursor
+
+# Erste Ergebniszeile oder None. Es wird immer das gesamte Ergebnis gelesen, damit der
+# vorbereitete Cursor für den nächsten Aufruf frei ist.
+def fetchone(connection, name, params):
+    statement = statements[name]
+    start = perf_counter()
+    cursor = connection.prepared(statement.sql)
+    cursor.execute(statement.sql, statement.bind(params))
+    rows = cursor.fetchall()
+    statement.seconds.observe(perf_counter() - start)
+    return rows[0] if rows else None
+
+# Alle Zeilen zu den Schlüsseln in values, in Blöcken von MANY_CHUNK_SIZE. Rückgabe: {Schlüssel: übrige Spalten}
+def fetch_many(connection, name, values):
+    statement = many_statements[name]
+    values = list(values)
+    result = {}
+    start = perf_counter()
+    cursor = connection.cursor()
+    try:
+        for offset in range(0, len(values), MANY_CHUNK_SIZE):
+            chunk = [statement.bind((value,))[0] for value in values[offset:offset + MANY_CHUNK_SIZE]]
+            cursor.execute(statement.sql.format(placeholders=', '.join(['%s'] * len(chunk))), chunk)
+            for row in cursor.fetchall():
+                result[row[0]] = row[1:]
+    finally:
+        cursor.close()
+    statement.seconds.observe(perf_counter() - start)
+    return result
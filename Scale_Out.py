@@ -0,0 +1,220 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv, find_dotenv
+from MQTT_Pipeline import shard_for
+from Traffic_Capture import worker_path
+import Service_Log
+
+# Scale-Out des Microservice auf mehrere Prozesse (und damit CPU-Kerne).
+# Jeder Beacon gehört genau einem Worker: shard_for (crc32 der MAC_SENSOR) modulo SCALE_WORKERS, wie in der Pipeline.
+# Jeder Worker ist ein vollständiger Main_Microservice mit eigenem Zustand, Pool und write-behind. Daten, die Beacons
+# verschiedener Worker betreffen, liegen im memcache: Paarungsanfragen werden je Hub unter einer Sperre geprüft (CacheLock),
+# Gefährdungseinträge nach dem Schreiben erneut gelesen (parallel), das Pair Registry schreibt per gets/cas.
+# Nur Worker 0 füllt beim Start den memcache vor und führt die vollständige Prüfung der Beaconpaare aus, die anderen
+# Worker starten erst danach.
+# Modi (SCALE_MODE):
+#   supervisor  Dieser Prozess empfängt alle Nachrichten und verteilt sie über Queues an die Worker.
+#   shared      Jeder Worker abonniert das Topic als Shared Subscription ($share/SCALE_GROUP/MQTT_TOPIC), der Broker
+#               verteilt die Last. Nachrichten eines fremden Beacons leitet der Worker über das Topic
+#               SCALE_OWNER_TOPIC/<Worker> (ohne Angabe MQTT_TOPIC/owner/<Worker>) an den zuständigen Worker weiter.
+#               Das Topic darf keine Wildcards enthalten und nicht unter MQTT_TOPIC fallen, sonst käme die
+#               weitergeleitete Nachricht wieder über die Shared Subscription an. Bei MQTT_TOPIC mit Wildcards (#, +)
+#               muss SCALE_OWNER_TOPIC daher gesetzt sein.
+#               Die Reihenfolge der Nachrichten eines Beacons ist dabei nicht garantiert (direkt und weitergeleitet
+#               empfangene können sich überholen). Die geglättete Raumzuordnung (ROOM_ASSIGNMENT = smoothed) braucht
+#               sie, beim Start wird dann gewarnt. Wird die Reihenfolge benötigt, den Modus supervisor verwenden.
+# Lokaler Test: mosquitto -p 1883 (ab Version 1.6 mit Shared Subscriptions), MQTT_SERVER = localhost,
+# dann python Scale_Out.py und als Last python MQTT_spam.py.
+
+log = logging.getLogger(__name__)
+
+load_dotenv(find_dotenv('Default_Config.env'))
+mqtt_server = os.getenv('MQTT_SERVER')
+mqtt_port = int(os.getenv('MQTT_PORT'))
+mqtt_topic = os.getenv('MQTT_TOPIC')
+scale_mode = os.getenv('SCALE_MODE', 'supervisor')
+scale_workers = int(os.getenv('SCALE_WORKERS', 4))
+scale_group = os.getenv('SCALE_GROUP', 'ats')
+scale_queue_size = int(os.getenv('SCALE_QUEUE_SIZE', 10000))
+scale_owner_topic = os.getenv('SCALE_OWNER_TOPIC') or f"{mqtt_topic.rstrip('/')}/owner"
+room_assignment_mode = os.getenv('ROOM_ASSIGNMENT', 'smoothed')
+
+def owner_topic(index):
+    return f"{scale_owner_topic.rstrip('/')}/{index}"
+
+# Prüfen der Topics für die Weiterleitung im Modus shared, bevor ein Worker startet
+def check_owner_topics(worker_count):
+    for index in range(worker_count):
+        topic = owner_topic(index)
+        if '#' in topic or '+' in topic:
+            raise ValueError(f"Owner topic {topic} contains a wildcard, set SCALE_OWNER_TOPIC for SCALE_MODE = shared")
+        if mqtt.topic_matches_sub(mqtt_topic, topic):
+            raise ValueError(f"Owner topic {topic} is matched by MQTT_TOPIC {mqtt_topic}, "
+                             f"set SCALE_OWNER_TOPIC to a topic outside of it")
+
+
+# Worker im Modus supervisor: Nachrichten aus der eigenen Queue, bis None als Ende-Zeichen kommt
+def run_supervised_worker(service, inbox):
+    try:
+        while True:
+            payload = inbox.get()
+            if payload is None:
+                break
+            service.nachricht_annehmen(payload)
+    finally:
+        service.shutdown()
+
+# Worker im Modus shared: eigene MQTT Verbindung, fremde Nachrichten werden an den zuständigen Worker weitergeleitet
+def run_shared_worker(service, index, worker_count):
+    own_topic = owner_topic(index)
+    service.mqtt_subscriptions = [f"$share/{scale_group}/{mqtt_topic}", own_topic]
+
+    def on_message(client, userdata, msg):
+        if msg.topic != own_topic:
+            owner = shard_for(msg.payload, worker_count)
+            if owner != index:
+                client.publish(owner_topic(owner), msg.payload)
+                return
+        service.nachricht_annehmen(msg.payload)
+
+    service.mqtt_loop(on_message)
+
+def worker_main(index, worker_count, mode, inbox, ready):
+    # Strg+C beendet den Supervisor, der die Worker geordnet stoppt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import Main_Microservice as service
+    if index != 0:
+        service.validity_check.expiry.scan_interval = 0
+    # Jeder Worker hat seinen eigenen Endpunkt der Kennzahlen: METRICS_PORT + Index des Workers
+    if service.metrics_port > 0:
+        service.metrics_port += index
+    # Beacons eines Hubs verteilen sich auf alle Worker, Paarungsanfragen müssen daher über den memcache laufen
+    service.presence_pairing = False
+    # Beide Beacons eines Paares können in verschiedenen Workern gleichzeitig den Raum wechseln
+    service.parallel = worker_count > 1
+    # Überwacht werden nur die eigenen Beacons, bekannt aus den Nachrichten und dem Snapshot des Workers
+    service.monitor_seed = False
+    # Mitschnitt je Worker in eine eigene Datei (CAPTURE_FILE mit Index), Traffic_Replay.py führt sie wieder zusammen
+    if service.capture is not None:
+        service.capture.path = worker_path(service.capture_file, index)
+    # Ereignisse je Worker als eigene Quelle mit eigener seq, das Protokoll ebenfalls in einer eigenen Datei
+    if service.events is not None:
+        service.events.source = str(index)
+        if service.events.log_path:
+            service.events.log_path = worker_path(service.events_log_file, index)
+    # Snapshot des Zustands je Worker in eine eigene Datei, beim Neustart liest jeder Worker seine wieder ein
+    if service.state_snapshot_file:
+        service.state_snapshot_file = worker_path(service.state_snapshot_file, index)
+    service.start_services(warmup=index == 0)
+    ready.set()
+    if mode == 'supervisor':
+        run_supervised_worker(service, inbox)
+    else:
+        run_shared_worker(service, index, worker_count)
+
+
+class Supervisor:
+    def __init__(self, mode, worker_count, queue_size):
+        if mode not in ('supervisor', 'shared'):
+            raise ValueError(f"Unknown scale mode: {mode}")
+        if mode == 'shared':
+            check_owner_topics(worker_count)
+            if room_assignment_mode == 'smoothed':
+                log.warning("SCALE_MODE = shared does not keep the order of a beacon's messages, "
+                            "ROOM_ASSIGNMENT = smoothed may assign rooms from reordered readings; use SCALE_MODE = supervisor")
+        self.mode = mode
+        self.worker_count = worker_count
+        # spawn: die Worker importieren den Microservice neu und erben keine Threads oder Verbindungen
+        self.context = multiprocessing.get_context('spawn')
+        self.inboxes = [self.context.Queue(max(1, queue_size // worker_count)) if mode == 'supervisor' else None
+                        for _ in range(worker_count)]
+        self.workers = []
+        self.ready = []      # Events bleiben bis zum Start der Worker referenziert
+        self.client = None
+        self._stop = False
+
+    def _start_worker(self, index):
+        ready = self.context.Event()
+        worker = self.context.Process(target=worker_main, name=f"ats-worker-{index}",
+                                      args=(index, self.worker_count, self.mode, self.inboxes[index], ready))
+        worker.start()
+        self.workers.append(worker)
+        self.ready.append(ready)
+        return worker, ready
+
+    # Worker 0 füllt den memcache vor, die übrigen starten danach
+    def start_workers(self):
+        worker, ready = self._start_worker(0)
+        while not ready.wait(1):
+            if not worker.is_alive():
+                log.error("Worker 0 failed during start with exit code %s", worker.exitcode)
+                sys.exit(worker.exitcode or 1)
+        for index in range(1, self.worker_count):
+            self._start_worker(index)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(mqtt_topic)
+        else:
+            log.warning("Verbindung fehlgeschlagen mit Code %s", rc)
+
+    # Verteilung nach MAC_SENSOR. Eine volle Queue hält den Empfang an (Backpressure bis zum Broker),
+    # beim Beenden wird nicht mehr gewartet.
+    def on_message(self, client, userdata, msg):
+        inbox = self.inboxes[shard_for(msg.payload, self.worker_count)]
+        while not self._stop:
+            try:
+                inbox.put(msg.payload, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def stop(self, signum=None, frame=None):
+        self._stop = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.start_workers()
+        if self.mode == 'supervisor':
+            self.client = mqtt.Client()
+            self.client.username_pw_set(os.getenv('MQTT_USER'), os.getenv('MQTT_PW'))
+            self.client.on_connect = self.on_connect
+            self.client.on_message = self.on_message
+            self.client.connect_async(mqtt_server, mqtt_port, 60)
+            self.client.loop_start()   # paho verbindet sich bei Abbruch selbstständig neu
+        while not self._stop:
+            if not all(worker.is_alive() for worker in self.workers):
+                log.error("A worker process stopped unexpectedly, shutting down")
+                break
+            time.sleep(1)
+        self.shutdown()
+
+    # Empfang beenden, gepufferte Nachrichten noch verarbeiten lassen, dann auf die Worker warten
+    def shutdown(self):
+        self._stop = True
+        if self.client is not None:
+            self.client.loop_stop()
+        for worker, inbox in zip(self.workers, self.inboxes):
+            if inbox is not None and worker.is_alive():
+                inbox.put(None)
+            else:
+                worker.terminate()   # SIGTERM, der Worker beendet sich geordnet (siehe mqtt_loop)
+        for worker in self.workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    # Meldungen des Supervisors, die Worker richten ihre Protokollierung in start_services ein
+    Service_Log.setup(os.getenv('LOG_LEVEL'), os.getenv('LOG_FORMAT', 'text'), int(os.getenv('LOG_SAMPLE', 1)),
+                      int(os.getenv('LOG_QUEUE_SIZE', 10000)), int(os.getenv('DEBUG_LEVEL', 0)))
+    try:
+        Supervisor(scale_mode, scale_workers, scale_queue_size).run()
+    finally:
+        Service_Log.stop()
@@ -0,0 +1,55 @@
+import random
+import timeit
+from Beacon_State import BeaconRecord, HubRecord
+import Cache_Serializer
+
+# Micro-Benchmark der memcache Formate: bisheriges JSON gegen die binären Formate aus Cache_Serializer.
+# Gemessen werden die gespeicherten Bytes je Eintrag und die Zeit für Kodieren und Dekodieren.
+# Aufruf: python Serializer_Benchmark.py
+
+value_count = 10000
+repeat = 5
+
+def build_values(count):
+    rnd = random.Random(1)
+    timestamp = 1700000000
+    values = {
+        'BeaconRecord': [BeaconRecord(rnd.randint(1, 5000), rnd.randint(1, 9), rnd.randint(100, 250), timestamp + i,
+                                      timestamp + i - rnd.randint(0, 3600), rnd.randint(0, 100), rnd.choice([None, 1, 2, 3]),
+                                      timestamp + i - rnd.randint(0, 600)) for i in range(count)],
+        'HubRecord': [HubRecord(rnd.randint(1, 9), timestamp + i, timestamp + i - rnd.randint(0, 3600)) for i in range(count)],
+        'Id-Liste (8 Partner)': [[rnd.randint(1, 5000) for _ in range(8)] for _ in range(count)],
+        'Pair Shard (100 Paare)': [[rnd.randint(1, 5000) for _ in range(200)] for _ in range(count // 10)],
+    }
+    return values
+
+def run(name, serializer, values):
+    encoded = [serializer('key', value) for value in values]
+    size = sum(len(data) for data, flags in encoded) / len(encoded)
+    def encode():
+        for value in values:
+            serializer('key', value)
+    def decode():
+        for data, flags in encoded:
+            Cache_Serializer.deserializer('key', data if isinstance(data, bytes) else data.encode(), flags)
+    encode_time = min(timeit.repeat(encode, number=1, repeat=repeat)) / len(values) * 1e6
+    decode_time = min(timeit.repeat(decode, number=1, repeat=repeat)) / len(values) * 1e6
+    print(f"  {name:<8} {size:8.1f} Bytes  {encode_time:7.3f} µs kodieren  {decode_time:7.3f} µs dekodieren")
+    return size
+
+def main():
+    print(f"{value_count} Werte je Art, bestes von {repeat} Läufen")
+    for kind, values in build_values(value_count).items():
+        # Beide Formate müssen dieselben Werte liefern
+        for value in values[:100]:
+            data, flags = Cache_Serializer.binary_serializer('key', value)
+            decoded = Cache_Serializer.deserializer('key', data, flags)
+            expected = value.to_list() if isinstance(value, (BeaconRecord, HubRecord)) else value
+            assert (decoded.to_list() if isinstance(decoded, (BeaconRecord, HubRecord)) else decoded) == expected
+        print(kind)
+        json_size = run("json", Cache_Serializer.json_serializer, values)
+        binary_size = run("binary", Cache_Serializer.binary_serializer, values)
+        print(f"  Speicher: {binary_size / json_size:.0%} des JSON-Eintrags")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import collections
+import json
+import logging
+import sys
+import threading
+import time
+
+# Protokollierung für Microservice, Validity Check und Scale-Out über das logging Modul.
+# Die aufrufenden Threads legen nur den LogRecord in eine begrenzte Queue (AsyncHandler), Formatieren und Schreiben
+# übernimmt ein Hintergrund-Thread. Meldungen werden mit Platzhaltern übergeben
+# (log.debug("Beacon %s", record)), der Text entsteht also nur für Meldungen, deren Level eingeschaltet ist.
+# Ist die Queue voll, wird die Meldung verworfen und gezählt, die Verarbeitung wartet nie auf die Ausgabe.
+# Logger:
+#   ats         Verarbeitung im Microservice (bisher do_debug(2))
+#   ats.detail  Details wie unbekannte Beacons und Hubwechsel (bisher do_debug(4))
+#   Module      logging.getLogger(__name__), z.B. DB_Pool
+# Ohne LOG_LEVEL wird das Level aus dem bisherigen DEBUG_LEVEL abgeleitet (Bit 2 -> ats, Bit 4 -> ats.detail).
+# sample: von Meldungen unterhalb WARNING wird je Meldungstext nur jede sample-te ausgegeben.
+# log_format: 'text' oder 'json' (eine JSON-Zeile je Meldung).
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+# Textformat, die Zeit wird je Sekunde nur einmal formatiert
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+        self._second = None
+        self._stamp = ''
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._second:
+            self._second = second
+            self._stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        return '%s,%03d' % (self._stamp, record.msecs)
+
+
+# Eine JSON-Zeile je Meldung, Felder aus extra={...} werden übernommen
+class JsonFormatter(logging.Formatter):
+    STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.STANDARD:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text   # bereits im aufrufenden Thread formatiert (AsyncHandler)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+# Nur jede sample-te Meldung je Logger und Meldungstext unterhalb WARNING. Warnungen und Fehler werden immer ausgegeben.
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample):
+        super().__init__()
+        self.sample = sample
+        self.counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return count % self.sample == 0
+
+
+# Handler ohne Formatieren im aufrufenden Thread und ohne Warten bei voller Queue. Der Aufrufer hängt den Record nur
+# an eine deque an. Ein Hintergrund-Thread holt alle wartenden Records alle interval Sekunden ab, formatiert sie und
+# schreibt sie mit einem write(). So wird nicht für jede Meldung ein Thread geweckt (weniger Wechsel um den GIL).
+# Die Argumente einer Meldung werden erst im Hintergrund in Text umgewandelt. Übergeben werden daher nur Werte,
+# die danach nicht mehr verändert werden (Records im Zustand werden ersetzt, nicht verändert).
+class AsyncHandler(logging.Handler):
+    def __init__(self, stream, formatter, queue_size=10000, interval=0.1):
+        super().__init__()
+        self.stream = stream
+        self.setFormatter(formatter)
+        self.queue_size = queue_size
+        self.interval = interval
+        self.records = collections.deque()
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Ohne die Sperre aus logging.Handler.handle, deque.append ist threadsicher
+    def handle(self, record):
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+        if record.exc_info:
+            # Traceback-Objekte nicht an den anderen Thread geben
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+    # Formatieren und Schreiben aller wartenden Records
+    def write_pending(self):
+        lines = []
+        while self.records:
+            record = self.records.popleft()
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write_pending()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write_pending()
+
+
+handler = None
+_lock = threading.Lock()
+
+def _level(name):
+    level = logging.getLevelName(str(name).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+# Einrichten der Protokollierung für den Prozess. Ein erneuter Aufruf ändert nichts.
+# level: Level aller Logger (z.B. 'INFO', 'DEBUG') oder None, dann aus debug_level abgeleitet
+def setup(level=None, log_format='text', sample=1, queue_size=10000, debug_level=0):
+    global handler
+    with _lock:
+        if handler is not None:
+            return
+        if log_format not in ('text', 'json'):
+            raise ValueError(f"Unknown log format: {log_format}")
+        # Keine Angaben zu Prozess und asyncio Task je Meldung, den Thread nur für das JSON-Format
+        # (siehe "Optimization" im Logging HOWTO)
+        logging.logThreads = log_format == 'json'
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        logging.logAsyncioTasks = False
+        formatter = JsonFormatter() if log_format == 'json' else TextFormatter()
+        handler = AsyncHandler(sys.stdout, formatter, queue_size)
+        if sample > 1:
+            handler.addFilter(SamplingFilter(sample))
+        root = logging.getLogger()
+        root.handlers = [handler]
+        if level:
+            root.setLevel(_level(level))
+            logging.getLogger('ats').setLevel(logging.NOTSET)
+            logging.getLogger('ats.detail').setLevel(logging.NOTSET)
+        else:
+            root.setLevel(logging.INFO)
+            logging.getLogger('ats').setLevel(logging.DEBUG if debug_level & 2 else logging.INFO)
+            logging.getLogger('ats.detail').setLevel(logging.DEBUG if debug_level & 8 else logging.INFO)
+        handler.start()
+
+# Anzahl der wegen voller Queue verworfenen Meldungen
+def dropped():
+    return handler.dropped if handler is not None else 0
+
+# Schreiben aller noch wartenden Meldungen und Beenden des Hintergrund-Threads, z.B. beim Herunterfahren.
+# Spätere Meldungen werden direkt ausgegeben.
+def stop():
+    with _lock:
+        if handler is not None and handler._thread is not None:
+            handler.stop()
+            direct = logging.StreamHandler(handler.stream)
+            direct.setFormatter(handler.formatter)
+            logging.getLogger().handlers = [direct]
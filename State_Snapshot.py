@@ -0,0 +1,200 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from Beacon_State import HubRecord
+from Beacon_Table import BeaconTable, as_table
+from Cache_Warmup import WarmupReport, beacon_from_row, set_chunked, stream_rows, warmup_mp_mapping
+
+# Schneller Neustart aus einem Snapshot des Zustands im Prozess (STATE_SNAPSHOT_FILE, STATE_RESTORE = 1).
+# Statt beim Start beacon_left_join_mp, mp_mapping und beaconpair vollständig zu lesen und in den memcache zu schreiben,
+# wird der letzte Snapshot per mmap gelesen und nur mit den seit dem Snapshot geänderten Zeilen der Datenbank abgeglichen.
+# Geschrieben wird alle STATE_SNAPSHOT_INTERVAL Sekunden und beim Beenden im Thread des StateStore.
+# Inhalt: Kopf, Metadaten als JSON (Zeitpunkt, Hubs, Paare, Gefährdungseinträge, Anwesenheit und Paarungsanfragen,
+# RSSI-Fenster der Raumzuordnung, Überwachung der Beacons),
+# danach die Beacon-Datensätze als BeaconTable (siehe Beacon_Table.py), auf 8 Byte ausgerichtet.
+# Ob der memcache seit dem Snapshot neu gestartet wurde, zeigt der Schlüssel EPOCH_KEY: er wird beim Start einmal gesetzt
+# und im Snapshot festgehalten. Fehlt er oder hat er einen anderen Wert, werden Beacons, Hubs, Paare und
+# Gefährdungseinträge aus dem Snapshot wieder in den memcache geschrieben.
+# Abgleich mit der Datenbank: Beacons und Hubs mit Zeitstempel ab dem Snapshot (abzüglich RECONCILE_MARGIN) oder
+# größerer Id, Paare ab dem Snapshot, mp_mapping vollständig (wenige Zeilen). Nicht erkannt werden Änderungen anderer
+# Programme ohne neuen Zeitstempel (z.B. geänderte MP-Zuordnung) und gelöschte Zeilen, dafür ist ein vollständiges
+# Laden nötig (Snapshot-Datei löschen).
+# Im Scale-Out hat jeder Worker eine eigene Datei, die gemeinsamen Teile (Paare, mp_mapping) übernimmt nur der erste.
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'ATSSNAP1'
+# Länge der Metadaten (JSON)
+HEADER = struct.Struct('<Q')
+EPOCH_KEY = 'ats_state_epoch'
+# Sekunden vor dem Snapshot, ab denen Zeilen der Datenbank erneut gelesen werden (Uhren, noch nicht geschriebene Updates)
+RECONCILE_MARGIN = 60
+
+
+# Kennung des memcache, wird nur gesetzt, wenn sie fehlt. Rückgabe: der gültige Wert
+def mark_epoch(memcache):
+    memcache.add(EPOCH_KEY, str(time.time_ns()))
+    return memcache.get(EPOCH_KEY)
+
+def _critical_keys(pairs):
+    return [key for beacon_id_1, beacon_id_2 in pairs
+            for key in (f'beacon_mapping_krit_{beacon_id_1}_{beacon_id_2}', f'beacon_mapping_krit_{beacon_id_2}_{beacon_id_1}')]
+
+
+# Schreiben des Snapshots: Beacons und Hubs aus dem StateStore, Paare aus dem Pair Registry, die Gefährdungseinträge
+# der kritischen Paare (Ablaufsteuerung) aus dem memcache, Anwesenheit und Paarungsanfragen aus dem PresenceIndex,
+# die RSSI-Fenster aus der Raumzuordnung, Batteriestände und stille Beacons aus dem BeaconMonitor (None = aus)
+def save(path, memcache, state, registry, expiry, presence, room_assignment, monitor=None):
+    taken = int(time.time())
+    table = as_table(state.beacons)
+    markers = memcache.get_many(_critical_keys(expiry.critical()))
+    meta = {'taken': taken,
+            'epoch': memcache.get(EPOCH_KEY),
+            'hubs': [[hub_MAC] + record.to_list() for hub_MAC, record in list(state.hubs.items())],
+            'pairs': sorted(list(pair) for pair in registry.pairs()),
+            'critical': [[key, list(value)] for key, value in markers.items()],
+            'presence': presence.export(),
+            'rooms': room_assignment.export(),
+            'monitor': monitor.export() if monitor is not None else None}
+    data = json.dumps(meta, separators=(',', ':')).encode()
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(MAGIC)
+        file.write(HEADER.pack(len(data)))
+        file.write(data)
+        file.write(b'\0' * (-len(data) % 8))
+        table.write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+    log.debug("State snapshot written: %s beacons, %s hubs", len(table), len(meta['hubs']))
+
+# Lesen eines Snapshots, Rückgabe (Metadaten, BeaconTable).
+# OSError, wenn die Datei fehlt, ValueError bei einem ungültigen oder abgeschnittenen Snapshot
+def load(path):
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a state snapshot")
+        length, = HEADER.unpack_from(data, len(MAGIC))
+        position = len(MAGIC) + HEADER.size
+        meta = json.loads(data[position:position + length])
+        position += length + (-length % 8)
+        with memoryview(data) as view:
+            table = BeaconTable.read(view[position:])
+    return meta, table
+
+
+# Phase 1: Zustand im Prozess aus dem Snapshot. Mit STATE_BEACON_STORE = table wird die gelesene Tabelle übernommen.
+def restore_state(meta, table, state, presence, room_assignment, monitor):
+    if isinstance(state.beacons, BeaconTable):
+        state.beacons = table
+    else:
+        for beacon_MAC, record in table.items():
+            state.put_beacon(beacon_MAC, record, write_through=False)
+    for hub_MAC, hub_id, timestamp, db_sync_timestamp in meta['hubs']:
+        state.put_hub(hub_MAC, HubRecord(hub_id, timestamp, db_sync_timestamp), write_through=False)
+    presence.restore(meta['presence'])
+    room_assignment.restore(meta['rooms'])
+    if monitor is not None and meta.get('monitor'):
+        monitor.restore(meta['monitor'])
+    return len(table) + len(meta['hubs'])
+
+# Phase 2, nur nach einem Neustart des memcache: Beacons, Hubs und Gefährdungseinträge dieses Prozesses, mit shared
+# auch die Paare. Gefährdungseinträge werden nur ergänzt (add), ein inzwischen neu gesetzter bleibt erhalten.
+def restore_memcache(meta, memcache, state, registry, shared, chunk_size):
+    values = dict(state.beacons.items())
+    values.update(state.hubs)
+    set_chunked(memcache, values, chunk_size)
+    for key, value in meta['critical']:
+        memcache.add(key, value)
+    if shared:
+        registry.add_many([tuple(pair) for pair in meta['pairs']])
+    return len(values) + len(meta['critical']) + (len(meta['pairs']) if shared else 0)
+
+# Phase 3: Beacons, die seit dem Snapshot in der Datenbank geändert oder neu angelegt wurden.
+# Wie beim Warm-up bleibt ein neuerer Stand im Prozess erhalten.
+def reconcile_beacons(connection, state, since, max_beacon_id, chunk_size):
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM beacon_left_join_mp WHERE beacon_timestamp >= %s OR beacon_id > %s',
+                            chunk_size, (since, max_beacon_id)):
+        for data_values in rows:
+            record = beacon_from_row(data_values)
+            current = state.get_beacon(data_values['beacon_MAC'])
+            if current is None or (record.timestamp is not None and
+                                   (current.timestamp is None or record.timestamp > current.timestamp)):
+                state.put_beacon(data_values['beacon_MAC'], record)
+        count += len(rows)
+    return count
+
+def reconcile_hubs(connection, state, since, max_hub_id, chunk_size):
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM hub WHERE hub_timestamp >= %s OR hub_id > %s',
+                            chunk_size, (since, max_hub_id)):
+        for data_values in rows:
+            # Hubs ohne Zeitstempel werden wie bisher bei der ersten Nachricht geladen
+            if data_values['hub_timestamp'] is None:
+                continue
+            current = state.get_hub(data_values['hub_MAC'])
+            if current is None or current.hub_id != data_values['hub_id'] \
+                    or data_values['hub_timestamp'] > current.timestamp:
+                state.put_hub(data_values['hub_MAC'], HubRecord(data_values['hub_id'], data_values['hub_timestamp'],
+                                                                data_values['hub_timestamp']))
+        count += len(rows)
+    return count
+
+def reconcile_beaconpairs(connection, registry, since, chunk_size):
+    pairs = []
+    count = 0
+    for rows in stream_rows(connection, 'SELECT * FROM beaconpair WHERE beaconpair_timestamp >= %s', chunk_size, (since,)):
+        for data_values in rows:
+            pairs.append((data_values['beaconpair_beacon_id_1'], data_values['beaconpair_beacon_id_2']))
+        count += len(rows)
+    registry.add_many(pairs)
+    return count
+
+
+# Start aus dem Snapshot statt Cache_Warmup.bulk_warmup. shared: dieser Prozess übernimmt die gemeinsamen Teile im
+# memcache (Paare, mp_mapping, EPOCH_KEY), im Scale-Out nur der erste Worker.
+# Rückgabe: WarmupReport oder None, wenn kein gültiger Snapshot vorliegt (dann ist vollständig zu laden)
+def restore(path, db_pool, memcache, state, registry, presence, room_assignment, monitor=None, shared=True,
+            chunk_size=1000):
+    report = WarmupReport()
+    total_start = time.perf_counter()
+    start = time.perf_counter()
+    try:
+        meta, table = load(path)
+        rows = restore_state(meta, table, state, presence, room_assignment, monitor)
+    except FileNotFoundError:
+        log.info("No state snapshot in %s, loading all data from the database", path)
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log.warning("State snapshot %s not usable, loading all data from the database: %s", path, e)
+        return None
+    report.phase('snapshot', rows, time.perf_counter() - start)
+
+    epoch = memcache.get(EPOCH_KEY)
+    if epoch is None or epoch != meta['epoch']:
+        start = time.perf_counter()
+        rows = restore_memcache(meta, memcache, state, registry, shared, chunk_size)
+        report.phase('memcache', rows, time.perf_counter() - start)
+
+    since = meta['taken'] - RECONCILE_MARGIN
+    max_beacon_id = max([max(table.columns[0], default=0)] + [record.beacon_id for record in table.other.values()
+                                                              if isinstance(record.beacon_id, int)])
+    max_hub_id = max((hub[1] for hub in meta['hubs'] if isinstance(hub[1], int)), default=0)
+    phases = [('beacon_left_join_mp', lambda connection: reconcile_beacons(connection, state, since, max_beacon_id, chunk_size)),
+              ('hub', lambda connection: reconcile_hubs(connection, state, since, max_hub_id, chunk_size))]
+    if shared:
+        phases += [('beaconpair', lambda connection: reconcile_beaconpairs(connection, registry, since, chunk_size)),
+                   ('mp_mapping', lambda connection: warmup_mp_mapping(connection, memcache, chunk_size))]
+    for name, phase in phases:
+        start = time.perf_counter()
+        with db_pool.connection() as connection:
+            rows = phase(connection)
+        report.phase(name, rows, time.perf_counter() - start)
+    log.info("Start aus Snapshot gesamt: %.3f Sekunden (Stand %s)", time.perf_counter() - total_start,
+             time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(meta['taken'])))
+    return report
@@ -0,0 +1,157 @@
+import collections
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Mitschnitt der empfangenen MQTT Nachrichten mit Ankunftszeit, zum Nachspielen mit Traffic_Replay.py.
+# Eingeschaltet über CAPTURE_FILE. Der Empfang hängt nur (Zeit, Nachricht) an eine deque an, Packen, Komprimieren
+# und Schreiben übernimmt ein Hintergrund-Thread. Ist die deque voll, wird die Nachricht nicht mitgeschnitten
+# (gezählt in dropped), die Verarbeitung wartet nie auf die Datei.
+# Format (die Datei wird nur fortgeschrieben, ein Neustart hängt an):
+#   Kopf       MAGIC
+#   Block      <Länge der komprimierten Daten, Anzahl Nachrichten> (2 x uint32), danach zlib-komprimierte Datensätze
+#   Datensatz  <Ankunftszeit (double, Unix-Zeit), Länge (uint32)>, danach die Nachricht wie empfangen
+# Je Schreibintervall entsteht ein Block. Bricht der Prozess ab, fehlt höchstens der letzte Block, das Lesen endet dort.
+# Ist max_bytes erreicht, endet der Mitschnitt mit einer Warnung.
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'ATSCAP1\n'
+BLOCK = struct.Struct('<II')
+RECORD = struct.Struct('<dI')
+
+
+class TrafficRecorder:
+    def __init__(self, path, max_bytes=0, interval=1.0, queue_size=100000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.queue_size = queue_size
+        self.records = collections.deque()
+        self.recorded = 0
+        self.dropped = 0
+        self.full = False
+        self._file = None
+        self._size = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Aufruf beim Empfang, payload wie von paho geliefert (bytes)
+    def record(self, payload):
+        if self.full:
+            return
+        if len(self.records) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.records.append((time.time(), payload))
+
+    # Ein Block aus allen wartenden Nachrichten
+    def write_pending(self):
+        if self._file is None or not self.records:
+            return
+        parts = []
+        count = 0
+        while self.records:
+            arrival, payload = self.records.popleft()
+            if isinstance(payload, str):
+                payload = payload.encode()
+            parts.append(RECORD.pack(arrival, len(payload)))
+            parts.append(payload)
+            count += 1
+        data = zlib.compress(b''.join(parts), 6)
+        try:
+            self._file.write(BLOCK.pack(len(data), count))
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            log.error("Error writing capture file %s: %s", self.path, e)
+            self.dropped += count
+            return
+        self.recorded += count
+        self._size += BLOCK.size + len(data)
+        if self.max_bytes and self._size >= self.max_bytes:
+            self.full = True
+            self.records.clear()
+            log.warning("Capture file %s reached %s bytes, capture stopped", self.path, self._size)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write_pending()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Ein unvollständiger letzter Block (Abbruch beim Schreiben) wird abgeschnitten, bevor angehängt wird
+        complete = complete_length(self.path)
+        self._file = open(self.path, 'ab')
+        if self._file.tell() > complete:
+            self._file.truncate(complete)
+            self._file.seek(complete)
+        self._size = complete
+        if self._size == 0:
+            self._file.write(MAGIC)
+            self._size = len(MAGIC)
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+        log.info("Capturing received messages to %s", self.path)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write_pending()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Länge der Datei bis zum Ende des letzten vollständigen Blocks, 0 für eine leere oder fehlende Datei
+def complete_length(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    total = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} exists and is not a capture file")
+        position = len(MAGIC)
+        while position + BLOCK.size <= total:
+            length, count = BLOCK.unpack(file.read(BLOCK.size))
+            if position + BLOCK.size + length > total:
+                break
+            position += BLOCK.size + length
+            file.seek(position)
+    return position
+
+# Lesen eines Mitschnitts: (Ankunftszeit, Nachricht) in der Reihenfolge des Empfangs
+def read_capture(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = file.read(BLOCK.size)
+            if len(header) < BLOCK.size:
+                if header:
+                    log.warning("Capture file %s ends with an incomplete block", path)
+                return
+            length, count = BLOCK.unpack(header)
+            data = file.read(length)
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                log.warning("Capture file %s ends with an incomplete block", path)
+                return
+            position = 0
+            for _ in range(count):
+                arrival, size = RECORD.unpack_from(data, position)
+                position += RECORD.size
+                yield arrival, data[position:position + size]
+                position += size
+
+# Dateiname je Worker im Scale-Out, damit jeder Prozess seine eigene Datei fortschreibt
+def worker_path(path, index):
+    root, extension = os.path.splitext(path)
+    return f"{root}.{index}{extension}"
@@ -0,0 +1,166 @@
+import argparse
+import heapq
+import itertools
+import json
+import platform
+import sys
+import time
+from Traffic_Capture import read_capture
+from MQTT_Parser import parse_message, MessageFormatError
+import Benchmark
+
+# Nachspielen eines Mitschnitts (CAPTURE_FILE, siehe Traffic_Capture.py) durch die Verarbeitung des Microservice.
+# So lassen sich echte Lastformen offline wiederholen: Schichtwechsel, Umzüge vieler Geräte, Gateways, die nach
+# einem Reconnect gepufferte Nachrichten erneut senden.
+# Geschwindigkeit (--speed): 1 im Abstand der Ankunftszeiten, 10 zehnmal so schnell, 0 so schnell wie möglich.
+# Mehrere Dateien (z.B. je Worker aus dem Scale-Out) werden nach der Ankunftszeit zusammengeführt.
+# Konfiguration, Backend (fake/local), Messwerte und Bericht wie in Benchmark.py. Mit dem Backend fake werden die
+# Hubs und Beacons des Mitschnitts in der FakeDatabase angelegt (ohne Raum, MP-Typen und Paare).
+# Divergenz: Der Endzustand (je Beacon Hub, RSSI, Zeitstempel, Beginn am Hub und Batterie, dazu die Beaconpaare) wird
+# mit --state-output geschrieben und mit --reference gegen den Endzustand eines früheren Laufs verglichen.
+# Aufruf, z.B. Micro-Batch mit doppelter Geschwindigkeit gegen die sequentielle Verarbeitung in Originalgeschwindigkeit:
+#   python Traffic_Replay.py schicht.atscap --speed 1 --state-output ref.json
+#   python Traffic_Replay.py schicht.atscap --speed 2 --set BATCH_SIZE=50 --reference ref.json
+
+EXAMPLES = 10
+
+
+# Nachrichten aller Dateien in der Reihenfolge der Ankunft, höchstens limit
+def mitschnitt_laden(paths, limit=None):
+    records = heapq.merge(*(read_capture(path) for path in paths), key=lambda record: record[0])
+    return list(itertools.islice(records, limit))
+
+# MACs der Hubs und Beacons in der Reihenfolge des ersten Auftretens, dazu der erste Zeitstempel
+def macs_sammeln(records):
+    hubs = {}
+    beacons = {}
+    first = None
+    for _, payload in records:
+        try:
+            message = parse_message(payload)
+        except MessageFormatError:
+            continue
+        if first is None or message.timestamp < first:
+            first = message.timestamp
+        if message.hub_MAC is not None:
+            hubs.setdefault(message.hub_MAC, None)
+        if message.beacon_MAC is not None:
+            beacons.setdefault(message.beacon_MAC, None)
+    return list(hubs), list(beacons), first or 0
+
+def abspielen(service, probe, records, speed):
+    start = time.perf_counter()
+    first = records[0][0] if records else 0
+    for arrival, payload in records:
+        if speed > 0:
+            delay = start + (arrival - first) / speed - time.perf_counter()
+            if delay > 0.001:
+                time.sleep(delay)
+        probe.submit(payload)
+        service.nachricht_annehmen(payload)
+    return start
+
+# Endzustand nach dem Beenden (alle Änderungen geschrieben)
+def endzustand(service):
+    beacons = {mac: [record.hub_id, record.rssi, record.timestamp, record.hub_ts_beginn, record.batterie]
+               for mac, record in service.state.beacons.items()}
+    pairs = sorted(list(pair) for pair in service.registry.pairs())
+    return {'beacons': beacons, 'pairs': pairs}
+
+# Unterschiede zu einem früheren Endzustand: Anzahl Beacons mit anderem Hub, mit anderen Werten, fehlende und
+# zusätzliche Beacons und Paare, dazu einige Beispiele
+def divergenz(state, reference):
+    beacons, expected = state['beacons'], reference['beacons']
+    hub_differs = [mac for mac in expected if mac in beacons and beacons[mac][0] != expected[mac][0]]
+    values_differ = [mac for mac in expected if mac in beacons and beacons[mac] != expected[mac]]
+    missing = [mac for mac in expected if mac not in beacons]
+    extra = [mac for mac in beacons if mac not in expected]
+    pairs = {tuple(pair) for pair in state['pairs']}
+    expected_pairs = {tuple(pair) for pair in reference['pairs']}
+    examples = {}
+    for mac in itertools.chain(hub_differs, values_differ, missing, extra):
+        if len(examples) >= EXAMPLES:
+            break
+        examples[mac] = {'state': beacons.get(mac), 'reference': expected.get(mac)}
+    return {'beacons': len(expected), 'hub_differs': len(hub_differs), 'values_differ': len(values_differ),
+            'missing': len(missing), 'extra': len(extra), 'pairs_missing': len(expected_pairs - pairs),
+            'pairs_extra': len(pairs - expected_pairs), 'examples': examples}
+
+
+def run(args):
+    records = mitschnitt_laden(args.files, args.limit)
+    if not records:
+        raise SystemExit("No messages in capture")
+    service = Benchmark.dienst_laden(args.set)
+    import Metrics
+    if args.backend == 'fake':
+        from Bench_Fakes import FakeDatabase
+        hub_MACs, beacon_MACs, first = macs_sammeln(records)
+        Benchmark.fakes_einsetzen(service, FakeDatabase.from_macs(hub_MACs, beacon_MACs, first - 60),
+                                  args.fake_delay_us / 1e6)
+    probe = Benchmark.LatencyProbe(service)
+    service.start_services()
+    before = Benchmark.zaehlerstaende(Metrics)
+    dropped_start = service.verworfen()
+    start = abspielen(service, probe, records, args.speed)
+    complete = probe.wait(len(records), lambda: service.verworfen() - dropped_start, args.timeout)
+    lost = service.verworfen() - dropped_start
+    service.shutdown()
+    report = {
+        'label': args.label,
+        'revision': Benchmark.revision(),
+        'python': platform.python_version(),
+        'files': args.files,
+        'backend': args.backend,
+        'speed': args.speed,
+        'capture_seconds': round(records[-1][0] - records[0][0], 3),
+        'config': Benchmark.konfiguration(service, args.set),
+    }
+    report.update(Benchmark.messwerte(probe, len(records), start, complete, lost,
+                                      Benchmark.differenz(before, Benchmark.zaehlerstaende(Metrics))))
+    return report, endzustand(service)
+
+
+def ausgeben(report):
+    speed = f"{report['speed']}x" if report['speed'] > 0 else "so schnell wie möglich"
+    print(f"Replay {Benchmark.bezeichnung(report)}, Python {report['python']}: {report['messages']} Nachrichten "
+          f"aus {report['capture_seconds']} s Mitschnitt, {speed}, Backend {report['backend']}")
+    Benchmark.messwerte_ausgeben(report)
+    result = report.get('divergence')
+    if result is not None:
+        print(f"  Divergenz           {result['hub_differs']} von {result['beacons']} Beacons mit anderem Hub, "
+              f"{result['values_differ']} mit anderen Werten, {result['missing']} fehlen, {result['extra']} zusätzlich, "
+              f"Paare {result['pairs_missing']} fehlen, {result['pairs_extra']} zusätzlich")
+        for mac, values in result['examples'].items():
+            print(f"    {mac}: {values['state']} statt {values['reference']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nachspielen eines Mitschnitts durch den Microservice")
+    parser.add_argument('files', nargs='+', help="Mitschnitt(e), siehe CAPTURE_FILE")
+    parser.add_argument('--speed', type=float, default=0, help="1 = Originalgeschwindigkeit, 0 = so schnell wie möglich")
+    parser.add_argument('--limit', type=int, default=None, help="höchstens so viele Nachrichten")
+    parser.add_argument('--backend', choices=('fake', 'local'), default='fake')
+    parser.add_argument('--fake-delay-us', type=float, default=0, help="künstliche Dauer je Aufruf im Backend fake")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="Konfiguration überschreiben")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--output', help="Bericht als JSON schreiben")
+    parser.add_argument('--state-output', help="Endzustand als JSON schreiben (Referenz für --reference)")
+    parser.add_argument('--reference', help="Endzustand eines früheren Laufs (JSON) für den Vergleich")
+    args = parser.parse_args(argv)
+    report, state = run(args)
+    if args.reference:
+        with open(args.reference) as file:
+            report['divergence'] = divergenz(state, json.load(file))
+    ausgeben(report)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.state_output:
+        with open(args.state_output, 'w') as file:
+            json.dump(state, file, indent=1, sort_keys=True)
+    return 0 if report['complete'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
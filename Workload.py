@@ -0,0 +1,158 @@
+import json
+import random
+
+# Reproduzierbare Last für Benchmark.py und MQTT_spam.py.
+# Aus einem Seed entstehen immer dieselbe "Welt" (Hubs, Beacons mit MP-Typ und Heimat-Hub, zulässige MP-Typ Paarungen,
+# bestehende Beaconpaare) und dieselbe Folge von Nachrichten. Die Beacons stammen aus beacon_mac.txt.
+# Die Beacons melden sich reihum, wie in MQTT_spam.py. Je Nachricht wird zufällig (mit den Anteilen aus den Parametern):
+#   hub_change_ratio  der Beacon wechselt seinen Heimat-Hub, die Meldungen kommen danach mit starkem RSSI vom neuen Hub
+#   noise_ratio       die Meldung kommt mit schwachem RSSI von einem anderen Hub (Rauschen, kein Raumwechsel)
+#   button_ratio      der Taster ist gedrückt (einzelne Paarungsanfrage ohne Partner)
+#   pairing_ratio     zwei Beacons mit zulässigen MP-Typen am selben Hub drücken nacheinander den Taster (Paarung)
+#   unknown_ratio     die Meldung kommt von einem Beacon, den die Datenbank nicht kennt
+# Die Zeitstempel laufen mit rate Nachrichten je Sekunde ab start_time, unabhängig davon, wie schnell gesendet wird.
+# Format wie nach dem Broker: {"time": <unix ts>, "data": "layer=1, MAC_ROOM=.., ..", "seq": <laufende Nummer>}.
+# seq macht jede Nachricht eindeutig (Zuordnung der Latenz im Benchmark), der Parser ignoriert das Feld.
+
+START_TIME = 1700000000
+
+
+def load_mac_addresses(file_path):
+    with open(file_path, 'r') as file:
+        return [line.strip() for line in file.readlines() if line.strip()]
+
+def hub_mac(index):
+    return f"00:00:00:00:{index >> 8:02X}:{index & 0xFF:02X}"
+
+
+# Ein Beacon der Welt mit seinem Heimat-Hub (Index) und Batteriestand zu Beginn der Last
+class SimBeacon:
+    __slots__ = ('mac', 'beacon_id', 'mp_typ', 'hub', 'batterie')
+
+    def __init__(self, mac, beacon_id, mp_typ, hub, batterie):
+        self.mac = mac
+        self.beacon_id = beacon_id
+        self.mp_typ = mp_typ
+        self.hub = hub
+        self.batterie = batterie
+
+
+class Workload:
+    def __init__(self, seed=1, beacons=None, hubs=9, rate=1000, hub_change_ratio=0.01, noise_ratio=0.1,
+                 button_ratio=0.005, pairing_ratio=0.002, unknown_ratio=0.01, mp_types=4, pair_share=0.2,
+                 start_time=START_TIME, mac_file="./beacon_mac.txt"):
+        if hubs < 1 or rate <= 0:
+            raise ValueError("Workload needs at least one hub and a positive rate")
+        self.seed = seed
+        self.hubs = hubs
+        self.rate = rate
+        self.hub_change_ratio = hub_change_ratio
+        self.noise_ratio = noise_ratio
+        self.button_ratio = button_ratio
+        self.pairing_ratio = pairing_ratio
+        self.unknown_ratio = unknown_ratio
+        self.mp_types = mp_types
+        self.pair_share = pair_share
+        self.start_time = start_time
+        mac_addresses = load_mac_addresses(mac_file)
+        self.beacon_count = len(mac_addresses) if beacons is None else min(beacons, len(mac_addresses))
+        self._build_world(mac_addresses[:self.beacon_count])
+
+    # Parameter der Last, z.B. für den Bericht des Benchmarks
+    def settings(self):
+        return {'seed': self.seed, 'beacons': self.beacon_count, 'hubs': self.hubs, 'rate': self.rate,
+                'hub_change_ratio': self.hub_change_ratio, 'noise_ratio': self.noise_ratio,
+                'button_ratio': self.button_ratio, 'pairing_ratio': self.pairing_ratio,
+                'unknown_ratio': self.unknown_ratio, 'mp_types': self.mp_types, 'pair_share': self.pair_share}
+
+    # Hubs (Index 1..hubs, hub_id = Index), Beacons mit MP-Typ, zulässige Paarungen 1-2, 3-4, ...
+    # Ein Anteil pair_share der Beacons liegt paarweise am selben Hub, mit zueinander passenden MP-Typen.
+    # Die erste Hälfte dieser Paare ist bereits in der Datenbank gepaart, die zweite Hälfte paart sich über pairing_ratio.
+    def _build_world(self, mac_addresses):
+        rnd = random.Random(self.seed)
+        self.hub_macs = {index: hub_mac(index) for index in range(1, self.hubs + 1)}
+        self.mp_mapping = [(mp_typ, mp_typ + 1) for mp_typ in range(1, self.mp_types, 2)]
+        self.beacons = []
+        for position, mac in enumerate(mac_addresses):
+            mp_typ = rnd.randint(1, self.mp_types) if self.mp_types and rnd.random() < 0.8 else None
+            self.beacons.append(SimBeacon(mac, position + 1, mp_typ, rnd.randint(1, self.hubs), rnd.randint(20, 100)))
+        self.pairs = []
+        if self.mp_mapping:
+            candidates = list(self.beacons)
+            rnd.shuffle(candidates)
+            for position in range(0, int(len(candidates) * self.pair_share) - 1, 2):
+                first, second = candidates[position], candidates[position + 1]
+                first.mp_typ, second.mp_typ = rnd.choice(self.mp_mapping)
+                second.hub = first.hub
+                self.pairs.append((first, second))
+        self.existing_pairs = self.pairs[:len(self.pairs) // 2]
+        self.pairing_candidates = self.pairs[len(self.pairs) // 2:]
+        self.unknown_macs = [f"FF:FF:FF:00:{index >> 8:02X}:{index & 0xFF:02X}" for index in range(max(1, self.beacon_count // 10))]
+
+    def _data(self, hub, mac, batterie, button, rssi):
+        return f"layer=1, MAC_ROOM={self.hub_macs[hub]}, MAC_SENSOR={mac}, BATT={batterie}, BUTTON={button}, RSSI={rssi}"
+
+    def _other_hub(self, rnd, hub):
+        if self.hubs == 1:
+            return hub
+        other = rnd.randint(1, self.hubs - 1)
+        return other + 1 if other >= hub else other
+
+    # data-Strings der Nachrichten mit ihrem Zeitstempel, count = None für eine endlose Folge.
+    # Die Welt selbst bleibt unverändert, jeder Aufruf liefert dieselbe Folge.
+    def data(self, count=None):
+        rnd = random.Random(self.seed + 1)
+        order = list(self.beacons)
+        rnd.shuffle(order)
+        hub_of = {beacon: beacon.hub for beacon in self.beacons}
+        batterie_of = {beacon: beacon.batterie for beacon in self.beacons}
+        scheduled = []
+        position = 0
+        index = 0
+        while count is None or index < count:
+            timestamp = self.start_time + int(index / self.rate)
+            if scheduled:
+                yield timestamp, scheduled.pop()
+                index += 1
+                continue
+            chance = rnd.random()
+            if chance < self.unknown_ratio or not order:
+                yield timestamp, self._data(rnd.randint(1, self.hubs), rnd.choice(self.unknown_macs), 100, 0, _strong(rnd))
+                index += 1
+                continue
+            chance -= self.unknown_ratio
+            if chance < self.pairing_ratio and self.pairing_candidates:
+                # Beide Beacons am Hub des ersten, die zweite Meldung folgt direkt danach
+                first, second = rnd.choice(self.pairing_candidates)
+                hub = hub_of[second] = hub_of[first]
+                scheduled.append(self._data(hub, second.mac, batterie_of[second], 1, _strong(rnd)))
+                yield timestamp, self._data(hub, first.mac, batterie_of[first], 1, _strong(rnd))
+                index += 1
+                continue
+            chance -= self.pairing_ratio
+            beacon = order[position]
+            position = (position + 1) % len(order)
+            if rnd.random() < 0.001 and batterie_of[beacon] > 0:
+                batterie_of[beacon] -= 1
+            button = 1 if rnd.random() < self.button_ratio else 0
+            if chance < self.hub_change_ratio:
+                hub_of[beacon] = self._other_hub(rnd, hub_of[beacon])
+                yield timestamp, self._data(hub_of[beacon], beacon.mac, batterie_of[beacon], button, _strong(rnd))
+            elif chance < self.hub_change_ratio + self.noise_ratio:
+                yield timestamp, self._data(self._other_hub(rnd, hub_of[beacon]), beacon.mac, batterie_of[beacon], button, _weak(rnd))
+            else:
+                yield timestamp, self._data(hub_of[beacon], beacon.mac, batterie_of[beacon], button, _strong(rnd))
+            index += 1
+
+    # Vollständige Nachrichten wie nach dem Broker (bytes, wie von paho geliefert)
+    def messages(self, count=None):
+        for seq, (timestamp, data) in enumerate(self.data(count)):
+            yield json.dumps({"time": timestamp, "data": data, "seq": seq}).encode()
+
+
+# RSSI am Heimat-Hub und an einem Nachbar-Hub, im Bereich von MQTT_spam.py (100 bis 250)
+def _strong(rnd):
+    return max(100, min(250, int(rnd.gauss(210, 8))))
+
+def _weak(rnd):
+    return max(100, min(250, int(rnd.gauss(160, 15))))
@@ -0,0 +1,38 @@
+import os
+import sys
+
+# Die Module liegen flach im Wurzelverzeichnis des Repositories
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+# Mindestwerte der Konfiguration, damit Main_Microservice ohne Default_Config.env geladen werden kann
+SERVICE_ENV = {'DB_PORT': '3306', 'MEMCACHE_PORT': '11211', 'MQTT_PORT': '1883', 'MQTT_TOPIC': 'ats',
+               'ROOM_TIMEGAP': '300', 'TIMEGAP': '30', 'DB_UPDATE_CYCLE_BEACON': '600', 'DB_UPDATE_CYCLE_HUB': '3600'}
+
+
+# Frisch geladener Microservice mit memcache und Datenbank aus Bench_Fakes.py (wie Benchmark.py --backend fake).
+# Benötigt die Abhängigkeiten des Microservice, sonst werden die Tests übersprungen.
+@pytest.fixture
+def load_service(monkeypatch):
+    for module in ('paho.mqtt.client', 'mysql.connector', 'pymemcache', 'dotenv'):
+        pytest.importorskip(module)
+    for key, value in SERVICE_ENV.items():
+        monkeypatch.setenv(key, os.getenv(key, value))
+
+    def load(database=None, delay=0.0, **settings):
+        import Benchmark
+        from Bench_Fakes import FakeDatabase
+        for key, value in settings.items():
+            monkeypatch.setenv(key, str(value))
+        for module in ('Main_Microservice', 'Beaconpair_Validity_check'):
+            sys.modules.pop(module, None)
+        service = Benchmark.dienst_laden([])
+        Benchmark.fakes_einsetzen(service, database if database is not None else FakeDatabase(), delay)
+        return service
+
+    yield load
+    for module in ('Main_Microservice', 'Beaconpair_Validity_check'):
+        sys.modules.pop(module, None)
@@ -0,0 +1,56 @@
+import threading
+from types import SimpleNamespace
+
+from Async_Runtime import AsyncRuntime
+
+
+# paho Client: loop_start verbindet und liefert die Nachrichten aus einem eigenen Thread wie der Netzwerk-Thread
+class FakeClient:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.subscribed = []
+        self.runtime = None
+        self._thread = None
+
+    def connect_async(self, host, port, keepalive):
+        pass
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def _network(self):
+        self.on_connect(self, None, {}, 0)
+        for payload in self.payloads:
+            self.on_message(self, None, SimpleNamespace(payload=payload))
+        self.runtime.loop.call_soon_threadsafe(self.runtime._stop.set)
+
+    def loop_start(self):
+        self._thread = threading.Thread(target=self._network)
+        self._thread.start()
+
+    def loop_stop(self):
+        self._thread.join()
+
+
+def test_subscribes_all_topics_and_processes_in_its_own_pool():
+    payloads = [b'{"time": %d, "data": "MAC_SENSOR=AA:%02d"}' % (i, i % 7) for i in range(200)]
+    client = FakeClient(payloads)
+    handled = []
+    threads = set()
+
+    def handler(payload):
+        threads.add(threading.current_thread().name)
+        handled.append(payload)
+
+    runtime = AsyncRuntime(client, 'broker', 1883, ['$share/ats/ats', 'ats/owner/0'], handler, workers=4, io_threads=2,
+                           queue_size=16)
+    client.runtime = runtime
+    runtime.start()
+    assert client.subscribed == ['$share/ats/ats', 'ats/owner/0']
+    assert sorted(handled) == sorted(payloads)
+    # Nachrichten eines Beacons in der Reihenfolge des Empfangs
+    for beacon in range(7):
+        mac = b'AA:%02d' % beacon
+        assert [payload for payload in handled if mac in payload] == [payload for payload in payloads if mac in payload]
+    assert threads and all(name.startswith('async-io') for name in threads)
+    assert runtime.executor._shutdown
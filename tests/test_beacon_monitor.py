@@ -0,0 +1,104 @@
+import json
+
+from Beacon_Monitor import BeaconMonitor
+from Beacon_State import BeaconRecord
+
+
+def monitor(**settings):
+    batches = []
+    return BeaconMonitor(batches.append, smoothing=1.0, **settings), batches
+
+
+def kinds(batch):
+    return sorted((alert['beacon'], alert['kind']) for alert in batch)
+
+
+def test_battery_alerts_use_the_hysteresis():
+    beacon_monitor, batches = monitor(battery_threshold=20, battery_hysteresis=5)
+    beacon_monitor.seen(1, 30, 100)
+    beacon_monitor.seen(1, 19, 110)
+    beacon_monitor.seen(1, 18, 120)
+    assert beacon_monitor.run_once() == 1
+    assert kinds(batches[-1]) == [(1, 'battery_low')] and batches[-1][0]['battery'] == 19
+    # innerhalb der Hysterese kein neuer Alarm
+    beacon_monitor.seen(1, 22, 130)
+    beacon_monitor.seen(1, 19, 140)
+    assert beacon_monitor.run_once() == 0
+    beacon_monitor.seen(1, 25, 150)
+    beacon_monitor.run_once()
+    assert kinds(batches[-1]) == [(1, 'battery_ok')]
+    assert beacon_monitor.alerts == {'battery_low': 1, 'battery_ok': 1, 'silent': 0, 'back': 0}
+
+
+def test_smoothing_ignores_a_single_low_reading():
+    batches = []
+    beacon_monitor = BeaconMonitor(batches.append, battery_threshold=20, smoothing=0.3)
+    beacon_monitor.seen(1, 50, 100)
+    beacon_monitor.seen(1, 0, 110)
+    assert beacon_monitor.run_once() == 0 and beacon_monitor.low_battery() == []
+
+
+def test_silence_and_back_use_message_time():
+    beacon_monitor, batches = monitor(silence=900)
+    beacon_monitor.seen(1, None, 100)
+    beacon_monitor.seen(2, None, 100)
+    beacon_monitor.seen(2, None, 900)
+    beacon_monitor.seen(2, None, 1000)
+    beacon_monitor.run_once()
+    assert kinds(batches[-1]) == [(1, 'silent')] and beacon_monitor.silent() == [1]
+    beacon_monitor.seen(1, None, 1100)
+    beacon_monitor.run_once()
+    assert kinds(batches[-1]) == [(1, 'back')] and beacon_monitor.silent() == []
+    # ältere Nachricht ändert nichts
+    beacon_monitor.seen(1, None, 500)
+    assert beacon_monitor.query(['beacon', '1'])['last_seen'] == 1100
+
+
+def test_opposite_alerts_cancel_before_reporting():
+    beacon_monitor, batches = monitor(battery_threshold=20, battery_hysteresis=5, silence=900)
+    beacon_monitor.seen(1, 30, 100)
+    beacon_monitor.seen(2, None, 1000)
+    beacon_monitor.run_once()
+    assert kinds(batches[-1]) == [(1, 'silent')]
+    beacon_monitor.seen(2, None, 2000)
+    beacon_monitor.run_once()
+    # battery_low und battery_ok desselben Beacons zwischen zwei Ausgaben heben sich auf, back bleibt
+    beacon_monitor.seen(1, 10, 2100)
+    beacon_monitor.seen(1, 30, 2110)
+    assert beacon_monitor.run_once() == 1
+    assert kinds(batches[-1]) == [(1, 'back')]
+
+
+def test_load_marks_beacons_without_alerts():
+    beacon_monitor, batches = monitor(battery_threshold=20, silence=900)
+    records = [BeaconRecord(1, 7, -60, 100, 100, 10, 1, 100),
+               BeaconRecord(2, 7, -60, 2000, 2000, 80, 1, 2000),
+               BeaconRecord(3, 7, -60, None, None, None, 1, None)]
+    assert beacon_monitor.load(records) == 2
+    assert beacon_monitor.low_battery() == [1] and beacon_monitor.silent() == [1]
+    assert beacon_monitor.run_once() == 0 and batches == []
+
+
+def test_export_and_restore_round_trip():
+    beacon_monitor, _ = monitor(battery_threshold=20, silence=900)
+    beacon_monitor.seen(1, 10, 100)
+    beacon_monitor.seen(2, 80, 1500)
+    beacon_monitor.run_once()
+    data = json.loads(json.dumps(beacon_monitor.export()))
+    restored, batches = monitor(battery_threshold=20, silence=900)
+    restored.restore(data)
+    assert restored.low_battery() == [1] and restored.silent() == [1] and len(restored) == 2
+    # die Fristen der nicht stillen Beacons werden mit übernommen
+    restored.seen(1, 10, 2500)
+    restored.run_once()
+    assert kinds(batches[-1]) == [(1, 'back'), (2, 'silent')]
+
+
+def test_query():
+    beacon_monitor, _ = monitor(battery_threshold=20)
+    beacon_monitor.seen(1, 10, 100)
+    assert beacon_monitor.query([]) == {'low_battery': [1], 'silent': [], 'beacons': 1}
+    assert beacon_monitor.query(['beacon', '1']) == {'beacon': 1, 'last_seen': 100, 'battery': 10, 'rate': None,
+                                                      'low': True, 'silent': False}
+    assert beacon_monitor.query(['beacon', '2']) is None
+    assert beacon_monitor.query(['hub', '1']) is None
@@ -0,0 +1,91 @@
+from Beacon_State import BeaconRecord, HubRecord, StateStore, as_beacon, as_hub
+from Bench_Fakes import FakeMemcache
+
+
+def beacon(beacon_id=1, timestamp=1700000000):
+    return BeaconRecord(beacon_id, 2, -60, timestamp, timestamp, 80, 3, timestamp)
+
+
+def test_records_round_trip_as_lists():
+    record = beacon()
+    assert as_beacon(record.to_list()).to_list() == record.to_list()
+    assert as_hub([5, 10, 20]).to_list() == [5, 10, 20]
+    assert as_beacon([1, 2, 3]) is None
+    assert as_beacon(None) is None
+
+
+def test_reads_are_served_from_the_process():
+    memcache = FakeMemcache()
+    state = StateStore(memcache)
+    state.put_beacon('AA', beacon())
+    state.put_hub('HH', HubRecord(5, 10, 10))
+    assert state.get_beacon('AA').beacon_id == 1
+    assert state.get_hub('HH').hub_id == 5
+    assert memcache.get('AA') is None   # noch nicht geschrieben
+
+
+def test_flush_coalesces_updates_of_one_key():
+    memcache = FakeMemcache()
+    state = StateStore(memcache)
+    state.put_beacon('AA', beacon(timestamp=1))
+    state.put_beacon('AA', beacon(timestamp=2))
+    assert state.pending() == 1
+    assert state.flush() == 1
+    assert memcache.get('AA').timestamp == 2
+    assert state.pending() == 0
+
+
+def test_failed_keys_are_written_again():
+    memcache = FakeMemcache()
+    state = StateStore(memcache)
+    memcache.set_many = lambda values: list(values)
+    state.put_beacon('AA', beacon())
+    assert state.flush() == 0
+    assert state.pending() == 1
+
+
+def test_without_write_through_nothing_is_flushed():
+    memcache = FakeMemcache()
+    state = StateStore(memcache)
+    state.put_beacon('AA', beacon(), write_through=False)
+    assert state.flush() == 0
+
+
+def test_load_from_memcache_on_miss():
+    memcache = FakeMemcache()
+    memcache.set('AA', beacon(7))
+    state = StateStore(memcache)
+    assert state.load_beacon('AA').beacon_id == 7
+    assert state.get_beacon('AA').beacon_id == 7
+    assert state.load_hub('HH') is None
+
+
+def test_unknown_macs_are_retried_after_the_interval():
+    state = StateStore(FakeMemcache(), unknown_retry=60)
+    state.mark_unknown('XX', 100)
+    assert state.is_unknown('XX', 159)
+    assert not state.is_unknown('XX', 160)
+    state.put_beacon('XX', beacon())
+    assert not state.is_unknown('XX', 120)
+
+
+def test_unknown_macs_are_bounded():
+    state = StateStore(FakeMemcache(), unknown_retry=60, unknown_max=3)
+    for number in range(5):
+        state.mark_unknown(f'R{number}', 100 + number)
+    assert len(state._unknown) == 3
+    assert not state.is_unknown('R0', 105) and state.is_unknown('R4', 105)
+    # eine erneute erfolglose Suche verschiebt die MAC ans Ende
+    state.mark_unknown('R2', 110)
+    state.mark_unknown('R5', 111)
+    assert list(state._unknown) == ['R4', 'R2', 'R5']
+
+
+def test_expired_unknown_macs_are_removed():
+    state = StateStore(FakeMemcache(), unknown_retry=60)
+    state.mark_unknown('XX', 100)
+    state.mark_unknown('YY', 130)
+    assert state.expire_unknown() == 0
+    state.mark_unknown('ZZ', 170)
+    assert state.expire_unknown() == 1
+    assert list(state._unknown) == ['YY', 'ZZ']
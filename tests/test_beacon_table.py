@@ -0,0 +1,75 @@
+import io
+import pytest
+
+from Beacon_State import BeaconRecord
+from Beacon_Table import BeaconTable
+
+
+def record(beacon_id, timestamp=1000, batterie=80, hub_id=7):
+    return BeaconRecord(beacon_id, hub_id, -60, timestamp, timestamp, batterie, 1, None)
+
+
+def test_behaves_like_a_dict():
+    table = BeaconTable()
+    table['AA'] = record(1)
+    table['BB'] = record(2)
+    table['AA'] = record(1, timestamp=2000)
+    assert len(table) == 2 and 'AA' in table and 'CC' not in table
+    assert table['AA'].to_list() == record(1, timestamp=2000).to_list()
+    assert table['AA'].db_sync_timestamp is None
+    assert table.get('CC') is None
+    with pytest.raises(KeyError):
+        table['CC']
+
+
+def test_stale_and_low_battery():
+    table = BeaconTable()
+    table['AA'] = record(1, timestamp=1000, batterie=10)
+    table['BB'] = record(2, timestamp=5000, batterie=None)
+    table['CC'] = record(3, timestamp=None, batterie=90)
+    assert table.stale(2000) == ['AA']
+    assert table.low_battery(20) == ['AA']
+
+
+def test_beacon_returning_from_other_reuses_its_row():
+    table = BeaconTable()
+    table['AA'] = record(1)
+    table['BB'] = record(2)
+    table['AA'] = record('x')
+    assert table['AA'].beacon_id == 'x' and 'AA' in table.other
+    for attempt in range(3):
+        table['AA'] = record(1, timestamp=3000 + attempt)
+        table['AA'] = record(1 << 40)
+    table['AA'] = record(1, timestamp=4000)
+    assert len(table.macs) == 2 and len(table.columns[0]) == 2
+    assert table.rows['AA'] == 0 and not table.free and not table.other
+    assert table['AA'].timestamp == 4000 and table['BB'].beacon_id == 2
+
+
+def test_save_and_load_round_trip(tmp_path):
+    table = BeaconTable()
+    table['AA'] = record(1)
+    table['BB'] = record(2, batterie=None)
+    table['CC'] = record(3)
+    table['CC'] = record('x')
+    path = str(tmp_path / 'beacons.tab')
+    table.save(path)
+    loaded = BeaconTable.load(path)
+    assert dict((mac, r.to_list()) for mac, r in loaded.items()) == \
+        dict((mac, r.to_list()) for mac, r in table.items())
+    # die ungenutzte Zeile von CC wird nicht geschrieben
+    assert loaded.macs == ['AA', 'BB'] and len(loaded.columns[0]) == 2
+    assert loaded.other['CC'].beacon_id == 'x'
+
+
+def test_read_rejects_invalid_and_truncated_data():
+    table = BeaconTable()
+    table['AA'] = record(1)
+    file = io.BytesIO()
+    table.write(file)
+    data = file.getvalue()
+    assert BeaconTable.read(data)['AA'].beacon_id == 1
+    with pytest.raises(ValueError):
+        BeaconTable.read(b'NOTATAB' + data[7:])
+    with pytest.raises(ValueError):
+        BeaconTable.read(data[:-8])
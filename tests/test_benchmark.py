@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+from MQTT_Parser import parse_message
+from Workload import Workload
+
+MAC_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'beacon_mac.txt')
+
+
+def test_workload_is_reproducible():
+    first = list(Workload(seed=5, beacons=50, mac_file=MAC_FILE).messages(300))
+    second = list(Workload(seed=5, beacons=50, mac_file=MAC_FILE).messages(300))
+    other = list(Workload(seed=6, beacons=50, mac_file=MAC_FILE).messages(300))
+    assert first == second
+    assert first != other
+
+
+def test_workload_messages_follow_the_hub_format():
+    workload = Workload(seed=1, beacons=50, hubs=4, rate=100, mac_file=MAC_FILE)
+    messages = [parse_message(message) for message in workload.messages(500)]
+    known = {beacon.mac for beacon in workload.beacons} | set(workload.unknown_macs)
+    assert {message.beacon_MAC for message in messages} <= known
+    assert {message.hub_MAC for message in messages} <= set(workload.hub_macs.values())
+    assert messages[-1].timestamp == workload.start_time + 499 // 100
+    assert workload.settings()['beacons'] == 50
+
+
+def test_helpers():
+    import Benchmark
+    assert Benchmark.percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert Benchmark.percentile([], 0.5) is None
+    before = {'ats_messages_total': {'case1': 2}}
+    after = {'ats_messages_total': {'case1': 5, 'case2': 0}}
+    assert Benchmark.differenz(before, after) == {'ats_messages_total': {'case1': 3}}
+    assert Benchmark.je_nachricht({'get': 10, 'set': 5}, 5) == {'get': 2.0, 'set': 1.0, 'total': 3.0}
+
+
+def test_end_to_end_report(load_service, tmp_path, capsys, monkeypatch):
+    import Benchmark
+    for key in ('STATE_SNAPSHOT_FILE', 'CAPTURE_FILE', 'EVENTS_LOG_FILE'):
+        monkeypatch.setenv(key, '')
+    for module in ('Main_Microservice', 'Beaconpair_Validity_check'):
+        sys.modules.pop(module, None)
+    output = tmp_path / 'report.json'
+    assert Benchmark.main(['--messages', '300', '--warmup-messages', '50', '--beacons', '40', '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report['complete'] and report['messages'] == 300
+    assert report['throughput'] > 0 and report['latency_ms']['p50'] is not None
+    assert sum(report['outcomes'].values()) > 0
+    assert 'Durchsatz' in capsys.readouterr().out
@@ -0,0 +1,74 @@
+import threading
+
+from Bench_Fakes import FakeMemcache
+from Cache_Batch import CacheBatch, CacheLock
+
+
+class CountingMemcache(FakeMemcache):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def get_many(self, keys):
+        self.calls.append('get_many')
+        return super().get_many(keys)
+
+    def set_many(self, values, expire=0, noreply=None, flags=None):
+        self.calls.append(('set_many', expire))
+        return super().set_many(values, expire)
+
+    def delete_many(self, keys, noreply=None):
+        self.calls.append('delete_many')
+        return super().delete_many(keys)
+
+
+def test_one_round_trip_per_kind_of_access():
+    memcache = CountingMemcache()
+    memcache.set('a', 1)
+    memcache.set('b', 2)
+    with CacheBatch(memcache) as batch:
+        assert batch.fetch(['a', 'b', 'c']) == {'a': 1, 'b': 2, 'c': None}
+        assert batch.get('a') == 1
+        batch.set('c', 3)
+        batch.set('d', 4, expire=60)
+        batch.delete('a')
+        assert batch.get('a') is None and batch.get('c') == 3
+        assert batch.pending() == 3
+    assert memcache.calls == ['get_many', ('set_many', 0), ('set_many', 60), 'delete_many']
+    assert (memcache.get('a'), memcache.get('b'), memcache.get('c'), memcache.get('d')) == (None, 2, 3, 4)
+
+
+def test_later_change_of_a_key_wins():
+    memcache = CountingMemcache()
+    with CacheBatch(memcache) as batch:
+        batch.set('a', 1)
+        batch.delete('a')
+        batch.set('b', 1, expire=60)
+        batch.set('b', 2)
+    assert memcache.get('a') is None
+    assert memcache.get('b') == 2
+    assert memcache.calls == [('set_many', 0), 'delete_many']
+
+
+def test_nothing_is_written_after_an_error():
+    memcache = CountingMemcache()
+    try:
+        with CacheBatch(memcache) as batch:
+            batch.set('a', 1)
+            raise KeyError('a')
+    except KeyError:
+        pass
+    assert memcache.get('a') is None
+
+
+def test_lock_serialises_holders_and_times_out():
+    memcache = FakeMemcache()
+    order = []
+    with CacheLock(memcache, 'lock') as lock:
+        assert lock.acquired
+        waiter = threading.Thread(target=lambda: order.append(CacheLock(memcache, 'lock', timeout=2.0).acquire()))
+        waiter.start()
+        assert not CacheLock(memcache, 'lock', timeout=0.01).acquire()
+        order.append('released')
+    waiter.join()
+    assert order == ['released', True]
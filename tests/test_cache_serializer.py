@@ -0,0 +1,61 @@
+import pytest
+
+import Cache_Serializer
+from Beacon_State import BeaconRecord, HubRecord
+from Cache_Serializer import (FLAG_BEACON, FLAG_HUB, FLAG_INTS, FLAG_JSON, binary_serializer, deserializer,
+                              json_serializer, serializer_for)
+
+
+def round_trip(serializer, value):
+    data, flags = serializer('key', value)
+    return deserializer('key', data if isinstance(data, bytes) else data.encode(), flags), flags
+
+
+@pytest.mark.parametrize('value, flags', [
+    (BeaconRecord(7, 1, -60, 1700000000, 1699999000, 80, 3, 1700000000), FLAG_BEACON),
+    (BeaconRecord(7, None, None, 1700000000, None, None, None, None), FLAG_BEACON),
+    (HubRecord(5, 1700000000, None), FLAG_HUB),
+    ([1, 2, 3], FLAG_INTS),
+    ([1, 2 ** 40], FLAG_INTS),
+    ([], FLAG_INTS),
+])
+def test_binary_round_trip(value, flags):
+    result, written = round_trip(binary_serializer, value)
+    assert written == flags
+    expected = value.to_list() if hasattr(value, 'to_list') else value
+    assert (result.to_list() if hasattr(result, 'to_list') else result) == expected
+    assert type(result) is (type(value) if hasattr(value, 'to_list') else list)
+
+
+@pytest.mark.parametrize('value', [
+    BeaconRecord(7, 1, -60, 1700000000.5, 1699999000, 80, 3, 1700000000),   # Zeitstempel als float
+    BeaconRecord(7, 1, 40000, 1700000000, 1699999000, 80, 3, 1700000000),    # RSSI außerhalb von int16
+    ['1,2', '3,4'],
+    {'a': 1},
+    'text',
+])
+def test_values_outside_the_binary_format_fall_back_to_json(value):
+    result, flags = round_trip(binary_serializer, value)
+    assert flags == FLAG_JSON
+    assert result == (value.to_list() if hasattr(value, 'to_list') else value)
+
+
+def test_json_format_writes_records_as_lists():
+    record = HubRecord(5, 10, 20)
+    result, flags = round_trip(json_serializer, record)
+    assert (result, flags) == ([5, 10, 20], FLAG_JSON)
+
+
+def test_unknown_version_and_format_are_rejected():
+    data, flags = binary_serializer('key', HubRecord(5, 10, 20))
+    with pytest.raises(ValueError):
+        deserializer('key', bytes([Cache_Serializer.VERSION + 1]) + data[1:], flags)
+    with pytest.raises(Exception):
+        deserializer('key', data, 99)
+
+
+def test_configured_format():
+    assert serializer_for('json') is json_serializer
+    assert serializer_for('binary') is binary_serializer
+    with pytest.raises(ValueError):
+        serializer_for('xml')
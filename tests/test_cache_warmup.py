@@ -0,0 +1,47 @@
+import Cache_Serializer
+from Beacon_State import BeaconRecord, StateStore, as_beacon
+from Bench_Fakes import FakeDatabase, FakeMemcache
+from Cache_Warmup import bulk_warmup, merge_ids
+from DB_Pool import ConnectionPool
+from Pair_Registry import PairRegistry
+
+
+def setup():
+    database = FakeDatabase()
+    for index in range(1, 6):
+        mac = 'AA:%02d' % index
+        database.beacons[mac] = [index, mac, 1, -60, 1000, 900, 80, index % 2 + 1]
+        database.beacon_macs[index] = mac
+    database.mp_mapping = [[1, 2]]
+    database.beaconpairs = [[1, 2, 1000, 1], [3, 4, 1000, 1]]
+    memcache = FakeMemcache(Cache_Serializer.json_serializer, Cache_Serializer.deserializer)
+    pool = ConnectionPool({}, size=1, connect=database.connect)
+    return database, memcache, pool
+
+
+def test_merge_ids_keeps_the_cached_order():
+    assert merge_ids([3, 1], [1, 2, 3, 4]) == [3, 1, 2, 4]
+    assert merge_ids(None, [2, 2]) == [2]
+
+
+def test_bulk_warmup_loads_all_tables_in_chunks():
+    database, memcache, pool = setup()
+    state = StateStore(memcache)
+    registry = PairRegistry(memcache, 4)
+    report = bulk_warmup(pool, memcache, state, registry, chunk_size=2)
+    assert [(name, rows) for name, rows, _ in report.phases] == [('beacon_left_join_mp', 5), ('mp_mapping', 1),
+                                                                 ('beaconpair', 2)]
+    assert len(state.beacons) == 5
+    assert as_beacon(memcache.get('AA:03')).beacon_id == 3
+    assert memcache.get('mp_typ_mapping_1') == [2] and memcache.get('mp_typ_mapping_2') == [1]
+    assert sorted(registry.pairs()) == [(1, 2), (3, 4)]
+
+
+def test_newer_cached_beacon_is_kept():
+    database, memcache, pool = setup()
+    newer = BeaconRecord(1, 2, -50, 2000, 2000, 70, 2, 1000)
+    memcache.set('AA:01', newer)
+    state = StateStore(memcache)
+    bulk_warmup(pool, memcache, state, PairRegistry(memcache, 4))
+    assert state.get_beacon('AA:01').to_list() == newer.to_list()
+    assert state.get_beacon('AA:02').timestamp == 1000
@@ -0,0 +1,74 @@
+import time
+import pytest
+
+mysql_connector = pytest.importorskip("mysql.connector")
+
+from DB_Pool import ConnectionPool, PoolError
+
+
+class FakeRaw:
+    def __init__(self, pool, alive=True):
+        self.pool = pool
+        self.alive = alive
+        self.pings = 0
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        # Während der Prüfung ist nur diese eine Verbindung entnommen
+        assert self.pool._idle.qsize() == self.pool.size - 1
+        self.pings += 1
+        if not self.alive:
+            raise mysql_connector.errors.InterfaceError("Lost connection")
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(size=3, health_interval=30):
+    pool = ConnectionPool({}, size=size, health_interval=health_interval, timeout=0.1)
+    pool.connect = lambda **config: FakeRaw(pool)
+    return pool
+
+
+def connections(pool):
+    return list(pool._idle.queue)
+
+
+def test_empty_slots_are_filled():
+    pool = make_pool()
+    pool._health_check()
+    assert all(connection is not None for connection in connections(pool))
+
+
+def test_fresh_connections_are_not_pinged():
+    pool = make_pool()
+    pool._health_check()
+    pool._health_check()
+    assert [connection.raw.pings for connection in connections(pool)] == [0, 0, 0]
+
+
+def test_stale_connections_are_pinged_and_dead_ones_replaced():
+    pool = make_pool()
+    pool._health_check()
+    stale, dead, fresh = connections(pool)
+    for connection in (stale, dead):
+        connection.last_used = time.monotonic() - 60
+    dead.raw.alive = False
+    pool._health_check()
+    assert stale.raw.pings == 1 and fresh.raw.pings == 0
+    assert dead.raw.closed and dead not in connections(pool)
+    assert len(connections(pool)) == 3 and None not in connections(pool)
+
+
+def test_failed_connection_attempt_keeps_the_slot():
+    pool = make_pool(size=2)
+
+    def refuse(**config):
+        raise mysql_connector.errors.InterfaceError("Can't connect")
+
+    pool.connect = refuse
+    pool._health_check()
+    assert connections(pool) == [None, None]
+    with pytest.raises(PoolError):
+        with pool.connection():
+            pass
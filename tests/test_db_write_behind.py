@@ -0,0 +1,101 @@
+import contextlib
+import pytest
+
+mysql_connector = pytest.importorskip("mysql.connector")
+
+from DB_Write_Behind import WriteBehindQueue
+
+
+class DataError(mysql_connector.Error):
+    pass
+
+
+# Datenbank mit Transaktionen: ausgeführte Parameter werden erst mit commit übernommen
+class FakeConnection:
+    def __init__(self, reject=(), down=False):
+        self.reject = reject
+        self.down = down
+        self.open = []
+        self.committed = []
+        self.rollbacks = 0
+
+    def prepared(self, sql):
+        return self
+
+    def execute(self, sql, params):
+        if self.down:
+            raise mysql_connector.errors.OperationalError("MySQL server has gone away")
+        if params in self.reject:
+            raise DataError("Duplicate entry")
+        self.open.append(params)
+
+    def executemany(self, sql, rows):
+        for params in rows:
+            self.execute(sql, params)
+
+    def commit(self):
+        self.committed += self.open
+        self.open = []
+
+    def rollback(self):
+        self.open = []
+        self.rollbacks += 1
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.raw = connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self.raw
+
+
+def test_flush_coalesces_by_key():
+    connection = FakeConnection()
+    queue = WriteBehindQueue(FakePool(connection))
+    queue.submit('hub', 5, (10, 5))
+    queue.submit('hub', 5, (20, 5))
+    queue.submit('hub', 6, (20, 6))
+    assert queue.depth() == 2
+    assert queue.flush() == 2
+    assert sorted(connection.committed) == [(20, 5), (20, 6)]
+    assert queue.depth() == 0
+
+
+def test_rejected_row_is_dropped_and_the_rest_written():
+    connection = FakeConnection(reject={(1, 2, 100, 7)})
+    queue = WriteBehindQueue(FakePool(connection))
+    queue.submit('beaconpair', (1, 2), (1, 2, 100, 7))
+    queue.submit('beaconpair', (3, 4), (3, 4, 100, 7))
+    queue.submit('hub', 7, (100, 7))
+    assert queue.flush() == 2
+    assert sorted(connection.committed) == [(3, 4, 100, 7), (100, 7)]
+    assert queue.depth() == 0
+    # der verworfene Datensatz blockiert den nächsten Block nicht
+    queue.submit('hub', 7, (200, 7))
+    assert queue.flush() == 1
+    assert connection.committed[-1] == (200, 7)
+
+
+def test_unavailable_database_requeues_the_batch():
+    connection = FakeConnection(down=True)
+    queue = WriteBehindQueue(FakePool(connection))
+    queue.submit('hub', 5, (10, 5))
+    queue.submit('hub', 6, (10, 6))
+    assert queue.flush() == -1
+    assert queue.depth() == 2
+    # ein danach eingereichter Stand ersetzt den wieder vorgemerkten
+    queue.submit('hub', 5, (30, 5))
+    connection.down = False
+    assert queue.flush() == 2
+    assert sorted(connection.committed) == [(10, 6), (30, 5)]
+
+
+def test_unbindable_row_is_dropped():
+    connection = FakeConnection()
+    queue = WriteBehindQueue(FakePool(connection))
+    queue.submit('hub', 5, ('not a number', 5))
+    queue.submit('hub', 6, (10, 6))
+    assert queue.flush() == 1
+    assert connection.committed == [(10, 6)]
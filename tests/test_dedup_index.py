@@ -0,0 +1,62 @@
+import pytest
+
+import Dedup_Index
+from Dedup_Index import DedupIndex
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(Dedup_Index.time, 'monotonic', clock)
+    return clock
+
+
+def test_repeated_message_is_detected(clock):
+    index = DedupIndex(window=300)
+    assert not index.seen('AA', 'H1', 1)
+    assert index.seen('AA', 'H1', 1)
+    assert not index.seen('AA', 'H2', 1)
+    assert not index.seen('AA', 'H1', 2)
+    assert (index.hits, len(index)) == (1, 3)
+
+
+def test_keys_are_kept_for_at_least_the_window(clock):
+    index = DedupIndex(window=300, generations=4)
+    index.seen('AA', 'H1', 1)
+    for _ in range(3):
+        clock.now += 100
+        index.seen('BB', 'H1', clock.now)   # neue Nachricht, löst die Rotation aus
+    assert index.seen('AA', 'H1', 1)
+
+
+def test_rotation_drops_the_oldest_generation(clock):
+    index = DedupIndex(window=300, generations=4)
+    index.seen('AA', 'H1', 1)
+    for _ in range(4):
+        clock.now += 100
+        index.seen('BB', 'H1', clock.now)
+    assert not index.seen('AA', 'H1', 1)
+
+
+def test_full_generation_rotates_early(clock):
+    index = DedupIndex(window=300, max_entries=8, generations=4)
+    for timestamp in range(11):
+        index.seen('AA', 'H1', timestamp)
+    assert index.early_rotations == 5   # je zwei Einträge eine Generation
+    assert len(index) <= 8
+    assert not index.seen('AA', 'H1', 0)
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        DedupIndex(window=0)
+    with pytest.raises(ValueError):
+        DedupIndex(generations=1)
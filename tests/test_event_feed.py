@@ -0,0 +1,93 @@
+import json
+
+from Event_Feed import EventFeed
+
+
+class Info:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+# paho Client, der veröffentlichte Nachrichten nur sammelt
+class FakeClient:
+    def __init__(self, rc=0):
+        self.rc = rc
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, json.loads(payload), retain))
+        return Info(self.rc)
+
+
+def snapshot():
+    return {'beacons': {'1': [7, 100, 'AA']}, 'pairs': [[1, 2]], 'critical': []}
+
+
+def test_first_flush_writes_snapshot_then_deltas_in_batches():
+    client = FakeClient()
+    feed = EventFeed(snapshot, client=client, topic='ats/events', batch_size=2)
+    for beacon_id in range(5):
+        feed.emit('location', beacon=beacon_id, hub=7, previous=None, ts=100)
+    feed.flush()
+    topics = [topic for topic, _, _ in client.published]
+    assert topics == ['ats/events/main/snapshot'] + ['ats/events/main/delta'] * 3
+    _, message, retain = client.published[0]
+    assert retain and message['type'] == 'snapshot' and message['seq'] == 5 and message['pairs'] == [[1, 2]]
+    deltas = [message for _, message, _ in client.published[1:]]
+    assert [(delta['first'], delta['last']) for delta in deltas] == [(1, 2), (3, 4), (5, 5)]
+    assert deltas[0]['events'][0] == {'beacon': 0, 'hub': 7, 'previous': None, 'ts': 100, 'seq': 1, 'type': 'location'}
+    assert feed.published == 5 and feed.snapshots == 1
+
+
+def test_snapshot_only_when_due_or_requested():
+    client = FakeClient()
+    feed = EventFeed(snapshot, client=client, topic='t', snapshot_interval=0)
+    feed.flush()
+    feed.emit('pair', beacons=[1, 2], hub=7, ts=100)
+    feed.flush()
+    assert feed.snapshots == 1
+    feed.request_snapshot()
+    feed.flush()
+    assert feed.snapshots == 2
+
+
+def test_full_queue_drops_events_and_forces_snapshot():
+    client = FakeClient()
+    feed = EventFeed(snapshot, client=client, topic='t', queue_size=2, snapshot_interval=0)
+    feed.flush()
+    for beacon_id in range(3):
+        feed.emit('location', beacon=beacon_id, hub=7, previous=None, ts=100)
+    assert feed.dropped == 1 and feed.seq == 3
+    feed.flush()
+    # die Lücke in seq wird durch einen neuen Snapshot geschlossen
+    assert feed.snapshots == 2
+    assert client.published[-2][1]['type'] == 'snapshot' and client.published[-2][1]['seq'] == 3
+
+
+def test_failed_snapshot_is_retried_later():
+    def broken():
+        raise RuntimeError("state not ready")
+
+    feed = EventFeed(broken, client=FakeClient(), topic='t')
+    feed.flush()
+    assert feed.snapshots == 0 and feed._next_snapshot > 0
+
+
+def test_failed_publish_is_counted():
+    feed = EventFeed(snapshot, client=FakeClient(rc=4), topic='t')
+    feed.emit('unpair', beacons=[1, 2], ts=100)
+    feed.flush()
+    assert feed.failed == 2
+
+
+def test_event_log_appends_one_line_per_message(tmp_path):
+    path = tmp_path / 'events.log'
+    for run in range(2):
+        feed = EventFeed(snapshot, log_path=str(path), source=f'w{run}', interval=60)
+        feed.start()
+        feed.emit('critical', beacons=[1, 2], action='created', hub=7, ts=100)
+        feed.stop()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(line['source'], line['type']) for line in lines] == [('w0', 'snapshot'), ('w0', 'delta'),
+                                                                  ('w1', 'snapshot'), ('w1', 'delta')]
+    assert lines[1]['events'][0]['action'] == 'created'
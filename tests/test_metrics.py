@@ -0,0 +1,71 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from Metrics import MetricsRegistry, MetricsServer, TimedClient
+
+
+def test_render_counters_histograms_and_gauges():
+    metrics = MetricsRegistry()
+    messages = metrics.counter('ats_test_messages_total', 'Messages', ('outcome',))
+    messages.labels('case1').inc()
+    messages.labels('case1').inc(2)
+    latency = metrics.histogram('ats_test_seconds', 'Latency', buckets=(0.1, 1.0))
+    latency.observe(0.5)
+    metrics.gauge('ats_test_depth', 'Depth', lambda: {'hub': 3}, 'queue')
+    text = metrics.render()
+    assert 'ats_test_messages_total{outcome="case1"} 3' in text
+    assert 'ats_test_seconds_bucket{le="0.1"} 0' in text
+    assert 'ats_test_seconds_bucket{le="1.0"} 1' in text
+    assert 'ats_test_seconds_count 1' in text
+    assert 'ats_test_depth{queue="hub"} 3' in text
+    assert '# TYPE ats_test_depth gauge' in text
+
+
+def test_same_name_with_other_labels_is_rejected():
+    metrics = MetricsRegistry()
+    metrics.counter('ats_test_total', 'Total', ('a',))
+    with pytest.raises(ValueError):
+        metrics.counter('ats_test_total', 'Total', ('b',))
+    with pytest.raises(ValueError):
+        metrics.counter('ats_test_total', 'Total', ('a',)).labels('x', 'y')
+
+
+def test_failing_gauge_is_skipped():
+    metrics = MetricsRegistry()
+    metrics.gauge('ats_test_broken', 'Broken', lambda: 1 / 0)
+    assert not [line for line in metrics.render().splitlines() if line.startswith('ats_test_broken')]
+
+
+def test_timed_client_measures_each_operation():
+    metrics = MetricsRegistry()
+    family = metrics.histogram('ats_test_memcache_seconds', 'memcache', ('operation',))
+
+    class Client:
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: name
+
+    client = TimedClient(Client(), family)
+    assert client.get('key') == 'get'
+    assert family.labels('get').counts[-1] + sum(family.labels('get').counts[:-1]) == 1
+    assert family.labels('set').sum == 0
+
+
+def test_server_serves_metrics_and_routes():
+    metrics = MetricsRegistry()
+    metrics.counter('ats_test_requests_total', 'Requests').inc()
+    server = MetricsServer(metrics, port=0, routes={'/echo': lambda parts: parts or None})
+    server.start()
+    try:
+        base = 'http://127.0.0.1:%d' % server._server.server_address[1]
+        with urllib.request.urlopen(base + '/metrics') as response:
+            assert b'ats_test_requests_total 1' in response.read()
+        with urllib.request.urlopen(base + '/echo/a/b') as response:
+            assert json.loads(response.read()) == ['a', 'b']
+        for path in ('/echo', '/unknown'):
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(base + path)
+    finally:
+        server.stop()
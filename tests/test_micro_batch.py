@@ -0,0 +1,42 @@
+import os
+
+from Bench_Fakes import FakeDatabase
+from Workload import Workload
+
+MAC_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'beacon_mac.txt')
+
+
+def workload():
+    return Workload(seed=3, beacons=200, hubs=6, rate=50, hub_change_ratio=0.1, noise_ratio=0.2, pairing_ratio=0.02,
+                    mac_file=MAC_FILE)
+
+
+# Verarbeitung aller Nachrichten, Rückgabe des Zustands nach dem Schreiben in memcache und Datenbank
+def run(load_service, batch_size):
+    database = FakeDatabase.from_workload(workload())
+    service = load_service(database, WARMUP_MODE='bulk')
+    service.load_initial_data()
+    messages = list(workload().messages(3000))
+    if batch_size > 1:
+        for start in range(0, len(messages), batch_size):
+            service.process_batch(messages[start:start + batch_size])
+    else:
+        for message in messages:
+            service.process_message(message)
+    service.state.flush()
+    service.db_writer.flush()
+    memcache = service.memcache.client
+    values = {key: memcache._decode(key, entry) for key, entry in memcache._values.items()}
+    return {'beacons': {mac: record.to_list() for mac, record in service.state.beacons.items()},
+            'hubs': {mac: record.to_list() for mac, record in service.state.hubs.items()},
+            'memcache': {key: value.to_list() if hasattr(value, 'to_list') else value for key, value in values.items()},
+            'deadlines': dict(service.expiry._deadlines),
+            'database': (database.hubs, database.beacons, sorted(map(tuple, database.beaconpairs)))}
+
+
+def test_micro_batches_give_the_same_state_as_single_messages(load_service):
+    sequential = run(load_service, 1)
+    batched = run(load_service, 64)
+    for name in sequential:
+        assert batched[name] == sequential[name], name
+    assert sequential['deadlines'] and len(sequential['database'][2]) > 0
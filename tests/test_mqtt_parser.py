@@ -0,0 +1,45 @@
+import json
+import pytest
+
+from MQTT_Parser import MessageFormatError, parse_data, parse_data_general, parse_message
+
+CANONICAL = 'layer=1, MAC_ROOM=00:00:00:00:00:01, MAC_SENSOR=AA:BB, BATT=80, BUTTON=0, RSSI=-60'
+
+
+def message(data, time=1700000000):
+    return json.dumps({'time': time, 'data': data}).encode()
+
+
+def test_canonical_message():
+    parsed = parse_message(message(CANONICAL))
+    assert (parsed.timestamp, parsed.layer, parsed.hub_MAC, parsed.beacon_MAC, parsed.batterie, parsed.taster,
+            parsed.rssi) == (1700000000, 1, '00:00:00:00:00:01', 'AA:BB', 80, 0, -60)
+
+
+def test_general_path_matches_the_canonical_path():
+    assert repr(parse_data_general(CANONICAL, 1)) == repr(parse_data(CANONICAL, 1))
+
+
+def test_other_order_missing_and_unknown_fields():
+    parsed = parse_data('RSSI=-70, extra=1, MAC_SENSOR=AA:BB', 5)
+    assert (parsed.rssi, parsed.beacon_MAC, parsed.hub_MAC, parsed.batterie) == (-70, 'AA:BB', None, 0)
+
+
+@pytest.mark.parametrize('data', [
+    'layer=1, MAC_ROOM, MAC_SENSOR=AA:BB',    # Feld ohne "="
+    'MAC_SENSOR=a=b, RSSI=-60',               # mehr als ein "="
+    'layer=1, , RSSI=-60',                    # leeres Feld
+    '=1, RSSI=-60',                           # Feld ohne Schlüssel
+    'RSSI=strong',                            # kein Zahlenwert
+])
+def test_malformed_data_is_rejected(data):
+    with pytest.raises(MessageFormatError):
+        parse_data(data, 1)
+
+
+@pytest.mark.parametrize('raw', [
+    b'garbage', b'[1, 2]', b'{"data": "RSSI=1"}', b'{"time": "soon", "data": "RSSI=1"}', b'{"time": 1, "data": 5}',
+])
+def test_malformed_envelope_is_rejected(raw):
+    with pytest.raises(MessageFormatError):
+        parse_message(raw)
@@ -0,0 +1,54 @@
+import threading
+
+from MQTT_Pipeline import MessagePipeline, RingBuffer, shard_for
+
+
+def payload(time, mac):
+    return b'{"time": %d, "data": "layer=1, MAC_ROOM=H1, MAC_SENSOR=%s, BATT=80, BUTTON=0, RSSI=-60"}' % (time, mac)
+
+
+def test_ring_buffer_wraps_and_drops_when_full():
+    buffer = RingBuffer(2)
+    assert buffer.put(1) and buffer.put(2)
+    assert not buffer.put(3, block=False)
+    assert buffer.get() == 1
+    assert buffer.put(4)
+    assert buffer.get_batch(10, 0) == [2, 4]
+    buffer.close()
+    assert buffer.get() is None
+
+
+def test_shard_depends_only_on_the_sensor_mac():
+    assert shard_for(payload(1, b'AA:01'), 8) == shard_for(payload(2, b'AA:01'), 8)
+    assert shard_for(b'no sensor', 8) == 0
+
+
+def test_messages_of_one_beacon_keep_their_order():
+    handled = []
+    lock = threading.Lock()
+
+    def handler(message):
+        with lock:
+            handled.append(message)
+
+    pipeline = MessagePipeline(handler, worker_count=4, queue_size=64)
+    pipeline.start()
+    messages = [payload(time, b'AA:%02d' % (time % 5)) for time in range(500)]
+    for message in messages:
+        assert pipeline.submit(message)
+    pipeline.stop()
+    assert sorted(handled) == sorted(messages)
+    for beacon in range(5):
+        mac = b'MAC_SENSOR=AA:%02d' % beacon
+        assert [message for message in handled if mac in message] == [message for message in messages if mac in message]
+
+
+def test_micro_batches_are_passed_as_lists():
+    batches = []
+    pipeline = MessagePipeline(batches.append, worker_count=1, queue_size=100, batch_size=10, batch_delay=0.01)
+    for time in range(25):
+        pipeline.submit(payload(time, b'AA:01'))
+    pipeline.start()
+    pipeline.stop()
+    assert all(isinstance(batch, list) and len(batch) <= 10 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 25
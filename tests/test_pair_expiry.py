@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from Pair_Expiry import ExpiryEngine, deadline
+
+
+def engine(resolve=None):
+    resolved = []
+
+    def record(pairs):
+        resolved.extend(pairs)
+        return resolve(pairs) if resolve else {}
+
+    return ExpiryEngine(record, timegap=30), resolved
+
+
+def test_deadline_is_the_first_second_past_the_timegap():
+    assert deadline(1000, 30) == 1031
+
+
+def test_due_pairs_are_resolved_at_their_deadline():
+    expiry, resolved = engine()
+    expiry.schedule(2, 1, 1000)
+    expiry.schedule(3, 4, 1010)
+    assert expiry.run_due(now=1030) == 0
+    assert expiry.run_due(now=1031) == 1
+    assert resolved == [(1, 2)]
+    assert expiry.critical() == [(3, 4)]
+
+
+def test_earlier_deadline_of_a_pair_is_kept():
+    expiry, resolved = engine()
+    expiry.schedule(1, 2, 1000)
+    expiry.schedule(2, 1, 1020)
+    assert expiry._deadlines == {(1, 2): 1031}
+    expiry.schedule_deadline(1, 2, 1010)
+    assert expiry._deadlines == {(1, 2): 1010}
+
+
+def test_cancel_drops_the_deadline():
+    expiry, resolved = engine()
+    expiry.schedule(1, 2, 1000)
+    expiry.cancel('2', '1')
+    assert expiry.pending() == 0
+    assert expiry.run_due(now=2000) == 0
+    assert resolved == []
+
+
+def test_pairs_still_critical_are_rescheduled():
+    expiry, resolved = engine(lambda pairs: {pair: 1100 for pair in pairs})
+    expiry.schedule(1, 2, 1000)
+    assert expiry.run_due(now=1031) == 1
+    assert expiry._deadlines == {(1, 2): 1100}
+    assert expiry.run_due(now=1099) == 0
+
+
+def test_failed_resolve_is_retried():
+    def fail(pairs):
+        raise ConnectionError("memcache down")
+
+    expiry, resolved = engine(fail)
+    expiry.schedule(1, 2, 1000)
+    expiry.run_due(now=1031)
+    assert expiry.critical() == [(1, 2)]
+
+
+def test_expired_marker_dissolves_the_pair(load_service):
+    service = load_service()
+    validity = service.validity_check
+    service.registry.add_many([(1, 2)])
+    old = int(time.time()) - 100
+    service.memcache.set('beacon_mapping_krit_2_1', [old, 5])
+    assert validity.resolve_pairs([(1, 2)]) == {}
+    assert service.memcache.get('beacon_mapping_krit_2_1') is None
+    assert not service.registry.contains(1, 2)
+
+
+# Der Microservice schreibt den Eintrag neu, während der Check ihn prüft: das Paar bleibt und wird erneut geprüft
+def test_marker_changed_during_resolve_keeps_the_pair(load_service, monkeypatch):
+    service = load_service()
+    validity = service.validity_check
+    service.registry.add_many([(1, 2)])
+    now = int(time.time())
+    service.memcache.set('beacon_mapping_krit_2_1', [now - 100, 5])
+    gets = service.memcache.gets
+
+    def gets_after_change(key, *args, **kwargs):
+        service.memcache.client.set(key, [now, 6])
+        return gets(key, *args, **kwargs)
+
+    monkeypatch.setattr(service.memcache, 'gets', gets_after_change)
+    pending = validity.resolve_pairs([(1, 2)])
+    assert pending == {(1, 2): pytest.approx(now + validity.RECHECK_DELAY, abs=1)}
+    assert service.registry.contains(1, 2)
+    assert service.memcache.get('beacon_mapping_krit_2_1') == [now, 6]
+
+
+def test_standalone_check_only_points_to_the_microservice(load_service, monkeypatch):
+    service = load_service()
+    validity_check = service.validity_check
+    monkeypatch.setattr(validity_check.Service_Log, 'setup', lambda *args: None)
+    monkeypatch.setattr(validity_check.Service_Log, 'stop', lambda: None)
+    # Ein zweiter Durchlauf der Ablaufsteuerung neben dem Microservice darf nicht mehr starten
+    monkeypatch.setattr(validity_check.expiry, 'run', lambda: pytest.fail("expiry must not run standalone"))
+    assert validity_check.main() == 1
@@ -0,0 +1,114 @@
+import Cache_Serializer
+import Pair_Registry
+from Bench_Fakes import FakeMemcache
+from Pair_Registry import LEGACY_KEY, PairRegistry, canonical
+
+
+def registry(shard_count=4):
+    return PairRegistry(FakeMemcache(Cache_Serializer.json_serializer, Cache_Serializer.deserializer), shard_count)
+
+
+def test_canonical_orders_and_coerces_ids():
+    assert canonical('9', 3) == (3, 9)
+    assert canonical(3, 9) == canonical(9, 3)
+
+
+def test_add_many_skips_duplicates_and_self_pairs():
+    pairs = registry()
+    assert pairs.add_many([(2, 1), (1, 2), (3, 3), (4, 1)]) == 2
+    assert pairs.add(1, 2) is False
+    assert pairs.pairs() == {(1, 2), (1, 4)}
+    assert sorted(pairs.partners(1)) == [2, 4]
+    assert pairs.partners(2) == [1]
+    assert pairs.contains(4, 1)
+
+
+def test_remove_updates_shard_and_both_neighbourhoods():
+    pairs = registry()
+    pairs.add_many([(1, 2), (1, 3)])
+    assert pairs.remove(2, 1)
+    assert not pairs.remove(2, 1)
+    assert pairs.pairs() == {(1, 3)}
+    assert pairs.partners(1) == [3]
+    assert pairs.partners(2) == []
+
+
+def test_concurrent_writer_is_not_overwritten():
+    pairs = registry(shard_count=1)
+    other = PairRegistry(pairs.memcache, 1)
+    gets = pairs.memcache.gets
+    interfered = []
+
+    # Zwischen gets und cas trägt ein anderer Prozess ein Paar ein, der erste cas schlägt fehl
+    def gets_with_interference(key, *args, **kwargs):
+        result = gets(key, *args, **kwargs)
+        if key == 'beaconpairs_shard_0' and not interfered:
+            interfered.append(key)
+            other.add(5, 6)
+        return result
+
+    pairs.memcache.gets = gets_with_interference
+    pairs.add(1, 2)
+    assert pairs.pairs() == {(1, 2), (5, 6)}
+
+
+def test_legacy_list_is_migrated_once():
+    pairs = registry()
+    pairs.memcache.set(LEGACY_KEY, ['1,2', '3,1'])
+    assert pairs.migrate_legacy() == 2
+    assert pairs.memcache.get(LEGACY_KEY) is None
+    assert pairs.pairs() == {(1, 2), (1, 3)}
+    assert pairs.migrate_legacy() == 0
+
+
+def test_membership_is_one_key_per_pair():
+    pairs = registry()
+    pairs.add(2, 1)
+    assert pairs.memcache.get('beaconpair_1_2') == 0
+    assert pairs.contains(1, 2) and pairs.contains('2', '1')
+    assert not pairs.contains(1, 3)
+    pairs.remove(1, 2)
+    assert not pairs.contains(1, 2)
+
+
+def test_full_bucket_starts_a_new_one(monkeypatch):
+    monkeypatch.setattr(Pair_Registry, 'BUCKET_PAIRS', 2)
+    pairs = registry(shard_count=1)
+    assert pairs.add_many([(1, 2), (1, 3), (1, 4)]) == 3
+    pairs.add(1, 5)
+    assert pairs.memcache.get('beaconpairs_shard_0_tail') == 1
+    assert len(pairs.memcache.get('beaconpairs_shard_0')) == 4
+    assert len(pairs.memcache.get('beaconpairs_shard_0_1')) == 4
+    assert pairs.pairs() == {(1, 2), (1, 3), (1, 4), (1, 5)}
+    assert pairs.memcache.get('beaconpair_1_5') == 1
+
+
+# Hinzufügen und Entfernen schreiben nur den Block des Paares, nicht den ganzen Shard
+def test_changes_touch_one_bucket(monkeypatch):
+    monkeypatch.setattr(Pair_Registry, 'BUCKET_PAIRS', 2)
+    pairs = registry(shard_count=1)
+    pairs.add_many([(1, 2), (1, 3), (1, 4), (1, 5), (1, 6)])
+    written = []
+    cas = pairs.memcache.cas
+
+    def recording_cas(key, *args, **kwargs):
+        written.append(key)
+        return cas(key, *args, **kwargs)
+
+    pairs.memcache.cas = recording_cas
+    assert pairs.remove(1, 3)
+    assert [key for key in written if key.startswith('beaconpairs_shard')] == ['beaconpairs_shard_0']
+    assert pairs.pairs() == {(1, 2), (1, 4), (1, 5), (1, 6)}
+    assert not pairs.remove(1, 3)
+
+
+def test_pairs_from_older_shards_get_their_member_keys():
+    pairs = registry(shard_count=1)
+    pairs.memcache.set('beaconpairs_shard_0', [1, 2, 3, 4])
+    assert not pairs.contains(1, 2)
+    assert pairs.migrate_legacy() == 0
+    assert pairs.contains(1, 2) and pairs.contains(3, 4)
+    # auch ohne Übernahme findet remove das Paar im Shard
+    pairs.memcache.delete('beaconpair_3_4')
+    assert pairs.remove(3, 4)
+    assert pairs.pairs() == {(1, 2)}
@@ -0,0 +1,85 @@
+import threading
+
+
+def test_pair_reunited_on_the_new_hub_clears_the_marker(load_service):
+    service = load_service()
+    service.registry.add_many([(1, 2)])
+    service.beacon_pairing_hubwechsel(1, 5, 1000)
+    assert service.memcache.get('beacon_mapping_krit_2_1') == [1000, 5]
+    assert service.expiry.critical() == [(1, 2)]
+    service.beacon_pairing_hubwechsel(2, 5, 1001)
+    assert service.memcache.get('beacon_mapping_krit_2_1') is None
+    assert service.memcache.get('beacon_mapping_krit_1_2') is None
+    assert service.expiry.critical() == []
+
+
+def test_marker_keeps_the_older_deadline(load_service):
+    service = load_service()
+    service.registry.add_many([(1, 2)])
+    service.beacon_pairing_hubwechsel(1, 5, 1000)
+    deadline = service.expiry._deadlines[(1, 2)]
+    service.beacon_pairing_hubwechsel(2, 6, 1010)
+    assert service.memcache.get('beacon_mapping_krit_1_2') == [1010, 6]
+    assert service.expiry._deadlines[(1, 2)] == deadline
+
+
+def simultaneous_change(service, beacon_ids, hub_id):
+    barrier = threading.Barrier(len(beacon_ids))
+
+    def change(beacon_id):
+        barrier.wait()
+        service.beacon_pairing_hubwechsel(beacon_id, hub_id, 1000)
+
+    threads = [threading.Thread(target=change, args=(beacon_id,)) for beacon_id in beacon_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+# Beide Beacons eines Paares wechseln gleichzeitig in denselben Raum (zwei Worker). Das erneute Lesen nach dem
+# Schreiben sorgt dafür, dass mindestens einer den Eintrag des anderen sieht und das Paar als wieder zusammen erkennt.
+def test_simultaneous_change_of_both_beacons(load_service):
+    service = load_service(delay=0.002)
+    service.parallel = True
+    service.registry.add_many([(1, 2)])
+    cleared = service.critical_ergebnis['cleared'].value
+    simultaneous_change(service, (1, 2), 5)
+    assert service.memcache.get('beacon_mapping_krit_2_1') is None
+    assert service.memcache.get('beacon_mapping_krit_1_2') is None
+    assert service.critical_ergebnis['cleared'].value == cleared + 1
+    assert service.expiry.critical() == []
+
+
+def test_simultaneous_change_to_different_rooms_stays_critical(load_service):
+    service = load_service(delay=0.002)
+    service.parallel = True
+    service.registry.add_many([(1, 2)])
+    barrier = threading.Barrier(2)
+
+    def change(beacon_id, hub_id):
+        barrier.wait()
+        service.beacon_pairing_hubwechsel(beacon_id, hub_id, 1000)
+
+    threads = [threading.Thread(target=change, args=(1, 5)), threading.Thread(target=change, args=(2, 6))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.memcache.get_many(['beacon_mapping_krit_2_1', 'beacon_mapping_krit_1_2'])
+    assert service.expiry.critical() == [(1, 2)]
+
+
+# Mit einem Worker wird nicht nachgeprüft und nichts gesperrt
+def test_single_worker_writes_without_rechecking(load_service, monkeypatch):
+    service = load_service()
+    assert not service.parallel
+    service.registry.add_many([(1, 2), (1, 3)])
+    rechecked = []
+    monkeypatch.setattr(service, 'paare_nachpruefen', lambda *args: rechecked.append(args))
+    added = []
+    add = service.memcache.add
+    monkeypatch.setattr(service.memcache, 'add', lambda key, *args, **kwargs: added.append(key) or add(key, *args, **kwargs))
+    service.beacon_pairing_hubwechsel(1, 5, 1000)
+    assert rechecked == [] and added == []
+    assert service.expiry.critical() == [(1, 2), (1, 3)]
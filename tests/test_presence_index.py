@@ -0,0 +1,80 @@
+import json
+
+from Presence_Index import PresenceIndex
+
+
+def test_hub_change_moves_the_beacon():
+    presence = PresenceIndex(timeout=300)
+    presence.seen(1, 7, 100)
+    presence.seen(2, 7, 110)
+    presence.seen(1, 8, 120)
+    assert presence.hub(7) == {2: 110}
+    assert presence.hub(8) == {1: 120}
+    assert presence.beacon(1) == (8, 120, 120)
+    presence.seen(1, 8, 130)
+    assert presence.beacon(1) == (8, 120, 130)
+    assert presence.occupancy() == {7: 1, 8: 1}
+
+
+def test_silent_beacons_expire_with_message_time():
+    presence = PresenceIndex(timeout=300)
+    presence.seen(1, 7, 100)
+    presence.seen(2, 7, 100)
+    presence.seen(2, 7, 350)
+    # Frist von Beacon 1 abgelaufen, Beacon 2 hat sich inzwischen gemeldet
+    presence.seen(3, 8, 400)
+    assert presence.beacon(1) is None
+    assert presence.hub(7) == {2: 350}
+    assert presence.expired == 1
+    presence.seen(3, 8, 700)
+    assert 7 not in presence.occupancy() and len(presence) == 1
+
+
+def test_pairing_matches_a_waiting_request_in_the_same_hub():
+    presence = PresenceIndex()
+    presence.seen(1, 7, 100)
+    presence.seen(2, 7, 100)
+    assert presence.pairing(7, 'A', ('B',), 1, 100, 10) is None
+    # eigene Anfrage ist kein Partner
+    assert presence.pairing(7, 'A', ('A',), 1, 101, 10) is None
+    assert presence.pairing(7, 'B', ('A',), 2, 105, 10) == 1
+    assert presence.requests[7] == {}
+
+
+def test_pairing_ignores_old_requests_and_beacons_that_left():
+    presence = PresenceIndex()
+    presence.seen(1, 7, 100)
+    presence.seen(2, 7, 100)
+    presence.seen(3, 7, 100)
+    presence.pairing(7, 'A', ('B',), 1, 100, 10)
+    assert presence.pairing(7, 'B', ('A',), 2, 200, 10) is None
+    presence.seen(2, 8, 201)
+    assert presence.pairing(7, 'A', ('B',), 3, 202, 10) is None
+    assert presence.requests[7] == {'A': (3, 202)}
+
+
+def test_export_and_restore_round_trip():
+    presence = PresenceIndex(timeout=300)
+    presence.seen(1, 7, 100)
+    presence.seen(2, 8, 150)
+    presence.pairing(8, 'A', ('B',), 2, 150, 10)
+    data = json.loads(json.dumps(presence.export()))
+    restored = PresenceIndex(timeout=300)
+    restored.restore(data)
+    assert restored.occupancy() == {7: 1, 8: 1}
+    assert restored.beacon(2) == (8, 150, 150)
+    assert restored.pairing(8, 'B', ('A',), 3, 155, 10) == 2
+    # die Fristen werden mit übernommen
+    restored.seen(3, 8, 420)
+    assert restored.beacon(1) is None and restored.beacon(2) is not None
+
+
+def test_query():
+    presence = PresenceIndex()
+    presence.seen(1, 7, 100)
+    assert presence.query([]) == {'7': 1}
+    assert presence.query(['hub', '7']) == {'hub': 7, 'beacons': {'1': 100}}
+    assert presence.query(['beacon', '1']) == {'beacon': 1, 'hub': 7, 'since': 100, 'last_seen': 100}
+    assert presence.query(['beacon', '2']) is None
+    assert presence.query(['hub', 'x']) is None
+    assert presence.query(['room', '7']) is None
@@ -0,0 +1,84 @@
+import pytest
+
+from Beacon_State import BeaconRecord
+from Room_Assignment import RSSI_MAX, RSSI_MIN, RoomAssignment, RssiWindow
+
+
+def current(hub_id=1, rssi=200, timestamp=1000):
+    return BeaconRecord(7, hub_id, rssi, timestamp, timestamp, 80, 1, timestamp)
+
+
+def test_window_mean_median_and_wrap():
+    window = RssiWindow(3)
+    for rssi in (10, 40, 20, 30):
+        window.add(rssi, 1)
+    assert sorted(window.values()) == [20, 30, 40]
+    assert window.median() == 30 and window.mean() == 30
+
+
+def test_out_of_range_rssi_is_clamped():
+    window = RssiWindow(2)
+    window.add(10 ** 6, 1)
+    window.add(-10 ** 6, 2)
+    assert list(window.values()) == [RSSI_MAX, RSSI_MIN]
+
+
+def test_single_strong_reading_does_not_change_the_hub():
+    rooms = RoomAssignment(hysteresis=10, min_samples=3)
+    for timestamp in range(1000, 1005):
+        rooms.observe(7, 1, 200, timestamp)
+    rooms.observe(7, 2, 230, 1005)
+    assert not rooms.decide(current(), 2, 230, 1005)
+    assert (rooms.changes, rooms.avoided) == (0, 1)
+
+
+def test_hysteresis_needs_a_lasting_lead():
+    rooms = RoomAssignment(hysteresis=10, min_samples=3)
+    for timestamp in range(1000, 1003):
+        rooms.observe(7, 1, 200, timestamp)
+        rooms.observe(7, 2, 205, timestamp)
+    assert not rooms.decide(current(), 2, 205, 1002)
+    for timestamp in range(1003, 1006):
+        rooms.observe(7, 1, 200, timestamp)
+        rooms.observe(7, 2, 220, timestamp)
+    assert rooms.decide(current(), 2, 220, 1005)
+    assert (rooms.changes, rooms.timegap_changes) == (1, 0)
+
+
+def test_timegap_changes_like_before():
+    rooms = RoomAssignment(room_timegap=300)
+    assert rooms.decide(current(rssi=250), 2, 120, 1301)
+    assert (rooms.changes, rooms.timegap_changes) == (1, 1)
+
+
+def test_stale_windows_are_dropped():
+    rooms = RoomAssignment(sample_timeout=30)
+    rooms.observe(7, 1, 200, 1000)
+    rooms.observe(7, 2, 200, 1031)
+    assert list(rooms.windows[7]) == [2]
+
+
+def test_legacy_mode_compares_single_values():
+    rooms = RoomAssignment(mode='legacy')
+    rooms.observe(7, 2, 201, 1000)
+    assert rooms.windows == {}
+    assert rooms.decide(current(rssi=200), 2, 201, 1001)
+
+
+def test_export_and_restore():
+    rooms = RoomAssignment(window=4)
+    for timestamp, rssi in enumerate((200, 210, 220, 230, 240), 1000):
+        rooms.observe(7, 1, rssi, timestamp)
+    restored = RoomAssignment(window=4)
+    restored.restore(rooms.export())
+    assert restored.export() == rooms.export()
+    other_size = RoomAssignment(window=8)
+    other_size.restore(rooms.export())
+    assert other_size.windows == {}
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        RoomAssignment(mode='nearest')
+    with pytest.raises(ValueError):
+        RoomAssignment(smoothing='max')
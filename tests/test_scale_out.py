@@ -0,0 +1,84 @@
+import os
+import queue
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from MQTT_Pipeline import shard_for
+
+
+@pytest.fixture
+def scale_out(monkeypatch):
+    for module in ('paho.mqtt.client', 'dotenv'):
+        pytest.importorskip(module)
+    monkeypatch.setenv('MQTT_PORT', os.getenv('MQTT_PORT', '1883'))
+    monkeypatch.setenv('MQTT_TOPIC', 'ats')
+    sys.modules.pop('Scale_Out', None)
+    import Scale_Out
+    yield Scale_Out
+    sys.modules.pop('Scale_Out', None)
+
+
+def message(mac, topic='ats'):
+    return SimpleNamespace(topic=topic, payload=b'{"time": 1, "data": "MAC_SENSOR=%s, RSSI=-60"}' % mac)
+
+
+def test_supervisor_routes_by_sensor_mac(scale_out):
+    supervisor = scale_out.Supervisor('supervisor', 3, 30)
+    supervisor.inboxes = [queue.Queue() for _ in range(3)]
+    for mac in (b'AA:01', b'AA:02', b'AA:01', b'AA:03'):
+        supervisor.on_message(None, None, message(mac))
+    for index, inbox in enumerate(supervisor.inboxes):
+        while not inbox.empty():
+            assert shard_for(inbox.get(), 3) == index
+    with pytest.raises(ValueError):
+        scale_out.Supervisor('threads', 3, 30)
+
+
+# Im Modus shared bearbeitet ein Worker nur eigene Beacons und leitet fremde an den zuständigen Worker weiter
+def test_shared_worker_forwards_foreign_beacons(scale_out):
+    handled = []
+    published = []
+    service = SimpleNamespace(nachricht_annehmen=handled.append, mqtt_subscriptions=None)
+    service.mqtt_loop = lambda on_message: setattr(service, 'on_message', on_message)
+    scale_out.run_shared_worker(service, 1, 4)
+    assert service.mqtt_subscriptions == ['$share/ats/ats', 'ats/owner/1']
+    client = SimpleNamespace(publish=lambda topic, payload: published.append((topic, payload)))
+    own = next(mac for mac in (b'AA:%02d' % i for i in range(100)) if shard_for(message(mac).payload, 4) == 1)
+    foreign = next(mac for mac in (b'AA:%02d' % i for i in range(100)) if shard_for(message(mac).payload, 4) == 2)
+    service.on_message(client, None, message(own))
+    service.on_message(client, None, message(foreign))
+    # Weitergeleitete Nachrichten werden ohne erneute Prüfung angenommen
+    service.on_message(client, None, message(foreign, 'ats/owner/1'))
+    assert handled == [message(own).payload, message(foreign).payload]
+    assert published == [('ats/owner/2', message(foreign).payload)]
+
+
+# Bei einem MQTT_TOPIC mit Wildcard fiele das abgeleitete Owner-Topic unter die Shared Subscription
+@pytest.mark.parametrize('topic', ['ats/#', 'ats/+/rooms'])
+def test_shared_mode_rejects_owner_topic_under_a_wildcard(scale_out, monkeypatch, topic):
+    monkeypatch.setattr(scale_out, 'mqtt_topic', topic)
+    monkeypatch.setattr(scale_out, 'scale_owner_topic', f"{topic}/owner")
+    with pytest.raises(ValueError):
+        scale_out.Supervisor('shared', 2, 30)
+    monkeypatch.setattr(scale_out, 'scale_owner_topic', 'ats/owner')
+    if topic == 'ats/#':
+        with pytest.raises(ValueError):
+            scale_out.Supervisor('shared', 2, 30)
+    monkeypatch.setattr(scale_out, 'scale_owner_topic', 'ats_owner/')
+    scale_out.Supervisor('shared', 2, 30)
+    assert scale_out.owner_topic(1) == 'ats_owner/1'
+    # Im Modus supervisor gibt es keine Weiterleitung
+    monkeypatch.setattr(scale_out, 'scale_owner_topic', f"{topic}/owner")
+    scale_out.Supervisor('supervisor', 2, 30)
+
+
+def test_shared_mode_warns_about_ordered_room_assignment(scale_out, monkeypatch, caplog):
+    with caplog.at_level('WARNING', logger='Scale_Out'):
+        scale_out.Supervisor('shared', 2, 30)
+        assert 'ROOM_ASSIGNMENT = smoothed' in caplog.text
+        caplog.clear()
+        monkeypatch.setattr(scale_out, 'room_assignment_mode', 'legacy')
+        scale_out.Supervisor('shared', 2, 30)
+        assert caplog.text == ''
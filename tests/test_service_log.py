@@ -0,0 +1,89 @@
+import io
+import json
+import logging
+
+import pytest
+
+import Service_Log
+from Service_Log import AsyncHandler, JsonFormatter, SamplingFilter, TextFormatter
+
+
+def logger(handler, name='ats.test'):
+    log = logging.getLogger(name)
+    log.handlers = [handler]
+    log.propagate = False
+    log.setLevel(logging.DEBUG)
+    return log
+
+
+def test_records_are_written_in_the_background_thread():
+    stream = io.StringIO()
+    handler = AsyncHandler(stream, TextFormatter())
+    log = logger(handler)
+    log.info("Beacon %s", 7)
+    assert stream.getvalue() == ''
+    handler.write_pending()
+    assert stream.getvalue().endswith('INFO ats.test: Beacon 7\n')
+
+
+def test_full_queue_drops_and_counts():
+    handler = AsyncHandler(io.StringIO(), TextFormatter(), queue_size=2)
+    log = logger(handler)
+    for index in range(5):
+        log.info("message %s", index)
+    assert (len(handler.records), handler.dropped) == (2, 3)
+
+
+def test_json_lines_with_extra_fields_and_exception():
+    stream = io.StringIO()
+    handler = AsyncHandler(stream, JsonFormatter())
+    log = logger(handler)
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.exception("Failed for %s", 'AA:01', extra={'beacon': 7})
+    handler.write_pending()
+    entry = json.loads(stream.getvalue())
+    assert (entry['level'], entry['message'], entry['beacon']) == ('ERROR', 'Failed for AA:01', 7)
+    assert 'ZeroDivisionError' in entry['exception']
+
+
+def test_sampling_keeps_warnings():
+    sample = SamplingFilter(3)
+    records = [logging.LogRecord('ats', level, '', 0, 'text', (), None)
+               for level in [logging.INFO] * 6 + [logging.WARNING] * 2]
+    assert [sample.filter(record) for record in records] == [True, False, False, True, False, False, True, True]
+
+
+@pytest.fixture
+def fresh_setup(monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', list(root.handlers))
+    monkeypatch.setattr(Service_Log, 'handler', None)
+    for flag in ('logThreads', 'logProcesses', 'logMultiprocessing'):
+        monkeypatch.setattr(logging, flag, getattr(logging, flag))
+    monkeypatch.setattr(logging, 'logAsyncioTasks', getattr(logging, 'logAsyncioTasks', True), raising=False)
+    levels = {name: logging.getLogger(name).level for name in ('', 'ats', 'ats.detail')}
+    factory = logging.getLogRecordFactory()
+    yield
+    Service_Log.handler.stop()
+    assert logging.getLogRecordFactory() is factory
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def test_setup_uses_public_logging_switches(fresh_setup):
+    Service_Log.setup(None, 'text', debug_level=2)
+    assert not logging.logProcesses and not logging.logMultiprocessing and not logging.logThreads
+    assert logging.getLogger('ats').level == logging.DEBUG
+    assert logging.getLogger('ats.detail').level == logging.INFO
+    handler = Service_Log.handler
+    Service_Log.setup('DEBUG', 'json')
+    assert Service_Log.handler is handler
+
+
+def test_unknown_format_is_rejected(fresh_setup):
+    with pytest.raises(ValueError):
+        Service_Log.setup(None, 'xml')
+    Service_Log.setup('WARNING', 'json')
+    assert logging.logThreads
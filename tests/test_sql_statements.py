@@ -0,0 +1,53 @@
+import pytest
+
+import SQL_Statements
+from Bench_Fakes import FakeConnection, FakeDatabase
+from DB_Pool import PooledConnection
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    database.hubs['HH:01'] = [1, 1000]
+    database.beacons['AA:01'] = [7, 'AA:01', 1, -60, 1000, 900, 80, 3]
+    database.beacon_macs[7] = 'AA:01'
+    return database
+
+
+def test_parameters_are_bound_with_their_types():
+    statement = SQL_Statements.statements['beacon_update']
+    assert statement.bind(('1', -60, 1000.0, 900, None, 7)) == (1, -60, 1000, 900, None, 7)
+    with pytest.raises(ValueError):
+        statement.bind((1, 2))
+    with pytest.raises(ValueError):
+        SQL_Statements.statements['hub_update'].bind(('soon', 1))
+
+
+def test_prepared_cursor_is_reused_per_connection(database):
+    connection = PooledConnection(FakeConnection(database))
+    first = SQL_Statements.execute(connection, 'hub_update', (2000, 1))
+    second = SQL_Statements.execute(connection, 'hub_update', (3000, 1))
+    assert first is second
+    assert len(connection.prepared_cursors) == 1
+    assert database.hubs['HH:01'] == [1, 3000]
+
+
+def test_fetchone_and_executemany(database):
+    connection = PooledConnection(FakeConnection(database))
+    assert SQL_Statements.fetchone(connection, 'hub_select', ('HH:01',)) == (1, 1000)
+    assert SQL_Statements.fetchone(connection, 'hub_select', ('HH:02',)) is None
+    SQL_Statements.executemany(connection, 'beaconpair_insert', [(7, 8, 1000, 1), (7, 9, 1000, 1)])
+    assert [row[:2] for row in database.beaconpairs] == [[7, 8], [7, 9]]
+
+
+def test_fetch_many_in_chunks_and_timed(database, monkeypatch):
+    monkeypatch.setattr(SQL_Statements, 'MANY_CHUNK_SIZE', 2)
+    for index in range(2, 6):
+        database.hubs['HH:%02d' % index] = [index, 1000]
+    seconds = SQL_Statements.many_statements['hub_select_many'].seconds
+    total = seconds.sum
+    connection = PooledConnection(FakeConnection(database))
+    result = SQL_Statements.fetch_many(connection, 'hub_select_many', ['HH:01', 'HH:03', 'HH:05', 'HH:09'])
+    assert result == {'HH:01': (1, 1000), 'HH:03': (3, 1000), 'HH:05': (5, 1000)}
+    # Gemessen wird die Dauer des Aufrufs, nicht ab dem Beginn des letzten Blocks
+    assert 0 <= seconds.sum - total < 1
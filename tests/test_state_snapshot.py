@@ -0,0 +1,172 @@
+import contextlib
+
+import State_Snapshot
+from Beacon_Monitor import BeaconMonitor
+from Beacon_State import BeaconRecord, HubRecord, StateStore
+from Beacon_Table import BeaconTable
+from Bench_Fakes import FakeMemcache
+from Pair_Expiry import ExpiryEngine
+from Pair_Registry import PairRegistry
+from Presence_Index import PresenceIndex
+from Room_Assignment import RoomAssignment
+
+
+# Datenbank für den Abgleich: jede Abfrage liefert die Zeilen aus rows (nach Tabelle) und wird protokolliert
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.database.queries.append((sql, params))
+        table = sql.split(' FROM ')[1].split()[0]
+        self.rows = list(self.database.rows.get(table, []))
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.queries = []
+
+    def cursor(self, dictionary=False, buffered=None):
+        return FakeCursor(self)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+
+class Service:
+    def __init__(self, memcache, beacons=None):
+        self.memcache = memcache
+        self.state = StateStore(memcache, beacons=beacons)
+        self.registry = PairRegistry(memcache, shard_count=4)
+        self.expiry = ExpiryEngine(lambda pairs: {}, timegap=30)
+        self.presence = PresenceIndex(timeout=300)
+        self.rooms = RoomAssignment()
+        self.alerts = []
+        self.monitor = BeaconMonitor(self.alerts.extend)
+
+    def save(self, path):
+        State_Snapshot.save(path, self.memcache, self.state, self.registry, self.expiry, self.presence, self.rooms,
+                            self.monitor)
+
+    def restore(self, path, pool, shared=True):
+        return State_Snapshot.restore(path, pool, self.memcache, self.state, self.registry, self.presence, self.rooms,
+                                      self.monitor, shared=shared)
+
+
+def beacon(beacon_id, timestamp=1000):
+    return BeaconRecord(beacon_id, 7, -60, timestamp, timestamp, 80, 1, timestamp)
+
+
+def running_service(memcache):
+    service = Service(memcache)
+    State_Snapshot.mark_epoch(memcache)
+    service.state.put_beacon('AA', beacon(1))
+    service.state.put_beacon('BB', beacon(2, timestamp=1100))
+    service.state.put_hub('HH', HubRecord(7, 1100, 1000))
+    service.state.flush()
+    service.registry.add(1, 2)
+    service.expiry.schedule(1, 2, 1100)
+    memcache.set('beacon_mapping_krit_1_2', [7, 1100])
+    service.presence.seen(1, 7, 1000)
+    service.rooms.observe(1, 7, -60, 1000)
+    service.monitor.seen(1, 15, 1000)
+    service.monitor.run_once()
+    return service
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    memcache = FakeMemcache()
+    service = running_service(memcache)
+    service.save(path)
+    meta, table = State_Snapshot.load(path)
+    assert meta['epoch'] == memcache.get(State_Snapshot.EPOCH_KEY)
+    assert meta['hubs'] == [['HH', 7, 1100, 1000]]
+    assert meta['pairs'] == [[1, 2]]
+    assert meta['critical'] == [['beacon_mapping_krit_1_2', [7, 1100]]]
+    assert sorted((mac, record.to_list()) for mac, record in table.items()) == \
+        [('AA', beacon(1).to_list()), ('BB', beacon(2, timestamp=1100).to_list())]
+    assert not (tmp_path / 'state.snap.tmp').exists()
+
+
+def test_restore_with_running_memcache_only_reconciles(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    memcache = FakeMemcache()
+    running_service(memcache).save(path)
+    taken = State_Snapshot.load(path)[0]['taken']
+    pool = FakePool({'beacon_left_join_mp': []})
+    service = Service(memcache)
+    report = service.restore(path, pool)
+    assert [name for name, _, _ in report.phases] == ['snapshot', 'beacon_left_join_mp', 'hub', 'beaconpair',
+                                                      'mp_mapping']
+    assert service.state.get_beacon('BB').timestamp == 1100
+    assert service.state.get_hub('HH').hub_id == 7 and service.state.pending() == 0
+    assert service.presence.beacon(1) == (7, 1000, 1000)
+    assert service.monitor.low_battery() == [1] and service.alerts == []
+    since = taken - State_Snapshot.RECONCILE_MARGIN
+    assert pool.queries[:3] == [(pool.queries[0][0], (since, 2)), (pool.queries[1][0], (since, 7)),
+                                (pool.queries[2][0], (since,))]
+
+
+def test_reconcile_keeps_newer_records_and_adds_new_ones(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    memcache = FakeMemcache()
+    running_service(memcache).save(path)
+    row = {'beacon_id': 1, 'beacon_MAC': 'AA', 'beacon_hub_id': 8, 'beacon_RSSI': -50, 'beacon_timestamp': 900,
+           'beacon_hub_ts_beginn': 900, 'beacon_batterie': 70, 'mp_mp_typ_id': 1}
+    newer = dict(row, beacon_id=3, beacon_MAC='CC', beacon_timestamp=2000, beacon_hub_ts_beginn=2000)
+    service = Service(memcache)
+    service.restore(path, FakePool({'beacon_left_join_mp': [row, newer],
+                                    'hub': [{'hub_id': 9, 'hub_MAC': 'H2', 'hub_timestamp': 2000}]}))
+    assert service.state.get_beacon('AA').hub_id == 7
+    assert service.state.get_beacon('CC').beacon_id == 3
+    assert service.state.get_hub('H2').hub_id == 9
+
+
+def test_restarted_memcache_is_filled_from_the_snapshot(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    running_service(FakeMemcache()).save(path)
+    memcache = FakeMemcache()
+    service = Service(memcache)
+    report = service.restore(path, FakePool())
+    assert 'memcache' in [name for name, _, _ in report.phases]
+    assert memcache.get('AA').beacon_id == 1 and memcache.get('HH').hub_id == 7
+    assert memcache.get('beacon_mapping_krit_1_2') == [7, 1100]
+    assert service.registry.pairs() == {(1, 2)}
+
+
+def test_worker_without_shared_parts_leaves_pairs_alone(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    running_service(FakeMemcache()).save(path)
+    memcache = FakeMemcache()
+    service = Service(memcache)
+    report = service.restore(path, FakePool(), shared=False)
+    assert [name for name, _, _ in report.phases] == ['snapshot', 'memcache', 'beacon_left_join_mp', 'hub']
+    assert service.registry.pairs() == set()
+
+
+def test_table_store_adopts_the_loaded_table(tmp_path):
+    path = str(tmp_path / 'state.snap')
+    memcache = FakeMemcache()
+    running_service(memcache).save(path)
+    service = Service(memcache, beacons=BeaconTable())
+    service.restore(path, FakePool())
+    assert isinstance(service.state.beacons, BeaconTable) and len(service.state.beacons) == 2
+
+
+def test_missing_or_broken_snapshot_means_full_load(tmp_path):
+    service = Service(FakeMemcache())
+    assert service.restore(str(tmp_path / 'missing.snap'), FakePool()) is None
+    broken = tmp_path / 'broken.snap'
+    broken.write_bytes(b'not a snapshot at all')
+    assert service.restore(str(broken), FakePool()) is None
@@ -0,0 +1,73 @@
+import pytest
+
+from Traffic_Capture import MAGIC, TrafficRecorder, complete_length, read_capture, worker_path
+from Traffic_Replay import divergenz, macs_sammeln, mitschnitt_laden
+
+
+def capture(path, payloads, arrivals=None):
+    recorder = TrafficRecorder(str(path))
+    recorder.start()
+    for index, payload in enumerate(payloads):
+        recorder.record(payload)
+        if arrivals is not None:
+            recorder.records[-1] = (arrivals[index], payload)
+    recorder.stop()
+    return recorder
+
+
+def test_round_trip_and_append_after_restart(tmp_path):
+    path = tmp_path / 'traffic.atscap'
+    first = capture(path, [b'one', 'two'])
+    capture(path, [b'three'])
+    assert first.recorded == 2
+    assert [payload for _, payload in read_capture(str(path))] == [b'one', b'two', b'three']
+
+
+def test_incomplete_last_block_is_cut_off(tmp_path):
+    path = tmp_path / 'traffic.atscap'
+    capture(path, [b'one'])
+    complete = path.stat().st_size
+    with open(path, 'ab') as file:
+        file.write(b'\x40\x00\x00\x00\x01\x00\x00\x00partial')
+    assert complete_length(str(path)) == complete
+    assert [payload for _, payload in read_capture(str(path))] == [b'one']
+    capture(path, [b'two'])
+    assert [payload for _, payload in read_capture(str(path))] == [b'one', b'two']
+
+
+def test_other_files_are_not_overwritten(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'not a capture')
+    with pytest.raises(ValueError):
+        TrafficRecorder(str(path)).start()
+    assert path.read_bytes() == b'not a capture'
+
+
+def test_capture_stops_at_max_bytes(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path / 'traffic.atscap'), max_bytes=len(MAGIC) + 1)
+    recorder.start()
+    recorder.record(b'one')
+    recorder.write_pending()
+    recorder.record(b'two')
+    recorder.stop()
+    assert recorder.full and recorder.recorded == 1
+
+
+def test_worker_files_are_merged_by_arrival(tmp_path):
+    assert worker_path('/data/traffic.atscap', 2) == '/data/traffic.2.atscap'
+    capture(tmp_path / 'a.atscap', [b'a1', b'a2'], [1.0, 3.0])
+    capture(tmp_path / 'b.atscap', [b'b1', b'b2'], [2.0, 4.0])
+    records = mitschnitt_laden([str(tmp_path / 'a.atscap'), str(tmp_path / 'b.atscap')])
+    assert [payload for _, payload in records] == [b'a1', b'b1', b'a2', b'b2']
+
+
+def test_macs_and_divergence():
+    records = [(0, b'{"time": 20, "data": "MAC_ROOM=H1, MAC_SENSOR=B1"}'), (0, b'garbage'),
+               (0, b'{"time": 10, "data": "MAC_ROOM=H2, MAC_SENSOR=B2"}')]
+    assert macs_sammeln(records) == (['H1', 'H2'], ['B1', 'B2'], 10)
+    reference = {'beacons': {'B1': [1, -60, 10, 10, 80], 'B2': [2, -60, 10, 10, 80]}, 'pairs': [[1, 2]]}
+    state = {'beacons': {'B1': [3, -60, 10, 10, 80], 'B3': [1, -60, 10, 10, 80]}, 'pairs': []}
+    result = divergenz(state, reference)
+    assert (result['hub_differs'], result['values_differ'], result['missing'], result['extra']) == (1, 1, 1, 1)
+    assert (result['pairs_missing'], result['pairs_extra']) == (1, 0)
+    assert divergenz(reference, reference)['examples'] == {}